@@ -0,0 +1,372 @@
+"""
+asyncio-based DNS lookup methods for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import random
+import time
+
+import DNS
+
+from pydnstest.breaker import ServerUnreachable
+from pydnstest.cache import cache_key
+from pydnstest.dns import DNStestDNS, soa_serial
+from pydnstest.socketpool import reply_id
+from pydnstest.wire import WireResponse, build_query
+
+
+class DNSQueryProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol for a single in-flight query; resolves ``reply`` with
+    the raw response whose ID matches the query.
+    """
+
+    def __init__(self, tid, loop):
+        self.tid = tid
+        self.reply = loop.create_future()
+
+    def datagram_received(self, data, addr):
+        # the endpoint is connected to the server, so the kernel already
+        # drops datagrams from any other source; just match the query ID
+        if not self.reply.done() and reply_id(data) == self.tid:
+            self.reply.set_result(data)
+
+    def error_received(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
+class DNStestAsyncDNS:
+    """
+    Non-blocking counterpart to DNStestDNS.
+
+    resolve_name() and lookup_reverse() are coroutines returning exactly the
+    same {'answer': ...} / {'status': ...} dicts as the DNStestDNS methods,
+    but each query is sent on a non-blocking UDP socket, so any number of
+    them can be awaited concurrently on one event loop.
+    """
+
+    # seconds to wait for a reply; same as the DNS module's default
+    timeout = 30
+    resolve_mode = DNStestDNS.resolve_mode
+    cache = None
+    pool = None
+    limiter = None
+    concurrency = None
+    retry = None
+    breaker = None
+    hedge = None
+    snapshots = None
+
+    def __init__(self, timeout=None, resolve_mode=None, cache=None, pool=None, limiter=None,
+                 concurrency=None, retry=None, breaker=None, hedge=None, snapshots=None):
+        """
+        :param timeout: seconds to wait for each reply
+        :param resolve_mode: one of pydnstest.config.RESOLVE_MODES, default 'single'
+        :param cache: pydnstest.cache.DNStestCache to answer repeated queries
+          from, or None to always query the server
+        :param pool: pydnstest.socketpool.AsyncDNSTransport (or another async
+          pool) to send queries through, or None to open a new socket per query
+        :param limiter: pydnstest.ratelimit.RateLimiter to pace queries to
+          each server, or None to send them as fast as possible
+        :param concurrency: pydnstest.concurrency.AdaptiveConcurrency to limit
+          the queries in flight to each server, or None for no limit
+        :param retry: pydnstest.retry.RetryPolicies setting the timeout and
+          retries for each server, or None to send each query once and wait
+          for ``timeout``
+        :param breaker: pydnstest.breaker.CircuitBreakers to fail queries
+          immediately to servers that have stopped answering, or None
+        :param hedge: dict of server to a pydnstest.hedge.HedgedServers; queries
+          to that server are sent to the servers in the group instead
+        :param snapshots: dict of server to a pydnstest.axfr.ZoneSnapshot of
+          zones transferred from it, to answer lookups for names in them
+          from; usually shared with a DNStestDNS that transferred them
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if resolve_mode is not None:
+            self.resolve_mode = resolve_mode
+        self.cache = cache
+        self.pool = pool
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.retry = retry
+        self.breaker = breaker
+        self.hedge = hedge or {}
+        self.snapshots = snapshots if snapshots is not None else {}
+
+    async def resolve_name(self, query, to_server, to_port=53, direct=False):
+        """
+        Resolves a single name against the given server; returns
+        {'status': 'TIMEOUT'} if the server didn't answer, or
+        {'status': 'UNREACHABLE'} if its circuit breaker is open.
+        If direct is True, queries to_server itself even if it's in self.hedge.
+        Names in a zone transferred from the server are answered from
+        self.snapshots.
+        """
+        if to_server in self.snapshots:
+            r = self.snapshots[to_server].resolve_name(query)
+            if r is not None:
+                return r
+        try:
+            if self.resolve_mode == 'parallel':
+                return await self.resolve_name_parallel(query, to_server, to_port, direct)
+            return await self.resolve_name_once(query, to_server, to_port, direct)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
+
+    async def resolve_name_direct(self, query, to_server, to_port=53):
+        """
+        Resolves a single name against exactly the given server, never
+        hedging the query to another one
+        """
+        return await self.resolve_name(query, to_server, to_port, direct=True)
+
+    async def resolve_name_once(self, query, to_server, to_port=53, direct=False):
+        # first try an A record
+        a = await self.query(query, to_server, 'A', to_port, direct)
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+        if self.resolve_mode == 'single':
+            return {'status': a.header['status']}
+
+        # if that didnt work, try a CNAME
+        a = await self.query(query, to_server, 'CNAME', to_port, direct)
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+        return {'status': a.header['status']}
+
+    async def resolve_name_parallel(self, query, to_server, to_port=53, direct=False):
+        """
+        Resolves a single name by sending A and CNAME queries at once, and
+        returning the first answer to arrive. If neither has an answer,
+        returns the status of the A query.
+        """
+        qa = asyncio.ensure_future(self.query(query, to_server, 'A', to_port, direct))
+        qc = asyncio.ensure_future(self.query(query, to_server, 'CNAME', to_port, direct))
+        try:
+            for f in asyncio.as_completed([qa, qc]):
+                try:
+                    a = await f
+                except (DNS.TimeoutError, ServerUnreachable):
+                    # the other query may still have an answer
+                    continue
+                if len(a.answers) > 0:
+                    return {'answer': a.answers[0]}
+            return {'status': qa.result().header['status']}
+        finally:
+            qa.cancel()
+            qc.cancel()
+
+    async def lookup_soa_serial(self, name, to_server, to_port=53):
+        """
+        Returns {'serial': n}, the serial of the zone holding name on exactly
+        the given server, or {'status': ...} if it returned no SOA record
+        """
+        try:
+            a = await self.query(name, to_server, 'SOA', to_port, direct=True)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
+        return soa_serial(a)
+
+    async def lookup_reverse(self, name, to_server, to_port=53):
+        """
+        convenience routine for doing a reverse lookup of an address;
+        returns {'status': 'TIMEOUT'} if the server didn't answer, or
+        {'status': 'UNREACHABLE'} if its circuit breaker is open
+        """
+        if to_server in self.snapshots:
+            r = self.snapshots[to_server].lookup_reverse(name)
+            if r is not None:
+                return r
+        a = name.split('.')
+        a.reverse()
+        b = '.'.join(a) + '.in-addr.arpa'
+
+        try:
+            a = await self.query(b, to_server, 'PTR', to_port)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+        return {'status': a.header['status']}
+
+    async def query(self, name, to_server, qtype, to_port=53, direct=False):
+        """
+        Send a single query with send_query(), or answer it from self.cache
+        if possible, and return the response. Queries sent are paced by
+        self.limiter, their number in flight bounded by self.concurrency,
+        resent on timeouts as set by self.retry, and hedged across the
+        servers of a group in self.hedge.
+
+        Raises DNS.TimeoutError if every attempt timed out, or
+        pydnstest.breaker.ServerUnreachable if self.breaker is open.
+
+        :param name: name to query
+        :param to_server: server hostname or IP address
+        :param qtype: query type name, i.e. 'A'
+        :param to_port: server port
+        :param direct: if True, query to_server even if it's in self.hedge
+        """
+        if self.cache is not None:
+            key = cache_key(name, to_server, qtype, to_port)
+            a = self.cache.get(key)
+            if a is not None:
+                return a
+        if to_server in self.hedge and not direct:
+            a = await self.hedge[to_server].query_async(
+                lambda server: self.attempt(name, server, qtype, to_port))
+        else:
+            a = await self.attempt(name, to_server, qtype, to_port)
+        if self.cache is not None:
+            self.cache.put(key, a)
+        return a
+
+    async def attempt(self, name, to_server, qtype, to_port=53):
+        """
+        Send a query with send(), resending it on timeouts as set by
+        self.retry, and return the response.
+        """
+        if self.retry is None:
+            return await self.send(name, to_server, qtype, to_port, self.timeout)
+        return await self.retry.get(to_server).call_async(
+            lambda timeout: self.send(name, to_server, qtype, to_port, timeout))
+
+    async def send(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a query with send_paced(), unless self.breaker is open for the
+        server, recording whether it got a reply.
+        """
+        if self.breaker is None:
+            return await self.send_paced(name, to_server, qtype, to_port, timeout)
+        self.breaker.check(to_server)
+        try:
+            a = await self.send_paced(name, to_server, qtype, to_port, timeout)
+        except DNS.TimeoutError:
+            self.breaker.timeout(to_server)
+            raise
+        except BaseException:
+            self.breaker.abandon(to_server)
+            raise
+        self.breaker.success(to_server)
+        return a
+
+    async def send_paced(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Wait for self.limiter and a slot from self.concurrency, then send a
+        query and return the response.
+
+        :param timeout: seconds to wait for the reply, default self.timeout
+        """
+        if self.limiter is not None:
+            await self.limiter.acquire_async(to_server)
+        if self.concurrency is None:
+            return await self.send_one(name, to_server, qtype, to_port, timeout)
+        started = await self.concurrency.acquire(to_server)
+        rtt = None
+        status = None
+        timed_out = False
+        try:
+            sent = time.monotonic()
+            a = await self.send_one(name, to_server, qtype, to_port, timeout)
+            rtt = time.monotonic() - sent
+            status = a.header['status']
+        except DNS.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.concurrency.release(to_server, started, rtt, status, timed_out)
+        return a
+
+    async def send_one(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a query through self.pool, or with send_query() if there is
+        no pool, and return the response.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if self.pool is not None:
+            return await self.pool.query(name, to_server, qtype, to_port, timeout)
+        return await self.send_query(name, to_server, qtype, to_port, timeout)
+
+    async def send_query(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a single UDP query and return the reply as a WireResponse.
+
+        Raises DNS.TimeoutError if no reply arrives within the timeout,
+        and DNS.SocketError on socket errors, like DNS.Request.req() does.
+
+        :param name: name to query
+        :param to_server: server hostname or IP address
+        :param qtype: query type name, i.e. 'A'
+        :param to_port: server port
+        :param timeout: seconds to wait for the reply, default self.timeout
+        """
+        if timeout is None:
+            timeout = self.timeout
+        loop = asyncio.get_event_loop()
+        tid = random.randint(0, 65535)
+
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: DNSQueryProtocol(tid, loop), remote_addr=(to_server, to_port))
+        except OSError as e:
+            raise DNS.SocketError(e)
+        try:
+            transport.sendto(build_query(tid, name, qtype))
+            reply = await asyncio.wait_for(protocol.reply, timeout)
+        except asyncio.TimeoutError:
+            raise DNS.TimeoutError('Timeout')
+        except OSError as e:
+            raise DNS.SocketError(e)
+        finally:
+            transport.close()
+        return WireResponse(reply)
+
+    async def close(self):
+        """
+        close the socket pool, if any; await this before closing the event loop
+        """
+        if self.pool is not None:
+            await self.pool.close()
@@ -0,0 +1,407 @@
+"""
+AXFR zone transfers, and in-memory snapshots of the zones transferred
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import random
+import socket
+import struct
+
+import DNS
+
+from pydnstest.socketpool import frame, resolve_server
+from pydnstest.wire import WireResponse, build_query
+from pydnstest.zonediff import canonical_data
+
+
+class TransferError(DNS.DNSError):
+    """
+    A zone transfer was refused, or ended before the zone was complete
+    """
+    pass
+
+
+def normalize(name):
+    """ return a name lower-cased and without a trailing dot """
+    return name.lower().rstrip('.')
+
+
+def reverse_name(addr):
+    """ return the in-addr.arpa name for an IPv4 address """
+    a = addr.split('.')
+    a.reverse()
+    return '.'.join(a) + '.in-addr.arpa'
+
+
+def reverse_address(owner):
+    """
+    return the IPv4 address of an in-addr.arpa name, or None if it isn't
+    the name of a single address
+    """
+    if not owner.endswith('.in-addr.arpa'):
+        return None
+    a = owner[:-len('.in-addr.arpa')].split('.')
+    if len(a) != 4:
+        return None
+    a.reverse()
+    return '.'.join(a)
+
+
+def read_exactly(sock, n):
+    """ read n bytes from a socket """
+    chunks = []
+    while n > 0:
+        data = sock.recv(n)
+        if not data:
+            raise TransferError('connection closed before the end of the zone')
+        chunks.append(data)
+        n -= len(data)
+    return b''.join(chunks)
+
+
+def iter_messages(zone, query, tid, to_server, to_port=53, timeout=30):
+    """
+    Send a zone transfer query over TCP and yield the records of the
+    answer sections of the replies, one message at a time, until the
+    caller stops iterating; the connection is then closed.
+
+    Raises TransferError if the server refuses the transfer or closes the
+    connection, DNS.TimeoutError if it stops sending for ``timeout``
+    seconds, and DNS.SocketError on socket errors.
+
+    @param zone name of the zone, for error messages
+    @param query wire format query
+    @param tid ID of the query
+    """
+    family, addr = resolve_server(to_server, to_port, socket.SOCK_STREAM)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        sock.sendall(frame(query))
+        while True:
+            n = struct.unpack('!H', read_exactly(sock, 2))[0]
+            msg = WireResponse(read_exactly(sock, n))
+            if msg.header['id'] != tid:
+                raise TransferError('reply ID %d does not match query' % msg.header['id'])
+            if msg.header['status'] != 'NOERROR':
+                raise TransferError('transfer of %s refused: %s' % (zone, msg.header['status']))
+            for rr in msg.answers:
+                yield rr
+    except socket.timeout:
+        raise DNS.TimeoutError('Timeout')
+    except OSError as e:
+        raise DNS.SocketError(e)
+    finally:
+        sock.close()
+
+
+def iter_axfr(zone, to_server, to_port=53, timeout=30):
+    """
+    Transfer a zone with AXFR (RFC 5936) and yield its records, as record
+    dicts like WireResponse.answers, starting with the SOA record. The
+    transfer is read one message at a time as the records are consumed,
+    so the whole zone is never held in memory.
+
+    Raises the same exceptions as iter_messages(), or TransferError if
+    the transfer doesn't start with the zone's SOA record.
+
+    @param zone name of the zone
+    @param to_server server hostname or IP address
+    @param to_port server port
+    @param timeout seconds to wait for each message
+    """
+    tid = random.randint(0, 65535)
+    messages = iter_messages(zone, build_query(tid, zone, 'AXFR'), tid, to_server, to_port, timeout)
+    soa = 0
+    try:
+        for rr in messages:
+            if rr['typename'] == 'SOA':
+                soa += 1
+                if soa == 2:
+                    # the zone ends with its SOA record again
+                    return
+            elif soa == 0:
+                raise TransferError('transfer of %s does not start with a SOA record' % zone)
+            yield rr
+    finally:
+        messages.close()
+
+
+def record_identity(rr):
+    """
+    return what identifies a record within a zone: its name, type and
+    data, but not its TTL (as in RFC 1995 deletions)
+    """
+    return (normalize(rr['name']), rr['typename'], repr(canonical_data(rr)))
+
+
+class Zone(object):
+    """
+    The records of one zone, indexed by owner name and by the IP address
+    of PTR records, answering lookups the way its authoritative server
+    would: the name's CNAME or first A record, NOERROR for names that exist
+    without one (including empty non-terminals and names at or below a
+    delegation), wildcard records for names that don't exist, and NXDOMAIN
+    otherwise.
+    """
+
+    def __init__(self, name):
+        """
+        @param name name of the zone
+        """
+        self.name = normalize(name)
+        self.serial = None
+        self.count = 0
+        # owner name -> list of record dicts
+        self.names = {}
+        # IP address -> its PTR record dict
+        self.ptr = {}
+        # names that exist only because there are names below them
+        self.nonterminals = set()
+        # names delegated to other servers
+        self.cuts = set()
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, name):
+        """ return True if a normalized name is at or below the zone apex """
+        return name == self.name or name.endswith('.' + self.name)
+
+    def add(self, rr):
+        """
+        add a record dict to the zone; records outside the zone are ignored
+        """
+        owner = normalize(rr['name'])
+        if not self.contains(owner):
+            return
+        self.names.setdefault(owner, []).append(rr)
+        self.count += 1
+        if rr['typename'] == 'SOA' and owner == self.name:
+            # SOA data is (mname, rname, ('serial', n), refresh, retry, expire, minimum)
+            self.serial = rr['data'][2][1]
+        elif rr['typename'] == 'NS' and owner != self.name:
+            self.cuts.add(owner)
+        elif rr['typename'] == 'PTR':
+            addr = reverse_address(owner)
+            if addr is not None:
+                self.ptr.setdefault(addr, rr)
+        while owner != self.name:
+            owner = owner.split('.', 1)[1]
+            if owner in self.nonterminals:
+                break
+            self.nonterminals.add(owner)
+
+    def remove(self, rr):
+        """
+        remove the record with the same record_identity() as a record dict;
+        returns True if there was one. Call reindex() once done removing.
+        """
+        owner = normalize(rr['name'])
+        rrs = self.names.get(owner, [])
+        ident = record_identity(rr)
+        for i, r in enumerate(rrs):
+            if record_identity(r) == ident:
+                break
+        else:
+            return False
+        del rrs[i]
+        self.count -= 1
+        if not rrs:
+            del self.names[owner]
+        if rr['typename'] == 'NS' and not any(r['typename'] == 'NS' for r in rrs):
+            self.cuts.discard(owner)
+        elif rr['typename'] == 'PTR':
+            addr = reverse_address(owner)
+            if addr is not None and self.ptr.get(addr) is r:
+                del self.ptr[addr]
+                for r in rrs:
+                    if r['typename'] == 'PTR':
+                        self.ptr[addr] = r
+                        break
+        return True
+
+    def reindex(self):
+        """ recompute the empty non-terminals, after removing names """
+        self.nonterminals = set()
+        for owner in self.names:
+            while owner != self.name:
+                owner = owner.split('.', 1)[1]
+                if owner in self.nonterminals:
+                    break
+                self.nonterminals.add(owner)
+
+    def apply(self, changes):
+        """
+        Apply a zone transfer delta, i.e. from pydnstest.ixfr.iter_ixfr():
+        ('delete', record) and ('add', record) tuples, and ('reset', None)
+        to remove every record first. Returns the set of owner names with
+        records deleted or added, or None if the zone was reset.
+        """
+        changed = set()
+        removed = False
+        for op, rr in changes:
+            if op == 'reset':
+                self.__init__(self.name)
+                changed = None
+            elif op == 'delete':
+                removed = self.remove(rr) or removed
+            else:
+                self.add(rr)
+            if changed is not None and rr is not None:
+                changed.add(normalize(rr['name']))
+        if removed:
+            self.reindex()
+        return changed
+
+    def records(self):
+        """ yield every record dict in the zone """
+        for rrs in self.names.values():
+            for rr in rrs:
+                yield rr
+
+    def exists(self, name):
+        return name in self.names or name in self.nonterminals
+
+    def wildcard(self, name):
+        """
+        return the records of the wildcard at the closest existing
+        ancestor of a name that doesn't exist, or None
+        """
+        while name != self.name:
+            name = name.split('.', 1)[1]
+            if self.exists(name):
+                return self.names.get('*.' + name)
+        return None
+
+    def lookup(self, query, typenames):
+        """
+        Return {'answer': record} with the first record of the first of
+        typenames that a name has, or {'status': ...} if it has none. The
+        answer's name is the name as queried, as in a server's response.
+        """
+        name = normalize(query)
+        parent = name
+        while parent != self.name:
+            if parent in self.cuts:
+                # the server would only refer us elsewhere
+                return {'status': 'NOERROR'}
+            parent = parent.split('.', 1)[1]
+        rrs = self.names.get(name)
+        if rrs is None:
+            if name in self.nonterminals:
+                return {'status': 'NOERROR'}
+            rrs = self.wildcard(name)
+            if rrs is None:
+                return {'status': 'NXDOMAIN'}
+        for typename in typenames:
+            for rr in rrs:
+                if rr['typename'] == typename:
+                    return {'answer': dict(rr, name=query.rstrip('.'))}
+        return {'status': 'NOERROR'}
+
+    def resolve_name(self, query):
+        """ the result of DNStestDNS.resolve_name() for a name in the zone """
+        return self.lookup(query, ('CNAME', 'A'))
+
+    def lookup_reverse(self, addr):
+        """ the result of DNStestDNS.lookup_reverse() for an address in the zone """
+        rr = self.ptr.get(addr)
+        if rr is not None:
+            return {'answer': dict(rr)}
+        return self.lookup(reverse_name(addr), ('CNAME', 'PTR'))
+
+
+def transfer_zone(zone, to_server, to_port=53, timeout=30):
+    """
+    Transfer a zone with AXFR and return it as a Zone. Raises the same
+    exceptions as iter_axfr().
+    """
+    z = Zone(zone)
+    for rr in iter_axfr(zone, to_server, to_port, timeout):
+        z.add(rr)
+    return z
+
+
+class ZoneSnapshot(object):
+    """
+    The zones transferred from one server, answering lookups for names in
+    any of them without querying the server.
+    """
+
+    def __init__(self):
+        # zone name -> Zone
+        self.zones = {}
+
+    def add_zone(self, zone):
+        """ add a Zone, replacing any earlier transfer of it """
+        self.zones[zone.name] = zone
+
+    def remove_zone(self, name):
+        """ stop answering lookups for names in a zone """
+        self.zones.pop(normalize(name), None)
+
+    def zone_for(self, name):
+        """ return the innermost Zone holding a name, or None """
+        name = normalize(name)
+        while True:
+            if name in self.zones:
+                return self.zones[name]
+            if '.' not in name:
+                return None
+            name = name.split('.', 1)[1]
+
+    def resolve_name(self, query):
+        """
+        the result of DNStestDNS.resolve_name() for a name, or None if it
+        isn't in any of the zones
+        """
+        zone = self.zone_for(query)
+        if zone is None:
+            return None
+        return zone.resolve_name(query)
+
+    def lookup_reverse(self, addr):
+        """
+        the result of DNStestDNS.lookup_reverse() for an address, or None if
+        its reverse name isn't in any of the zones
+        """
+        zone = self.zone_for(reverse_name(addr))
+        if zone is None:
+            return None
+        return zone.lookup_reverse(addr)
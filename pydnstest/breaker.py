@@ -0,0 +1,153 @@
+"""
+Per-server circuit breakers for dnstest.py, to fail fast when a server stops answering
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import time
+
+import DNS
+
+
+class ServerUnreachable(DNS.DNSError):
+    """
+    raised instead of sending a query to a server whose circuit breaker is open
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for one server.
+
+    It starts closed, letting every query through. After ``threshold``
+    consecutive timeouts it opens, and queries fail immediately instead of
+    each waiting out the timeout. Once it has been open for ``reset_after``
+    seconds it half-opens, letting a single probe query through: an answer
+    closes it again, a timeout re-opens it for another ``reset_after``.
+    """
+
+    def __init__(self, threshold=5, reset_after=30.0, clock=time.monotonic):
+        """
+        @param threshold number of consecutive timeouts that open the breaker
+        @param reset_after seconds to stay open before probing the server
+        @param clock callable returning the current time in seconds
+        """
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.short_circuited = 0
+
+    def allow(self):
+        """
+        return True if a query may be sent now; False (counting it as
+        short-circuited) if it should fail immediately
+        """
+        if self.state == 'open' and self.clock() - self.opened_at >= self.reset_after:
+            self.state = 'half-open'
+        if self.state == 'closed':
+            return True
+        if self.state == 'half-open' and not self.probing:
+            self.probing = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def success(self):
+        """ record a reply from the server, closing the breaker """
+        self.state = 'closed'
+        self.failures = 0
+        self.probing = False
+
+    def timeout(self):
+        """ record a query to the server that timed out """
+        self.failures += 1
+        if self.state == 'half-open' or self.failures >= self.threshold:
+            self.state = 'open'
+            self.opened_at = self.clock()
+        self.probing = False
+
+    def abandon(self):
+        """ record a query that neither got a reply nor timed out """
+        self.probing = False
+
+
+class CircuitBreakers(object):
+    """
+    CircuitBreakers by server, created on the first query to each one.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        keyword arguments are passed on to each CircuitBreaker
+        """
+        self.kwargs = kwargs
+        self.breakers = {}
+
+    def breaker_for(self, server):
+        """ return the CircuitBreaker for server """
+        if server not in self.breakers:
+            self.breakers[server] = CircuitBreaker(**self.kwargs)
+        return self.breakers[server]
+
+    def check(self, server):
+        """ raise ServerUnreachable if a query to server should fail immediately """
+        if not self.breaker_for(server).allow():
+            raise ServerUnreachable('circuit breaker open for %s' % server)
+
+    def success(self, server):
+        """ record a reply from server """
+        self.breaker_for(server).success()
+
+    def timeout(self, server):
+        """ record a query to server that timed out """
+        self.breaker_for(server).timeout()
+
+    def abandon(self, server):
+        """ record a query to server that neither got a reply nor timed out """
+        self.breaker_for(server).abandon()
+
+    def stats(self):
+        """
+        return a dict of server to a dict of its breaker's ``state`` and
+        number of queries ``short_circuited``
+        """
+        return dict((server, {'state': b.state, 'short_circuited': b.short_circuited})
+                    for server, b in self.breakers.items())
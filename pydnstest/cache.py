@@ -0,0 +1,284 @@
+"""
+TTL-aware in-process cache of DNS responses for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import ast
+import copy
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+def cache_key(name, to_server, qtype, to_port=53):
+    """
+    return the cache key for a query
+
+    @param name name queried
+    @param to_server server queried
+    @param qtype query type name, i.e. 'A'
+    @param to_port server port
+    @return tuple (server, port, qname, qtype)
+    """
+    return (to_server, to_port, name.lower().rstrip('.'), qtype)
+
+
+def response_ttl(response):
+    """
+    returns the number of seconds a response may be cached for, or None
+    if it must not be cached.
+
+    A response with answers may be cached for the lowest TTL of its answers.
+    Per RFC 2308, a negative (NXDOMAIN, or NOERROR with no answers) response
+    may be cached for the lower of the TTL and minimum field of the SOA
+    record in its authority section; without one, it isn't cached. Any
+    other response (i.e. SERVFAIL or REFUSED) isn't cached.
+
+    @param response DNS.DnsResult, WireResponse or CachedResponse
+    @return int or None
+    """
+    if len(response.answers) > 0:
+        return min(a['ttl'] for a in response.answers)
+    if response.header['status'] not in ('NXDOMAIN', 'NOERROR'):
+        return None
+    for a in getattr(response, 'authority', []):
+        if a['typename'] == 'SOA':
+            # SOA data is (mname, rname, serial, refresh, retry, expire, minimum),
+            # each of the numeric fields a ('label', seconds, ...) tuple
+            return min(a['ttl'], a['data'][6][1])
+    return None
+
+
+class CachedResponse(object):
+    """
+    Response returned from the cache, with the same answers, authority and
+    header['status'] attributes as the response it was stored from.
+    """
+
+    def __init__(self, answers, authority, status):
+        self.answers = answers
+        self.authority = authority
+        self.header = {'status': status}
+
+
+class DNStestCache(object):
+    """
+    LRU cache of DNS responses, keyed by (server, port, qname, qtype).
+
+    Each response is kept for the TTL given by response_ttl(), and the
+    least recently used response is evicted when more than max_size are
+    cached. Answer TTLs are returned as received from the server, not
+    counted down, so a cached answer compares equal to a fresh one.
+
+    If a backing store (i.e. a DNStestPersistentCache) is given, responses
+    not in memory are looked up in it, and every response cached is also
+    stored in it.
+
+    Every get() counts as a hit or a miss, in self.hits and self.misses.
+    """
+
+    def __init__(self, max_size=1000, clock=time.time, backing=None):
+        """
+        @param max_size maximum number of responses to keep in memory
+        @param clock callable returning the current time in seconds
+        @param backing object with load(key) and store(key, entry) methods
+        """
+        self.max_size = max_size
+        self.clock = clock
+        self.backing = backing
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        return a CachedResponse for key, or None if it isn't cached or has expired.
+
+        The response is a copy, so callers are free to modify it.
+
+        @param key tuple from cache_key()
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= self.clock():
+            del self.entries[key]
+            entry = None
+        if entry is None and self.backing is not None:
+            entry = self.backing.load(key)
+            if entry is not None:
+                self.remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        expires, answers, authority, status = entry
+        return CachedResponse(copy.deepcopy(answers), copy.deepcopy(authority), status)
+
+    def contains(self, key):
+        """
+        return True if get(key) would return a response; unlike get(), this
+        doesn't count a hit or miss, or change which response is evicted next
+
+        @param key tuple from cache_key()
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            return True
+        return self.backing is not None and self.backing.load(key) is not None
+
+    def put(self, key, response):
+        """
+        cache a response, if response_ttl() allows it
+
+        @param key tuple from cache_key()
+        @param response DNS.DnsResult or WireResponse
+        """
+        ttl = response_ttl(response)
+        if ttl is None or ttl <= 0:
+            return
+        entry = (self.clock() + ttl,
+                 copy.deepcopy(response.answers),
+                 copy.deepcopy(getattr(response, 'authority', [])),
+                 response.header['status'])
+        self.remember(key, entry)
+        if self.backing is not None:
+            self.backing.store(key, entry)
+
+    def remember(self, key, entry):
+        """
+        keep an (expires, answers, authority, status) entry in memory,
+        evicting the least recently used entries past max_size
+        """
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """ drop all cached responses """
+        self.entries.clear()
+
+    def close(self):
+        """ close the backing store, if any """
+        if self.backing is not None:
+            self.backing.close()
+
+    def stats(self):
+        """
+        return a dict of cache statistics: size, hits, misses and evictions
+        """
+        return {'size': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class DNStestPersistentCache(object):
+    """
+    SQLite-backed store of cached responses, kept between runs; for use as
+    the backing store of a DNStestCache.
+
+    Only responses from the given servers (i.e. the PROD server) are stored
+    and loaded. Responses expire at the same time they would in memory. If
+    refresh is True, nothing is loaded, but new responses are still stored,
+    replacing any stored earlier.
+
+    Stored responses are written out in batches; call close() to write
+    out the rest.
+    """
+
+    # write out stored responses every this many store() calls
+    batch_size = 500
+
+    def __init__(self, path, servers, refresh=False, clock=time.time):
+        """
+        @param path path to the SQLite database file; created if needed
+        @param servers list of servers to store responses from
+        @param refresh if True, ignore stored responses
+        @param clock callable returning the current time in seconds
+        """
+        self.path = path
+        self.servers = set(servers)
+        self.refresh = refresh
+        self.clock = clock
+        self.pending = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (server TEXT, port INTEGER, "
+                          "qname TEXT, qtype TEXT, expires REAL, answers TEXT, authority TEXT, "
+                          "status TEXT, PRIMARY KEY (server, port, qname, qtype))")
+        self.conn.execute("DELETE FROM responses WHERE expires <= ?", (self.clock(),))
+        self.conn.commit()
+
+    def load(self, key):
+        """
+        return the stored (expires, answers, authority, status) entry for
+        key, or None
+
+        @param key tuple from cache_key()
+        """
+        if self.refresh or key[0] not in self.servers:
+            return None
+        row = self.conn.execute("SELECT expires, answers, authority, status FROM responses "
+                                "WHERE server=? AND port=? AND qname=? AND qtype=?", key).fetchone()
+        if row is None or row[0] <= self.clock():
+            return None
+        # answers are stored as their repr(), to round-trip tuples and bytes
+        return (row[0], ast.literal_eval(row[1]), ast.literal_eval(row[2]), row[3])
+
+    def store(self, key, entry):
+        """
+        store an (expires, answers, authority, status) entry for key
+
+        @param key tuple from cache_key()
+        """
+        if key[0] not in self.servers:
+            return
+        expires, answers, authority, status = entry
+        self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          key + (expires, repr(answers), repr(authority), status))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        """ write out any pending responses and close the database """
+        self.conn.commit()
+        self.conn.close()
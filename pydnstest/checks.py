@@ -37,9 +37,29 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 """
 
+import asyncio
 import re
-from pydnstest.dns import DNStestDNS
+import time
+
+import DNS
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.axfr import iter_axfr, normalize, reverse_name
+from pydnstest.breaker import CircuitBreakers
+from pydnstest.concurrency import AdaptiveConcurrency
+from pydnstest.cache import DNStestCache, DNStestPersistentCache, cache_key
+from pydnstest.dns import DNStestDNS, serial_at_least, soa_serial
+from pydnstest.hedge import HedgedServers
+from pydnstest.ixfr import Delta, ResultStore, SnapshotStore
+from pydnstest.ratelimit import RateLimiter, TokenBucket
+from pydnstest.retry import RetryPolicies, RetryPolicy
+from pydnstest.socketpool import AsyncDNSTransport, DNSTransport
+from pydnstest.timing import LOOKUP_QTYPES, CheckTiming, TimingSummary
 from pydnstest.util import dns_dict_to_string
+from pydnstest.wire import WireError
+from pydnstest.zonediff import SortedRecords, diff_zones, iter_rrsets, rrset_text
+from pydnstest.zonedigest import DigestStore, DigestTree
+from pydnstest.zonefile import ZoneFileError, iter_zone_file
 
 
 class DNStestChecks:
@@ -52,25 +72,420 @@ class DNStestChecks:
     - secondary: list of strings, describing sub-test steps
     - warnings: list of strings, of any non-critical warnings generated
     {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+
+    Each check is implemented as a query plan - a generator method named
+    plan_<check name> that yields lists of independent lookups, each a
+    (method, name, server) tuple where method is 'resolve_name' or
+    'lookup_reverse', is sent back the list of their results, and returns
+    the result dict. run_plan() runs a plan against the blocking self.DNS,
+    and run_plan_async() awaits each list of lookups concurrently on
+    self.AsyncDNS. Plans called with speculate=True, as run_async() does,
+    also send lookups they may not need up front - the reverse lookup of
+    the expected address, and every lookup of a rename - so TEST, PROD and
+    reverse lookups for a line are all in flight at the same time; the
+    blocking check methods make the same queries, in the same order, as
+    they always have.
     """
 
     config = None
     DNS = None
+    AsyncDNS = None
+    results = None
+    timings = None
 
     def __init__(self, config):
         """
         init method for DNStestChecks - class for all DNS check and verify methods
         """
         self.config = config
-        self.DNS = DNStestDNS()
+        # one response cache, shared by the blocking and asyncio lookups,
+        # optionally backed by a file of PROD responses kept between runs
+        cache = None
+        backing = None
+        if config.persistent_cache:
+            backing = DNStestPersistentCache(config.cache_file(), [config.server_prod],
+                                             refresh=config.refresh_cache or config.refresh_responses)
+        if config.cache_size > 0 or backing is not None:
+            cache = DNStestCache(max_size=config.cache_size, backing=backing)
+        # every PROD server if there are several; lookups addressed to
+        # config.server_prod are hedged across all of them
+        prod = config.prod_servers() or [config.server_prod]
+        hedge = {}
+        if len(prod) > 1:
+            hedge[config.server_prod] = HedgedServers(prod)
+        tcp_servers = []
+        if config.transport_prod == 'tcp':
+            tcp_servers.extend(prod)
+        if config.transport_test == 'tcp':
+            tcp_servers.append(config.server_test)
+        # per-server query rate limits, shared by the blocking and asyncio lookups
+        buckets = {}
+        for server in prod:
+            if config.qps_prod > 0:
+                buckets[server] = TokenBucket(config.qps_prod, config.burst_prod)
+        if config.qps_test > 0:
+            buckets[config.server_test] = TokenBucket(config.qps_test, config.burst_test)
+        limiter = RateLimiter(buckets)
+        policies = dict((server, RetryPolicy(config.timeout_prod, config.retries_prod, config.retry_backoff_prod))
+                        for server in prod)
+        policies[config.server_test] = RetryPolicy(config.timeout_test, config.retries_test, config.retry_backoff_test)
+        retry = RetryPolicies(policies)
+        # per-server circuit breakers, shared by the blocking and asyncio lookups
+        breaker = None
+        if config.breaker_threshold > 0:
+            breaker = CircuitBreakers(threshold=config.breaker_threshold, reset_after=config.breaker_reset)
+        # zones transferred by load_snapshots(), shared by the blocking and asyncio lookups
+        snapshots = {}
+        self.DNS = DNStestDNS(resolve_mode=config.resolve_mode, cache=cache,
+                              pool=DNSTransport(tcp_servers=tcp_servers), limiter=limiter,
+                              retry=retry, breaker=breaker, hedge=hedge, snapshots=snapshots)
+        self.AsyncDNS = DNStestAsyncDNS(resolve_mode=config.resolve_mode, cache=cache,
+                                        pool=AsyncDNSTransport(tcp_servers=tcp_servers),
+                                        limiter=limiter, concurrency=AdaptiveConcurrency(),
+                                        retry=retry, breaker=breaker, hedge=hedge,
+                                        snapshots=snapshots)
+        # with the persistent cache, the IXFR deltas load_snapshots() applied
+        # to zones stored by the last run, by (server, zone), and the stored
+        # verify results they tell us are still good
+        self.deltas = {}
         self.ip_regex = re.compile(r"^((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}(1[0-9]{2}|2[0-4][0-9]|25[0-5]|[1-9][0-9]|[0-9]))$")
 
+    def close(self):
+        """
+        close the blocking lookups' sockets, and write out and close the
+        persistent response cache, if any. The asyncio lookups' sockets are
+        closed by awaiting self.AsyncDNS.close() on their event loop.
+        """
+        self.DNS.close()
+        if self.DNS.cache is not None:
+            self.DNS.cache.close()
+        if self.results is not None:
+            self.results.close()
+
+    def load_snapshots(self):
+        """
+        Transfer each zone in config.axfr_zones from the TEST and PROD
+        servers, so lookups of names in them are answered from the
+        transferred copies. A zone that can't be transferred from both
+        servers is queried name by name on both as usual, so responses
+        from the two servers are always compared like with like.
+
+        With the persistent cache, the zones are kept between runs, and a
+        zone stored by the last run is brought up to date with IXFR instead
+        of transferred again; the changes are kept in self.deltas, so verify
+        checks whose names they can't affect reuse their last result.
+
+        Returns a list of messages, one per zone and server.
+        """
+        messages = []
+        store = None
+        if self.config.persistent_cache:
+            store = SnapshotStore(self.config.cache_file(), refresh=self.config.refresh_cache)
+            if self.results is None:
+                self.results = ResultStore(self.config.cache_file())
+        for zone in self.config.axfr_zones:
+            transferred = []
+            failed = False
+            for server, label in ((self.config.server_test, 'TEST'), (self.config.server_prod, 'PROD')):
+                try:
+                    messages.append(self.load_snapshot(store, zone, server, label))
+                except (DNS.DNSError, WireError) as e:
+                    messages.append("WARNING: could not transfer zone %s from %s (%s), will query it instead: %s" % (zone, server, label, e))
+                    failed = True
+                    continue
+                transferred.append(server)
+            if failed:
+                for server in transferred:
+                    self.DNS.snapshots[server].remove_zone(zone)
+                    self.deltas.pop((server, normalize(zone)), None)
+        if store is not None:
+            store.close()
+        return messages
+
+    def load_snapshot(self, store, zone, server, label):
+        """
+        Transfer one zone from one server for load_snapshots(), or update
+        its copy in ``store`` (a SnapshotStore, or None) incrementally, and
+        return a message describing what was done.
+        """
+        z = None if store is None else store.load(server, zone)
+        if z is None:
+            z = self.DNS.transfer_zone(zone, server)
+            if store is not None:
+                store.save(server, z)
+            return "Note - transferred %d records in zone %s (serial %s) from %s (%s)" % (len(z), zone, z.serial, server, label)
+        base = z.serial
+        changes = self.DNS.update_zone(z, server)
+        if changes and changes[0][0] == 'reset':
+            store.save(server, z)
+            return "Note - transferred %d records in zone %s (serial %s) from %s (%s)" % (len(z), zone, z.serial, server, label)
+        store.update(server, z, changes)
+        self.deltas[(server, z.name)] = Delta(z.name, base, changes)
+        if not changes:
+            return "Note - zone %s unchanged at serial %s on %s (%s)" % (zone, base, server, label)
+        # not counting the SOA records that mark each change
+        deleted = len([c for c in changes if c[0] == 'delete' and c[1]['typename'] != 'SOA'])
+        added = len([c for c in changes if c[0] == 'add' and c[1]['typename'] != 'SOA'])
+        return "Note - updated zone %s from serial %s to %s on %s (%s): %d records deleted, %d added" % (
+            zone, base, z.serial, server, label, deleted, added)
+
+    def enable_timing(self):
+        """
+        Time every lookup made by a query plan from now on: each check's
+        result dict gets a ``timing`` section (see
+        pydnstest.timing.CheckTiming.as_dict()), and the lookups are added
+        up in self.timings, a pydnstest.timing.TimingSummary.
+        """
+        self.timings = TimingSummary({self.config.server_prod: 'PROD', self.config.server_test: 'TEST'})
+
+    def run_plan(self, plan):
+        """
+        Run a query plan using the blocking self.DNS, one lookup at a time,
+        and return its result dict.
+
+        @param plan query plan generator
+        """
+        results = None
+        unanswered = []
+        timing = None if self.timings is None else CheckTiming()
+        try:
+            while True:
+                queries = plan.send(results)
+                if timing is None:
+                    results = [getattr(self.DNS, q[0])(q[1], q[2]) for q in queries]
+                else:
+                    results = [self.timed_lookup(q, timing) for q in queries]
+                unanswered.extend(self.unanswered(queries, results))
+        except StopIteration as e:
+            return self.add_timing(self.report_unanswered(e.value, unanswered), timing)
+
+    async def run_plan_async(self, plan):
+        """
+        Run a query plan using self.AsyncDNS, awaiting each list of lookups
+        concurrently, and return its result dict.
+
+        @param plan query plan generator
+        """
+        results = None
+        unanswered = []
+        timing = None if self.timings is None else CheckTiming()
+        try:
+            while True:
+                queries = plan.send(results)
+                if timing is None:
+                    results = await asyncio.gather(*[getattr(self.AsyncDNS, q[0])(q[1], q[2]) for q in queries])
+                else:
+                    results = await asyncio.gather(*[self.timed_lookup_async(q, timing) for q in queries])
+                unanswered.extend(self.unanswered(queries, results))
+        except StopIteration as e:
+            return self.add_timing(self.report_unanswered(e.value, unanswered), timing)
+
+    def timed_lookup(self, q, timing):
+        """ make a (method, name, server) lookup with self.DNS, recording it in a CheckTiming """
+        cached = self.lookup_cached(self.DNS, q)
+        start = timing.clock()
+        r = getattr(self.DNS, q[0])(q[1], q[2])
+        timing.record(q[0], q[1], q[2], timing.clock() - start, cached)
+        return r
+
+    async def timed_lookup_async(self, q, timing):
+        """ make a (method, name, server) lookup with self.AsyncDNS, recording it in a CheckTiming """
+        cached = self.lookup_cached(self.AsyncDNS, q)
+        start = timing.clock()
+        r = await getattr(self.AsyncDNS, q[0])(q[1], q[2])
+        timing.record(q[0], q[1], q[2], timing.clock() - start, cached)
+        return r
+
+    def lookup_cached(self, resolver, q):
+        """
+        Return True if a (method, name, server) lookup will be answered
+        from a zone snapshot or the response cache of a resolver, rather
+        than by querying the server; as checked just before the lookup, so
+        a concurrent lookup may have cached the response by the time it's made.
+        """
+        method, name, server = q
+        qname = name
+        if method == 'lookup_reverse':
+            qname = reverse_name(name)
+        snap = resolver.snapshots.get(server)
+        if method != 'lookup_soa_serial' and snap is not None and snap.zone_for(qname) is not None:
+            return True
+        if resolver.cache is None:
+            return False
+        return resolver.cache.contains(cache_key(qname, server, LOOKUP_QTYPES.get(method, method)))
+
+    def add_timing(self, res, timing):
+        """ add the timing section to a check's result dict, and to self.timings """
+        if timing is not None:
+            res['timing'] = timing.as_dict()
+            self.timings.add(res['timing'])
+        return res
+
+    def unanswered(self, queries, results):
+        """
+        Return the (name, server, status) of each forward lookup in a list
+        of lookups that got a TIMEOUT status, or UNREACHABLE if it wasn't
+        sent because the server's circuit breaker was open. Reverse lookups
+        without an answer are only reported as warnings by the checks.
+
+        @param queries list of (method, name, server) lookups
+        @param results list of their results
+        """
+        return [(q[1], q[2], r['status']) for q, r in zip(queries, results)
+                if q[0].startswith('resolve_name') and r.get('status') in ('TIMEOUT', 'UNREACHABLE')]
+
+    def report_unanswered(self, res, unanswered):
+        """
+        Fail a check if any of its forward lookups got no answer - whatever
+        the check made of the TIMEOUT or UNREACHABLE status - with a message
+        naming the lookups and servers. A check with UNREACHABLE lookups is
+        also marked with ``short_circuited`` set to True.
+
+        @param res result dict of the check
+        @param unanswered list of (name, server, status) forward lookups
+        """
+        if not unanswered:
+            return res
+        messages = []
+        for name, server, status in unanswered:
+            label = ''
+            if server == self.config.server_prod:
+                label = ' (PROD)'
+            elif server == self.config.server_test:
+                label = ' (TEST)'
+            if status == 'TIMEOUT':
+                messages.append("TIMEOUT: no response for %s from %s%s" % (name, server, label))
+            else:
+                messages.append("UNREACHABLE: %s not queried, %s has stopped answering%s" % (name, server, label))
+                res['short_circuited'] = True
+        res['result'] = False
+        res['message'] = "; ".join(messages)
+        return res
+
+    async def run_async(self, check, *args):
+        """
+        Coroutine to run the named check (i.e. 'check_added_name') with
+        concurrent lookups, and return its result dict.
+
+        @param check name of the check method
+        @param args arguments to the check method
+        """
+        if check.startswith('verify_'):
+            res, serials = self.reusable_result(check, args)
+            if res is None:
+                res = await self.run_plan_async(getattr(self, 'plan_' + check)(*args, speculate=True))
+            self.remember_result(check, args, serials, res)
+            return res
+        return await self.run_plan_async(getattr(self, 'plan_' + check)(*args, speculate=True))
+
+    def run_verify(self, check, *args):
+        """
+        Run the named verify check (i.e. 'verify_added_name') with run_plan(),
+        unless its result from the last run can be reused, and return its
+        result dict.
+
+        @param check name of the check method
+        @param args arguments to the check method
+        """
+        res, serials = self.reusable_result(check, args)
+        if res is None:
+            res = self.run_plan(getattr(self, 'plan_' + check)(*args))
+        self.remember_result(check, args, serials, res)
+        return res
+
+    def check_names(self, args):
+        """
+        return the names a check with the given arguments looks up: each
+        hostname as a FQDN, and the reverse name of each IP address
+        """
+        names = []
+        for a in args:
+            if self.ip_regex.match(a):
+                names.append(reverse_name(a))
+            elif a.find('.') == -1:
+                names.append(normalize(a + self.config.default_domain))
+            else:
+                names.append(normalize(a))
+        return names
+
+    def reusable_result(self, check, args):
+        """
+        Return (result, serials) for a verify check: its stored result from
+        the last run, if every name it looks up is in a zone that was
+        updated incrementally from the serial the result was stored at, and
+        none of the changes since could affect them, otherwise None; and
+        the {(server, zone): serial} of the zones holding those names, or
+        None if any of them isn't in a zone transferred from both servers.
+        """
+        if self.results is None:
+            return (None, None)
+        names = self.check_names(args)
+        serials = {}
+        for server in (self.config.server_test, self.config.server_prod):
+            snap = self.DNS.snapshots.get(server)
+            for name in names:
+                z = None if snap is None else snap.zone_for(name)
+                if z is None:
+                    return (None, None)
+                serials[(server, z.name)] = z.serial
+        stored = self.results.load((check, args))
+        if stored is None:
+            return (None, serials)
+        old_serials, res = stored
+        for key in serials:
+            delta = self.deltas.get(key)
+            if delta is None or old_serials.get(key) != delta.base:
+                return (None, serials)
+            if any(delta.affects(name) for name in names):
+                return (None, serials)
+        return (res, serials)
+
+    def remember_result(self, check, args, serials, res):
+        """
+        store the result of a verify check for the next run, if its names
+        were all looked up in zones transferred from both servers
+        """
+        if self.results is not None and serials is not None:
+            # the timing of this run's lookups won't apply to the next
+            res = dict((k, v) for k, v in res.items() if k != 'timing')
+            self.results.save((check, args), serials, res)
+
+    def speculative_reverse(self, addr, enabled=True):
+        """
+        Return the list of addresses to speculatively reverse-lookup up front,
+        alongside the forward lookups - addr, if it's an IP address.
+
+        @param addr expected address of the record
+        @param enabled False to skip speculation
+        """
+        if enabled and self.ip_regex.match(addr):
+            return [addr]
+        return []
+
+    def lookup_reverse_step(self, speculative, addr, server):
+        """
+        Query plan step for a reverse lookup of addr; uses the result of a
+        speculative lookup if one was made for addr, otherwise queries it.
+
+        @param speculative dict of address to speculative reverse lookup result
+        @param addr address to look up
+        @param server server to query
+        """
+        if addr in speculative:
+            return speculative[addr]
+        results = yield [('lookup_reverse', addr, server)]
+        return results[0]
+
     def check_removed_name(self, n):
         """
         Test a removed name
 
         @param n name that should be removed
         """
+        return self.run_plan(self.plan_check_removed_name(n))
+
+    def plan_check_removed_name(self, n, speculate=False):
+        """ query plan for check_removed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         # make sure we have a FQDN
@@ -83,11 +498,11 @@ class DNStestChecks:
 
         # resolve with both test and prod
         if is_ip:
-            qt = self.DNS.lookup_reverse(name, self.config.server_test)
-            qp = self.DNS.lookup_reverse(name, self.config.server_prod)
+            qt, qp = yield [('lookup_reverse', name, self.config.server_test),
+                            ('lookup_reverse', name, self.config.server_prod)]
         else:
-            qt = self.DNS.resolve_name(name, self.config.server_test)
-            qp = self.DNS.resolve_name(name, self.config.server_prod)
+            qt, qp = yield [('resolve_name', name, self.config.server_test),
+                            ('resolve_name', name, self.config.server_prod)]
 
         if 'status' in qp:
             res['result'] = False
@@ -101,7 +516,7 @@ class DNStestChecks:
             res['secondary'].append("PROD value was %s (PROD)" % qp['answer']['data'])
             # check for any leftover reverse lookups
             if is_ip is False:
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_test)
+                rev = yield from self.lookup_reverse_step({}, qp['answer']['data'], self.config.server_test)
                 if 'answer' in rev:
                     if rev['answer']['data'] == name:
                         res['warnings'].append("REVERSE NG: %s appears to still have reverse DNS set to %s (TEST)" % (qp['answer']['data'], rev['answer']['data']))
@@ -121,6 +536,10 @@ class DNStestChecks:
 
         @param n name that was removed
         """
+        return self.run_verify('verify_removed_name', n)
+
+    def plan_verify_removed_name(self, n, speculate=False):
+        """ query plan for verify_removed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         # make sure we have a FQDN
@@ -133,11 +552,11 @@ class DNStestChecks:
 
         # resolve with both test and prod
         if is_ip:
-            qt = self.DNS.lookup_reverse(name, self.config.server_test)
-            qp = self.DNS.lookup_reverse(name, self.config.server_prod)
+            qt, qp = yield [('lookup_reverse', name, self.config.server_test),
+                            ('lookup_reverse', name, self.config.server_prod)]
         else:
-            qt = self.DNS.resolve_name(name, self.config.server_test)
-            qp = self.DNS.resolve_name(name, self.config.server_prod)
+            qt, qp = yield [('resolve_name', name, self.config.server_test),
+                            ('resolve_name', name, self.config.server_prod)]
 
         if 'status' in qp and qp['status'] == "NXDOMAIN":
             res['result'] = True
@@ -160,6 +579,10 @@ class DNStestChecks:
         @param newn new name
         @param value the record value (should be unchanged)
         """
+        return self.run_plan(self.plan_check_renamed_name(n, newn, value))
+
+    def plan_check_renamed_name(self, n, newn, value, speculate=False):
+        """ query plan for check_renamed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         newname = newn
@@ -172,16 +595,27 @@ class DNStestChecks:
         if newval.find('.') == -1:
             newval = newval + self.config.default_domain
 
+        # resolve the old name in test, then the new name in test and the
+        # old name in prod; when speculating, all of them at once
+        spec = self.speculative_reverse(value, speculate)
+        first = [('resolve_name', name, self.config.server_test)]
+        rest = ([('resolve_name', newname, self.config.server_test),
+                 ('resolve_name', name, self.config.server_prod)] +
+                [('lookup_reverse', a, self.config.server_test) for a in spec])
+        results = yield (first + rest if speculate else first)
+        qt_old = results[0]
+
         # make sure the old name is gone
-        qt_old = self.DNS.resolve_name(name, self.config.server_test)
         if 'answer' in qt_old:
             res['message'] = "%s got answer from TEST (%s), old name is still active (TEST)" % (n, qt_old['answer']['data'])
             res['result'] = False
             return res
 
-        # resolve with both test and prod
-        qt = self.DNS.resolve_name(newname, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        if not speculate:
+            results = [qt_old] + (yield rest)
+        qt, qp = results[1:3]
+        speculative = dict(zip(spec, results[3:]))
+
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD - cannot change a name that doesn't exist (PROD)" % (n, qp['status'])
@@ -206,7 +640,7 @@ class DNStestChecks:
             res['message'] = "rename %s => %s (TEST)" % (n, newn)
             # check for any leftover reverse lookups
             if qt['answer']['typename'] == 'A' or qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qt['answer']['data'], self.config.server_test)
+                rev = yield from self.lookup_reverse_step(speculative, qt['answer']['data'], self.config.server_test)
                 if 'answer' in rev:
                     if rev['answer']['data'] == newn or rev['answer']['data'] == newname:
                         res['secondary'].append("REVERSE OK: reverse DNS is set correctly for %s (TEST)" % qt['answer']['data'])
@@ -224,6 +658,10 @@ class DNStestChecks:
         @param newn new name
         @param value the record value (should be unchanged)
         """
+        return self.run_verify('verify_renamed_name', n, newn, value)
+
+    def plan_verify_renamed_name(self, n, newn, value, speculate=False):
+        """ query plan for verify_renamed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         newname = newn
@@ -237,9 +675,13 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(newname, self.config.server_test)
-        qp = self.DNS.resolve_name(newname, self.config.server_prod)
-        qp_old = self.DNS.resolve_name(name, self.config.server_prod)
+        spec = self.speculative_reverse(value, speculate)
+        results = yield ([('resolve_name', newname, self.config.server_test),
+                          ('resolve_name', newname, self.config.server_prod),
+                          ('resolve_name', name, self.config.server_prod)] +
+                         [('lookup_reverse', a, self.config.server_prod) for a in spec])
+        qt, qp, qp_old = results[:3]
+        speculative = dict(zip(spec, results[3:]))
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s (PROD)" % (newn, qp['status'])
@@ -260,7 +702,7 @@ class DNStestChecks:
             res['message'] = "rename %s => %s (PROD)" % (n, newn)
             # check for any leftover reverse lookups
             if qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_prod)
+                rev = yield from self.lookup_reverse_step(speculative, qp['answer']['data'], self.config.server_prod)
                 if 'answer' in rev:
                     if rev['answer']['data'] == newn or rev['answer']['data'] == newname:
                         res['secondary'].append("REVERSE OK: reverse DNS is set correctly for %s (PROD)" % qp['answer']['data'])
@@ -277,6 +719,10 @@ class DNStestChecks:
         @param n name
         @param value record value
         """
+        return self.run_plan(self.plan_check_added_name(n, value))
+
+    def plan_check_added_name(self, n, value, speculate=False):
+        """ query plan for check_added_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         # make sure we have a FQDN
@@ -288,8 +734,12 @@ class DNStestChecks:
             target = target + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        spec = self.speculative_reverse(value, speculate and self.config.have_reverse_dns)
+        results = yield ([('resolve_name', name, self.config.server_test),
+                          ('resolve_name', name, self.config.server_prod)] +
+                         [('lookup_reverse', a, self.config.server_test) for a in spec])
+        qt, qp = results[:2]
+        speculative = dict(zip(spec, results[2:]))
         # make sure PROD returns NXDOMAIN, since it's a new record
         if 'status' in qp:
             if qp['status'] != 'NXDOMAIN':
@@ -313,7 +763,7 @@ class DNStestChecks:
                 res['secondary'].append("PROD server returns NXDOMAIN for %s (PROD)" % n)
             # check reverse DNS if we say to
             if self.config.have_reverse_dns and qt['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(value, self.config.server_test)
+                rev = yield from self.lookup_reverse_step(speculative, value, self.config.server_test)
                 if 'status' in rev:
                     res['warnings'].append("REVERSE NG: got status %s for name %s (TEST)" % (rev['status'], value))
                 elif rev['answer']['data'] == n or rev['answer']['data'] == name:
@@ -332,6 +782,10 @@ class DNStestChecks:
         @param n name
         @param value record value
         """
+        return self.run_verify('verify_added_name', n, value)
+
+    def plan_verify_added_name(self, n, value, speculate=False):
+        """ query plan for verify_added_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         # make sure we have a FQDN
@@ -342,8 +796,12 @@ class DNStestChecks:
         if target.find('.') == -1:
             target = target + self.config.default_domain
 
-        # resolve with both test and prod
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        # resolve with prod
+        spec = self.speculative_reverse(value, speculate and self.config.have_reverse_dns)
+        results = yield ([('resolve_name', name, self.config.server_prod)] +
+                         [('lookup_reverse', a, self.config.server_prod) for a in spec])
+        qp = results[0]
+        speculative = dict(zip(spec, results[1:]))
 
         # check the answer we got back from PROD
         if 'answer' in qp:
@@ -355,7 +813,7 @@ class DNStestChecks:
                 res['message'] = "%s resolves to %s instead of %s (PROD)" % (n, qp['answer']['data'], value)
             # check reverse DNS if we say to
             if self.config.have_reverse_dns and qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(value, self.config.server_prod)
+                rev = yield from self.lookup_reverse_step(speculative, value, self.config.server_prod)
                 if 'status' in rev:
                     res['warnings'].append("REVERSE NG: got status %s for name %s (PROD)" % (rev['status'], value))
                 elif rev['answer']['data'] == n or rev['answer']['data'] == name:
@@ -374,6 +832,10 @@ class DNStestChecks:
         @param n name to change
         @param val new value
         """
+        return self.run_plan(self.plan_check_changed_name(n, val))
+
+    def plan_check_changed_name(self, n, val, speculate=False):
+        """ query plan for check_changed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         newval = val
@@ -384,8 +846,12 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        spec = self.speculative_reverse(val, speculate)
+        results = yield ([('resolve_name', name, self.config.server_test),
+                          ('resolve_name', name, self.config.server_prod)] +
+                         [('lookup_reverse', a, self.config.server_test) for a in spec])
+        qt, qp = results[:2]
+        speculative = dict(zip(spec, results[2:]))
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD - cannot change a name that doesn't exist (PROD)" % (n, qp['status'])
@@ -410,7 +876,7 @@ class DNStestChecks:
             res['message'] = "change %s from '%s' to '%s' (TEST)" % (n, qp['answer']['data'], qt['answer']['data'])
             # check for any leftover reverse lookups
             if qt['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qt['answer']['data'], self.config.server_test)
+                rev = yield from self.lookup_reverse_step(speculative, qt['answer']['data'], self.config.server_test)
                 if 'answer' in rev:
                     if rev['answer']['data'] == name or rev['answer']['data'] == n:
                         res['secondary'].append("REVERSE OK: %s => %s (TEST)" % (qt['answer']['data'], rev['answer']['data']))
@@ -429,6 +895,10 @@ class DNStestChecks:
         @param n name to change
         @param val new value
         """
+        return self.run_verify('verify_changed_name', n, val)
+
+    def plan_verify_changed_name(self, n, val, speculate=False):
+        """ query plan for verify_changed_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         newval = val
@@ -439,8 +909,12 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        spec = self.speculative_reverse(val, speculate)
+        results = yield ([('resolve_name', name, self.config.server_test),
+                          ('resolve_name', name, self.config.server_prod)] +
+                         [('lookup_reverse', a, self.config.server_prod) for a in spec])
+        qt, qp = results[:2]
+        speculative = dict(zip(spec, results[2:]))
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD (PROD)" % (n, qp['status'])
@@ -459,7 +933,7 @@ class DNStestChecks:
             res['message'] = "change %s value to '%s' (PROD)" % (n, qp['answer']['data'])
             # check for bad reverse DNS
             if qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_prod)
+                rev = yield from self.lookup_reverse_step(speculative, qp['answer']['data'], self.config.server_prod)
                 if 'answer' in rev:
                     if rev['answer']['data'] == n or rev['answer']['data'] == name:
                         res['secondary'].append("REVERSE OK: %s => %s (PROD)" % (qp['answer']['data'], rev['answer']['data']))
@@ -479,6 +953,10 @@ class DNStestChecks:
 
         @param n name
         """
+        return self.run_plan(self.plan_confirm_name(n))
+
+    def plan_confirm_name(self, n, speculate=False):
+        """ query plan for confirm_name() """
         res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
         name = n
         # make sure we have a FQDN
@@ -486,8 +964,8 @@ class DNStestChecks:
             name = name + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [('resolve_name', name, self.config.server_test),
+                        ('resolve_name', name, self.config.server_prod)]
         if 'status' in qt:
             if 'status' not in qp:
                 res['message'] = "test server returned status %s for name %s, but prod returned valid answer of %s" % (qt['status'], n, qp['answer']['data'])
@@ -536,3 +1014,231 @@ class DNStestChecks:
         res['secondary'].append("response: %s" % dns_dict_to_string(qp['answer']))
         res['result'] = True
         return res
+
+    def confirm_all_name(self, n):
+        """
+        Confirms that the given name returns the same result
+        on every server in config.confirm_all_servers().
+
+        @param n name
+        """
+        return self.run_plan(self.plan_confirm_all_name(n))
+
+    def plan_confirm_all_name(self, n, speculate=False):
+        """ query plan for confirm_all_name() """
+        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        name = n
+        # make sure we have a FQDN
+        if name.find('.') == -1:
+            name = name + self.config.default_domain
+        servers = self.config.confirm_all_servers()
+
+        # resolve the name, and the serial of its zone, on every server at once
+        results = yield ([('resolve_name_direct', name, s) for s in servers] +
+                         [('lookup_soa_serial', name, s) for s in servers])
+        answers = results[:len(servers)]
+        serials = [r.get('serial', r.get('status')) for r in results[len(servers):]]
+
+        # group the servers by the response they returned
+        groups = []
+        for server, a in zip(servers, answers):
+            if 'answer' in a:
+                a = dict(a['answer'])
+                if self.config.ignore_ttl:
+                    a.pop('ttl', None)
+                desc = dns_dict_to_string(a)
+            else:
+                desc = "status %s" % a['status']
+            for g in groups:
+                if g[0] == desc:
+                    g[1].append(server)
+                    break
+            else:
+                groups.append((desc, [server]))
+
+        if len(groups) == 1:
+            res['message'] = "all %d servers return same response for '%s'" % (len(servers), n)
+            res['secondary'].append("response: %s" % groups[0][0])
+            if len(set(serials)) == 1:
+                res['secondary'].append("SOA serial %s on all servers" % serials[0])
+            else:
+                for server, serial in zip(servers, serials):
+                    res['secondary'].append("%s: SOA serial %s" % (server, serial))
+            res['result'] = True
+            return res
+
+        # the servers not giving the most common response disagree
+        majority = max(groups, key=lambda g: len(g[1]))
+        disagree = [s for s in servers if s not in majority[1]]
+        res['message'] = "%d of %d servers disagree for '%s': %s" % (
+            len(disagree), len(servers), n, ", ".join(disagree))
+        for server, serial in zip(servers, serials):
+            desc = [g[0] for g in groups if server in g[1]][0]
+            res['secondary'].append("%s%s: %s (SOA serial %s)" % (
+                "NG " if server in disagree else "", server, desc, serial))
+        res['result'] = False
+        return res
+
+    def confirm_zone(self, zone, prod_file=None, test_file=None):
+        """
+        Compares a whole zone on PROD and TEST, RRset by RRset.
+
+        Both zones are sorted into canonical order (spilling to temporary
+        files, so zones of any size fit in memory) and a Merkle tree of
+        digests is built over each (pydnstest.zonedigest). If the roots
+        match, the zones are the same; otherwise only the RRsets in the
+        buckets whose digests differ are merge-joined. With persistent_cache
+        set the trees are kept between runs, and a zone whose SOA serial
+        hasn't changed since isn't transferred again.
+
+        Yields a result dict for each RRset added, removed or changed on
+        TEST, then one for the zone as a whole.
+
+        @param zone name of the zone
+        @param prod_file path of a zone file to read the PROD zone from,
+          instead of transferring it (AXFR) from the PROD server
+        @param test_file path of a zone file to read the TEST zone from
+        """
+        ignore_ttl = self.config.ignore_ttl
+        store = None
+        if self.config.persistent_cache:
+            store = DigestStore(self.config.cache_file(), refresh=self.config.refresh_cache)
+        sides = [{'label': 'prod', 'server': self.config.server_prod, 'file': prod_file},
+                 {'label': 'test', 'server': self.config.server_test, 'file': test_file}]
+        reused = []
+        counts = {'same': 0, 'added': 0, 'removed': 0, 'changed': 0}
+        try:
+            for side in sides:
+                side['records'] = None
+                side['tree'] = None
+                if store is not None and side['file'] is None:
+                    tree = store.load(side['server'], zone, ignore_ttl)
+                    if tree is not None and tree.serial is not None and tree.serial == self.current_serial(zone, side['server']):
+                        side['tree'] = tree
+                        reused.append("%s: serial %s unchanged since last run, not transferred" % (side['label'], tree.serial))
+            if None in (sides[0]['tree'], sides[1]['tree']) or sides[0]['tree'].root != sides[1]['tree'].root:
+                for side in sides:
+                    try:
+                        side['records'] = self.sorted_zone(zone, side['server'], side['file'])
+                    except (DNS.DNSError, WireError, ZoneFileError, OSError) as e:
+                        res = {'result': False, 'message': None, 'secondary': [], 'warnings': []}
+                        res['message'] = "could not read zone '%s' from %s: %s" % (zone, side['label'], e)
+                        yield res
+                        return
+                    if side['tree'] is None:
+                        side['tree'] = DigestTree.from_rrsets(iter_rrsets(side['records']), zone, ignore_ttl,
+                                                              side['records'].count)
+                        if store is not None and side['file'] is None:
+                            store.save(side['server'], zone, side['tree'])
+            prod, test = sides[0]['tree'], sides[1]['tree']
+            buckets, compared = prod.diff(test)
+            if buckets:
+                # merge-join just the RRsets in the buckets that differ
+                wanted = set(buckets)
+                prod_rrsets, test_rrsets = [(r for r in iter_rrsets(side['records']) if DigestTree.bucket(r['name']) in wanted)
+                                            for side in sides]
+                for change, p, t in diff_zones(prod_rrsets, test_rrsets, ignore_ttl):
+                    counts[change] += 1
+                    if change != 'same':
+                        yield self.zone_change(change, p, t)
+        finally:
+            for side in sides:
+                if side.get('records') is not None:
+                    side['records'].close()
+            if store is not None:
+                store.close()
+
+        # the RRsets in the buckets whose digests matched are the same
+        wanted = set(buckets)
+        counts['same'] += sum(c for i, c in enumerate(prod.counts) if i not in wanted)
+        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        total = sum(counts.values())
+        if counts['same'] == total:
+            res['message'] = "prod and test servers return same zone '%s'" % zone
+            res['result'] = True
+        else:
+            res['message'] = "%d of %d RRsets differ in zone '%s'" % (total - counts['same'], total, zone)
+            res['result'] = False
+        res['secondary'].append("%d RRsets: %d added, %d removed, %d changed on test" % (
+            total, counts['added'], counts['removed'], counts['changed']))
+        res['secondary'].append("%d records from prod, %d from test" % (prod.records, test.records))
+        if buckets:
+            res['secondary'].append("%d of %d digest buckets differ (%d digests compared)" % (
+                len(buckets), DigestTree.buckets(), compared))
+        else:
+            res['secondary'].append("zone digest %s on both" % prod.root[:16])
+        res['secondary'].extend(reused)
+        yield res
+
+    def current_serial(self, zone, server):
+        """
+        Return the SOA serial of a zone on a server, queried directly
+        (never from the cache), or None if it didn't answer with one
+        """
+        try:
+            return soa_serial(self.DNS.attempt(zone, server, 'SOA')).get('serial')
+        except DNS.DNSError:
+            return None
+
+    def wait_for_serial(self, zone, serial, timeout, interval=1.0, max_interval=30.0):
+        """
+        Poll the SOA serial of a zone on the PROD server until it is at
+        least ``serial``, waiting ``interval`` seconds after the first poll
+        and doubling the wait each time up to ``max_interval``, for at most
+        ``timeout`` seconds in all. Returns a result dict, with result True
+        once PROD has the serial, False if it didn't within the timeout.
+
+        @param zone name of the zone
+        @param serial serial to wait for
+        @param timeout total seconds to wait
+        """
+        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        start = time.time()
+        polls = 0
+        while True:
+            current = self.current_serial(zone, self.config.server_prod)
+            polls += 1
+            elapsed = time.time() - start
+            if current is not None and serial_at_least(current, serial):
+                res['result'] = True
+                res['message'] = "PROD has serial %d for zone '%s' (waited for %d)" % (current, zone, serial)
+                break
+            if elapsed >= timeout:
+                res['result'] = False
+                res['message'] = "PROD still has serial %s for zone '%s' after %g seconds, waited for %d" % (
+                    current, zone, timeout, serial)
+                break
+            # the last poll is at the timeout
+            time.sleep(min(interval, timeout - elapsed))
+            interval = min(interval * 2, max_interval)
+        res['secondary'].append("%d SOA queries to %s over %.1f seconds" % (polls, self.config.server_prod, elapsed))
+        return res
+
+    def sorted_zone(self, zone, server, zone_file=None):
+        """
+        Return a zone's records as a pydnstest.zonediff.SortedRecords, read
+        from zone_file if given, otherwise transferred (AXFR) from server.
+        """
+        if zone_file is not None:
+            with open(zone_file, 'r') as fh:
+                return SortedRecords(iter_zone_file(fh, zone))
+        return SortedRecords(iter_axfr(zone, server, timeout=self.DNS.retry.get(server).timeout))
+
+    def zone_change(self, change, p, t):
+        """
+        Return the result dict for an RRset added, removed or changed on TEST
+        """
+        res = {'result': False, 'message': None, 'secondary': [], 'warnings': []}
+        rrset = p if t is None else t
+        desc = "'%s %s'" % (rrset['name'], rrset['typename'])
+        if change == 'added':
+            res['message'] = "RRset %s only on test server (added)" % desc
+        elif change == 'removed':
+            res['message'] = "RRset %s only on prod server (removed)" % desc
+        else:
+            res['message'] = "RRset %s differs between prod and test" % desc
+        if p is not None:
+            res['secondary'].extend("PROD: %s" % r for r in rrset_text(p))
+        if t is not None:
+            res['secondary'].extend("TEST: %s" % r for r in rrset_text(t))
+        return res
@@ -0,0 +1,217 @@
+"""
+Adaptive (AIMD) limits on in-flight queries per server for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+from collections import deque
+
+
+class AIMDLimit(object):
+    """
+    Limit on the number of queries in flight to one server, adjusted with
+    additive-increase / multiplicative-decrease like TCP congestion control.
+
+    Until the first congestion signal the limit grows by one per successful
+    reply ("slow start", doubling each round trip); after that it grows by
+    ``increase`` per round trip, as long as the reply's RTT stays within
+    ``rtt_tolerance`` times the lowest RTT seen. A timeout, SERVFAIL or
+    REFUSED reply cuts the limit by ``decrease`` - at most once per round
+    trip, as only queries sent after the last cut can trigger the next one.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=256, increase=1.0,
+                 decrease=0.5, rtt_tolerance=2.0, clock=time.monotonic):
+        """
+        @param initial starting limit
+        @param minimum lowest the limit can be cut to
+        @param maximum highest the limit can grow to
+        @param increase amount the limit grows by per round trip
+        @param decrease factor the limit is multiplied by on congestion
+        @param rtt_tolerance multiple of the lowest RTT seen, above which
+          replies no longer grow the limit
+        @param clock callable returning the current time in seconds
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.rtt_tolerance = rtt_tolerance
+        self.clock = clock
+        self.in_flight = 0
+        self.waiters = deque()
+        self.min_rtt = None
+        self.last_cut = None
+        self.cuts = 0
+
+    def available(self):
+        """ return True if another query may be sent now """
+        return self.in_flight < max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        """
+        await a free slot, and return the time it was taken; pass that to
+        release() once the query completes
+        """
+        if self.available() and not self.waiters:
+            self.in_flight += 1
+            return self.clock()
+        fut = asyncio.get_event_loop().create_future()
+        self.waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # the slot was handed to us just as we were cancelled
+                self.in_flight -= 1
+                self.wake()
+            raise
+        return self.clock()
+
+    def release(self, started, rtt=None, congested=False):
+        """
+        give back a slot, adjusting the limit for how the query went
+
+        @param started time returned by acquire()
+        @param rtt seconds the query took, if it got a reply
+        @param congested True if the query timed out or was answered
+          with SERVFAIL or REFUSED
+        """
+        self.in_flight -= 1
+        if congested:
+            self.cut(started)
+        elif rtt is not None:
+            self.grow(rtt)
+        self.wake()
+
+    def grow(self, rtt):
+        """ raise the limit after a reply that took rtt seconds """
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        if rtt > self.min_rtt * self.rtt_tolerance:
+            return
+        if self.last_cut is None:
+            self.limit += 1
+        else:
+            self.limit += self.increase / self.limit
+        self.limit = min(self.limit, float(self.maximum))
+
+    def cut(self, started):
+        """ lower the limit after a query sent at started was congested """
+        if self.last_cut is not None and started < self.last_cut:
+            # sent before the last cut; that already accounted for it
+            return
+        self.limit = max(float(self.minimum), self.limit * self.decrease)
+        self.last_cut = self.clock()
+        self.cuts += 1
+
+    def wake(self):
+        """ hand free slots to waiting acquire() calls, in order """
+        while self.waiters and self.available():
+            fut = self.waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1
+                fut.set_result(None)
+
+
+class AdaptiveConcurrency(object):
+    """
+    AIMDLimits by server, created on the first query to each one.
+    """
+
+    # response statuses treated as a signal to back off
+    congestion_statuses = ('SERVFAIL', 'REFUSED')
+
+    def __init__(self, **kwargs):
+        """
+        keyword arguments are passed on to each AIMDLimit
+        """
+        self.kwargs = kwargs
+        self.limits = {}
+
+    def limit_for(self, server):
+        """ return the AIMDLimit for server """
+        if server not in self.limits:
+            self.limits[server] = AIMDLimit(**self.kwargs)
+        return self.limits[server]
+
+    async def acquire(self, server):
+        """ await a free slot for a query to server; see AIMDLimit.acquire() """
+        return await self.limit_for(server).acquire()
+
+    def release(self, server, started, rtt=None, status=None, timed_out=False):
+        """
+        give back a query's slot; only a timeout or a congestion status
+        cuts the limit, so a query that was cancelled (i.e. the losing
+        query of a parallel lookup or a hedge) or failed some other way
+        just frees its slot
+
+        @param server server hostname or IP address
+        @param started time returned by acquire()
+        @param rtt seconds the query took, or None if it got no reply
+        @param status response status, i.e. 'NOERROR'
+        @param timed_out True if the query timed out
+        """
+        self.limit_for(server).release(
+            started, rtt, congested=(timed_out or status in self.congestion_statuses))
+
+    def stats(self):
+        """
+        return a dict of server to a dict of the current ``limit``, lowest
+        RTT seen in milliseconds (``min_rtt_ms``) and number of ``cuts``
+        """
+        res = {}
+        for server, l in self.limits.items():
+            res[server] = {
+                'limit': max(l.minimum, int(l.limit)),
+                'min_rtt_ms': None if l.min_rtt is None else round(l.min_rtt * 1000, 1),
+                'cuts': l.cuts,
+            }
+        return res
+
+    def summary(self):
+        """
+        return a one-line description of the live limit on each server,
+        or None if no queries have been sent
+        """
+        if not self.limits:
+            return None
+        s = self.stats()
+        return ", ".join("%s %d in flight (%d cuts)" % (server, s[server]['limit'], s[server]['cuts'])
+                         for server in sorted(s))
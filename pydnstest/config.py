@@ -48,16 +48,46 @@ if sys.version_info[0] == 3:
 else:
     import ConfigParser
 
+# Ways DNStestDNS.resolve_name() can find a CNAME:
+# - single: send only an A query; authoritative servers answer an A query for
+#   an alias with the CNAME record itself, so one round trip is enough
+# - parallel: send A and CNAME queries at the same time, and use the first
+#   response with an answer (DNStestAsyncDNS only; same as fallback otherwise)
+# - fallback: send an A query, then a CNAME query if the A query got no answer
+RESOLVE_MODES = ('single', 'parallel', 'fallback')
+
 
 class DnstestConfig():
 
     conf_file = os.path.expanduser("~/.dnstest.ini")  # default value
     server_prod = ""
+    servers_prod = []  # all PROD servers, if more than one; server_prod is the first
     server_test = ""
+    confirm_servers = []
+    transport_prod = 'udp'
+    transport_test = 'udp'
+    qps_prod = 0.0
+    qps_test = 0.0
+    burst_prod = 1
+    burst_test = 1
+    timeout_prod = 5.0
+    timeout_test = 5.0
+    retries_prod = 2
+    retries_test = 2
+    retry_backoff_prod = 0.5
+    retry_backoff_test = 0.5
     have_reverse_dns = True
     default_domain = ""
     ignore_ttl = False
     sleep = 0.0
+    resolve_mode = 'single'
+    cache_size = 1000
+    persistent_cache = False
+    breaker_threshold = 5
+    breaker_reset = 30.0
+    axfr_zones = []
+    refresh_cache = False  # set from the command line, not the config file
+    refresh_responses = False  # ignore stored responses only; set by main()
 
     ipaddr_re = None
     bool_t_re = None
@@ -76,10 +106,49 @@ class DnstestConfig():
         return a dictionary of all configuration options.
         """
         d = {'servers': {'prod': self.server_prod, 'test': self.server_test},
+             'prod_servers': self.prod_servers(),
+             'confirm_servers': self.confirm_servers,
+             'transport': {'prod': self.transport_prod, 'test': self.transport_test},
+             'qps': {'prod': self.qps_prod, 'test': self.qps_test},
+             'burst': {'prod': self.burst_prod, 'test': self.burst_test},
+             'timeout': {'prod': self.timeout_prod, 'test': self.timeout_test},
+             'retries': {'prod': self.retries_prod, 'test': self.retries_test},
+             'retry_backoff': {'prod': self.retry_backoff_prod, 'test': self.retry_backoff_test},
              'have_reverse_dns': self.have_reverse_dns, 'default_domain': self.default_domain,
-             'ignore_ttl': self.ignore_ttl, 'sleep': 0.0}
+             'ignore_ttl': self.ignore_ttl, 'sleep': 0.0,
+             'resolve_mode': self.resolve_mode, 'cache_size': self.cache_size,
+             'persistent_cache': self.persistent_cache,
+             'breaker_threshold': self.breaker_threshold, 'breaker_reset': self.breaker_reset,
+             'axfr_zones': self.axfr_zones}
         return d
 
+    def prod_servers(self):
+        """
+        Returns the list of PROD servers; more than one if ``prod`` in the
+        config file is a comma-separated list
+        """
+        if self.servers_prod:
+            return list(self.servers_prod)
+        if self.server_prod:
+            return [self.server_prod]
+        return []
+
+    def confirm_all_servers(self):
+        """
+        Returns the list of servers to compare with --confirm-all; the
+        ``confirm_servers`` list if set, otherwise all the PROD servers
+        """
+        if self.confirm_servers:
+            return list(self.confirm_servers)
+        return self.prod_servers()
+
+    def cache_file(self):
+        """
+        Returns the path to the persistent cache file, next to the config
+        file; i.e. ~/.dnstest.cache for ~/.dnstest.ini
+        """
+        return os.path.splitext(self.conf_file)[0] + '.cache'
+
     def find_config_file(self):
         """
         Returns the absolute path to the dnstest config file, or
@@ -104,15 +173,74 @@ class DnstestConfig():
         Config.read(conf_file)
 
         try:
-            self.server_prod = Config.get("servers", "prod")
+            self.servers_prod = [p.strip() for p in Config.get("servers", "prod").split(",") if p.strip()]
         except:
-            self.server_prod = ""
+            self.servers_prod = []
+        self.server_prod = self.servers_prod[0] if self.servers_prod else ""
 
         try:
             self.server_test = Config.get("servers", "test")
         except:
             self.server_test = ""
 
+        try:
+            self.confirm_servers = [c.strip() for c in Config.get("servers", "confirm_servers").split(",") if c.strip()]
+        except:
+            self.confirm_servers = []
+
+        self.transport_prod = self.get_transport(Config, "prod")
+        self.transport_test = self.get_transport(Config, "test")
+
+        try:
+            self.qps_prod = Config.getfloat("servers", "prod_qps")
+        except:
+            self.qps_prod = 0.0
+
+        try:
+            self.qps_test = Config.getfloat("servers", "test_qps")
+        except:
+            self.qps_test = 0.0
+
+        try:
+            self.burst_prod = Config.getint("servers", "prod_burst")
+        except:
+            self.burst_prod = 1
+
+        try:
+            self.burst_test = Config.getint("servers", "test_burst")
+        except:
+            self.burst_test = 1
+
+        try:
+            self.timeout_prod = Config.getfloat("servers", "prod_timeout")
+        except:
+            self.timeout_prod = 5.0
+
+        try:
+            self.timeout_test = Config.getfloat("servers", "test_timeout")
+        except:
+            self.timeout_test = 5.0
+
+        try:
+            self.retries_prod = Config.getint("servers", "prod_retries")
+        except:
+            self.retries_prod = 2
+
+        try:
+            self.retries_test = Config.getint("servers", "test_retries")
+        except:
+            self.retries_test = 2
+
+        try:
+            self.retry_backoff_prod = Config.getfloat("servers", "prod_retry_backoff")
+        except:
+            self.retry_backoff_prod = 0.5
+
+        try:
+            self.retry_backoff_test = Config.getfloat("servers", "test_retry_backoff")
+        except:
+            self.retry_backoff_test = 0.5
+
         try:
             self.default_domain = Config.get("defaults", "domain")
         except:
@@ -133,18 +261,86 @@ class DnstestConfig():
         except:
             self.sleep = 0.0
 
+        try:
+            self.resolve_mode = Config.get("defaults", "resolve_mode").strip().lower()
+        except:
+            self.resolve_mode = 'single'
+        if self.resolve_mode not in RESOLVE_MODES:
+            self.resolve_mode = 'single'
+
+        try:
+            self.cache_size = Config.getint("defaults", "cache_size")
+        except:
+            self.cache_size = 1000
+
+        try:
+            self.persistent_cache = Config.getboolean("defaults", "persistent_cache")
+        except:
+            self.persistent_cache = False
+
+        try:
+            self.breaker_threshold = Config.getint("defaults", "breaker_threshold")
+        except:
+            self.breaker_threshold = 5
+
+        try:
+            self.breaker_reset = Config.getfloat("defaults", "breaker_reset")
+        except:
+            self.breaker_reset = 30.0
+
+        try:
+            self.axfr_zones = [z.strip() for z in Config.get("defaults", "axfr_zones").split(",") if z.strip()]
+        except:
+            self.axfr_zones = []
+
         return True
 
+    def get_transport(self, Config, server):
+        """
+        return the transport ('udp' or 'tcp') configured for a server,
+        defaulting to 'udp'
+
+        :param Config: ConfigParser the config file was read into
+        :param server: 'prod' or 'test'
+        """
+        try:
+            transport = Config.get("servers", "%s_transport" % server).strip().lower()
+        except:
+            transport = 'udp'
+        if transport not in ('udp', 'tcp'):
+            transport = 'udp'
+        return transport
+
     def set_example_values(self):
         """
         Set config contents to example values.
         """
         self.server_prod = '1.2.3.4'
+        self.servers_prod = ['1.2.3.4']
         self.server_test = '1.2.3.5'
+        self.confirm_servers = []
+        self.transport_prod = 'udp'
+        self.transport_test = 'udp'
+        self.qps_prod = 0.0
+        self.qps_test = 0.0
+        self.burst_prod = 1
+        self.burst_test = 1
+        self.timeout_prod = 5.0
+        self.timeout_test = 5.0
+        self.retries_prod = 2
+        self.retries_test = 2
+        self.retry_backoff_prod = 0.5
+        self.retry_backoff_test = 0.5
         self.have_reverse_dns = True
         self.default_domain = '.example.com'
         self.ignore_ttl = False
         self.sleep = 0.0
+        self.resolve_mode = 'single'
+        self.cache_size = 1000
+        self.persistent_cache = False
+        self.breaker_threshold = 5
+        self.breaker_reset = 30.0
+        self.axfr_zones = []
 
     def to_string(self):
         """
@@ -154,12 +350,42 @@ class DnstestConfig():
         We do this manually (i.e. without configparser) to preserve comments.
         """
         s = """[servers]
-# the IP address of your production/live DNS server
+# the IP address of your production/live DNS server, or a comma-separated list
+# of equivalent ones (i.e. all authoritative servers for the zone) to spread
+# queries across, re-sending slow queries to a second server
 prod: {prod}
 
 # the IP address of your test/staging DNS server
 test: {test}
 
+# comma-separated list of servers to compare with --confirm-all; default all prod servers
+confirm_servers: {confirm_servers}
+
+# how to send queries to each server: 'udp' (falling back to TCP for truncated
+# responses) or 'tcp' (pipelined over one persistent connection); default udp
+prod_transport: {prod_transport}
+test_transport: {test_transport}
+
+# maximum (float) queries per second to send to each server; 0.0 for no limit; default 0.0
+prod_qps: {prod_qps}
+test_qps: {test_qps}
+
+# number of queries that may be sent to each server at once before the qps limit applies; default 1
+prod_burst: {prod_burst}
+test_burst: {test_burst}
+
+# (float) seconds to wait for each reply from each server; default 5.0
+prod_timeout: {prod_timeout}
+test_timeout: {test_timeout}
+
+# number of times to resend a query that timed out; default 2
+prod_retries: {prod_retries}
+test_retries: {test_retries}
+
+# (float) seconds to wait before the first resend, doubling for each one after; default 0.5
+prod_retry_backoff: {prod_retry_backoff}
+test_retry_backoff: {test_retry_backoff}
+
 [defaults]
 # True if you want to check ofr reverse DNS (for A records) by default, False otherwise
 have_reverse_dns: {have_reverse}
@@ -172,12 +398,53 @@ ignore_ttl: {ignore_ttl}
 
 # a (float) number of seconds to sleep between DNS tests; default 0.0
 sleep: {sleep}
-""".format(prod=self.server_prod,
+
+# how to find CNAMEs: 'single' (one A query; the server answers with the CNAME),
+# 'parallel' (A and CNAME queries at once) or 'fallback' (A, then CNAME); default single
+resolve_mode: {resolve_mode}
+
+# maximum number of DNS responses to cache (for their TTL) during a run; 0 to disable; default 1000
+cache_size: {cache_size}
+
+# True to keep PROD responses between runs (for their TTL) in a cache file next to this one, False otherwise
+persistent_cache: {persistent_cache}
+
+# number of consecutive timeouts from a server after which lookups to it fail
+# immediately (UNREACHABLE) instead of waiting; 0 to always wait; default 5
+breaker_threshold: {breaker_threshold}
+
+# (float) seconds to fail lookups to such a server before trying it again; default 30.0
+breaker_reset: {breaker_reset}
+
+# comma-separated list of zones to transfer (AXFR) from the prod and test servers
+# at the start of a run; lookups of names in them are answered from the transferred
+# copy instead of being queried one at a time. Both servers must allow transfers to us.
+axfr_zones: {axfr_zones}
+""".format(prod=", ".join(self.prod_servers()),
            test=self.server_test,
+           confirm_servers=", ".join(self.confirm_servers),
+           prod_transport=self.transport_prod,
+           test_transport=self.transport_test,
+           prod_qps=self.qps_prod,
+           test_qps=self.qps_test,
+           prod_burst=self.burst_prod,
+           test_burst=self.burst_test,
+           prod_timeout=self.timeout_prod,
+           test_timeout=self.timeout_test,
+           prod_retries=self.retries_prod,
+           test_retries=self.retries_test,
+           prod_retry_backoff=self.retry_backoff_prod,
+           test_retry_backoff=self.retry_backoff_test,
            have_reverse=str(self.have_reverse_dns),
            domain=self.default_domain,
            ignore_ttl=self.ignore_ttl,
-           sleep=self.sleep)
+           sleep=self.sleep,
+           resolve_mode=self.resolve_mode,
+           cache_size=self.cache_size,
+           persistent_cache=self.persistent_cache,
+           breaker_threshold=self.breaker_threshold,
+           breaker_reset=self.breaker_reset,
+           axfr_zones=", ".join(self.axfr_zones))
         return s
 
     def write(self):
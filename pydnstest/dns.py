@@ -40,37 +40,269 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import DNS
 
+from pydnstest.axfr import ZoneSnapshot, transfer_zone
+from pydnstest.breaker import ServerUnreachable
+from pydnstest.cache import cache_key
+from pydnstest.ixfr import iter_ixfr
+
+
+def soa_serial(response):
+    """
+    Returns {'serial': n} from the SOA record in a response to a SOA query -
+    in the answer section if the name is a zone apex, otherwise in the
+    authority section - or {'status': ...} if there is none.
+
+    @param response DNS.DnsResult, WireResponse or CachedResponse
+    """
+    for a in list(response.answers) + list(getattr(response, 'authority', [])):
+        if a['typename'] == 'SOA':
+            # SOA data is (mname, rname, ('serial', n), refresh, retry, expire, minimum)
+            return {'serial': a['data'][2][1]}
+    return {'status': response.header['status']}
+
+
+def serial_at_least(serial, target):
+    """
+    True if SOA serial ``serial`` is the same as or newer than ``target``,
+    in sequence space arithmetic (RFC 1982), so a serial that has wrapped
+    around past 2**32 - 1 is still newer.
+    """
+    return (serial - target) % 2 ** 32 < 2 ** 31
+
 
 class DNStestDNS:
 
-    def resolve_name(self, query, to_server, to_port=53):
+    resolve_mode = 'single'
+    cache = None
+    pool = None
+    limiter = None
+    retry = None
+    breaker = None
+    hedge = None
+    snapshots = None
+
+    def __init__(self, resolve_mode=None, cache=None, pool=None, limiter=None, retry=None,
+                 breaker=None, hedge=None, snapshots=None):
+        """
+        :param resolve_mode: one of pydnstest.config.RESOLVE_MODES, default 'single'
+        :param cache: pydnstest.cache.DNStestCache to answer repeated queries
+          from, or None to always query the server
+        :param pool: pydnstest.socketpool.DNSTransport (or UDPSocketPool or
+          TCPConnectionPool) to send queries through, or None to use a new
+          DNS.Request (and socket) per query
+        :param limiter: pydnstest.ratelimit.RateLimiter to pace queries to
+          each server, or None to send them as fast as possible
+        :param retry: pydnstest.retry.RetryPolicies setting the timeout and
+          retries for each server, or None to send each query once and wait
+          for the pool's (or DNS module's) default timeout
+        :param breaker: pydnstest.breaker.CircuitBreakers to fail queries
+          immediately to servers that have stopped answering, or None
+        :param hedge: dict of server to a pydnstest.hedge.HedgedServers; queries
+          to that server are sent to the servers in the group instead
+        :param snapshots: dict of server to a pydnstest.axfr.ZoneSnapshot of
+          zones transferred from it, to answer lookups for names in them
+          from; filled in by transfer_zone()
+        """
+        if resolve_mode is not None:
+            self.resolve_mode = resolve_mode
+        self.cache = cache
+        self.pool = pool
+        self.limiter = limiter
+        self.retry = retry
+        self.breaker = breaker
+        self.hedge = hedge or {}
+        self.snapshots = snapshots if snapshots is not None else {}
+
+    def transfer_zone(self, zone, to_server, to_port=53):
+        """
+        Transfer a zone from a server with AXFR into self.snapshots, so
+        lookups of names in it are answered without querying the server,
+        and return it as a pydnstest.axfr.Zone.
+
+        Raises pydnstest.axfr.TransferError if the server refuses the
+        transfer, DNS.TimeoutError or DNS.SocketError.
+        """
+        timeout = 30
+        if self.retry is not None:
+            timeout = self.retry.get(to_server).timeout
+        z = transfer_zone(zone, to_server, to_port, timeout)
+        self.snapshots.setdefault(to_server, ZoneSnapshot()).add_zone(z)
+        return z
+
+    def update_zone(self, z, to_server, to_port=53):
+        """
+        Bring a pydnstest.axfr.Zone transferred from a server earlier up to
+        date with IXFR, add it to self.snapshots, and return the list of
+        changes applied to it (see pydnstest.ixfr.iter_ixfr()).
+
+        Raises the same exceptions as transfer_zone().
+        """
+        timeout = 30
+        if self.retry is not None:
+            timeout = self.retry.get(to_server).timeout
+        changes = list(iter_ixfr(z.name, z.serial, to_server, to_port, timeout))
+        z.apply(changes)
+        self.snapshots.setdefault(to_server, ZoneSnapshot()).add_zone(z)
+        return changes
+
+    def resolve_name(self, query, to_server, to_port=53, direct=False):
+        """
+        Resolves a single name against the given server; returns
+        {'status': 'TIMEOUT'} if the server didn't answer, or
+        {'status': 'UNREACHABLE'} if its circuit breaker is open.
+        If direct is True, queries to_server itself even if it's in self.hedge.
+        Names in a zone transferred from the server are answered from
+        self.snapshots.
+        """
+        if to_server in self.snapshots:
+            r = self.snapshots[to_server].resolve_name(query)
+            if r is not None:
+                return r
+        try:
+            return self.resolve_name_once(query, to_server, to_port, direct)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
+
+    def resolve_name_direct(self, query, to_server, to_port=53):
         """
-        Resolves a single name against the given server
+        Resolves a single name against exactly the given server, never
+        hedging the query to another one
         """
+        return self.resolve_name(query, to_server, to_port, direct=True)
 
+    def resolve_name_once(self, query, to_server, to_port=53, direct=False):
         # first try an A record
-        s = DNS.Request(name=query, server=to_server, qtype='A', port=to_port)
-        a = s.req()
+        a = self.query(query, to_server, 'A', to_port, direct)
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
+        if self.resolve_mode == 'single':
+            return {'status': a.header['status']}
 
         # if that didnt work, try a CNAME
-        s = DNS.Request(name=query, server=to_server, qtype='CNAME', port=to_port)
-        a = s.req()
+        a = self.query(query, to_server, 'CNAME', to_port, direct)
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
         return {'status': a.header['status']}
 
+    def lookup_soa_serial(self, name, to_server, to_port=53):
+        """
+        Returns {'serial': n}, the serial of the zone holding name on exactly
+        the given server, or {'status': ...} if it returned no SOA record
+        """
+        try:
+            a = self.query(name, to_server, 'SOA', to_port, direct=True)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
+        return soa_serial(a)
+
     def lookup_reverse(self, name, to_server, to_port=53):
         """
-        convenience routine for doing a reverse lookup of an address
+        convenience routine for doing a reverse lookup of an address;
+        returns {'status': 'TIMEOUT'} if the server didn't answer, or
+        {'status': 'UNREACHABLE'} if its circuit breaker is open
         """
+        if to_server in self.snapshots:
+            r = self.snapshots[to_server].lookup_reverse(name)
+            if r is not None:
+                return r
         a = name.split('.')
         a.reverse()
         b = '.'.join(a) + '.in-addr.arpa'
 
-        s = DNS.Request(name=b, server=to_server, qtype='PTR', port=to_port)
-        a = s.req()
+        try:
+            a = self.query(b, to_server, 'PTR', to_port)
+        except DNS.TimeoutError:
+            return {'status': 'TIMEOUT'}
+        except ServerUnreachable:
+            return {'status': 'UNREACHABLE'}
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
         return {'status': a.header['status']}
+
+    def query(self, name, to_server, qtype, to_port=53, direct=False):
+        """
+        Send a single query, or answer it from self.cache if possible,
+        and return the response. Queries sent are paced by self.limiter,
+        resent on timeouts as set by self.retry, and failed over between
+        the servers of a group in self.hedge.
+
+        Raises DNS.TimeoutError if every attempt timed out, or
+        pydnstest.breaker.ServerUnreachable if self.breaker is open.
+
+        :param name: name to query
+        :param to_server: server hostname or IP address
+        :param qtype: query type name, i.e. 'A'
+        :param to_port: server port
+        :param direct: if True, query to_server even if it's in self.hedge
+        """
+        if self.cache is not None:
+            key = cache_key(name, to_server, qtype, to_port)
+            a = self.cache.get(key)
+            if a is not None:
+                return a
+        if to_server in self.hedge and not direct:
+            a = self.hedge[to_server].query(lambda server: self.attempt(name, server, qtype, to_port))
+        else:
+            a = self.attempt(name, to_server, qtype, to_port)
+        if self.cache is not None:
+            self.cache.put(key, a)
+        return a
+
+    def attempt(self, name, to_server, qtype, to_port=53):
+        """
+        Send a query with send(), resending it on timeouts as set by
+        self.retry, and return the response.
+        """
+        if self.retry is None:
+            return self.send(name, to_server, qtype, to_port)
+        return self.retry.get(to_server).call(
+            lambda timeout: self.send(name, to_server, qtype, to_port, timeout))
+
+    def send(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a query with send_one(), unless self.breaker is open for the
+        server, recording whether it got a reply.
+        """
+        if self.breaker is None:
+            return self.send_one(name, to_server, qtype, to_port, timeout)
+        self.breaker.check(to_server)
+        try:
+            a = self.send_one(name, to_server, qtype, to_port, timeout)
+        except DNS.TimeoutError:
+            self.breaker.timeout(to_server)
+            raise
+        except BaseException:
+            self.breaker.abandon(to_server)
+            raise
+        self.breaker.success(to_server)
+        return a
+
+    def send_one(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Wait for self.limiter, then send a query through self.pool, or with
+        DNS.Request if there is no pool, and return the response.
+
+        :param timeout: seconds to wait for the reply, or None for the default
+        """
+        if self.limiter is not None:
+            self.limiter.acquire(to_server)
+        if self.pool is not None:
+            if timeout is None:
+                return self.pool.query(name, to_server, qtype, to_port)
+            return self.pool.query(name, to_server, qtype, to_port, timeout)
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        s = DNS.Request(name=name, server=to_server, qtype=qtype, port=to_port, **kwargs)
+        return s.req()
+
+    def close(self):
+        """
+        close the socket pool, if any
+        """
+        if self.pool is not None:
+            self.pool.close()
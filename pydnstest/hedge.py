@@ -0,0 +1,238 @@
+"""
+Hedged queries across a group of equivalent nameservers for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+
+import DNS
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of response times, in buckets growing by a factor of sqrt(2)
+    from 0.5ms. Once it holds ``max_count`` samples, all counts are halved,
+    so it follows changes in a server's latency rather than its whole history.
+    """
+
+    bounds = [0.0005 * 2 ** (i / 2.0) for i in range(40)]
+
+    def __init__(self, max_count=1000):
+        """
+        @param max_count number of samples at which counts are halved
+        """
+        self.max_count = max_count
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+
+    def record(self, seconds):
+        """ add a response time to the histogram """
+        i = 0
+        while i < len(self.bounds) and seconds > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        if self.count >= self.max_count:
+            self.counts = [c // 2 for c in self.counts]
+            self.count = sum(self.counts)
+
+    def percentile(self, p):
+        """
+        return the upper bound of the bucket holding the p'th percentile
+        (0 to 100) response time, or None if there are no samples
+        """
+        if self.count == 0:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.bounds[-1] * 2
+        return self.bounds[-1] * 2
+
+
+class HedgedServers(object):
+    """
+    A group of servers that should give the same answers, such as all the
+    authoritative servers for a zone.
+
+    Each query goes to the server with the lowest median response time
+    (servers not yet tried first, in configured order). If it hasn't
+    answered after that server's 95th percentile response time, the query
+    is also sent to the next server, and whichever answers first is used
+    ("hedging"). A server that fails or times out is failed over from
+    right away. Timeouts and failures count as ``penalty`` seconds, and
+    losing queries as however long they had been waiting, so slow or
+    broken servers drop down the order.
+    """
+
+    def __init__(self, servers, min_delay=0.005, max_delay=1.0, default_delay=0.1,
+                 min_samples=10, max_hedges=1, penalty=10.0, clock=time.monotonic):
+        """
+        @param servers list of server hostnames or IP addresses
+        @param min_delay lower bound on the hedging delay, in seconds
+        @param max_delay upper bound on the hedging delay, in seconds
+        @param default_delay hedging delay for a server with fewer than
+          ``min_samples`` response times recorded
+        @param min_samples response times needed to use a server's p95
+        @param max_hedges maximum number of extra copies of a query to send
+          (not counting failovers)
+        @param penalty response time recorded for a failed query
+        @param clock callable returning the current time in seconds
+        """
+        self.servers = list(servers)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.penalty = penalty
+        self.clock = clock
+        self.histograms = dict((s, LatencyHistogram()) for s in self.servers)
+        self.hedges = 0
+
+    def ranked(self):
+        """ return the servers in the order to try them """
+        def key(i):
+            p50 = self.histograms[self.servers[i]].percentile(50)
+            return (p50 is not None, p50 or 0.0, i)
+        return [self.servers[i] for i in sorted(range(len(self.servers)), key=key)]
+
+    def delay(self, server):
+        """ seconds to wait for server to answer before hedging """
+        h = self.histograms[server]
+        if h.count < self.min_samples:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, h.percentile(95)))
+
+    def query(self, send):
+        """
+        Call send(server) for each server in turn until one returns a
+        response; blocking queries can't be hedged, only failed over.
+        Raises the first server's DNS.DNSError if none answer.
+        """
+        error = None
+        for server in self.ranked():
+            start = self.clock()
+            try:
+                a = send(server)
+            except DNS.DNSError as e:
+                self.histograms[server].record(self.penalty)
+                if error is None:
+                    error = e
+                continue
+            self.histograms[server].record(self.clock() - start)
+            return a
+        raise error
+
+    async def timed(self, server, send):
+        """ await send(server), recording how long it took """
+        start = self.clock()
+        try:
+            a = await send(server)
+        except DNS.DNSError:
+            self.histograms[server].record(self.penalty)
+            raise
+        except asyncio.CancelledError:
+            # lost to a hedged query; it took at least this long
+            self.histograms[server].record(self.clock() - start)
+            raise
+        self.histograms[server].record(self.clock() - start)
+        return a
+
+    async def query_async(self, send):
+        """
+        Await send(server) on the best server, hedging to the next one if
+        it's slow and failing over if it fails, and return the first
+        response. Raises the first server's DNS.DNSError if none answer.
+        """
+        servers = self.ranked()
+        tasks = {}
+        state = {'next': 0, 'hedges': 0}
+        error = None
+
+        def launch():
+            server = servers[state['next']]
+            state['next'] += 1
+            tasks[asyncio.ensure_future(self.timed(server, send))] = server
+            return server
+
+        try:
+            last = launch()
+            while tasks:
+                timeout = None
+                if state['next'] < len(servers) and state['hedges'] < self.max_hedges:
+                    timeout = self.delay(last)
+                done, pending = await asyncio.wait(list(tasks), timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    state['hedges'] += 1
+                    self.hedges += 1
+                    last = launch()
+                    continue
+                for t in done:
+                    tasks.pop(t)
+                    if t.exception() is None:
+                        return t.result()
+                    if not isinstance(t.exception(), DNS.DNSError):
+                        raise t.exception()
+                    if error is None:
+                        error = t.exception()
+                if not tasks and state['next'] < len(servers):
+                    last = launch()
+            raise error
+        finally:
+            for t in tasks:
+                if t.done() and not t.cancelled():
+                    # finished alongside the one used; discard its result
+                    t.exception()
+                t.cancel()
+            if tasks:
+                await asyncio.wait(list(tasks))
+
+    def stats(self):
+        """
+        return a dict of ``hedges`` (extra queries sent) and ``servers``,
+        a dict of server to its recorded ``count``, ``p50`` and ``p95``
+        """
+        return {
+            'hedges': self.hedges,
+            'servers': dict((s, {'count': h.count, 'p50': h.percentile(50), 'p95': h.percentile(95)})
+                            for s, h in self.histograms.items()),
+        }
@@ -0,0 +1,280 @@
+"""
+Incremental zone transfers (IXFR), and zone snapshots and verify results kept
+between runs, so re-verifying only needs what changed since the last run
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import ast
+import random
+import sqlite3
+
+from pydnstest.axfr import TransferError, Zone, iter_messages, normalize, record_identity
+from pydnstest.wire import HEADER, QUESTION_TAIL, RR_HEADER, TYPE_CODES, U32, encode_name
+
+
+def build_ixfr_query(tid, zone, serial):
+    """
+    return the wire format of an IXFR query (RFC 1995) for the changes to
+    a zone since the given serial, which goes in a SOA record in the
+    authority section
+    """
+    name = encode_name(zone)
+    # a SOA with root names and only the serial set
+    rdata = b'\x00\x00' + U32.pack(serial) + b'\x00' * 16
+    return (HEADER.pack(tid, 0, 1, 0, 1, 0) + name + QUESTION_TAIL.pack(TYPE_CODES['IXFR'], 1) +
+            name + RR_HEADER.pack(TYPE_CODES['SOA'], 1, 0, len(rdata)) + rdata)
+
+
+def soa_record_serial(rr):
+    # SOA data is (mname, rname, ('serial', n), refresh, retry, expire, minimum)
+    return rr['data'][2][1]
+
+
+def iter_ixfr(zone, serial, to_server, to_port=53, timeout=30):
+    """
+    Transfer the changes to a zone since a serial with IXFR, yielding them
+    as ('delete', record) and ('add', record) tuples (the SOA records
+    marking each change included) for pydnstest.axfr.Zone.apply(). Yields
+    nothing if the zone is still at that serial. If the server sends the
+    whole zone instead (as it may, i.e. if it has no history back to that
+    serial), yields ('reset', None) and then an ('add', record) for every
+    record in the zone.
+
+    Raises the same exceptions as pydnstest.axfr.iter_messages().
+
+    @param zone name of the zone
+    @param serial serial of the copy of the zone we have
+    @param to_server server hostname or IP address
+    @param to_port server port
+    @param timeout seconds to wait for each message
+    """
+    tid = random.randint(0, 65535)
+    messages = iter_messages(zone, build_ixfr_query(tid, zone, serial), tid, to_server, to_port, timeout)
+    try:
+        first = next(messages)
+        if first['typename'] != 'SOA':
+            raise TransferError('transfer of %s does not start with a SOA record' % zone)
+        current = soa_record_serial(first)
+        if current == serial:
+            return
+        second = next(messages)
+        if second['typename'] != 'SOA' or soa_record_serial(second) == current:
+            # the whole zone, as in an AXFR
+            yield ('reset', None)
+            yield ('add', first)
+            if second['typename'] != 'SOA':
+                yield ('add', second)
+                for rr in messages:
+                    if rr['typename'] == 'SOA':
+                        return
+                    yield ('add', rr)
+            return
+        # one or more differences: the old SOA and the records deleted,
+        # then the new SOA and the records added
+        op = 'delete'
+        marker = second
+        yield ('delete', second)
+        for rr in messages:
+            if rr['typename'] == 'SOA':
+                if op == 'add' and soa_record_serial(marker) == current:
+                    # the closing copy of the current SOA
+                    return
+                op = 'add' if op == 'delete' else 'delete'
+                marker = rr
+            yield (op, rr)
+    except StopIteration:
+        raise TransferError('connection closed before the end of the zone')
+    finally:
+        messages.close()
+
+
+class SnapshotStore(object):
+    """
+    Copies of zones transferred from each server, kept between runs in
+    tables of the persistent cache's SQLite file, and updated in place
+    with the changes from each incremental transfer. If refresh is True,
+    nothing is loaded, but zones are still saved.
+    """
+
+    def __init__(self, path, refresh=False):
+        """
+        @param path path to the SQLite database file; created if needed
+        @param refresh if True, ignore stored zones
+        """
+        self.refresh = refresh
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS zone_serials (server TEXT, zone TEXT, "
+                          "serial INTEGER, PRIMARY KEY (server, zone))")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS zone_records (server TEXT, zone TEXT, "
+                          "identity TEXT, record TEXT, PRIMARY KEY (server, zone, identity))")
+        self.conn.commit()
+
+    def load(self, server, zone):
+        """ return the stored pydnstest.axfr.Zone of a zone from a server, or None """
+        if self.refresh:
+            return None
+        zone = normalize(zone)
+        if self.serial(server, zone) is None:
+            return None
+        z = Zone(zone)
+        # records are stored as their repr(), to round-trip tuples and bytes
+        for row in self.conn.execute("SELECT record FROM zone_records WHERE server=? AND zone=?", (server, zone)):
+            z.add(ast.literal_eval(row[0]))
+        return z
+
+    def serial(self, server, zone):
+        """ return the serial of the stored copy of a zone from a server, or None """
+        row = self.conn.execute("SELECT serial FROM zone_serials WHERE server=? AND zone=?",
+                                (server, normalize(zone))).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, server, zone):
+        """ store a whole pydnstest.axfr.Zone transferred from a server """
+        self.conn.execute("DELETE FROM zone_records WHERE server=? AND zone=?", (server, zone.name))
+        self.conn.executemany("INSERT OR REPLACE INTO zone_records VALUES (?, ?, ?, ?)",
+                              ((server, zone.name, repr(record_identity(rr)), repr(rr)) for rr in zone.records()))
+        self.conn.execute("INSERT OR REPLACE INTO zone_serials VALUES (?, ?, ?)", (server, zone.name, zone.serial))
+        self.conn.commit()
+
+    def update(self, server, zone, changes):
+        """
+        store the changes from an incremental transfer of a zone; ``zone``
+        is the pydnstest.axfr.Zone they've been applied to
+        """
+        for op, rr in changes:
+            key = (server, zone.name, repr(record_identity(rr)))
+            if op == 'delete':
+                self.conn.execute("DELETE FROM zone_records WHERE server=? AND zone=? AND identity=?", key)
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO zone_records VALUES (?, ?, ?, ?)", key + (repr(rr),))
+        self.conn.execute("INSERT OR REPLACE INTO zone_serials VALUES (?, ?, ?)", (server, zone.name, zone.serial))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class ResultStore(object):
+    """
+    The result of each verify check, kept between runs with the serials
+    of the zones its names were looked up in, so a check whose names
+    haven't changed since can reuse it.
+    """
+
+    def __init__(self, path):
+        """
+        @param path path to the SQLite database file; created if needed
+        """
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS verify_results (check_key TEXT PRIMARY KEY, "
+                          "serials TEXT, result TEXT)")
+        self.conn.commit()
+
+    def load(self, key):
+        """ return the stored (serials, result dict) of a check, or None """
+        row = self.conn.execute("SELECT serials, result FROM verify_results WHERE check_key=?",
+                                (repr(key),)).fetchone()
+        if row is None:
+            return None
+        return (ast.literal_eval(row[0]), ast.literal_eval(row[1]))
+
+    def save(self, key, serials, result):
+        """
+        store the result of a check
+
+        @param key (check name, args) tuple
+        @param serials dict of (server, zone) to the serial the check's
+          names were looked up at
+        @param result result dict
+        """
+        self.conn.execute("INSERT OR REPLACE INTO verify_results VALUES (?, ?, ?)",
+                          (repr(key), repr(serials), repr(result)))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class Delta(object):
+    """
+    The changes to a zone since a serial, as from iter_ixfr(), indexed to
+    tell whether they could change the answer for a name.
+    """
+
+    def __init__(self, zone, base, changes):
+        """
+        @param zone name of the zone
+        @param base serial the changes were made since
+        @param changes list of ('delete', record) and ('add', record) tuples
+        """
+        zone = normalize(zone)
+        self.base = base
+        # owner names with records deleted or added
+        self.changed = set()
+        # names above those, which may have started or stopped existing
+        self.above = set()
+        # names with a delegation or wildcard below them changed
+        self.cuts = set()
+        self.wildcards = set()
+        for op, rr in changes:
+            name = normalize(rr['name'])
+            if name in self.changed:
+                continue
+            self.changed.add(name)
+            if name.startswith('*.'):
+                self.wildcards.add(name[2:])
+            while name != zone and '.' in name:
+                name = name.split('.', 1)[1]
+                self.above.add(name)
+        for op, rr in changes:
+            if rr['typename'] == 'NS' and normalize(rr['name']) != zone:
+                self.cuts.add(normalize(rr['name']))
+
+    def affects(self, name):
+        """
+        True if a change could affect the answer for a name: a change to
+        the name itself or a name below it, to a delegation above it, or
+        to a wildcard that could cover it
+        """
+        name = normalize(name)
+        if name in self.changed or name in self.above or name in self.cuts:
+            return True
+        while '.' in name:
+            name = name.split('.', 1)[1]
+            if name in self.cuts or name in self.wildcards:
+                return True
+        return False
@@ -48,12 +48,11 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 import sys
 import optparse
 import os.path
-from pyparsing import ParseException
-from time import sleep
+from time import monotonic, sleep
 
-from pydnstest.checks import DNStestChecks
 from pydnstest.config import DnstestConfig
-from pydnstest.parser import DnstestParser
+from pydnstest.output import WRITERS, TextWriter, result_text
+from pydnstest.parser import DnstestParser, ParseError
 from pydnstest.version import VERSION
 
 
@@ -64,7 +63,7 @@ def run_check_line(line, parser, chk):
     """
     try:
         d = parser.parse_line(line)
-    except ParseException:
+    except ParseError:
         print("ERROR: could not parse input line, SKIPPING: %s" % line)
         return False
 
@@ -91,7 +90,7 @@ def run_verify_line(line, parser, chk):
     """
     try:
         d = parser.parse_line(line)
-    except ParseException:
+    except ParseError:
         print("ERROR: could not parse input line, SKIPPING: %s" % line)
         return False
 
@@ -110,18 +109,279 @@ def run_verify_line(line, parser, chk):
         return False
 
 
+class LastLineParser(object):
+    """
+    Wraps a DnstestParser, remembering the last line parsed, so a line
+    parsed for its fields and then again by run_check_line() or
+    run_verify_line() is only parsed once.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.line = None
+        self.parsed = None
+
+    def parse_line(self, line):
+        if line != self.line:
+            self.parsed = self.parser.parse_line(line)
+            self.line = line
+        return self.parsed
+
+    def get_grammar(self):
+        return self.parser.get_grammar()
+
+
+def run_input_line(line, parser, chk, verify, writer):
+    """
+    Run the tests for a raw input line with run_verify_line() if verify is
+    True, otherwise run_check_line(), and return a (parsed line, result)
+    tuple; the result is False if the line couldn't be run. The line is
+    only parsed here if the writer wants its fields, otherwise the parsed
+    line is None. Pass a LastLineParser to only parse it once.
+    """
+    d = None
+    if writer.wants_fields:
+        try:
+            d = parser.parse_line(line)
+        except ParseError:
+            writer.write_message("ERROR: could not parse input line, SKIPPING: %s" % line)
+            return (None, False)
+    if verify:
+        return (d, run_verify_line(line, parser, chk))
+    return (d, run_check_line(line, parser, chk))
+
+
+def run_watch(lines, parser, chk, timeout, interval=5.0, max_interval=60.0, writer=None):
+    """
+    Verify each of ``lines`` against PROD, then keep re-verifying only the
+    ones that haven't passed yet, waiting ``interval`` seconds after the
+    first pass and doubling the wait each time up to ``max_interval``,
+    until they all pass or ``timeout`` seconds have gone by. The first
+    pass writes every result and later passes only the lines that now
+    pass; the last result of each line that never passed is written at
+    the end, then how long each line took to pass. Returns a
+    (passed, failed) tuple.
+
+    @param writer pydnstest.output writer for the results, default text
+      to stdout
+    """
+    if writer is None:
+        writer = TextWriter(sys.stdout)
+    start = monotonic()
+    watched = []
+    # index in watched -> seconds from start until the line passed
+    converged = {}
+    last = {}
+    for line in lines:
+        d, r = run_input_line(line, parser, chk, True, writer)
+        if r is False:
+            continue
+        writer.write_result(r, line, d)
+        if r['result']:
+            converged[len(watched)] = 0.0
+        else:
+            last[len(watched)] = r
+        watched.append((line, d))
+    pending = sorted(last)
+    if pending:
+        writer.write_message("Note - watching %d of %d lines until they pass, for up to %g seconds" % (len(pending), len(watched), timeout))
+    while pending:
+        elapsed = monotonic() - start
+        if elapsed >= timeout:
+            break
+        # the last pass is at the timeout
+        sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 2, max_interval)
+        waiting = []
+        for i in pending:
+            r = run_verify_line(watched[i][0], parser, chk)
+            if r['result']:
+                converged[i] = monotonic() - start
+                writer.write_result(r, *watched[i])
+            else:
+                last[i] = r
+                waiting.append(i)
+        pending = waiting
+    if pending:
+        writer.write_message("Note - %d lines did not pass within %g seconds:" % (len(pending), timeout))
+        for i in pending:
+            writer.write_result(last[i], *watched[i])
+    writer.write_message("++++ Time to convergence:")
+    for i, (line, d) in enumerate(watched):
+        if i in converged:
+            writer.write_message("\t%s: %.1f seconds" % (line, converged[i]))
+        else:
+            writer.write_message("\t%s: did not pass" % line)
+    return (len(converged), len(pending))
+
+
+def check_for_line(d, verify, confirm_all=False):
+    """
+    Returns a (check method name, args) tuple for a parsed input line - the
+    DNStestChecks method that run_check_line() or run_verify_line() would
+    call - or None if the operation is unknown. If confirm_all is True,
+    every line's name is checked with confirm_all_name() instead.
+    """
+    if confirm_all and d['operation'] in ('add', 'remove', 'change', 'rename', 'confirm'):
+        return ('confirm_all_name', (d['hostname'],))
+    if d['operation'] == 'add':
+        return ('verify_added_name' if verify else 'check_added_name', (d['hostname'], d['value']))
+    elif d['operation'] == 'remove':
+        return ('verify_removed_name' if verify else 'check_removed_name', (d['hostname'],))
+    elif d['operation'] == 'change':
+        return ('verify_changed_name' if verify else 'check_changed_name', (d['hostname'], d['value']))
+    elif d['operation'] == 'rename':
+        return ('verify_renamed_name' if verify else 'check_renamed_name', (d['hostname'], d['newname'], d['value']))
+    elif d['operation'] == 'confirm':
+        return ('confirm_name', (d['hostname'],))
+    return None
+
+
+async def run_pipeline(fh, parser, chk, verify, concurrency, sleep_secs=0.0, confirm_all=False, writer=None):
+    """
+    Test the lines of fh with up to ``concurrency`` lines in flight at once,
+    writing results in input order exactly as the serial loop in main()
+    would. Returns a (passed, failed, short_circuited) tuple, the last
+    being the number of lines failed by an open circuit breaker.
+
+    Stages are a reader, a parser, ``concurrency`` check executors
+    (awaiting DNStestChecks.run_async()) and an ordered formatter,
+    connected by bounded queues. The parser hands the formatter the line,
+    its parsed dict and one future per line, in input order; the future
+    resolves to either a result dict or an error message to write. With
+    confirm_all, every line is checked with confirm_all_name().
+
+    @param writer pydnstest.output writer for the results, default text
+      to stdout
+    """
+    import asyncio
+    if writer is None:
+        writer = TextWriter(sys.stdout)
+    loop = asyncio.get_event_loop()
+    line_q = asyncio.Queue(maxsize=concurrency)
+    work_q = asyncio.Queue(maxsize=concurrency)
+    out_q = asyncio.Queue(maxsize=concurrency)
+    # held from parsing a line until its result is printed
+    in_flight = asyncio.Semaphore(concurrency)
+    counts = {'passed': 0, 'failed': 0, 'short_circuited': 0}
+
+    async def reader():
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            if line[:1] == "#":
+                continue
+            await line_q.put(line)
+            if sleep_secs is not None and sleep_secs > 0.0:
+                await asyncio.sleep(sleep_secs)
+        await line_q.put(None)
+
+    async def line_parser():
+        while True:
+            line = await line_q.get()
+            if line is None:
+                break
+            await in_flight.acquire()
+            fut = loop.create_future()
+            d = None
+            try:
+                d = parser.parse_line(line)
+                call = check_for_line(d, verify, confirm_all)
+            except ParseError:
+                fut.set_result("ERROR: could not parse input line, SKIPPING: %s" % line)
+            else:
+                if call is None:
+                    fut.set_result("ERROR: unknown input operation")
+                else:
+                    await work_q.put((call, fut))
+            await out_q.put((line, d, fut))
+        for i in range(concurrency):
+            await work_q.put(None)
+        await out_q.put(None)
+
+    async def executor():
+        while True:
+            item = await work_q.get()
+            if item is None:
+                break
+            (check, args), fut = item
+            try:
+                fut.set_result(await chk.run_async(check, *args))
+            except Exception as e:
+                fut.set_exception(e)
+
+    async def formatter():
+        while True:
+            item = await out_q.get()
+            if item is None:
+                break
+            line, d, fut = item
+            r = await fut
+            in_flight.release()
+            if isinstance(r, str):
+                writer.write_message(r)
+                continue
+            if r['result']:
+                counts['passed'] += 1
+            else:
+                counts['failed'] += 1
+            if r.get('short_circuited'):
+                counts['short_circuited'] += 1
+            writer.write_result(r, line, d)
+
+    tasks = [asyncio.ensure_future(c) for c in
+             [reader(), line_parser(), formatter()] + [executor() for i in range(concurrency)]]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # on error, stop the remaining stages before the loop is closed
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while not out_q.empty():
+            item = out_q.get_nowait()
+            if item is not None and item[2].done() and not item[2].cancelled():
+                item[2].exception()
+    return (counts['passed'], counts['failed'], counts['short_circuited'])
+
+
 def format_test_output(res):
     """
     Prints test output in a nice textual format
     """
-    if res['result']:
-        print("OK: %s" % res['message'])
+    sys.stdout.write(result_text(res))
+
+
+def wait_for_serial(options, config, chk, writer):
+    """
+    Wait for PROD to have the SOA serial given with --wait-for-serial (or
+    the one on the TEST server, for 'test') for the zone given with
+    --wait-zone (default: the default domain), writing the result. Exits
+    with status 1 if it doesn't within --wait-timeout seconds.
+    """
+    def fail(msg):
+        writer.write_message(msg)
+        writer.close()
+        raise SystemExit(1)
+
+    zone = options.wait_zone or config.default_domain.lstrip('.')
+    if not zone:
+        fail("ERROR: --wait-for-serial needs --wait-zone, or a domain in the config file.")
+    if options.wait_for_serial == 'test':
+        serial = chk.current_serial(zone, config.server_test)
+        if serial is None:
+            fail("ERROR: could not get the SOA serial for zone '%s' from the TEST server %s." % (zone, config.server_test))
+        writer.write_message("Note - TEST has serial %d for zone '%s'" % (serial, zone))
     else:
-        print("**NG: %s" % res['message'])
-    for m in res['secondary']:
-        print("\t%s" % m)
-    for w in res['warnings']:
-        print("\t%s" % w)
+        try:
+            serial = int(options.wait_for_serial)
+        except ValueError:
+            fail("ERROR: --wait-for-serial must be a serial number or 'test'.")
+    r = chk.wait_for_serial(zone, serial, options.wait_timeout)
+    writer.write_result(r)
+    if not r['result']:
+        fail("++++ not running tests: PROD does not have the changes yet. (pydnstest %s)" % VERSION)
 
 
 def main(options):
@@ -159,69 +419,150 @@ def main(options):
         print(config.to_string())
         raise SystemExit(0)
 
-    parser = DnstestParser()
-    chk = DNStestChecks(config)
+    if options.refresh:
+        config.refresh_cache = True
 
-    if options.sleep:
-        config.sleep = options.sleep
-        print("Note - will sleep %g seconds between lines" % options.sleep)
-
-    # if no other options, read from stdin
-    if options.testfile:
-        if not os.path.exists(options.testfile):
-            print("ERROR: test file '%s' does not exist." % options.testfile)
+    if options.watch:
+        from pydnstest.zonefile import ZoneFileError, parse_ttl
+        try:
+            watch_timeout = parse_ttl(options.until_timeout)
+        except ZoneFileError:
+            print("ERROR: --until-timeout must be a number of seconds, or a duration like '30m' or '1h30m'.")
             raise SystemExit(1)
-        fh = open(options.testfile, 'r')
-    else:
-        # read from stdin
-        sys.stderr.write("WARNING: reading from STDIN. Run with '-f filename' to read tests from a file.\n")
-        fh = sys.stdin
-
-    # read input line by line, handle each line as we're given it
-    passed = 0
-    failed = 0
-    for line in fh:
-        line = line.strip()
-        if not line:
-            continue
-        if line[:1] == "#":
-            continue
-        if options.verify:
-            r = run_verify_line(line, parser, chk)
-        else:
-            r = run_check_line(line, parser, chk)
-        if r is False:
-            continue
-        elif r['result']:
-            passed = passed + 1
+        # watching re-verifies lines against PROD until they pass
+        options.verify = True
+
+    if options.verify or options.confirm_all:
+        # verify wants the live state of PROD, not answers cached earlier;
+        # the persistent cache (if any) is still updated with what it sees.
+        # Stored zones and results are kept: they're brought up to date
+        # with IXFR before they're used
+        config.cache_size = 0
+        config.refresh_responses = True
+
+    # open the input before waiting for, transferring or looking up anything
+    fh = None
+    if not options.confirm_zone:
+        # if no other options, read from stdin
+        if options.testfile:
+            if not os.path.exists(options.testfile):
+                print("ERROR: test file '%s' does not exist." % options.testfile)
+                raise SystemExit(1)
+            fh = open(options.testfile, 'r')
         else:
-            failed = failed + 1
-        format_test_output(r)
-        if config.sleep is not None and config.sleep > 0.0:
-            sleep(config.sleep)
-
-    msg = ""
-    if failed == 0:
-        msg = "All %d tests passed. (pydnstest %s)" % (passed, VERSION)
-    else:
-        msg = "%d passed / %d FAILED. (pydnstest %s)" % (passed, failed, VERSION)
-    print("++++ %s" % msg)
+            # read from stdin
+            sys.stderr.write("WARNING: reading from STDIN. Run with '-f filename' to read tests from a file.\n")
+            fh = sys.stdin
 
-    if options.testfile:
-        # we were reading a file, close it
-        fh.close()
+    parser = DnstestParser()
+    writer = WRITERS[options.output_format](sys.stdout)
+    if writer.wants_fields:
+        # the writer gets each line's fields, from the same parse as the tests
+        parser = LastLineParser(parser)
+    # imported here rather than at the top, so --configprint and
+    # --example-config don't load DNS and asyncio
+    import asyncio
+    from pydnstest.checks import DNStestChecks
+    chk = DNStestChecks(config)
+    try:
+        if options.timing:
+            chk.enable_timing()
+        if options.wait_for_serial:
+            # don't look anything up until PROD has the changes
+            wait_for_serial(options, config, chk, writer)
+
+        if config.axfr_zones and not (options.confirm_all or options.confirm_zone or options.watch):
+            # --confirm-all compares every server live, and --watch waits for
+            # PROD to change, so they never use the copies
+            for msg in chk.load_snapshots():
+                writer.write_message(msg)
+
+        if options.sleep:
+            config.sleep = options.sleep
+            writer.write_message("Note - will sleep %g seconds between lines" % options.sleep)
+
+        # per-server concurrency limits, if lines ran through the pipeline
+        limits = None
+        if options.confirm_zone:
+            # compare a whole zone, instead of reading input lines
+            passed = 0
+            failed = 0
+            short_circuited = 0
+            for r in chk.confirm_zone(options.confirm_zone, options.prod_zone_file, options.test_zone_file):
+                if r['result']:
+                    passed = passed + 1
+                else:
+                    failed = failed + 1
+                writer.write_result(r)
+        elif options.watch:
+            lines = [line.strip() for line in fh]
+            passed, failed = run_watch([line for line in lines if line and line[:1] != "#"],
+                                       parser, chk, watch_timeout, writer=writer)
+            short_circuited = 0
+        elif options.concurrency > 1 or options.confirm_all:
+            # test many lines at once, with concurrent lookups; confirm-all
+            # always queries its servers concurrently, even one line at a time
+            loop = asyncio.new_event_loop()
+            try:
+                passed, failed, short_circuited = loop.run_until_complete(
+                    run_pipeline(fh, parser, chk, options.verify, options.concurrency, config.sleep,
+                                 options.confirm_all, writer))
+            finally:
+                loop.run_until_complete(chk.AsyncDNS.close())
+                loop.close()
+            limits = chk.AsyncDNS.concurrency.summary()
+        else:
+            # read input line by line, handle each line as we're given it
+            passed = 0
+            failed = 0
+            short_circuited = 0
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                if line[:1] == "#":
+                    continue
+                d, r = run_input_line(line, parser, chk, options.verify, writer)
+                if r is False:
+                    continue
+                elif r['result']:
+                    passed = passed + 1
+                else:
+                    failed = failed + 1
+                if r.get('short_circuited'):
+                    short_circuited = short_circuited + 1
+                writer.write_result(r, line, d)
+                if config.sleep is not None and config.sleep > 0.0:
+                    sleep(config.sleep)
+
+        notes = []
+        if short_circuited > 0:
+            notes.append("%d lines short-circuited: a server stopped answering (UNREACHABLE)" % short_circuited)
+        if limits is not None:
+            notes.append("Concurrency limits: %s" % limits)
+        if chk.timings is not None:
+            latency = chk.timings.summary()
+            if latency is not None:
+                notes.append("Query latency: %s" % latency)
+        writer.write_summary(passed, failed, notes)
+        writer.close()
+    finally:
+        if fh is not None and fh is not sys.stdin:
+            # we were reading a file, close it
+            fh.close()
+        # commits anything not yet written to the persistent cache
+        chk.close()
 
 
 def parse_opts():
     """
     Runs OptionParser and calls main() with the resulting options.
     """
-    usage = "%prog [-h|--help] [--version] [-c|--config path_to_config] [-f|--file path_to_test_file] [-V|--verify]"
+    usage = "%prog [-h|--help] [--version] [-c|--config path_to_config] [-f|--file path_to_test_file] [-V|--verify] [--confirm-all] [--confirm-zone zone] [--wait-for-serial N|test] [--watch [--until-timeout 30m]] [--concurrency N] [--refresh] [--timing] [--output-format text|jsonl|junit]"
     usage += "\n\npydnstest %s - <https://github.com/jantman/pydnstest/>" % VERSION
     usage += "\nlicensed under the GNU Affero General Public License - see LICENSE.txt"
     usage += "\nGrammar:\n\n"
-    parser = DnstestParser()
-    for s in parser.get_grammar():
+    for s in DnstestParser.grammar_strings:
         usage += "{s}\n".format(s=s)
     p = optparse.OptionParser(usage=usage, version="pydnstest %s" % VERSION)
     p.add_option('-c', '--config', dest='config_file',
@@ -233,8 +574,68 @@ def parse_opts():
     p.add_option('-V', '--verify', dest='verify', default=False, action='store_true',
                  help='verify changes against PROD server once they\'re live (default False)')
 
+    p.add_option('--confirm-all', dest='confirm_all', default=False, action='store_true',
+                 help='instead of testing each line\'s change, confirm that every server in '
+                 'confirm_servers (default: all prod servers) returns the same response '
+                 'for its name, and report any that disagree with their SOA serials')
+
+    p.add_option('--confirm-zone', dest='confirm_zone', action='store',
+                 help='instead of reading input lines, compare every RRset in this zone '
+                 'on the prod and test servers, transferring it from each with AXFR, '
+                 'and report any added, removed or changed')
+
+    p.add_option('--prod-zone-file', dest='prod_zone_file', action='store',
+                 help='with --confirm-zone, read the prod zone from this zone file '
+                 'instead of transferring it')
+
+    p.add_option('--test-zone-file', dest='test_zone_file', action='store',
+                 help='with --confirm-zone, read the test zone from this zone file '
+                 'instead of transferring it')
+
+    p.add_option('--wait-for-serial', dest='wait_for_serial', action='store', metavar='SERIAL',
+                 help='before testing, poll the prod server\'s SOA serial for --wait-zone '
+                 'until it is at least SERIAL (or the test server\'s serial, if SERIAL is '
+                 '"test"), backing off between polls; exit with an error if it isn\'t '
+                 'within --wait-timeout seconds')
+
+    p.add_option('--wait-zone', dest='wait_zone', action='store',
+                 help='zone whose serial --wait-for-serial polls (default: the domain '
+                 'in the config file)')
+
+    p.add_option('--wait-timeout', dest='wait_timeout', action='store', type='float', default=600.0,
+                 help='seconds --wait-for-serial waits in all (default 600)')
+
+    p.add_option('--watch', dest='watch', default=False, action='store_true',
+                 help='verify against PROD like -V, then keep re-verifying the lines that '
+                 'haven\'t passed, backing off between passes, until they all pass or '
+                 '--until-timeout; print each line as it passes, and how long it took')
+
+    p.add_option('--until-timeout', dest='until_timeout', action='store', default='30m',
+                 metavar='DURATION',
+                 help='how long --watch keeps re-verifying, in seconds or i.e. 30m or '
+                 '1h30m (default 30m)')
+
     p.add_option('-s', '--sleep', dest='sleep', action='store', type='float',
-                 help='optionally, a decimal number of seconds to sleep between queries')
+                 help='optionally, a decimal number of seconds to sleep between input lines; '
+                 'prod_qps / test_qps in the config file limit the query rate to each '
+                 'server more precisely')
+
+    p.add_option('--concurrency', dest='concurrency', action='store', type='int', default=1,
+                 help='number of input lines to test concurrently, with all of each line\'s '
+                 'lookups in flight at once; output is still in input order (default 1)')
+
+    p.add_option('--refresh', dest='refresh', default=False, action='store_true',
+                 help='ignore PROD responses saved in the persistent cache by earlier runs '
+                 '(default False)')
+
+    p.add_option('--output-format', dest='output_format', action='store', type='choice',
+                 choices=sorted(WRITERS), default='text',
+                 help='how to write results: text, jsonl (one JSON object per result, '
+                 'with the parsed line and any timing) or junit (JUnit XML) (default text)')
+
+    p.add_option('--timing', dest='timing', default=False, action='store_true',
+                 help='time every lookup, and print the p50/p95/p99 latency of each '
+                 'server after the summary (default False)')
 
     p.add_option('-t', '--ignore-ttl', dest='ignorettl', default=False, action='store_true',
                  help='when comparing responses, ignore the TTL value')
@@ -0,0 +1,213 @@
+"""
+Writers for the results of a run: human-readable text, JSON Lines and JUnit XML
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import shutil
+
+from pydnstest.version import VERSION
+
+# fields of a parsed input line included with each result
+LINE_FIELDS = ('operation', 'hostname', 'value', 'newname')
+
+
+def result_text(res):
+    """ return the human-readable text of a result dict, one line per message """
+    lines = ["%s: %s" % ('OK' if res['result'] else '**NG', res['message'])]
+    lines.extend("\t%s" % m for m in res['secondary'])
+    lines.extend("\t%s" % w for w in res['warnings'])
+    return "\n".join(lines) + "\n"
+
+
+def summary_text(passed, failed):
+    """ return the summary line of a run """
+    if failed == 0:
+        return "All %d tests passed. (pydnstest %s)" % (passed, VERSION)
+    return "%d passed / %d FAILED. (pydnstest %s)" % (passed, failed, VERSION)
+
+
+class TextWriter(object):
+    """
+    Writes each result as human-readable text as soon as it's given, i.e.
+    ``OK: message`` followed by its secondary messages and warnings
+    indented by a tab, and the summary as ``++++`` lines.
+
+    Every writer has the same methods: write_result() for each result,
+    write_message() for notes and errors about the run, write_summary()
+    once at the end, and close(). ``wants_fields`` is True if the writer
+    includes the parsed input line with each result.
+    """
+
+    wants_fields = False
+
+    def __init__(self, stream):
+        """
+        @param stream file object to write to, i.e. sys.stdout
+        """
+        self.stream = stream
+
+    def write_result(self, res, line=None, parsed=None):
+        """
+        write a result dict
+
+        @param line the input line it's the result of, if any
+        @param parsed the dict DnstestParser.parse_line() made of the line
+        """
+        self.stream.write(result_text(res))
+
+    def write_message(self, msg):
+        """ write a note or error about the run """
+        self.stream.write(msg + "\n")
+
+    def write_summary(self, passed, failed, notes=()):
+        """
+        write the summary of a run
+
+        @param passed number of results that passed
+        @param failed number of results that failed
+        @param notes list of further lines about the run, i.e. latencies
+        """
+        self.stream.write("++++ %s\n" % summary_text(passed, failed))
+        for n in notes:
+            self.stream.write("++++ %s\n" % n)
+
+    def close(self):
+        self.stream.flush()
+
+
+class JSONLinesWriter(TextWriter):
+    """
+    Writes one JSON object per line as soon as each is given: for each
+    result, ``{"type": "result", ...}`` with the input line, the fields of
+    the parsed line, and every key of the result dict (including
+    ``timing``, if the lookups were timed); ``{"type": "message",
+    "message": ...}`` for notes and errors, and a final ``{"type":
+    "summary", "passed": n, "failed": n, "notes": [...], "version": ...}``.
+    """
+
+    wants_fields = True
+
+    def write_result(self, res, line=None, parsed=None):
+        rec = {'type': 'result'}
+        if line is not None:
+            rec['line'] = line
+        for k in LINE_FIELDS:
+            if parsed is not None and k in parsed:
+                rec[k] = parsed[k]
+        rec.update(res)
+        self.write(rec)
+
+    def write_message(self, msg):
+        self.write({'type': 'message', 'message': msg})
+
+    def write_summary(self, passed, failed, notes=()):
+        self.write({'type': 'summary', 'passed': passed, 'failed': failed,
+                    'notes': list(notes), 'version': VERSION})
+
+    def write(self, rec):
+        self.stream.write(json.dumps(rec, sort_keys=True) + "\n")
+
+
+class JUnitWriter(TextWriter):
+    """
+    Writes a JUnit XML report, with one ``<testcase>`` per result. The
+    ``<testsuite>`` element's counts have to come before its test cases,
+    so test cases are spooled to a temporary file as they're given, and
+    the report is written by close().
+    """
+
+    wants_fields = True
+
+    def __init__(self, stream, name='pydnstest'):
+        """
+        @param stream file object to write to, i.e. sys.stdout
+        @param name name of the test suite
+        """
+        import tempfile
+        super(JUnitWriter, self).__init__(stream)
+        self.name = name
+        self.cases = tempfile.TemporaryFile(mode='w+')
+        self.messages = tempfile.TemporaryFile(mode='w+')
+        self.tests = 0
+        self.failures = 0
+        self.time = 0.0
+
+    def write_result(self, res, line=None, parsed=None):
+        # xml.sax.saxutils imports urllib.request, so only JUnit output loads it
+        from xml.sax.saxutils import escape, quoteattr
+        self.tests += 1
+        classname = 'pydnstest'
+        if parsed is not None and 'operation' in parsed:
+            classname = 'pydnstest.%s' % parsed['operation']
+        elapsed = 0.0
+        if 'timing' in res:
+            elapsed = res['timing']['elapsed']
+            self.time += elapsed
+        self.cases.write('  <testcase classname=%s name=%s time="%.6f">\n' % (
+            quoteattr(classname), quoteattr(line if line is not None else res['message']), elapsed))
+        if not res['result']:
+            self.failures += 1
+            self.cases.write('    <failure message=%s/>\n' % quoteattr(res['message']))
+        self.cases.write('    <system-out>%s</system-out>\n  </testcase>\n' % escape(result_text(res)))
+
+    def write_message(self, msg):
+        self.messages.write(msg + "\n")
+
+    def write_summary(self, passed, failed, notes=()):
+        self.messages.write("++++ %s\n" % summary_text(passed, failed))
+        for n in notes:
+            self.messages.write("++++ %s\n" % n)
+
+    def close(self):
+        from xml.sax.saxutils import escape, quoteattr
+        self.stream.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+        self.stream.write('<testsuite name=%s tests="%d" failures="%d" errors="0" time="%.6f">\n' % (
+            quoteattr(self.name), self.tests, self.failures, self.time))
+        self.cases.seek(0)
+        shutil.copyfileobj(self.cases, self.stream)
+        self.stream.write('  <system-out>')
+        self.messages.seek(0)
+        for line in self.messages:
+            self.stream.write(escape(line))
+        self.stream.write('</system-out>\n</testsuite>\n</testsuites>\n')
+        self.cases.close()
+        self.messages.close()
+        super(JUnitWriter, self).close()
+
+
+WRITERS = {'text': TextWriter, 'jsonl': JSONLinesWriter, 'junit': JUnitWriter}
@@ -37,19 +37,112 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 """
 
-from pyparsing import Word, alphas, alphanums, Suppress, Optional, Or, Regex, Literal, Keyword, MatchFirst, And, NotAny, ParseResults
+import re
 
+# the patterns of the grammar's names, shared with fast_parse_line()
+FQDN_PATTERN = "(([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9])(\.([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9]))*)"
+IPADDR_PATTERN = "((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}(1[0-9]{2}|2[0-4][0-9]|25[0-5]|[1-9][0-9]|[0-9]))"
 
-class DnstestParser:
+FQDN_RE = re.compile(FQDN_PATTERN)
+IPADDR_RE = re.compile(IPADDR_PATTERN)
+# pyparsing's default whitespace
+SEPARATOR_RE = re.compile("[ \t\r\n]+")
+# a keyword followed by a character that isn't part of a word, which
+# pyparsing matches as the keyword with the rest of the token after it
+KEYWORD_PREFIX_RE = re.compile("(add|remove|rename|change|confirm|record|entry|name|with|value|address|target|to)[-.]")
+
+OPERATIONS = ('add', 'remove', 'rename', 'change', 'confirm')
+REC_WORDS = ('record', 'entry', 'name')
+VAL_WORDS = ('value', 'address', 'target')
+
+
+class ParseError(Exception):
     """
-    Parses natural-language-like grammar describing DNS changes
+    An input line doesn't match the grammar
+    """
+    pass
+
+
+def match_name(token, allow_ip):
+    """
+    return True if a whole token is a hostname_or_fqdn, or with allow_ip,
+    a hostname_fqdn_or_ip, the way the grammar matches them
     """
+    if token is None:
+        return False
+    m = IPADDR_RE.match(token)
+    if m is not None:
+        # the grammar takes anything starting with an address as the address
+        return allow_ip and m.end() == len(token)
+    return FQDN_RE.fullmatch(token) is not None
 
-    grammar_strings = []
+
+def fast_parse_line(line):
+    """
+    Parse an input line without pyparsing, for the common case of words
+    separated by whitespace.
+
+    Returns the same dict as the pyparsing grammar, or None if the line
+    isn't one this can be sure of (including lines that don't parse at all),
+    which are left to pyparsing.
+
+    @param line the input line
+    """
+    tokens = SEPARATOR_RE.split(line.strip(" \t\r\n"))
+    for t in tokens:
+        if KEYWORD_PREFIX_RE.match(t):
+            return None
+    tokens.append(None)
+    op = tokens[0]
+    if op not in OPERATIONS:
+        return None
+    i = 1
+    if tokens[i] in REC_WORDS:
+        i += 1
+    if not match_name(tokens[i], op == 'remove'):
+        return None
+    d = {'operation': op, 'hostname': tokens[i]}
+    i += 1
+    if op == 'add':
+        if tokens[i] == 'with':
+            i += 1
+        if tokens[i] not in VAL_WORDS:
+            return None
+        i += 1
+    elif op == 'rename':
+        # the value keywords are optional, so a "with" that isn't
+        # followed by one is the value
+        if tokens[i] == 'with' and tokens[i + 1] in VAL_WORDS:
+            i += 2
+        elif tokens[i] in VAL_WORDS:
+            i += 1
+    elif op == 'change':
+        if tokens[i] != 'to':
+            return None
+        i += 1
+    if op in ('add', 'rename', 'change'):
+        if not match_name(tokens[i], True):
+            return None
+        d['value'] = tokens[i]
+        i += 1
+    if op == 'rename':
+        if tokens[i] != 'to' or not match_name(tokens[i + 1], False):
+            return None
+        d['newname'] = tokens[i + 1]
+        i += 2
+    if tokens[i] is not None:
+        return None
+    return d
+
+
+def build_grammar():
+    """
+    Import pyparsing and build the grammar of DnstestParser.grammar_strings,
+    returning the parser element for a whole line.
+    """
+    from pyparsing import Suppress, Optional, Or, Regex, Keyword, MatchFirst, And, NotAny
 
     # implement my grammar
-    word = Word(alphas)
-    value = Word(alphanums).setResultsName("value")
     add_op = Keyword("add").setResultsName("operation")
     rm_op = Keyword("remove").setResultsName("operation")
     rename_op = Keyword("rename").setResultsName("operation")
@@ -58,34 +151,63 @@ class DnstestParser:
     rec_op = Or([Keyword("record"), Keyword("entry"), Keyword("name")])
     val_op = Optional(Keyword("with")) + Or([Keyword("value"), Keyword("address"), Keyword("target")])
 
-    fqdn = Regex("(([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9])(\.([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9]))*)")
-    ipaddr = Regex("((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}(1[0-9]{2}|2[0-4][0-9]|25[0-5]|[1-9][0-9]|[0-9]))")
+    fqdn = Regex(FQDN_PATTERN)
+    ipaddr = Regex(IPADDR_PATTERN)
     hostname = Regex("([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9])")
     hostname_or_fqdn = And([NotAny(ipaddr), MatchFirst([fqdn, hostname])])
     hostname_fqdn_or_ip = MatchFirst([ipaddr, fqdn, hostname])
 
-    grammar_strings.append('add (record|name|entry)? <hostname_or_fqdn> (with ?)(value|address|target)? <hostname_fqdn_or_ip>')
     cmd_add = add_op + Optional(rec_op) + hostname_or_fqdn.setResultsName("hostname") + Suppress(val_op) + hostname_fqdn_or_ip.setResultsName('value')
-
-    grammar_strings.append('remove (record|name|entry)? <hostname_or_fqdn>')
     cmd_remove = rm_op + Optional(rec_op) + hostname_fqdn_or_ip.setResultsName("hostname")
-
-    grammar_strings.append('rename (record|name|entry)? <hostname_or_fqdn> (with ?)(value ?) <value> to <hostname_or_fqdn>')
     cmd_rename = rename_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname") + Suppress(Optional(val_op)) + hostname_fqdn_or_ip.setResultsName('value') + Suppress(Keyword("to")) + hostname_or_fqdn.setResultsName('newname')
-
-    grammar_strings.append('change (record|name|entry)? <hostname_or_fqdn> to <hostname_fqdn_or_ip>')
     cmd_change = change_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname") + Suppress(Keyword("to")) + hostname_fqdn_or_ip.setResultsName('value')
-
-    grammar_strings.append('confirm (record|name|entry)? <hostname_or_fqdn>')
     cmd_confirm = confirm_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname")
 
-    line_parser = Or([cmd_confirm, cmd_add, cmd_remove, cmd_rename, cmd_change])
+    return Or([cmd_confirm, cmd_add, cmd_remove, cmd_rename, cmd_change])
+
+
+class DnstestParser:
+    """
+    Parses natural-language-like grammar describing DNS changes
+    """
+
+    grammar_strings = [
+        'add (record|name|entry)? <hostname_or_fqdn> (with ?)(value|address|target)? <hostname_fqdn_or_ip>',
+        'remove (record|name|entry)? <hostname_or_fqdn>',
+        'rename (record|name|entry)? <hostname_or_fqdn> (with ?)(value ?) <value> to <hostname_or_fqdn>',
+        'change (record|name|entry)? <hostname_or_fqdn> to <hostname_fqdn_or_ip>',
+        'confirm (record|name|entry)? <hostname_or_fqdn>',
+    ]
+
+    # the pyparsing grammar, built the first time a line needs it
+    line_parser = None
 
     def __init__(self):
         pass
 
     def parse_line(self, line):
-        res = self.line_parser.parseString(line, parseAll=True)
+        """
+        Parse an input line into a dict of its operation, hostname and
+        (depending on the operation) value and newname; raises
+        ParseError if it doesn't match the grammar.
+
+        Lines are parsed by fast_parse_line() where it can, and by the
+        pyparsing grammar otherwise.
+        """
+        d = fast_parse_line(line)
+        if d is not None:
+            return d
+        return self.parse_line_pyparsing(line)
+
+    def parse_line_pyparsing(self, line):
+        """ parse an input line with the pyparsing grammar only """
+        from pyparsing import ParseException, ParseResults
+        if DnstestParser.line_parser is None:
+            DnstestParser.line_parser = build_grammar()
+        try:
+            res = self.line_parser.parseString(line, parseAll=True)
+        except ParseException as ex:
+            raise ParseError(str(ex))
         d = res.asDict()
         # hostname_or_fqdn using And and NotAny now returns a ParseResults object instead of a string,
         # we need to convert that to a string to just take the first value
@@ -0,0 +1,113 @@
+"""
+Per-server token-bucket rate limiting of DNS queries for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing ``rate`` queries per second on average, and up to
+    ``burst`` queries at once.
+
+    Each query takes a token as it is sent, waiting for one if the bucket is
+    empty. A waiting query reserves its token (the count goes negative), so
+    concurrent callers are spaced out by 1/rate seconds each rather than all
+    waking at once.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        """
+        @param rate queries per second
+        @param burst maximum number of tokens in the bucket
+        @param clock callable returning the current time in seconds
+        """
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.last = clock()
+
+    def reserve(self):
+        """
+        take a token, and return how many seconds to wait before using it
+        """
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def acquire(self):
+        """ take a token, sleeping until it's usable """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """ take a token, awaiting until it's usable """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter(object):
+    """
+    TokenBuckets by server; queries to any other server aren't limited.
+    """
+
+    def __init__(self, buckets=None):
+        """
+        @param buckets dict of server hostname or IP address to TokenBucket
+        """
+        self.buckets = buckets or {}
+
+    def acquire(self, server):
+        """ wait, if needed, to send a query to server """
+        bucket = self.buckets.get(server)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def acquire_async(self, server):
+        """ await, if needed, to send a query to server """
+        bucket = self.buckets.get(server)
+        if bucket is not None:
+            await bucket.acquire_async()
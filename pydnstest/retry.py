@@ -0,0 +1,121 @@
+"""
+Per-server query timeouts and retries for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+
+import DNS
+
+
+class RetryPolicy(object):
+    """
+    How long to wait for a reply from a server, and how many times to
+    resend a query that timed out. Resends are spaced out by
+    ``retry_backoff`` seconds, doubling each time.
+    """
+
+    timeout = 5.0
+    retries = 2
+    retry_backoff = 0.5
+
+    def __init__(self, timeout=None, retries=None, retry_backoff=None):
+        """
+        @param timeout seconds to wait for each reply
+        @param retries number of times to resend a query that timed out
+        @param retry_backoff seconds to wait before the first resend
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if retries is not None:
+            self.retries = max(0, retries)
+        if retry_backoff is not None:
+            self.retry_backoff = retry_backoff
+
+    def backoff(self, attempt):
+        """ seconds to wait before resend number ``attempt`` (from 1) """
+        return self.retry_backoff * (2 ** (attempt - 1))
+
+    def call(self, send):
+        """
+        Call send(timeout), resending on DNS.TimeoutError, and return its
+        result. Raises DNS.TimeoutError once every attempt has timed out.
+        """
+        attempt = 0
+        while True:
+            try:
+                return send(self.timeout)
+            except DNS.TimeoutError:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+            time.sleep(self.backoff(attempt))
+
+    async def call_async(self, send):
+        """
+        Await send(timeout), resending on DNS.TimeoutError, and return its
+        result. Only this query waits out the backoff; other queries in
+        flight carry on.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await send(self.timeout)
+            except DNS.TimeoutError:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+            await asyncio.sleep(self.backoff(attempt))
+
+
+class RetryPolicies(object):
+    """
+    RetryPolicy by server; queries to any other server use ``default``.
+    """
+
+    def __init__(self, policies=None, default=None):
+        """
+        @param policies dict of server hostname or IP address to RetryPolicy
+        @param default RetryPolicy for other servers, or None for a new one
+        """
+        self.policies = policies or {}
+        self.default = default if default is not None else RetryPolicy()
+
+    def get(self, server):
+        """ return the RetryPolicy for server """
+        return self.policies.get(server, self.default)
@@ -0,0 +1,639 @@
+"""
+Pools of long-lived UDP sockets and TCP connections for DNS queries, one
+set per server
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import random
+import socket
+import struct
+import time
+
+import DNS
+
+from pydnstest.wire import WireResponse, build_query
+
+
+def reply_id(data):
+    """
+    return the ID of a DNS message, or None if it's too short to be one
+    """
+    if len(data) < 12:
+        return None
+    return struct.unpack('!H', data[:2])[0]
+
+
+def reply_matches(data, query):
+    """
+    return True if data is a reply to query: it has the same ID, and the
+    same question section (the name compared case-insensitively)
+
+    @param data message received
+    @param query message sent, as built by pydnstest.wire.build_query()
+    """
+    end = len(query) - 4
+    return (reply_id(data) == reply_id(query) and
+            data[12:end].lower() == query[12:end].lower() and
+            data[end:end + 4] == query[end:])
+
+
+def frame(msg):
+    """ return a DNS message with the 2-byte length prefix used over TCP """
+    return struct.pack('!H', len(msg)) + msg
+
+
+def resolve_server(to_server, to_port, socktype=socket.SOCK_DGRAM):
+    """
+    return (family, sockaddr) for a server hostname or IP address
+
+    Raises DNS.SocketError if it can't be resolved.
+    """
+    try:
+        family, type_, proto, canonname, sockaddr = socket.getaddrinfo(
+            to_server, to_port, 0, socktype)[0]
+    except OSError as e:
+        raise DNS.SocketError(e)
+    return (family, sockaddr)
+
+
+class PooledSocket(object):
+    """
+    a UDP socket for queries to one server, and the number of queries sent on it
+    """
+
+    def __init__(self, family, addr):
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.addr = addr
+        self.queries = 0
+
+
+class UDPSocketPool(object):
+    """
+    Blocking queries over a small pool of long-lived UDP sockets per
+    (server, port), instead of a new socket (and ephemeral port) per query.
+
+    A socket is checked out for the duration of each query, so the pool
+    holds as many sockets per server as there have been queries to it at
+    once, up to max_idle kept open between queries. Replies are matched to
+    queries by ID, question and source address; anything else arriving on
+    the socket, such as a late reply to a query that already timed out, is
+    discarded - even if the new query happens to have reused its ID.
+    """
+
+    # seconds to wait for a reply; same as the DNS module's default
+    timeout = 30
+
+    def __init__(self, timeout=None, max_idle=4):
+        """
+        @param timeout seconds to wait for each reply
+        @param max_idle maximum number of sockets to keep open per server
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        self.max_idle = max_idle
+        self.addrs = {}
+        self.idle = {}
+        self.sockets = []
+
+    def acquire(self, key):
+        """ return an idle PooledSocket for (server, port), or a new one """
+        if self.idle.get(key):
+            return self.idle[key].pop()
+        if key not in self.addrs:
+            self.addrs[key] = resolve_server(*key)
+        family, addr = self.addrs[key]
+        ps = PooledSocket(family, addr)
+        self.sockets.append(ps)
+        return ps
+
+    def release(self, key, ps):
+        """ return a PooledSocket to the pool, closing it if enough are idle """
+        idle = self.idle.setdefault(key, [])
+        if len(idle) >= self.max_idle:
+            self.discard(ps)
+        else:
+            idle.append(ps)
+
+    def discard(self, ps):
+        ps.sock.close()
+        self.sockets.remove(ps)
+
+    def query(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a single query and return the reply as a WireResponse.
+
+        Raises DNS.TimeoutError if no reply arrives within the timeout,
+        and DNS.SocketError on socket errors, like DNS.Request.req() does.
+
+        @param name name to query
+        @param to_server server hostname or IP address
+        @param qtype query type name, i.e. 'A'
+        @param to_port server port
+        @param timeout seconds to wait for the reply, default self.timeout
+        """
+        if timeout is None:
+            timeout = self.timeout
+        key = (to_server, to_port)
+        ps = self.acquire(key)
+        msg = build_query(random.randint(0, 65535), name, qtype)
+        try:
+            ps.sock.sendto(msg, ps.addr)
+            ps.queries += 1
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise DNS.TimeoutError('Timeout')
+                ps.sock.settimeout(remaining)
+                try:
+                    data, addr = ps.sock.recvfrom(65535)
+                except socket.timeout:
+                    raise DNS.TimeoutError('Timeout')
+                if addr[:2] == ps.addr[:2] and reply_matches(data, msg):
+                    break
+        except OSError as e:
+            self.discard(ps)
+            raise DNS.SocketError(e)
+        except BaseException:
+            self.release(key, ps)
+            raise
+        self.release(key, ps)
+        return WireResponse(data)
+
+    def close(self):
+        """ close all sockets """
+        for ps in list(self.sockets):
+            self.discard(ps)
+        self.idle = {}
+
+    def stats(self):
+        """
+        return a dict of pool statistics: sockets_open, queries, and
+        queries_per_socket (a list, one count per open socket)
+        """
+        counts = [ps.queries for ps in self.sockets]
+        return {'sockets_open': len(self.sockets), 'queries': sum(counts),
+                'queries_per_socket': counts}
+
+
+class PooledConnection(object):
+    """
+    a TCP connection to one server, bytes received on it but not yet
+    read as a reply, and the number of queries sent on it
+    """
+
+    def __init__(self, family, addr, timeout):
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(addr)
+        self.buf = bytearray()
+        self.queries = 0
+
+    def read_message(self):
+        """ return the next complete message from buf, or None """
+        if len(self.buf) < 2:
+            return None
+        n = struct.unpack_from('!H', self.buf)[0]
+        if len(self.buf) < 2 + n:
+            return None
+        msg = bytes(self.buf[2:2 + n])
+        del self.buf[:2 + n]
+        return msg
+
+
+class TCPConnectionPool(object):
+    """
+    Blocking queries over one persistent TCP connection per (server, port)
+    (RFC 7766), instead of a new connection per query.
+
+    Replies are matched to queries by ID and question; replies to earlier
+    queries that timed out are discarded. If the server has closed an idle connection,
+    the query is retried once on a new one.
+    """
+
+    # seconds to wait for a reply; same as the DNS module's default
+    timeout = 30
+
+    def __init__(self, timeout=None):
+        """
+        @param timeout seconds to wait for each reply
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        self.addrs = {}
+        self.conns = {}
+
+    def connect(self, key, timeout):
+        """
+        open a connection to (server, port), waiting at most timeout seconds
+
+        Raises DNS.TimeoutError if it isn't established in time, and
+        DNS.SocketError on other socket errors.
+        """
+        if key not in self.addrs:
+            self.addrs[key] = resolve_server(key[0], key[1], socket.SOCK_STREAM)
+        family, addr = self.addrs[key]
+        try:
+            self.conns[key] = PooledConnection(family, addr, timeout)
+        except socket.timeout:
+            raise DNS.TimeoutError('Timeout')
+        except OSError as e:
+            raise DNS.SocketError(e)
+        return self.conns[key]
+
+    def disconnect(self, key):
+        self.conns.pop(key).sock.close()
+
+    def query(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a single query and return the reply as a WireResponse.
+
+        Raises DNS.TimeoutError if no reply arrives within the timeout,
+        and DNS.SocketError on socket errors, like DNS.Request.req() does.
+
+        @param name name to query
+        @param to_server server hostname or IP address
+        @param qtype query type name, i.e. 'A'
+        @param to_port server port
+        @param timeout seconds to wait for a new connection, and for the
+          reply, default self.timeout
+        """
+        if timeout is None:
+            timeout = self.timeout
+        key = (to_server, to_port)
+        query = build_query(random.randint(0, 65535), name, qtype)
+        msg = frame(query)
+        while True:
+            conn = self.conns.get(key)
+            reused = conn is not None
+            if conn is None:
+                conn = self.connect(key, timeout)
+            try:
+                conn.sock.settimeout(timeout)
+                conn.sock.sendall(msg)
+                conn.queries += 1
+                data = self.read_reply(conn, query, timeout)
+                break
+            except socket.timeout:
+                raise DNS.TimeoutError('Timeout')
+            except OSError as e:
+                self.disconnect(key)
+                if not reused:
+                    raise DNS.SocketError(e)
+        return WireResponse(data)
+
+    def read_reply(self, conn, query, timeout):
+        deadline = time.time() + timeout
+        while True:
+            msg = conn.read_message()
+            if msg is not None:
+                if reply_matches(msg, query):
+                    return msg
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout()
+            conn.sock.settimeout(remaining)
+            data = conn.sock.recv(65535)
+            if not data:
+                raise ConnectionResetError('connection closed by server')
+            conn.buf += data
+
+    def close(self):
+        """ close all connections """
+        for key in list(self.conns):
+            self.disconnect(key)
+
+    def stats(self):
+        """
+        return a dict of pool statistics: sockets_open, queries, and
+        queries_per_socket (a list, one count per open connection)
+        """
+        counts = [c.queries for c in self.conns.values()]
+        return {'sockets_open': len(counts), 'queries': sum(counts),
+                'queries_per_socket': counts}
+
+
+class DNSTransport(object):
+    """
+    Sends blocking queries over a UDPSocketPool, or a TCPConnectionPool for
+    servers in tcp_servers. A UDP reply with the TC (truncated) bit set is
+    thrown away and the query repeated over TCP.
+    """
+
+    def __init__(self, udp=None, tcp=None, tcp_servers=(), timeout=None):
+        """
+        @param udp UDPSocketPool, or None for a new one
+        @param tcp TCPConnectionPool, or None for a new one
+        @param tcp_servers servers to always query over TCP
+        @param timeout seconds to wait for each reply, for new pools
+        """
+        self.udp = udp if udp is not None else UDPSocketPool(timeout=timeout)
+        self.tcp = tcp if tcp is not None else TCPConnectionPool(timeout=timeout)
+        self.tcp_servers = set(tcp_servers)
+
+    def query(self, name, to_server, qtype, to_port=53, timeout=None):
+        """
+        Send a single query and return the reply as a WireResponse.
+        """
+        if to_server not in self.tcp_servers:
+            a = self.udp.query(name, to_server, qtype, to_port, timeout)
+            if not a.header['tc']:
+                return a
+        return self.tcp.query(name, to_server, qtype, to_port, timeout)
+
+    def close(self):
+        """ close all sockets and connections """
+        self.udp.close()
+        self.tcp.close()
+
+    def stats(self):
+        """ return a dict of 'udp' and 'tcp' pool statistics """
+        return {'udp': self.udp.stats(), 'tcp': self.tcp.stats()}
+
+
+class PendingQueries(object):
+    """
+    Mixin for asyncio protocols with any number of in-flight queries to
+    one server; ``pending`` maps the ID of each to its (query, future), and
+    reply_received() resolves the future whose query the reply matches.
+    """
+
+    def init_pending(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.pending = {}
+        self.queries = 0
+        self.closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def reply_received(self, data):
+        query, fut = self.pending.get(reply_id(data), (None, None))
+        if fut is not None and not fut.done() and reply_matches(data, query):
+            fut.set_result(data)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.fail_all(exc or ConnectionResetError('connection closed'))
+
+    def fail_all(self, exc):
+        for query, fut in self.pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+
+    def new_id(self):
+        """ return a query ID not already in flight on this socket """
+        while True:
+            tid = random.randint(0, 65535)
+            if tid not in self.pending:
+                return tid
+
+
+class SharedDatagramProtocol(PendingQueries, asyncio.DatagramProtocol):
+    """
+    Datagram protocol for any number of in-flight queries to one server.
+    """
+
+    def __init__(self, loop, addr):
+        self.init_pending(loop)
+        self.addr = addr
+
+    def datagram_received(self, data, addr):
+        if addr[:2] == self.addr[:2]:
+            self.reply_received(data)
+
+    def error_received(self, exc):
+        # ICMP errors can't be tied to one query, so fail them all
+        self.fail_all(exc)
+
+    def send(self, msg):
+        self.transport.sendto(msg)
+
+
+class PipelinedStreamProtocol(PendingQueries, asyncio.Protocol):
+    """
+    Stream protocol for any number of pipelined queries to one server over
+    TCP, with replies in any order (RFC 7766).
+    """
+
+    def __init__(self, loop):
+        self.init_pending(loop)
+        self.buf = bytearray()
+
+    def data_received(self, data):
+        self.buf += data
+        while len(self.buf) >= 2:
+            n = struct.unpack_from('!H', self.buf)[0]
+            if len(self.buf) < 2 + n:
+                break
+            msg = bytes(self.buf[2:2 + n])
+            del self.buf[:2 + n]
+            self.reply_received(msg)
+
+    def send(self, msg):
+        self.transport.write(frame(msg))
+
+
+class AsyncSocketPool(object):
+    """
+    Base class for asyncio queries over one long-lived socket per
+    (server, port), shared by all concurrent queries to that server and
+    matched to replies by query ID and question. Subclasses implement open().
+
+    Sockets belong to the event loop they were opened on; a query on a
+    different loop opens a new one. Await close() before closing the loop.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+
+    async def endpoint(self, key, timeout):
+        """
+        return the open protocol for (server, port), opening it if need be;
+        raises asyncio.TimeoutError if that takes more than timeout seconds
+        """
+        loop = asyncio.get_event_loop()
+        entry = self.endpoints.get(key)
+        if entry is not None and entry[0] is loop:
+            proto = await entry[1]
+            if not proto.closed:
+                return proto
+        task = asyncio.ensure_future(asyncio.wait_for(self.open(key, loop), timeout))
+        self.endpoints[key] = (loop, task)
+        try:
+            return await task
+        except BaseException:
+            del self.endpoints[key]
+            raise
+
+    async def open(self, key, loop):
+        raise NotImplementedError()
+
+    async def query(self, name, to_server, qtype, to_port=53, timeout=30):
+        """
+        Send a single query and return the reply as a WireResponse.
+
+        Raises DNS.TimeoutError if no reply arrives within timeout,
+        and DNS.SocketError on socket errors, like DNS.Request.req() does.
+
+        @param name name to query
+        @param to_server server hostname or IP address
+        @param qtype query type name, i.e. 'A'
+        @param to_port server port
+        @param timeout seconds to wait for a new connection, and for the reply
+        """
+        while True:
+            try:
+                proto = await self.endpoint((to_server, to_port), timeout)
+            except asyncio.TimeoutError:
+                raise DNS.TimeoutError('Timeout')
+            reused = proto.queries > 0
+            tid = proto.new_id()
+            query = build_query(tid, name, qtype)
+            fut = proto.loop.create_future()
+            proto.pending[tid] = (query, fut)
+            try:
+                proto.send(query)
+                proto.queries += 1
+                reply = await asyncio.wait_for(fut, timeout)
+                break
+            except asyncio.TimeoutError:
+                raise DNS.TimeoutError('Timeout')
+            except OSError as e:
+                # retry once if the server closed a connection we had used before
+                if not (reused and proto.closed):
+                    raise DNS.SocketError(e)
+            finally:
+                del proto.pending[tid]
+        return WireResponse(reply)
+
+    def protocols(self):
+        return [e[1].result() for e in self.endpoints.values()
+                if e[1].done() and not e[1].cancelled() and e[1].exception() is None]
+
+    async def close(self):
+        """ close all sockets opened on the running event loop """
+        loop = asyncio.get_event_loop()
+        for proto in self.protocols():
+            if proto.loop is loop and not proto.closed:
+                proto.transport.close()
+        self.endpoints = {}
+        # let the transports finish closing their sockets
+        await asyncio.sleep(0)
+
+    def stats(self):
+        """
+        return a dict of pool statistics: sockets_open, queries, and
+        queries_per_socket (a list, one count per open socket)
+        """
+        counts = [p.queries for p in self.protocols() if not p.closed]
+        return {'sockets_open': len(counts), 'queries': sum(counts),
+                'queries_per_socket': counts}
+
+
+class AsyncUDPSocketPool(AsyncSocketPool):
+    """
+    asyncio queries over one long-lived UDP socket per (server, port),
+    matched to replies by query ID, question and source address.
+    """
+
+    async def open(self, key, loop):
+        family, addr = resolve_server(*key)
+        try:
+            transport, proto = await loop.create_datagram_endpoint(
+                lambda: SharedDatagramProtocol(loop, addr), remote_addr=addr)
+        except OSError as e:
+            raise DNS.SocketError(e)
+        return proto
+
+
+class AsyncTCPConnectionPool(AsyncSocketPool):
+    """
+    asyncio queries pipelined over one persistent TCP connection per
+    (server, port) (RFC 7766), matched to replies by query ID and question
+    in whatever order they arrive. If the server closes a connection that has been
+    used before, queries in flight on it are retried once on a new one.
+    """
+
+    async def open(self, key, loop):
+        family, addr = resolve_server(key[0], key[1], socket.SOCK_STREAM)
+        try:
+            transport, proto = await loop.create_connection(
+                lambda: PipelinedStreamProtocol(loop), addr[0], addr[1])
+        except OSError as e:
+            raise DNS.SocketError(e)
+        return proto
+
+
+class AsyncDNSTransport(object):
+    """
+    asyncio counterpart to DNSTransport: sends queries over an
+    AsyncUDPSocketPool, or an AsyncTCPConnectionPool for servers in
+    tcp_servers or when a UDP reply is truncated.
+    """
+
+    def __init__(self, udp=None, tcp=None, tcp_servers=()):
+        """
+        @param udp AsyncUDPSocketPool, or None for a new one
+        @param tcp AsyncTCPConnectionPool, or None for a new one
+        @param tcp_servers servers to always query over TCP
+        """
+        self.udp = udp if udp is not None else AsyncUDPSocketPool()
+        self.tcp = tcp if tcp is not None else AsyncTCPConnectionPool()
+        self.tcp_servers = set(tcp_servers)
+
+    async def query(self, name, to_server, qtype, to_port=53, timeout=30):
+        """
+        Send a single query and return the reply as a WireResponse.
+        """
+        if to_server not in self.tcp_servers:
+            a = await self.udp.query(name, to_server, qtype, to_port, timeout)
+            if not a.header['tc']:
+                return a
+        return await self.tcp.query(name, to_server, qtype, to_port, timeout)
+
+    async def close(self):
+        """ close all sockets and connections opened on the running event loop """
+        await self.udp.close()
+        await self.tcp.close()
+
+    def stats(self):
+        """ return a dict of 'udp' and 'tcp' pool statistics """
+        return {'udp': self.udp.stats(), 'tcp': self.tcp.stats()}
@@ -0,0 +1,357 @@
+"""
+Minimal stand-in authoritative DNS server, for tests that need to exercise
+real sockets without depending on live DNS, and other helpers shared by the
+tests.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socketserver
+import struct
+import threading
+import time
+
+import DNS
+
+
+def run(coro):
+    """ run a coroutine to completion on a new event loop, and return its result """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class FakeClock(object):
+    """
+    Stands in for a clock callable (i.e. time.monotonic) or the time module.
+    Each reading advances it by ``step`` seconds, and sleep() advances it by
+    the time slept, which is appended to ``sleeps``; tests can also move
+    ``now`` themselves.
+    """
+
+    def __init__(self, step=0.0, now=1000.0):
+        self.now = now
+        self.step = step
+        self.sleeps = []
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+    def time(self):
+        return self()
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+class StubDNSServer(object):
+    """
+    Tiny threaded UDP DNS server answering from a dict of records.
+
+    ``records`` maps a lower-case owner name to a list of
+    ``(typename, data, ttl)`` tuples; for example
+    ``{'foo.example.com': [('A', '1.2.3.4', 360)]}``. A query for a name
+    that isn't in ``records`` gets NXDOMAIN, and a query for a name that
+    exists but has no records of the requested type gets an empty NOERROR
+    answer. ``rcodes`` maps a name to a status string (i.e. 'SERVFAIL')
+    that is returned for any query for that name.
+
+    Like a real authoritative server, an ``A`` query for a name holding a
+    CNAME is answered with the CNAME, unless ``cname_in_a`` is False. SOA
+    records are given as ``('SOA', (mname, rname, serial, refresh, retry,
+    expire, minimum), ttl)``; a negative answer for a name at or below an
+    owner with a SOA record carries that record in its authority section.
+
+    Every query received is appended to ``queries`` as a
+    ``(qname, qtypestr)`` tuple. If ``delay`` is set, each response is sent
+    after sleeping that many seconds (queries are handled concurrently);
+    ``delays`` maps a name to a delay for queries for just that name.
+
+    The server also listens for TCP on the same port, answering each
+    length-prefixed query on a connection in its own thread, so replies
+    to pipelined queries can go out of order; ``tcp_queries`` and
+    ``tcp_connections`` count them. UDP responses for names in
+    ``truncate`` have the TC bit set and no answers.
+
+    An AXFR query over TCP for a name with a SOA record is answered with
+    every record at or below it, between two copies of the SOA record, in
+    messages of ``axfr_chunk`` records each; zones in ``refuse_axfr`` (and
+    names without a SOA record) get REFUSED.
+
+    ``change_zone()`` changes the records of a zone and its SOA serial,
+    and keeps the change in ``journal``, so an IXFR query from an older
+    serial is answered with the changes since (or the whole zone, if the
+    journal doesn't go back to that serial, or ``ixfr_full`` is set).
+    """
+
+    def __init__(self, records=None, rcodes=None, cname_in_a=True, delay=0.0,
+                 delays=None, truncate=None, axfr_chunk=2, refuse_axfr=None,
+                 ixfr_full=False):
+        self.records = records or {}
+        self.rcodes = rcodes or {}
+        self.cname_in_a = cname_in_a
+        self.delay = delay
+        self.delays = delays or {}
+        self.truncate = set(truncate or [])
+        self.axfr_chunk = axfr_chunk
+        self.refuse_axfr = set(refuse_axfr or [])
+        self.ixfr_full = ixfr_full
+        # zone -> list of (old SOA, deleted, new SOA, added) with the records
+        # as (owner, typename, data, ttl) tuples
+        self.journal = {}
+        self.queries = []
+        self.tcp_queries = 0
+        self.tcp_connections = 0
+        self.udp = None
+        self.tcp = None
+        self.threads = []
+
+    @property
+    def port(self):
+        return self.udp.server_address[1]
+
+    def start(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                reply = server.build_response(data, udp=True)
+                server.sleep_for(data)
+                try:
+                    sock.sendto(reply, self.client_address)
+                except OSError:
+                    # the server was stopped while this reply was delayed
+                    pass
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server.tcp_connections += 1
+                lock = threading.Lock()
+                buf = b''
+                while True:
+                    data = self.request.recv(65535)
+                    if not data:
+                        return
+                    buf += data
+                    while len(buf) >= 2 and len(buf) >= 2 + struct.unpack('!H', buf[:2])[0]:
+                        n = struct.unpack('!H', buf[:2])[0]
+                        msg, buf = buf[2:2 + n], buf[2 + n:]
+                        server.tcp_queries += 1
+                        t = threading.Thread(target=self.reply, args=(msg, lock))
+                        t.daemon = True
+                        t.start()
+
+            def reply(self, msg, lock):
+                replies = server.build_transfer(msg)
+                if replies is None:
+                    replies = [server.build_response(msg)]
+                server.sleep_for(msg)
+                with lock:
+                    try:
+                        for reply in replies:
+                            self.request.sendall(struct.pack('!H', len(reply)) + reply)
+                    except OSError:
+                        pass
+
+        socketserver.ThreadingUDPServer.daemon_threads = True
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        while self.tcp is None:
+            self.udp = socketserver.ThreadingUDPServer(('127.0.0.1', 0), Handler)
+            try:
+                self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', self.port), TCPHandler)
+            except OSError:
+                # the TCP port is taken, i.e. by a client's connection; try another
+                self.udp.server_close()
+        for s in (self.udp, self.tcp):
+            t = threading.Thread(target=s.serve_forever, args=(0.05,))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def stop(self):
+        for s in (self.udp, self.tcp):
+            s.shutdown()
+            s.server_close()
+
+    def sleep_for(self, data):
+        qname = DNS.Lib.Munpacker(data[12:]).getname().lower().rstrip('.')
+        delay = self.delays.get(qname, self.delay)
+        if delay:
+            time.sleep(delay)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def lookup(self, qname, qtype):
+        """ return (status, list of (typename, data, ttl)) for a question """
+        name = qname.lower().rstrip('.')
+        if name in self.rcodes:
+            return (self.rcodes[name], [])
+        if name not in self.records:
+            return ('NXDOMAIN', [])
+        rrs = [r for r in self.records[name] if r[0] == qtype]
+        if not rrs and qtype == 'A' and self.cname_in_a:
+            rrs = [r for r in self.records[name] if r[0] == 'CNAME']
+        return ('NOERROR', rrs)
+
+    def find_soa(self, qname):
+        """ return (zone, SOA record tuple) of the zone enclosing qname, or None """
+        labels = qname.lower().rstrip('.').split('.')
+        for i in range(len(labels)):
+            zone = '.'.join(labels[i:])
+            for r in self.records.get(zone, []):
+                if r[0] == 'SOA':
+                    return (zone, r)
+        return None
+
+    def build_response(self, data, udp=False):
+        u = DNS.Lib.Munpacker(data)
+        header = u.getHeader()
+        qname, qtype, qclass = u.getQuestion()
+        qtypestr = DNS.Type.typestr(qtype)
+        self.queries.append((qname, qtypestr))
+        status, rrs = self.lookup(qname, qtypestr)
+        rcode = getattr(DNS.Status, status)
+        tc = 0
+        if udp and qname.lower().rstrip('.') in self.truncate:
+            tc = 1
+            rrs = []
+        soa = None
+        if not rrs and not tc and status in ('NOERROR', 'NXDOMAIN'):
+            soa = self.find_soa(qname)
+
+        m = DNS.Lib.Mpacker()
+        m.addHeader(header[0], 1, header[2], 1, tc, header[5], 0, 0, rcode,
+                    1, len(rrs), 1 if soa else 0, 0)
+        m.addQuestion(qname, qtype, qclass)
+        for typename, rdata, ttl in rrs:
+            self.add_rr(m, qname, typename, rdata, ttl)
+        if soa:
+            self.add_rr(m, soa[0], *soa[1])
+        return m.getbuf()
+
+    def change_zone(self, zone, serial, delete=(), add=()):
+        """
+        change the records of a zone, as (owner, typename, data, ttl)
+        tuples, and set its SOA serial, keeping the change in the journal
+        """
+        old = [r for r in self.records[zone] if r[0] == 'SOA'][0]
+        soa = (old[0], old[1][:2] + (serial,) + old[1][3:], old[2])
+        for owner, typename, data, ttl in delete:
+            self.records[owner].remove((typename, data, ttl))
+            if not self.records[owner]:
+                del self.records[owner]
+        for owner, typename, data, ttl in add:
+            self.records.setdefault(owner, []).append((typename, data, ttl))
+        self.records[zone][self.records[zone].index(old)] = soa
+        self.journal.setdefault(zone, []).append(((zone,) + old, list(delete), (zone,) + soa, list(add)))
+
+    def build_transfer(self, data):
+        """ return the list of messages answering an AXFR or IXFR query, or None for other queries """
+        u = DNS.Lib.Munpacker(data)
+        header = u.getHeader()
+        qname, qtype, qclass = u.getQuestion()
+        # pydns doesn't know the IXFR type
+        typestr = 'IXFR' if qtype == 251 else DNS.Type.typestr(qtype)
+        if typestr not in ('AXFR', 'IXFR'):
+            return None
+        self.queries.append((qname, typestr))
+        zone = qname.lower().rstrip('.')
+        soa = [r for r in self.records.get(zone, []) if r[0] == 'SOA']
+        if not soa or zone in self.refuse_axfr:
+            m = DNS.Lib.Mpacker()
+            m.addHeader(header[0], 1, 0, 0, 0, header[5], 0, 0, DNS.Status.REFUSED, 1, 0, 0, 0)
+            m.addQuestion(qname, qtype, qclass)
+            return [m.getbuf()]
+        rrs = None
+        if typestr == 'IXFR':
+            u.getRRheader()
+            rrs = self.ixfr_records(zone, u.getSOAdata()[2][1])
+        if rrs is None:
+            rrs = [(zone,) + soa[0]]
+            for owner in sorted(self.records):
+                if owner == zone or owner.endswith('.' + zone):
+                    rrs.extend((owner,) + r for r in self.records[owner] if r is not soa[0])
+            rrs.append((zone,) + soa[0])
+        messages = []
+        for i in range(0, len(rrs), self.axfr_chunk):
+            chunk = rrs[i:i + self.axfr_chunk]
+            m = DNS.Lib.Mpacker()
+            m.addHeader(header[0], 1, 0, 1, 0, header[5], 0, 0, 0, 1, len(chunk), 0, 0)
+            m.addQuestion(qname, qtype, qclass)
+            for rr in chunk:
+                self.add_rr(m, *rr)
+            messages.append(m.getbuf())
+        return messages
+
+    def ixfr_records(self, zone, serial):
+        """
+        return the records answering an IXFR query for the changes to a
+        zone since a serial, or None to send the whole zone instead
+        """
+        soa = [(zone,) + r for r in self.records[zone] if r[0] == 'SOA'][0]
+        if soa[2][2] == serial:
+            return [soa]
+        if self.ixfr_full:
+            return None
+        changes = self.journal.get(zone, [])
+        for i, change in enumerate(changes):
+            if change[0][2][2] == serial:
+                break
+        else:
+            return None
+        rrs = [soa]
+        for old, deleted, new, added in changes[i:]:
+            rrs.extend([old] + deleted + [new] + added)
+        rrs.append(soa)
+        return rrs
+
+    def add_rr(self, m, name, typename, rdata, ttl):
+        if typename == 'SOA':
+            m.addSOA(name, DNS.Class.IN, ttl, *rdata)
+        else:
+            getattr(m, 'add%s' % typename)(name, DNS.Class.IN, ttl, rdata)
@@ -0,0 +1,197 @@
+"""
+tests for asyncdns.py / DNStestAsyncDNS
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+import DNS
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.dns import DNStestDNS
+from pydnstest.retry import RetryPolicies, RetryPolicy
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+RECORDS = {
+    'host1.example.com': [('A', '1.2.3.4', 3600)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 300)],
+    '4.3.2.1.in-addr.arpa': [('PTR', 'host1.example.com', 3600)],
+}
+
+
+class TestAsyncDNS:
+    """
+    tests for asyncdns.py / DNStestAsyncDNS, against a local stub server
+    """
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(RECORDS, rcodes={'broken.example.com': 'SERVFAIL'}).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    def test_resolve_name_A(self, server):
+        result = {'answer': {'class': 1, 'classstr': 'IN', 'data': '1.2.3.4', 'name': 'host1.example.com', 'rdlength': 4, 'ttl': 3600, 'type': 1, 'typename': 'A'}}
+        foo = run(DNStestAsyncDNS().resolve_name('host1.example.com', '127.0.0.1', server.port))
+        assert foo == result
+
+    def test_resolve_name_CNAME(self, server):
+        result = {'answer': {'class': 1, 'classstr': 'IN', 'data': 'host1.example.com', 'name': 'alias1.example.com', 'rdlength': 8, 'ttl': 300, 'type': 5, 'typename': 'CNAME'}}
+        foo = run(DNStestAsyncDNS().resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert foo == result
+
+    def test_resolve_name_CNAME_fallback(self, server):
+        """ server that doesn't return the CNAME for an A query """
+        server.cname_in_a = False
+        foo = run(DNStestAsyncDNS(resolve_mode='fallback').resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert foo['answer']['data'] == 'host1.example.com'
+        assert server.queries == [('alias1.example.com', 'A'), ('alias1.example.com', 'CNAME')]
+
+    def test_resolve_name_single(self, server):
+        """ default mode sends one A query, even for NXDOMAIN """
+        foo = run(DNStestAsyncDNS().resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert foo['answer']['typename'] == 'CNAME'
+        foo = run(DNStestAsyncDNS().resolve_name('notaname.example.com', '127.0.0.1', server.port))
+        assert foo == {'status': 'NXDOMAIN'}
+        assert server.queries == [('alias1.example.com', 'A'), ('notaname.example.com', 'A')]
+
+    def test_resolve_name_single_no_cname_in_a(self, server):
+        """ single mode can't find a CNAME the server only returns for CNAME queries """
+        server.cname_in_a = False
+        foo = run(DNStestAsyncDNS(resolve_mode='single').resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert foo == {'status': 'NOERROR'}
+        assert server.queries == [('alias1.example.com', 'A')]
+
+    @pytest.mark.parametrize("name, typename", [
+        ('host1.example.com', 'A'),
+        ('alias1.example.com', 'CNAME'),
+    ])
+    def test_resolve_name_parallel(self, server, name, typename):
+        """ A and CNAME sent together; whichever has the answer wins """
+        server.cname_in_a = False
+        foo = run(DNStestAsyncDNS(resolve_mode='parallel').resolve_name(name, '127.0.0.1', server.port))
+        assert foo['answer']['typename'] == typename
+        # the query without the answer may be cancelled before it is sent
+        assert (name, typename) in server.queries
+        assert set(server.queries) <= set([(name, 'A'), (name, 'CNAME')])
+
+    def test_resolve_name_parallel_nxdomain(self, server):
+        server.delay = 0.2
+        start = time.time()
+        foo = run(DNStestAsyncDNS(resolve_mode='parallel').resolve_name('notaname.example.com', '127.0.0.1', server.port))
+        assert foo == {'status': 'NXDOMAIN'}
+        assert time.time() - start < 0.4
+
+    def test_resolve_name_nxdomain(self, server):
+        foo = run(DNStestAsyncDNS().resolve_name('notaname.example.com', '127.0.0.1', server.port))
+        assert foo == {'status': 'NXDOMAIN'}
+
+    def test_resolve_name_servfail(self, server):
+        foo = run(DNStestAsyncDNS().resolve_name('broken.example.com', '127.0.0.1', server.port))
+        assert foo == {'status': 'SERVFAIL'}
+
+    def test_lookup_reverse(self, server):
+        foo = run(DNStestAsyncDNS().lookup_reverse('1.2.3.4', '127.0.0.1', server.port))
+        assert foo['answer']['data'] == 'host1.example.com'
+        assert foo['answer']['typename'] == 'PTR'
+        assert server.queries == [('4.3.2.1.in-addr.arpa', 'PTR')]
+
+    def test_lookup_reverse_nxdomain(self, server):
+        foo = run(DNStestAsyncDNS().lookup_reverse('1.2.3.5', '127.0.0.1', server.port))
+        assert foo == {'status': 'NXDOMAIN'}
+
+    @pytest.mark.parametrize("method, name", [
+        ('resolve_name', 'host1.example.com'),
+        ('resolve_name', 'alias1.example.com'),
+        ('resolve_name', 'notaname.example.com'),
+        ('lookup_reverse', '1.2.3.4'),
+        ('lookup_reverse', '1.2.3.5'),
+    ])
+    def test_same_as_blocking(self, server, method, name):
+        """ results must match the blocking DNStestDNS exactly """
+        expected = getattr(DNStestDNS(), method)(name, '127.0.0.1', server.port)
+        foo = run(getattr(DNStestAsyncDNS(), method)(name, '127.0.0.1', server.port))
+        assert foo == expected
+
+    def test_concurrent(self, server):
+        """ slow queries awaited together take about as long as one """
+        server.delay = 0.2
+        adns = DNStestAsyncDNS()
+        names = ['host1.example.com', 'alias1.example.com'] * 10
+
+        async def resolve_all():
+            return await asyncio.gather(*[adns.resolve_name(n, '127.0.0.1', server.port) for n in names])
+
+        start = time.time()
+        foo = run(resolve_all())
+        elapsed = time.time() - start
+        assert [r['answer']['name'] for r in foo] == names
+        assert elapsed < 2.0
+
+    def test_timeout(self):
+        """ a server that never answers gets a TIMEOUT status """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        try:
+            dns = DNStestAsyncDNS(timeout=0.1)
+            assert run(dns.resolve_name('host1.example.com', '127.0.0.1', port)) == {'status': 'TIMEOUT'}
+            assert run(dns.lookup_reverse('1.2.3.4', '127.0.0.1', port)) == {'status': 'TIMEOUT'}
+            with pytest.raises(DNS.TimeoutError):
+                run(dns.query('host1.example.com', '127.0.0.1', 'A', port))
+        finally:
+            sock.close()
+
+    def test_timeout_retries(self):
+        """ timed out queries are resent as set by the server's RetryPolicy """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        try:
+            retry = RetryPolicies({'127.0.0.1': RetryPolicy(timeout=0.05, retries=2, retry_backoff=0.01)})
+            dns = DNStestAsyncDNS(timeout=10, retry=retry)
+            start = time.time()
+            assert run(dns.resolve_name('host1.example.com', '127.0.0.1', port)) == {'status': 'TIMEOUT'}
+            assert time.time() - start < 1.0
+            sock.settimeout(0.5)
+            for i in range(3):
+                sock.recvfrom(512)
+        finally:
+            sock.close()
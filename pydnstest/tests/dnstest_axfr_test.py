@@ -0,0 +1,290 @@
+"""
+tests for pydnstest.axfr zone transfers and snapshots, against a local stand-in
+authoritative server
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+
+import pytest
+import DNS
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.axfr import TransferError, Zone, ZoneSnapshot, iter_axfr, reverse_address, transfer_zone
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.dns import DNStestDNS
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+SOA = ('SOA', ('ns1.example.com', 'hostmaster.example.com', 2017122401, 3600, 600, 86400, 300), 3600)
+
+RECORDS = {
+    'example.com': [SOA, ('NS', 'ns1.example.com', 3600)],
+    'ns1.example.com': [('A', '1.2.3.1', 3600)],
+    'host1.example.com': [('A', '1.2.3.4', 3600), ('A', '1.2.3.5', 3600)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 300)],
+    'txt.example.com': [('TXT', 'hello', 300)],
+    'a.b.c.example.com': [('A', '1.2.3.6', 3600)],
+    'sub.example.com': [('NS', 'ns.elsewhere.net', 3600)],
+    'glue.sub.example.com': [('A', '1.2.3.7', 3600)],
+    '*.wild.example.com': [('A', '1.2.3.8', 3600)],
+    'wild.example.com': [('TXT', 'wildcards below', 300)],
+    'other.com': [SOA],
+    'host.other.com': [('A', '5.6.7.8', 3600)],
+    '3.2.1.in-addr.arpa': [('SOA', SOA[1], 3600)],
+    '4.3.2.1.in-addr.arpa': [('PTR', 'host1.example.com', 3600)],
+}
+
+
+def without_rdlength(r):
+    """ a lookup result without the answer's rdlength, which depends on name compression """
+    if 'answer' in r:
+        r['answer'].pop('rdlength')
+    return r
+
+
+@pytest.fixture(scope='module')
+def server():
+    with StubDNSServer(RECORDS) as s:
+        yield s
+
+
+@pytest.fixture(scope='module')
+def zone(server):
+    return transfer_zone('example.com', '127.0.0.1', server.port, timeout=5)
+
+
+def test_reverse_address():
+    assert reverse_address('4.3.2.1.in-addr.arpa') == '1.2.3.4'
+    assert reverse_address('3.2.1.in-addr.arpa') is None
+    assert reverse_address('host1.example.com') is None
+
+
+class TestIterAXFR:
+
+    def test_records(self, server):
+        rrs = list(iter_axfr('example.com', '127.0.0.1', server.port, timeout=5))
+        assert rrs[0]['typename'] == 'SOA'
+        assert rrs[0]['data'][2] == ('serial', 2017122401)
+        # the closing SOA record isn't yielded
+        assert [r['typename'] for r in rrs].count('SOA') == 1
+        names = set(r['name'] for r in rrs)
+        assert 'host1.example.com' in names
+        assert 'glue.sub.example.com' in names
+        assert 'host.other.com' not in names
+        assert len(rrs) == 12
+
+    def test_streamed(self, server):
+        """ records are yielded before the rest of the zone has been read """
+        rrs = iter_axfr('example.com', '127.0.0.1', server.port, timeout=5)
+        assert next(rrs)['typename'] == 'SOA'
+        rrs.close()
+
+    def test_refused(self):
+        with StubDNSServer(RECORDS, refuse_axfr=['example.com']) as s:
+            with pytest.raises(TransferError) as excinfo:
+                list(iter_axfr('example.com', '127.0.0.1', s.port, timeout=5))
+        assert 'REFUSED' in str(excinfo.value)
+        assert isinstance(excinfo.value, DNS.DNSError)
+
+    def test_not_a_zone(self, server):
+        with pytest.raises(TransferError):
+            list(iter_axfr('host1.example.com', '127.0.0.1', server.port, timeout=5))
+
+    def test_connection_refused(self):
+        with StubDNSServer(RECORDS) as s:
+            port = s.port
+        with pytest.raises(DNS.SocketError):
+            list(iter_axfr('example.com', '127.0.0.1', port, timeout=5))
+
+
+class TestZone:
+
+    def test_indexes(self, zone):
+        assert zone.name == 'example.com'
+        assert zone.serial == 2017122401
+        assert len(zone) == 12
+        assert zone.cuts == set(['sub.example.com'])
+        assert 'b.c.example.com' in zone.nonterminals
+        assert 'c.example.com' in zone.nonterminals
+
+    def test_resolve_a(self, zone):
+        r = zone.resolve_name('HOST1.example.com.')
+        assert r['answer']['data'] == '1.2.3.4'
+        assert r['answer']['typename'] == 'A'
+        assert r['answer']['name'] == 'HOST1.example.com'
+        assert zone.resolve_name('a.b.c.example.com')['answer']['data'] == '1.2.3.6'
+
+    def test_resolve_cname(self, zone):
+        r = zone.resolve_name('alias1.example.com')
+        assert r['answer']['typename'] == 'CNAME'
+        assert r['answer']['data'] == 'host1.example.com'
+
+    def test_answer_is_a_copy(self, zone):
+        zone.resolve_name('host1.example.com')['answer'].pop('ttl')
+        assert zone.resolve_name('host1.example.com')['answer']['ttl'] == 3600
+
+    def test_resolve_noerror(self, zone):
+        assert zone.resolve_name('txt.example.com') == {'status': 'NOERROR'}
+        assert zone.resolve_name('b.c.example.com') == {'status': 'NOERROR'}
+        assert zone.resolve_name('glue.sub.example.com') == {'status': 'NOERROR'}
+        assert zone.resolve_name('any.sub.example.com') == {'status': 'NOERROR'}
+
+    def test_resolve_nxdomain(self, zone):
+        assert zone.resolve_name('nothere.example.com') == {'status': 'NXDOMAIN'}
+        assert zone.resolve_name('x.a.b.c.example.com') == {'status': 'NXDOMAIN'}
+
+    def test_resolve_wildcard(self, zone):
+        r = zone.resolve_name('anything.wild.example.com')
+        assert r['answer']['data'] == '1.2.3.8'
+        assert r['answer']['name'] == 'anything.wild.example.com'
+        assert zone.resolve_name('wild.example.com') == {'status': 'NOERROR'}
+
+    def test_out_of_zone_ignored(self):
+        z = Zone('example.com')
+        z.add({'name': 'host.other.com', 'typename': 'A', 'data': '5.6.7.8'})
+        assert len(z) == 0
+
+    def test_reverse(self, server):
+        z = transfer_zone('3.2.1.in-addr.arpa', '127.0.0.1', server.port, timeout=5)
+        assert z.ptr['1.2.3.4']['data'] == 'host1.example.com'
+        assert z.lookup_reverse('1.2.3.4')['answer']['data'] == 'host1.example.com'
+        assert z.lookup_reverse('1.2.3.9') == {'status': 'NXDOMAIN'}
+
+
+class TestZoneSnapshot:
+
+    def test_zone_for(self, zone):
+        snap = ZoneSnapshot()
+        snap.add_zone(zone)
+        assert snap.zone_for('host1.EXAMPLE.com.') is zone
+        assert snap.zone_for('example.com') is zone
+        assert snap.zone_for('example.net') is None
+        assert snap.resolve_name('host.other.com') is None
+        assert snap.lookup_reverse('1.2.3.4') is None
+
+    def test_innermost_zone(self, zone):
+        inner = Zone('c.example.com')
+        snap = ZoneSnapshot()
+        snap.add_zone(zone)
+        snap.add_zone(inner)
+        assert snap.zone_for('a.b.c.example.com') is inner
+        assert snap.zone_for('host1.example.com') is zone
+
+
+class TestResolvers:
+
+    def test_transfer_zone(self, server):
+        d = DNStestDNS()
+        z = d.transfer_zone('example.com', '127.0.0.1', server.port)
+        assert d.snapshots['127.0.0.1'].zones['example.com'] is z
+        queries = len(server.queries)
+        assert d.resolve_name('host1.example.com', '127.0.0.1', server.port)['answer']['data'] == '1.2.3.4'
+        assert d.resolve_name('nothere.example.com', '127.0.0.1', server.port) == {'status': 'NXDOMAIN'}
+        assert len(server.queries) == queries
+        # names outside the transferred zones are still queried
+        assert d.resolve_name('host.other.com', '127.0.0.1', server.port)['answer']['data'] == '5.6.7.8'
+        assert d.lookup_reverse('1.2.3.4', '127.0.0.1', server.port)['answer']['data'] == 'host1.example.com'
+        assert len(server.queries) == queries + 2
+
+    def test_same_as_queried(self, server):
+        snap = DNStestDNS()
+        snap.transfer_zone('example.com', '127.0.0.1', server.port)
+        snap.transfer_zone('3.2.1.in-addr.arpa', '127.0.0.1', server.port)
+        d = DNStestDNS()
+        # (the stand-in server doesn't know about empty non-terminals or delegations)
+        for name in ('host1.example.com', 'alias1.example.com', 'txt.example.com', 'nothere.example.com'):
+            assert (without_rdlength(snap.resolve_name(name, '127.0.0.1', server.port)) ==
+                    without_rdlength(d.resolve_name(name, '127.0.0.1', server.port)))
+        for addr in ('1.2.3.4', '1.2.3.9'):
+            assert (without_rdlength(snap.lookup_reverse(addr, '127.0.0.1', server.port)) ==
+                    without_rdlength(d.lookup_reverse(addr, '127.0.0.1', server.port)))
+
+    def test_other_server_queried(self, server):
+        d = DNStestDNS()
+        d.transfer_zone('example.com', '127.0.0.1', server.port)
+        assert d.resolve_name('nothere.example.com', 'localhost', server.port) == {'status': 'NXDOMAIN'}
+        assert server.queries[-1] == ('nothere.example.com', 'A')
+
+    def test_async_shared(self, server):
+        d = DNStestDNS()
+        a = DNStestAsyncDNS(snapshots=d.snapshots)
+        d.transfer_zone('example.com', '127.0.0.1', server.port)
+        queries = len(server.queries)
+        r = run(a.resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert r['answer']['data'] == 'host1.example.com'
+        assert len(server.queries) == queries
+
+    def test_transfer_refused(self):
+        with StubDNSServer(RECORDS, refuse_axfr=['example.com']) as s:
+            d = DNStestDNS()
+            with pytest.raises(TransferError):
+                d.transfer_zone('example.com', '127.0.0.1', s.port)
+        assert d.snapshots == {}
+
+
+class TestLoadSnapshots:
+
+    def test_load_snapshots(self, server):
+        config = DnstestConfig()
+        config.server_test = "127.0.0.1"
+        config.server_prod = "prod.invalid"
+        config.axfr_zones = ['example.com']
+        chk = DNStestChecks(config)
+        transfer = chk.DNS.transfer_zone
+        chk.DNS.transfer_zone = lambda zone, to_server: transfer(zone, to_server, server.port)
+        messages = chk.load_snapshots()
+        assert messages[0] == "Note - transferred 12 records in zone example.com (serial 2017122401) from 127.0.0.1 (TEST)"
+        assert messages[1].startswith("WARNING: could not transfer zone example.com from prod.invalid (PROD), will query it instead: ")
+        # it couldn't be transferred from PROD, so isn't used for TEST either
+        assert chk.DNS.snapshots['127.0.0.1'].zones == {}
+        assert chk.AsyncDNS.snapshots is chk.DNS.snapshots
+        chk.close()
+
+    def test_load_snapshots_both(self, server):
+        config = DnstestConfig()
+        config.server_test = "127.0.0.1"
+        config.server_prod = "localhost"
+        config.axfr_zones = ['example.com', 'other.com']
+        chk = DNStestChecks(config)
+        transfer = chk.DNS.transfer_zone
+        chk.DNS.transfer_zone = lambda zone, to_server: transfer(zone, to_server, server.port)
+        messages = chk.load_snapshots()
+        assert len(messages) == 4
+        assert all(m.startswith("Note - ") for m in messages)
+        for s in ('127.0.0.1', 'localhost'):
+            assert sorted(chk.DNS.snapshots[s].zones) == ['example.com', 'other.com']
+        chk.close()
@@ -0,0 +1,174 @@
+"""
+tests for breaker.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.breaker import CircuitBreaker, CircuitBreakers, ServerUnreachable
+from pydnstest.dns import DNStestDNS
+from pydnstest.socketpool import AsyncUDPSocketPool, UDPSocketPool
+from pydnstest.tests.dnsserver import FakeClock, StubDNSServer, run
+
+
+class TestCircuitBreaker:
+    """
+    tests for CircuitBreaker and CircuitBreakers
+    """
+
+    def test_opens_after_threshold(self):
+        b = CircuitBreaker(threshold=3, clock=FakeClock())
+        for i in range(2):
+            assert b.allow()
+            b.timeout()
+        assert b.state == 'closed'
+        assert b.allow()
+        b.timeout()
+        assert b.state == 'open'
+        assert not b.allow()
+        assert b.short_circuited == 1
+
+    def test_success_resets_count(self):
+        b = CircuitBreaker(threshold=2, clock=FakeClock())
+        b.timeout()
+        b.success()
+        b.timeout()
+        assert b.state == 'closed'
+
+    def test_half_open_probe(self):
+        clock = FakeClock()
+        b = CircuitBreaker(threshold=1, reset_after=10, clock=clock)
+        b.timeout()
+        clock.now += 9
+        assert not b.allow()
+        clock.now += 1
+        # one probe at a time
+        assert b.allow()
+        assert b.state == 'half-open'
+        assert not b.allow()
+        # a failed probe re-opens it for another reset_after
+        b.timeout()
+        assert b.state == 'open'
+        clock.now += 5
+        assert not b.allow()
+        clock.now += 5
+        assert b.allow()
+        b.success()
+        assert b.state == 'closed'
+        assert b.allow()
+        assert b.allow()
+
+    def test_abandoned_probe(self):
+        clock = FakeClock()
+        b = CircuitBreaker(threshold=1, reset_after=10, clock=clock)
+        b.timeout()
+        clock.now += 10
+        assert b.allow()
+        b.abandon()
+        assert b.allow()
+
+    def test_breakers(self):
+        c = CircuitBreakers(threshold=1, clock=FakeClock())
+        c.check('a')
+        c.timeout('a')
+        with pytest.raises(ServerUnreachable):
+            c.check('a')
+        c.check('b')
+        c.success('b')
+        assert c.stats() == {'a': {'state': 'open', 'short_circuited': 1},
+                             'b': {'state': 'closed', 'short_circuited': 0}}
+
+
+class TestDNSBreaker:
+    """
+    tests for DNStestDNS and DNStestAsyncDNS with CircuitBreakers
+    """
+
+    def test_dns_fails_fast(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        pool = UDPSocketPool(timeout=0.05)
+        try:
+            dns = DNStestDNS(pool=pool, breaker=CircuitBreakers(threshold=2))
+            assert dns.resolve_name('foo.example.com', '127.0.0.1', port) == {'status': 'TIMEOUT'}
+            assert dns.resolve_name('foo.example.com', '127.0.0.1', port) == {'status': 'TIMEOUT'}
+            start = time.time()
+            assert dns.resolve_name('foo.example.com', '127.0.0.1', port) == {'status': 'UNREACHABLE'}
+            assert dns.lookup_reverse('1.2.3.4', '127.0.0.1', port) == {'status': 'UNREACHABLE'}
+            assert time.time() - start < 0.05
+        finally:
+            pool.close()
+            sock.close()
+
+    def test_dns_answers_close(self):
+        records = {'foo.example.com': [('A', '1.2.3.4', 360)]}
+        breaker = CircuitBreakers(threshold=1)
+        with StubDNSServer(records) as srv:
+            pool = UDPSocketPool()
+            dns = DNStestDNS(pool=pool, breaker=breaker)
+            foo = dns.resolve_name('foo.example.com', '127.0.0.1', srv.port)
+            pool.close()
+        assert foo['answer']['data'] == '1.2.3.4'
+        assert breaker.stats()['127.0.0.1']['state'] == 'closed'
+
+    def test_async_fails_fast(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        breaker = CircuitBreakers(threshold=1)
+        try:
+            pool = AsyncUDPSocketPool()
+            dns = DNStestAsyncDNS(timeout=0.05, pool=pool, breaker=breaker)
+
+            async def go():
+                first = await dns.resolve_name('foo.example.com', '127.0.0.1', port)
+                rest = await asyncio.gather(*[dns.resolve_name('host%d.example.com' % i, '127.0.0.1', port)
+                                              for i in range(10)])
+                await pool.close()
+                return first, rest
+            first, rest = run(go())
+        finally:
+            sock.close()
+        assert first == {'status': 'TIMEOUT'}
+        assert rest == [{'status': 'UNREACHABLE'}] * 10
+        assert breaker.stats()['127.0.0.1']['short_circuited'] == 10
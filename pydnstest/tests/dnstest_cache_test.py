@@ -0,0 +1,279 @@
+"""
+tests for cache.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.cache import DNStestCache, DNStestPersistentCache, cache_key, response_ttl
+from pydnstest.dns import DNStestDNS
+from pydnstest.tests.dnsserver import FakeClock, StubDNSServer, run
+
+SOA = ('SOA', ('ns1.example.com', 'hostmaster.example.com', 2017122401, 3600, 600, 86400, 60), 3600)
+
+RECORDS = {
+    'example.com': [SOA],
+    'host1.example.com': [('A', '1.2.3.4', 360)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 300)],
+}
+
+
+class FakeResponse(object):
+
+    def __init__(self, answers, status='NOERROR', authority=None):
+        self.answers = answers
+        self.authority = authority or []
+        self.header = {'status': status}
+
+
+def answer(name, data, ttl):
+    return {'name': name, 'data': data, 'ttl': ttl, 'typename': 'A', 'type': 1,
+            'class': 1, 'classstr': 'IN', 'rdlength': 4}
+
+
+def soa_rr(ttl, minimum):
+    return {'name': 'example.com', 'typename': 'SOA', 'ttl': ttl,
+            'data': ('ns1.example.com', 'hostmaster.example.com', ('serial', 1),
+                     ('refresh ', 3600, '1 hours'), ('retry', 600, '10 minutes'),
+                     ('expire', 86400, '1 days'), ('minimum', minimum, '1 minutes'))}
+
+
+class TestCache:
+    """
+    tests for DNStestCache
+    """
+
+    def test_cache_key(self):
+        assert cache_key('Foo.Example.com.', '1.2.3.4', 'A') == ('1.2.3.4', 53, 'foo.example.com', 'A')
+
+    @pytest.mark.parametrize("response, ttl", [
+        (FakeResponse([answer('a', '1.2.3.4', 300), answer('a', '1.2.3.5', 60)]), 60),
+        (FakeResponse([], 'NXDOMAIN', [soa_rr(3600, 60)]), 60),
+        (FakeResponse([], 'NOERROR', [soa_rr(30, 60)]), 30),
+        (FakeResponse([], 'NXDOMAIN'), None),
+        (FakeResponse([], 'SERVFAIL', [soa_rr(3600, 60)]), None),
+    ])
+    def test_response_ttl(self, response, ttl):
+        assert response_ttl(response) == ttl
+
+    def test_hit_miss(self):
+        c = DNStestCache(clock=FakeClock())
+        key = cache_key('a.example.com', '1.2.3.4', 'A')
+        assert c.get(key) is None
+        c.put(key, FakeResponse([answer('a.example.com', '1.2.3.4', 300)]))
+        r = c.get(key)
+        assert r.answers == [answer('a.example.com', '1.2.3.4', 300)]
+        assert r.header == {'status': 'NOERROR'}
+        assert c.stats() == {'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+    def test_contains(self):
+        clock = FakeClock()
+        c = DNStestCache(clock=clock)
+        key = cache_key('a.example.com', '1.2.3.4', 'A')
+        assert c.contains(key) is False
+        c.put(key, FakeResponse([answer('a.example.com', '1.2.3.4', 300)]))
+        assert c.contains(key) is True
+        # doesn't count as a hit or miss
+        assert c.stats() == {'size': 1, 'hits': 0, 'misses': 0, 'evictions': 0}
+        clock.now += 300
+        assert c.contains(key) is False
+
+    def test_contains_backing(self, tmpdir):
+        backing = DNStestPersistentCache(str(tmpdir.join('dnstest.cache')), ['1.2.3.4'], clock=FakeClock())
+        key = cache_key('a.example.com', '1.2.3.4', 'A')
+        backing.store(key, (1300.0, [answer('a.example.com', '1.2.3.4', 300)], [], 'NOERROR'))
+        c = DNStestCache(clock=FakeClock(), backing=backing)
+        assert c.contains(key) is True
+        assert len(c) == 0
+        backing.close()
+
+    def test_returns_copy(self):
+        """ confirm_name pops 'ttl' from answers; that mustn't reach the cache """
+        c = DNStestCache(clock=FakeClock())
+        c.put('k', FakeResponse([answer('a', '1.2.3.4', 300)]))
+        c.get('k').answers[0].pop('ttl')
+        assert c.get('k').answers[0]['ttl'] == 300
+
+    def test_expiry(self):
+        clock = FakeClock()
+        c = DNStestCache(clock=clock)
+        c.put('k', FakeResponse([answer('a', '1.2.3.4', 300)]))
+        clock.now += 299
+        assert c.get('k') is not None
+        clock.now += 1
+        assert c.get('k') is None
+        assert len(c) == 0
+
+    def test_negative_expiry(self):
+        clock = FakeClock()
+        c = DNStestCache(clock=clock)
+        c.put('k', FakeResponse([], 'NXDOMAIN', [soa_rr(3600, 60)]))
+        clock.now += 59
+        assert c.get('k').header['status'] == 'NXDOMAIN'
+        clock.now += 1
+        assert c.get('k') is None
+
+    @pytest.mark.parametrize("response", [
+        FakeResponse([], 'SERVFAIL'),
+        FakeResponse([], 'NXDOMAIN'),
+        FakeResponse([answer('a', '1.2.3.4', 0)]),
+    ])
+    def test_not_cached(self, response):
+        c = DNStestCache(clock=FakeClock())
+        c.put('k', response)
+        assert len(c) == 0
+
+    def test_lru_eviction(self):
+        c = DNStestCache(max_size=2, clock=FakeClock())
+        c.put('a', FakeResponse([answer('a', '1.2.3.4', 300)]))
+        c.put('b', FakeResponse([answer('b', '1.2.3.4', 300)]))
+        assert c.get('a') is not None
+        c.put('c', FakeResponse([answer('c', '1.2.3.4', 300)]))
+        assert c.get('b') is None
+        assert c.get('a') is not None
+        assert c.get('c') is not None
+        assert c.stats()['evictions'] == 1
+
+
+class TestPersistentCache:
+    """
+    tests for DNStestPersistentCache
+    """
+
+    def entry(self, expires):
+        return (expires, [{'name': 'a.example.com', 'data': (10, 'mx.example.com'), 'ttl': 300}],
+                [], 'NOERROR')
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        key = cache_key('a.example.com', '1.2.3.4', 'MX')
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=FakeClock())
+        c.store(key, self.entry(1300.0))
+        c.close()
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=FakeClock())
+        # tuples must come back as tuples, to compare equal to fresh answers
+        assert c.load(key) == self.entry(1300.0)
+        c.close()
+
+    def test_only_servers(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        key = cache_key('a.example.com', '1.2.3.5', 'MX')
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=FakeClock())
+        c.store(key, self.entry(1300.0))
+        assert c.load(key) is None
+        c.close()
+
+    def test_expiry(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        key = cache_key('a.example.com', '1.2.3.4', 'MX')
+        clock = FakeClock()
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=clock)
+        c.store(key, self.entry(1300.0))
+        clock.now = 1300.0
+        assert c.load(key) is None
+        c.close()
+
+    def test_refresh(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        key = cache_key('a.example.com', '1.2.3.4', 'MX')
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=FakeClock())
+        c.store(key, self.entry(1300.0))
+        c.close()
+        c = DNStestPersistentCache(path, ['1.2.3.4'], refresh=True, clock=FakeClock())
+        assert c.load(key) is None
+        c.store(key, self.entry(1200.0))
+        c.close()
+        c = DNStestPersistentCache(path, ['1.2.3.4'], clock=FakeClock())
+        assert c.load(key) == self.entry(1200.0)
+        c.close()
+
+    def test_warm_cache(self, tmpdir):
+        """ a second run answers PROD queries from the file """
+        path = str(tmpdir.join('dnstest.cache'))
+        with StubDNSServer(RECORDS) as server:
+            for i in range(2):
+                cache = DNStestCache(backing=DNStestPersistentCache(path, ['127.0.0.1']))
+                d = DNStestDNS(cache=cache)
+                assert d.resolve_name('host1.example.com', '127.0.0.1', server.port)['answer']['data'] == '1.2.3.4'
+                assert d.resolve_name('nxhost.example.com', '127.0.0.1', server.port) == {'status': 'NXDOMAIN'}
+                cache.close()
+            assert server.queries == [('host1.example.com', 'A'), ('nxhost.example.com', 'A')]
+            assert cache.stats()['hits'] == 2
+
+
+class TestCachedLookups:
+    """
+    tests for DNStestDNS and DNStestAsyncDNS with a cache, against a local stub server
+    """
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(RECORDS).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    def test_blocking(self, server):
+        d = DNStestDNS(cache=DNStestCache())
+        for i in range(3):
+            assert d.resolve_name('host1.example.com', '127.0.0.1', server.port)['answer']['data'] == '1.2.3.4'
+            assert d.resolve_name('nxhost.example.com', '127.0.0.1', server.port) == {'status': 'NXDOMAIN'}
+        assert server.queries == [('host1.example.com', 'A'), ('nxhost.example.com', 'A')]
+        assert d.cache.stats() == {'size': 2, 'hits': 4, 'misses': 2, 'evictions': 0}
+
+    def test_blocking_no_cache(self, server):
+        d = DNStestDNS()
+        d.resolve_name('host1.example.com', '127.0.0.1', server.port)
+        d.resolve_name('host1.example.com', '127.0.0.1', server.port)
+        assert len(server.queries) == 2
+
+    def test_keyed_by_port(self, server):
+        d = DNStestDNS(cache=DNStestCache())
+        d.resolve_name('host1.example.com', '127.0.0.1', server.port)
+        with StubDNSServer({'host1.example.com': [('A', '1.2.3.5', 360)]}) as other:
+            res = d.resolve_name('host1.example.com', '127.0.0.1', other.port)
+        assert res['answer']['data'] == '1.2.3.5'
+
+    def test_async_shared(self, server):
+        """ the blocking and asyncio engines can share one cache """
+        cache = DNStestCache()
+        DNStestDNS(cache=cache).resolve_name('alias1.example.com', '127.0.0.1', server.port)
+        res = run(DNStestAsyncDNS(cache=cache).resolve_name('alias1.example.com', '127.0.0.1', server.port))
+        assert res['answer']['data'] == 'host1.example.com'
+        assert server.queries == [('alias1.example.com', 'A')]
+        assert cache.hits == 1
@@ -0,0 +1,286 @@
+"""
+tests for running DNStestChecks query plans concurrently
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+
+import pytest
+
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+
+"""
+Format of the 'known_dns' dict:
+    [prod|test] - whether this is for the prod or test DNS server
+        [fwd|rev] - whether this is forward or reverse DNS
+            [recordname] = value; for 'rev' the PTR value, for 'fwd' a list
+            of the record data and typename
+"""
+known_dns = {'test': {'fwd': {}, 'rev': {}}, 'prod': {'fwd': {}, 'rev': {}}}
+known_dns['test']['fwd']['newhost.example.com'] = ['1.2.3.10', 'A']
+known_dns['test']['rev']['1.2.3.10'] = 'newhost.example.com'
+known_dns['test']['fwd']['changed.example.com'] = ['1.2.3.11', 'A']
+known_dns['prod']['fwd']['changed.example.com'] = ['1.2.3.12', 'A']
+known_dns['test']['rev']['1.2.3.11'] = 'changed.example.com'
+known_dns['test']['fwd']['same.example.com'] = ['1.2.3.13', 'A']
+known_dns['prod']['fwd']['same.example.com'] = ['1.2.3.13', 'A']
+known_dns['test']['fwd']['wrongval.example.com'] = ['1.2.3.14', 'A']
+known_dns['prod']['fwd']['wrongval.example.com'] = ['1.2.3.15', 'A']
+known_dns['test']['rev']['1.2.3.14'] = 'wrongval.example.com'
+known_dns['test']['fwd']['renamed.example.com'] = ['1.2.3.16', 'A']
+known_dns['prod']['fwd']['oldname.example.com'] = ['1.2.3.16', 'A']
+known_dns['test']['rev']['1.2.3.16'] = 'renamed.example.com'
+known_dns['prod']['fwd']['removed.example.com'] = ['1.2.3.17', 'A']
+
+
+def answer(name, data, typename):
+    return {'answer': {'name': name, 'data': data, 'typename': typename, 'classstr': 'IN', 'ttl': 360, 'type': 5, 'class': 1, 'rdlength': 14}}
+
+
+class StubDNS(object):
+    """
+    stub for DNStestDNS, answering from known_dns and logging each query
+    """
+
+    def __init__(self):
+        self.queries = []
+        # (name, server) lookups that time out
+        self.timeouts = set()
+        # servers whose circuit breaker is open
+        self.unreachable = set()
+
+    def resolve_name(self, query, to_server, to_port=53):
+        self.queries.append(('resolve_name', query, to_server))
+        if (query, to_server) in self.timeouts:
+            return {'status': 'TIMEOUT'}
+        if to_server in self.unreachable:
+            return {'status': 'UNREACHABLE'}
+        if query in known_dns[to_server]['fwd']:
+            return answer(query, *known_dns[to_server]['fwd'][query])
+        return {'status': 'NXDOMAIN'}
+
+    def lookup_reverse(self, name, to_server, to_port=53):
+        self.queries.append(('lookup_reverse', name, to_server))
+        if (name, to_server) in self.timeouts:
+            return {'status': 'TIMEOUT'}
+        if name in known_dns[to_server]['rev']:
+            return answer(name, known_dns[to_server]['rev'][name], 'PTR')
+        return {'status': 'NXDOMAIN'}
+
+
+class StubAsyncDNS(StubDNS):
+    """
+    stub for DNStestAsyncDNS; every lookup takes 10ms, and the maximum
+    number of lookups in flight at once is recorded in max_in_flight
+    """
+
+    def __init__(self):
+        super(StubAsyncDNS, self).__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.batches = []
+
+    async def _lookup(self, method, name, to_server):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return getattr(StubDNS, method)(self, name, to_server)
+
+    async def resolve_name(self, query, to_server, to_port=53):
+        return await self._lookup('resolve_name', query, to_server)
+
+    async def lookup_reverse(self, name, to_server, to_port=53):
+        return await self._lookup('lookup_reverse', name, to_server)
+
+
+class TestChecksAsync:
+    """
+    Tests DNStestChecks.run_async() against the blocking run_plan() path
+    """
+
+    @pytest.fixture
+    def chk(self):
+        config = DnstestConfig()
+        config.server_test = "test"
+        config.server_prod = "prod"
+        config.default_domain = ".example.com"
+        config.have_reverse_dns = True
+        config.ignore_ttl = False
+        chk = DNStestChecks(config)
+        chk.DNS = StubDNS()
+        chk.AsyncDNS = StubAsyncDNS()
+        return chk
+
+    def run(self, chk, check, *args):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(chk.run_async(check, *args))
+        finally:
+            loop.close()
+
+    @pytest.mark.parametrize(("check", "args"), [
+        ('check_added_name', ('newhost', '1.2.3.10')),
+        ('verify_added_name', ('newhost', '1.2.3.10')),
+        ('check_changed_name', ('changed', '1.2.3.11')),
+        ('check_changed_name', ('same', '1.2.3.13')),
+        ('check_changed_name', ('wrongval', '1.2.3.99')),
+        ('verify_changed_name', ('changed', '1.2.3.12')),
+        ('check_renamed_name', ('oldname', 'renamed', '1.2.3.16')),
+        ('verify_renamed_name', ('oldname', 'renamed', '1.2.3.16')),
+        ('check_removed_name', ('removed',)),
+        ('verify_removed_name', ('removed',)),
+        ('confirm_name', ('same',)),
+        ('confirm_name', ('changed',)),
+    ])
+    def test_same_as_blocking(self, chk, check, args):
+        """ concurrent and one-at-a-time runs of a plan give the same result """
+        expected = getattr(chk, check)(*args)
+        assert self.run(chk, check, *args) == expected
+
+    def test_check_added_concurrent(self, chk):
+        """ TEST, PROD and the speculative reverse lookup are issued together """
+        res = self.run(chk, 'check_added_name', 'newhost', '1.2.3.10')
+        assert res['result'] is True
+        assert 'REVERSE OK: 1.2.3.10 => newhost.example.com (TEST)' in res['secondary']
+        assert chk.AsyncDNS.max_in_flight == 3
+        assert sorted(chk.AsyncDNS.queries) == sorted([
+            ('resolve_name', 'newhost.example.com', 'test'),
+            ('resolve_name', 'newhost.example.com', 'prod'),
+            ('lookup_reverse', '1.2.3.10', 'test'),
+        ])
+
+    def test_check_added_no_reverse(self, chk):
+        """ no speculative reverse lookup if have_reverse_dns is False """
+        chk.config.have_reverse_dns = False
+        self.run(chk, 'check_added_name', 'newhost', '1.2.3.10')
+        assert chk.AsyncDNS.max_in_flight == 2
+        assert len(chk.AsyncDNS.queries) == 2
+
+    def test_check_renamed_concurrent(self, chk):
+        """ every lookup of a rename, and the reverse lookup, go out together """
+        res = self.run(chk, 'check_renamed_name', 'oldname', 'renamed', '1.2.3.16')
+        assert res['result'] is True
+        assert chk.AsyncDNS.max_in_flight == 4
+        assert len(chk.AsyncDNS.queries) == 4
+
+    @pytest.mark.parametrize(("check", "args", "queries"), [
+        ('check_added_name', ('newhost', '1.2.3.10'), [
+            ('resolve_name', 'newhost.example.com', 'test'),
+            ('resolve_name', 'newhost.example.com', 'prod'),
+            ('lookup_reverse', '1.2.3.10', 'test'),
+        ]),
+        ('check_changed_name', ('wrongval', '1.2.3.99'), [
+            ('resolve_name', 'wrongval.example.com', 'test'),
+            ('resolve_name', 'wrongval.example.com', 'prod'),
+        ]),
+        ('verify_added_name', ('newhost', '1.2.3.10'), [
+            ('resolve_name', 'newhost.example.com', 'prod'),
+        ]),
+        ('check_renamed_name', ('same', 'renamed', '1.2.3.13'), [
+            ('resolve_name', 'same.example.com', 'test'),
+        ]),
+        ('check_renamed_name', ('oldname', 'renamed', '1.2.3.16'), [
+            ('resolve_name', 'oldname.example.com', 'test'),
+            ('resolve_name', 'renamed.example.com', 'test'),
+            ('resolve_name', 'oldname.example.com', 'prod'),
+            ('lookup_reverse', '1.2.3.16', 'test'),
+        ]),
+    ])
+    def test_blocking_no_speculation(self, chk, check, args, queries):
+        """ the blocking check methods only make the lookups they need, in order """
+        getattr(chk, check)(*args)
+        assert chk.DNS.queries == queries
+
+    def test_check_renamed_speculation_miss(self, chk):
+        """ if TEST returns an unexpected address, the reverse lookup follows """
+        res = self.run(chk, 'check_renamed_name', 'oldname', 'renamed', '1.2.3.99')
+        assert res['result'] is False
+        assert ('lookup_reverse', '1.2.3.99', 'test') in chk.AsyncDNS.queries
+
+    def test_check_removed_reverse_followup(self, chk):
+        """ the reverse lookup of the PROD answer is a second round """
+        res = self.run(chk, 'check_removed_name', 'removed')
+        assert res['result'] is True
+        assert chk.AsyncDNS.max_in_flight == 2
+        assert chk.AsyncDNS.queries[-1] == ('lookup_reverse', '1.2.3.17', 'test')
+
+    @pytest.mark.parametrize("check", ['confirm_name', 'check_removed_name', 'verify_removed_name'])
+    def test_timeouts_fail(self, chk, check):
+        """ a forward lookup timing out fails the check, whatever it expected """
+        chk.DNS.timeouts = chk.AsyncDNS.timeouts = set([('removed.example.com', 'test'),
+                                                        ('removed.example.com', 'prod')])
+        expected = getattr(chk, check)('removed')
+        assert self.run(chk, check, 'removed') == expected
+        assert expected['result'] is False
+        assert expected['message'].startswith("TIMEOUT: no response for removed.example.com from ")
+        assert "(PROD)" in expected['message']
+
+    def test_timeout_one_server(self, chk):
+        chk.DNS.timeouts = set([('same.example.com', 'test')])
+        res = chk.confirm_name('same')
+        assert res['result'] is False
+        assert res['message'] == "TIMEOUT: no response for same.example.com from test (TEST)"
+
+    def test_reverse_timeout_warns(self, chk):
+        """ a reverse lookup timing out is only a warning """
+        chk.DNS.timeouts = set([('1.2.3.10', 'test')])
+        res = chk.check_added_name('newhost', '1.2.3.10')
+        assert res['result'] is True
+        assert "REVERSE NG: got status TIMEOUT for name 1.2.3.10 (TEST)" in res['warnings']
+
+    def test_unreachable(self, chk):
+        """ lookups failed by an open circuit breaker mark the check short-circuited """
+        chk.DNS.unreachable = chk.AsyncDNS.unreachable = set(['test'])
+        res = chk.confirm_name('same')
+        assert self.run(chk, 'confirm_name', 'same') == res
+        assert res['result'] is False
+        assert res['short_circuited'] is True
+        assert res['message'] == "UNREACHABLE: same.example.com not queried, test has stopped answering (TEST)"
+
+    def test_prod_servers_hedged(self):
+        """ lookups to server_prod are hedged across every PROD server """
+        config = DnstestConfig()
+        config.server_test = "test"
+        config.server_prod = "prod"
+        config.servers_prod = ["prod", "prod2"]
+        chk = DNStestChecks(config)
+        assert chk.DNS.hedge['prod'].servers == ["prod", "prod2"]
+        assert chk.AsyncDNS.hedge['prod'] is chk.DNS.hedge['prod']
+        assert chk.DNS.retry.get('prod2').timeout == config.timeout_prod
+        chk.close()
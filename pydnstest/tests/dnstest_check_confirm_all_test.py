@@ -0,0 +1,182 @@
+"""
+tests for DNStestChecks.confirm_all_name()
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.dns import DNStestDNS
+from pydnstest.hedge import HedgedServers
+from pydnstest.socketpool import AsyncUDPSocketPool, UDPSocketPool
+from pydnstest.tests.dnsserver import StubDNSServer
+
+
+def answer(name, data):
+    return {'answer': {'name': name, 'data': data, 'typename': 'A', 'classstr': 'IN', 'ttl': 360, 'type': 1, 'class': 1, 'rdlength': 4}}
+
+
+class FleetDNS(object):
+    """
+    stub for DNStestDNS; ``fleet`` maps server to (dict of name to address,
+    SOA serial)
+    """
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.queries = []
+
+    def resolve_name_direct(self, query, to_server, to_port=53):
+        self.queries.append(('resolve_name_direct', query, to_server))
+        names, serial = self.fleet[to_server]
+        if query in names:
+            return answer(query, names[query])
+        return {'status': 'NXDOMAIN'}
+
+    def lookup_soa_serial(self, name, to_server, to_port=53):
+        self.queries.append(('lookup_soa_serial', name, to_server))
+        return {'serial': self.fleet[to_server][1]}
+
+
+class TestConfirmAll:
+    """
+    tests for confirm_all_name()
+    """
+
+    @pytest.fixture
+    def chk(self):
+        config = DnstestConfig()
+        config.server_test = "test"
+        config.server_prod = "ns1"
+        config.servers_prod = ["ns1", "ns2", "ns3"]
+        config.default_domain = ".example.com"
+        config.ignore_ttl = False
+        chk = DNStestChecks(config)
+        return chk
+
+    def test_all_same(self, chk):
+        name = 'foo.example.com'
+        chk.DNS = FleetDNS({'ns1': ({name: '1.2.3.4'}, 10), 'ns2': ({name: '1.2.3.4'}, 10),
+                            'ns3': ({name: '1.2.3.4'}, 10)})
+        res = chk.confirm_all_name('foo')
+        assert res == {'result': True, 'message': "all 3 servers return same response for 'foo'",
+                       'secondary': ["response: {'class': 1, 'classstr': 'IN', 'data': '1.2.3.4', 'name': 'foo.example.com', "
+                                     "'rdlength': 4, 'ttl': 360, 'type': 1, 'typename': 'A'}",
+                                     "SOA serial 10 on all servers"],
+                       'warnings': []}
+        assert len(chk.DNS.queries) == 6
+
+    def test_same_different_serials(self, chk):
+        chk.DNS = FleetDNS({'ns1': ({}, 10), 'ns2': ({}, 11), 'ns3': ({}, 10)})
+        res = chk.confirm_all_name('foo')
+        assert res['result'] is True
+        assert res['secondary'] == ["response: status NXDOMAIN", "ns1: SOA serial 10",
+                                    "ns2: SOA serial 11", "ns3: SOA serial 10"]
+
+    def test_one_disagrees(self, chk):
+        name = 'foo.example.com'
+        chk.DNS = FleetDNS({'ns1': ({name: '1.2.3.4'}, 11), 'ns2': ({}, 10),
+                            'ns3': ({name: '1.2.3.4'}, 11)})
+        res = chk.confirm_all_name('foo')
+        assert res['result'] is False
+        assert res['message'] == "1 of 3 servers disagree for 'foo': ns2"
+        assert res['secondary'][1] == "NG ns2: status NXDOMAIN (SOA serial 10)"
+        assert res['secondary'][0].startswith("ns1: {'class': 1")
+        assert res['secondary'][0].endswith(" (SOA serial 11)")
+
+    def test_confirm_servers(self, chk):
+        chk.config.confirm_servers = ['ns2', 'ns3']
+        chk.DNS = FleetDNS({'ns2': ({}, 10), 'ns3': ({}, 10)})
+        assert chk.confirm_all_name('foo')['message'] == "all 2 servers return same response for 'foo'"
+
+    def test_ignore_ttl(self, chk):
+        name = 'foo.example.com'
+        chk.config.ignore_ttl = True
+        dns = FleetDNS({'ns1': ({name: '1.2.3.4'}, 10), 'ns2': ({name: '1.2.3.4'}, 10),
+                        'ns3': ({name: '1.2.3.4'}, 10)})
+        orig = dns.resolve_name_direct
+
+        def resolve(query, to_server, to_port=53):
+            r = orig(query, to_server, to_port)
+            r['answer']['ttl'] = len(to_server) * 100 if to_server != 'ns3' else 1
+            return r
+        dns.resolve_name_direct = resolve
+        chk.DNS = dns
+        assert chk.confirm_all_name('foo')['result'] is True
+
+
+class TestSOASerial:
+    """
+    tests for lookup_soa_serial() and resolve_name_direct() on the resolvers
+    """
+
+    records = {
+        'example.com': [('SOA', ('ns1.example.com', 'admin.example.com', 2017122401, 3600, 600, 86400, 300), 3600)],
+        'foo.example.com': [('A', '1.2.3.4', 360)],
+    }
+
+    def test_dns(self):
+        with StubDNSServer(self.records) as srv:
+            pool = UDPSocketPool()
+            dns = DNStestDNS(pool=pool)
+            assert dns.lookup_soa_serial('example.com', '127.0.0.1', srv.port) == {'serial': 2017122401}
+            assert dns.lookup_soa_serial('foo.example.com', '127.0.0.1', srv.port) == {'serial': 2017122401}
+            assert dns.lookup_soa_serial('bar.example.com', '127.0.0.1', srv.port) == {'serial': 2017122401}
+            assert dns.lookup_soa_serial('foo.example.org', '127.0.0.1', srv.port) == {'status': 'NXDOMAIN'}
+            pool.close()
+
+    def test_async_direct_not_hedged(self):
+        with StubDNSServer(self.records) as srv:
+            pool = AsyncUDPSocketPool()
+            dns = DNStestAsyncDNS(timeout=2, pool=pool, hedge={'127.0.0.1': HedgedServers(['192.0.2.1'])})
+
+            async def go():
+                r = await dns.resolve_name_direct('foo.example.com', '127.0.0.1', srv.port)
+                s = await dns.lookup_soa_serial('foo.example.com', '127.0.0.1', srv.port)
+                await pool.close()
+                return r, s
+            loop = asyncio.new_event_loop()
+            try:
+                r, s = loop.run_until_complete(go())
+            finally:
+                loop.close()
+        assert r['answer']['data'] == '1.2.3.4'
+        assert s == {'serial': 2017122401}
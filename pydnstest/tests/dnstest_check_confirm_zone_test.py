@@ -0,0 +1,244 @@
+"""
+tests for DNStestChecks.confirm_zone(), comparing whole zones from zone files
+and a local stand-in AXFR server
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import functools
+
+import pytest
+
+import pydnstest.checks
+import pydnstest.zonediff
+from pydnstest.axfr import iter_axfr
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.tests.dnsserver import StubDNSServer
+
+PROD_ZONE = """$TTL 3600
+@       SOA ns1 hostmaster 2017122401 3600 600 86400 300
+        NS  ns1
+ns1     A   1.2.3.1
+host1   A   1.2.3.4
+host2   A   1.2.3.5
+alias1  CNAME host1
+"""
+
+SOA = ('SOA', ('ns1.example.com', 'hostmaster.example.com', 2017122401, 3600, 600, 86400, 300), 3600)
+
+RECORDS = {
+    'example.com': [SOA, ('NS', 'ns1.example.com', 3600)],
+    'ns1.example.com': [('A', '1.2.3.1', 3600)],
+    'host1.example.com': [('A', '1.2.3.4', 3600)],
+    'host2.example.com': [('A', '1.2.3.5', 3600)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 3600)],
+}
+
+
+@pytest.fixture
+def chk():
+    config = DnstestConfig()
+    config.server_test = "127.0.0.1"
+    config.server_prod = "127.0.0.1"
+    config.ignore_ttl = False
+    chk = DNStestChecks(config)
+    yield chk
+    chk.close()
+
+
+@pytest.fixture
+def zone_file(tmpdir):
+    def write(name, text):
+        p = tmpdir.join(name)
+        p.write(text)
+        return str(p)
+    return write
+
+
+class TestConfirmZone:
+
+    def test_same(self, chk, zone_file):
+        prod = zone_file('prod.zone', PROD_ZONE)
+        test = zone_file('test.zone', PROD_ZONE.replace('host2   A', 'HOST2 3600 IN A'))
+        results = list(chk.confirm_zone('example.com', prod, test))
+        assert len(results) == 1
+        assert results[0]['result'] is True
+        assert results[0]['message'] == "prod and test servers return same zone 'example.com'"
+        assert results[0]['secondary'][:2] == ['6 RRsets: 0 added, 0 removed, 0 changed on test',
+                                               '6 records from prod, 6 from test']
+        assert results[0]['secondary'][2].startswith('zone digest ')
+        assert len(results[0]['secondary']) == 3
+
+    def test_changes(self, chk, zone_file):
+        prod = zone_file('prod.zone', PROD_ZONE)
+        test = zone_file('test.zone', PROD_ZONE.replace('2017122401', '2017122402')
+                         .replace('host2   A   1.2.3.5\n', 'host3   A   1.2.3.6\n')
+                         .replace('host1   A   1.2.3.4', 'host1 60 A 1.2.3.4'))
+        results = list(chk.confirm_zone('example.com', prod, test))
+        assert [r['message'] for r in results] == [
+            "RRset 'example.com SOA' differs between prod and test",
+            "RRset 'host1.example.com A' differs between prod and test",
+            "RRset 'host2.example.com A' only on prod server (removed)",
+            "RRset 'host3.example.com A' only on test server (added)",
+            "4 of 7 RRsets differ in zone 'example.com'",
+        ]
+        assert [r['result'] for r in results] == [False] * 5
+        assert results[0]['secondary'] == ['PROD: example.com 3600 IN SOA ns1.example.com hostmaster.example.com 2017122401 3600 600 86400 300',
+                                           'TEST: example.com 3600 IN SOA ns1.example.com hostmaster.example.com 2017122402 3600 600 86400 300']
+        assert results[2]['secondary'] == ['PROD: host2.example.com 3600 IN A 1.2.3.5']
+        assert results[3]['secondary'] == ['TEST: host3.example.com 3600 IN A 1.2.3.6']
+        assert results[4]['secondary'][0] == '7 RRsets: 1 added, 1 removed, 2 changed on test'
+        assert results[4]['secondary'][2].startswith('4 of 4096 digest buckets differ')
+
+    def test_ignore_ttl(self, chk, zone_file):
+        chk.config.ignore_ttl = True
+        prod = zone_file('prod.zone', PROD_ZONE)
+        test = zone_file('test.zone', PROD_ZONE.replace('host1   A', 'host1 60 A'))
+        results = list(chk.confirm_zone('example.com', prod, test))
+        assert len(results) == 1
+        assert results[0]['result'] is True
+
+    def test_bad_zone_file(self, chk, zone_file):
+        prod = zone_file('prod.zone', PROD_ZONE)
+        test = zone_file('test.zone', 'host1 A 1.2.3.4\n')
+        results = list(chk.confirm_zone('example.com', prod, test))
+        assert len(results) == 1
+        assert results[0]['result'] is False
+        assert results[0]['message'] == "could not read zone 'example.com' from test: no TTL for 'host1.example.com A'"
+
+    def test_missing_zone_file(self, chk, zone_file):
+        results = list(chk.confirm_zone('example.com', '/nonexistent/prod.zone'))
+        assert len(results) == 1
+        assert results[0]['message'].startswith("could not read zone 'example.com' from prod: ")
+
+    def test_axfr(self, chk, zone_file, monkeypatch):
+        """ a zone file for PROD against a transfer from the TEST server """
+        with StubDNSServer(dict(RECORDS, **{'host4.example.com': [('A', '1.2.3.7', 3600)]})) as s:
+            monkeypatch.setattr(pydnstest.checks, 'iter_axfr', functools.partial(iter_axfr, to_port=s.port))
+            results = list(chk.confirm_zone('example.com', zone_file('prod.zone', PROD_ZONE)))
+        assert [r['message'] for r in results] == [
+            "RRset 'host4.example.com A' only on test server (added)",
+            "1 of 7 RRsets differ in zone 'example.com'",
+        ]
+
+    def test_axfr_both(self, chk, monkeypatch):
+        with StubDNSServer(RECORDS) as s:
+            monkeypatch.setattr(pydnstest.checks, 'iter_axfr', functools.partial(iter_axfr, to_port=s.port))
+            results = list(chk.confirm_zone('example.com'))
+            assert s.queries == [('example.com', 'AXFR'), ('example.com', 'AXFR')]
+        assert len(results) == 1
+        assert results[0]['result'] is True
+
+    def test_axfr_refused(self, chk, monkeypatch):
+        with StubDNSServer(RECORDS, refuse_axfr=['example.com']) as s:
+            monkeypatch.setattr(pydnstest.checks, 'iter_axfr', functools.partial(iter_axfr, to_port=s.port))
+            results = list(chk.confirm_zone('example.com'))
+        assert len(results) == 1
+        assert results[0]['message'] == "could not read zone 'example.com' from prod: transfer of example.com refused: REFUSED"
+
+
+class TestConfirmZoneDigests:
+    """
+    digest trees kept between runs in the persistent cache file
+    """
+
+    @pytest.fixture
+    def persistent(self, chk, tmpdir, monkeypatch):
+        chk.config.persistent_cache = True
+        chk.config.conf_file = str(tmpdir.join('dnstest.ini'))
+        server = StubDNSServer(dict(RECORDS)).start()
+        monkeypatch.setattr(pydnstest.checks, 'iter_axfr', functools.partial(iter_axfr, to_port=server.port))
+        monkeypatch.setattr(chk.DNS, 'attempt', functools.partial(chk.DNS.attempt, to_port=server.port))
+        yield server
+        server.stop()
+
+    def transfers(self, server):
+        return len([q for q in server.queries if q[1] == 'AXFR'])
+
+    def test_unchanged_not_transferred(self, chk, persistent):
+        first = list(chk.confirm_zone('example.com'))
+        assert first[0]['result'] is True
+        assert self.transfers(persistent) == 2
+        second = list(chk.confirm_zone('example.com'))
+        assert self.transfers(persistent) == 2
+        assert second[0]['result'] is True
+        assert second[0]['secondary'][:3] == first[0]['secondary']
+        assert second[0]['secondary'][3:] == [
+            'prod: serial 2017122401 unchanged since last run, not transferred',
+            'test: serial 2017122401 unchanged since last run, not transferred']
+
+    def test_serial_changed(self, chk, persistent):
+        list(chk.confirm_zone('example.com'))
+        persistent.records['example.com'] = [('SOA', SOA[1][:2] + (2017122402,) + SOA[1][3:], 3600), RECORDS['example.com'][1]]
+        persistent.records['host5.example.com'] = [('A', '1.2.3.8', 3600)]
+        results = list(chk.confirm_zone('example.com'))
+        assert self.transfers(persistent) == 4
+        # both "servers" are the same stand-in, so the new copies agree
+        assert results[-1]['result'] is True
+        assert results[-1]['secondary'][0] == '7 RRsets: 0 added, 0 removed, 0 changed on test'
+
+    def test_refresh(self, chk, persistent):
+        list(chk.confirm_zone('example.com'))
+        chk.config.refresh_cache = True
+        list(chk.confirm_zone('example.com'))
+        assert self.transfers(persistent) == 4
+
+    def test_differs_from_stored(self, chk, persistent, zone_file):
+        """ a stored PROD tree that differs from TEST is transferred again to diff it """
+        list(chk.confirm_zone('example.com'))
+        test = zone_file('test.zone', PROD_ZONE.replace('host2   A   1.2.3.5', 'host2   A   1.2.3.9'))
+        results = list(chk.confirm_zone('example.com', test_file=test))
+        assert self.transfers(persistent) == 3
+        assert [r['message'] for r in results] == [
+            "RRset 'host2.example.com A' differs between prod and test",
+            "1 of 6 RRsets differ in zone 'example.com'",
+        ]
+        assert results[1]['secondary'][3] == 'prod: serial 2017122401 unchanged since last run, not transferred'
+
+    def test_only_differing_buckets_compared(self, chk, zone_file, monkeypatch):
+        compared = []
+        diff_zones = pydnstest.checks.diff_zones
+
+        def counting(prod, test, ignore_ttl=False):
+            for d in diff_zones(prod, test, ignore_ttl):
+                compared.append(d)
+                yield d
+        monkeypatch.setattr(pydnstest.checks, 'diff_zones', counting)
+        prod = zone_file('prod.zone', PROD_ZONE)
+        test = zone_file('test.zone', PROD_ZONE.replace('host2   A   1.2.3.5', 'host2   A   1.2.3.9'))
+        list(chk.confirm_zone('example.com', prod, test))
+        assert [(c[0], c[1]['name']) for c in compared] == [('changed', 'host2.example.com')]
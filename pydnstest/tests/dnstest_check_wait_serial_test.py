@@ -0,0 +1,110 @@
+"""
+Tests for DNStestChecks.wait_for_serial()
+
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+import pydnstest.checks
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.dns import serial_at_least
+from pydnstest.tests.dnsserver import FakeClock
+
+
+@pytest.fixture
+def chk(monkeypatch):
+    config = DnstestConfig()
+    config.server_prod = '1.2.3.4'
+    config.server_test = '1.2.3.5'
+    chk = DNStestChecks(config)
+    clock = FakeClock()
+    monkeypatch.setattr(pydnstest.checks, 'time', clock)
+    chk.clock = clock
+    chk.serials = []
+    chk.polls = []
+
+    def current_serial(zone, server):
+        chk.polls.append((zone, server, clock.now))
+        return chk.serials.pop(0) if len(chk.serials) > 1 else chk.serials[0]
+    chk.current_serial = current_serial
+    yield chk
+    chk.close()
+
+
+def test_serial_at_least():
+    assert serial_at_least(5, 5)
+    assert serial_at_least(6, 5)
+    assert not serial_at_least(4, 5)
+    # wrapped around
+    assert serial_at_least(3, 2 ** 32 - 10)
+    assert not serial_at_least(2 ** 32 - 10, 3)
+
+
+def test_already_there(chk):
+    chk.serials = [2017122402]
+    res = chk.wait_for_serial('example.com', 2017122401, 60)
+    assert res == {'result': True, 'message': "PROD has serial 2017122402 for zone 'example.com' (waited for 2017122401)",
+                   'secondary': ["1 SOA queries to 1.2.3.4 over 0.0 seconds"], 'warnings': []}
+    assert chk.clock.sleeps == []
+
+
+def test_backoff(chk):
+    chk.serials = [100, 100, None, 100, 101]
+    res = chk.wait_for_serial('example.com', 101, 600, interval=1.0, max_interval=4.0)
+    assert res['result'] is True
+    assert chk.clock.sleeps == [1.0, 2.0, 4.0, 4.0]
+    assert [p[:2] for p in chk.polls] == [('example.com', '1.2.3.4')] * 5
+    assert res['secondary'] == ["5 SOA queries to 1.2.3.4 over 11.0 seconds"]
+
+
+def test_timeout(chk):
+    chk.serials = [100]
+    res = chk.wait_for_serial('example.com', 101, 10, interval=4.0, max_interval=30.0)
+    assert res['result'] is False
+    assert res['message'] == "PROD still has serial 100 for zone 'example.com' after 10 seconds, waited for 101"
+    # the last sleep is cut short, to poll once more at the timeout
+    assert chk.clock.sleeps == [4.0, 6.0]
+    assert [p[2] for p in chk.polls] == [1000.0, 1004.0, 1010.0]
+
+
+def test_no_answer(chk):
+    chk.serials = [None]
+    res = chk.wait_for_serial('example.com', 101, 3)
+    assert res['result'] is False
+    assert res['message'] == "PROD still has serial None for zone 'example.com' after 3 seconds, waited for 101"
@@ -0,0 +1,264 @@
+"""
+tests for concurrency.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socket
+
+import DNS
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.concurrency import AIMDLimit, AdaptiveConcurrency
+from pydnstest.hedge import HedgedServers
+from pydnstest.socketpool import AsyncUDPSocketPool
+from pydnstest.tests.dnsserver import FakeClock, StubDNSServer, run
+
+
+class TestAIMDLimit:
+    """
+    tests for AIMDLimit
+    """
+
+    def test_slow_start_then_additive(self):
+        clock = FakeClock()
+        l = AIMDLimit(initial=4, clock=clock)
+
+        async def one(rtt, congested=False):
+            started = await l.acquire()
+            clock.now += 1
+            l.release(started, rtt, congested)
+
+        async def go():
+            for i in range(4):
+                await one(0.01)
+            assert l.limit == 8.0
+            await one(None, congested=True)
+            assert l.limit == 4.0
+            assert l.cuts == 1
+            for i in range(4):
+                await one(0.01)
+            # one more per round trip of ``limit`` replies
+            assert 4.9 < l.limit < 5.0
+        run(go())
+
+    def test_rtt_growth_holds_limit(self):
+        l = AIMDLimit(initial=4, clock=FakeClock())
+
+        async def go():
+            started = await l.acquire()
+            l.release(started, 0.01)
+            assert l.limit == 5.0
+            started = await l.acquire()
+            l.release(started, 0.05)
+            assert l.limit == 5.0
+        run(go())
+
+    def test_one_cut_per_round_trip(self):
+        """ queries sent before a cut don't cut it again """
+        clock = FakeClock()
+        l = AIMDLimit(initial=8, clock=clock)
+
+        async def go():
+            started = [await l.acquire() for i in range(4)]
+            clock.now += 5
+            for s in started:
+                l.release(s, None, congested=True)
+            assert l.limit == 4.0
+            assert l.cuts == 1
+            s = await l.acquire()
+            l.release(s, None, congested=True)
+            assert l.limit == 2.0
+            for i in range(5):
+                s = await l.acquire()
+                clock.now += 1
+                l.release(s, None, congested=True)
+            assert l.limit == 1.0
+        run(go())
+
+    def test_limit_bounds_in_flight(self):
+        l = AIMDLimit(initial=2, maximum=2)
+        counts = {'now': 0, 'max': 0}
+
+        async def one():
+            started = await l.acquire()
+            counts['now'] += 1
+            counts['max'] = max(counts['max'], counts['now'])
+            await asyncio.sleep(0.005)
+            counts['now'] -= 1
+            l.release(started, 0.005)
+
+        async def go():
+            await asyncio.gather(*[one() for i in range(10)])
+        run(go())
+        assert counts['max'] == 2
+        assert l.in_flight == 0
+        assert l.limit == 2.0
+
+    def test_cancelled_waiter(self):
+        l = AIMDLimit(initial=1)
+
+        async def go():
+            started = await l.acquire()
+            waiter = asyncio.ensure_future(l.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            l.release(started, 0.01)
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert l.in_flight == 0
+            assert l.available()
+        run(go())
+
+
+class TestAdaptiveConcurrency:
+    """
+    tests for AdaptiveConcurrency and its use by DNStestAsyncDNS
+    """
+
+    def test_statuses(self):
+        c = AdaptiveConcurrency(initial=8, clock=FakeClock())
+
+        async def go():
+            s = await c.acquire('a')
+            c.release('a', s, 0.01, 'NXDOMAIN')
+            s = await c.acquire('b')
+            c.release('b', s, 0.01, 'REFUSED')
+        run(go())
+        stats = c.stats()
+        assert stats['a'] == {'limit': 9, 'min_rtt_ms': 10.0, 'cuts': 0}
+        assert stats['b'] == {'limit': 4, 'min_rtt_ms': None, 'cuts': 1}
+        assert c.summary() == "a 9 in flight (0 cuts), b 4 in flight (1 cuts)"
+
+    def test_summary_empty(self):
+        assert AdaptiveConcurrency().summary() is None
+
+    def test_async_dns(self):
+        records = {'ok.example.com': [('A', '1.2.3.4', 360)]}
+        with StubDNSServer(records, rcodes={'bad.example.com': 'SERVFAIL'}) as srv:
+            pool = AsyncUDPSocketPool()
+            c = AdaptiveConcurrency(initial=2)
+            dns = DNStestAsyncDNS(timeout=2, pool=pool, concurrency=c)
+
+            async def go():
+                res = await asyncio.gather(*[dns.resolve_name('ok.example.com', '127.0.0.1', srv.port)
+                                             for i in range(6)])
+                assert all(r['answer']['data'] == '1.2.3.4' for r in res)
+                assert c.stats()['127.0.0.1']['limit'] >= 2
+                before = c.limits['127.0.0.1'].limit
+                r = await dns.resolve_name('bad.example.com', '127.0.0.1', srv.port)
+                assert r == {'status': 'SERVFAIL'}
+                assert c.limits['127.0.0.1'].limit == max(1.0, before / 2)
+                assert c.limits['127.0.0.1'].in_flight == 0
+                await pool.close()
+            run(go())
+
+    def test_no_reply_without_timeout(self):
+        """ a query cancelled or failed without timing out just frees its slot """
+        c = AdaptiveConcurrency(initial=4, clock=FakeClock())
+
+        async def go():
+            s = await c.acquire('a')
+            c.release('a', s)
+            s = await c.acquire('a')
+            c.release('a', s, timed_out=True)
+        run(go())
+        assert c.stats()['a'] == {'limit': 2, 'min_rtt_ms': None, 'cuts': 1}
+        assert c.limits['a'].in_flight == 0
+
+    def test_async_dns_timeout(self):
+        c = AdaptiveConcurrency(initial=4)
+        dns = DNStestAsyncDNS(timeout=0.05, concurrency=c)
+
+        # a socket that never answers
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+
+        async def go():
+            with pytest.raises(DNS.TimeoutError):
+                await dns.send_paced('foo.example.com', '127.0.0.1', 'A', sock.getsockname()[1])
+        try:
+            run(go())
+        finally:
+            sock.close()
+        assert c.stats()['127.0.0.1']['cuts'] == 1
+        assert c.limits['127.0.0.1'].in_flight == 0
+
+    def test_async_dns_parallel(self):
+        """ the losing query of each parallel lookup is cancelled, not a congestion signal """
+        records = {'ok.example.com': [('A', '1.2.3.4', 360)],
+                   'alias.example.com': [('CNAME', 'ok.example.com', 360)]}
+        with StubDNSServer(records) as srv:
+            pool = AsyncUDPSocketPool()
+            c = AdaptiveConcurrency(initial=2)
+            dns = DNStestAsyncDNS(timeout=2, pool=pool, concurrency=c, resolve_mode='parallel')
+
+            async def go():
+                res = await asyncio.gather(*[dns.resolve_name(n, '127.0.0.1', srv.port)
+                                             for n in ['ok.example.com', 'alias.example.com'] * 10])
+                await pool.close()
+                return res
+            res = run(go())
+        assert all('answer' in r for r in res)
+        assert c.stats()['127.0.0.1']['cuts'] == 0
+        assert c.stats()['127.0.0.1']['limit'] > 2
+        assert c.limits['127.0.0.1'].in_flight == 0
+
+    def test_async_dns_hedge_cancelled(self):
+        """ the copy of a hedged query that loses is cancelled, not a congestion signal """
+        records = {'foo.example.com': [('A', '1.2.3.4', 360)]}
+        with StubDNSServer(records, delay=0.5) as slow, StubDNSServer(records) as fast:
+            pool = AsyncUDPSocketPool()
+            c = AdaptiveConcurrency(initial=4)
+            dns = DNStestAsyncDNS(timeout=2, pool=pool, concurrency=c)
+            group = HedgedServers(['slow', 'fast'], default_delay=0.02)
+            dns.hedge = {'prod': group}
+            ports = {'slow': slow.port, 'fast': fast.port}
+
+            async def attempt(name, server, qtype, to_port=53):
+                return await dns.send(name, '127.0.0.1', qtype, ports[server])
+            dns.attempt = attempt
+
+            async def go():
+                r = await dns.resolve_name('foo.example.com', 'prod')
+                await pool.close()
+                return r
+            r = run(go())
+        assert r['answer']['data'] == '1.2.3.4'
+        assert group.hedges == 1
+        assert c.stats()['127.0.0.1']['cuts'] == 0
+        assert c.limits['127.0.0.1'].in_flight == 0
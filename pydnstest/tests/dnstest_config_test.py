@@ -119,8 +119,104 @@ class TestConfigMethods:
         assert dc.have_reverse_dns == True
         assert dc.ignore_ttl == False
         assert dc.sleep == 0.0
+        assert dc.resolve_mode == 'single'
+        assert dc.cache_size == 1000
         assert dc.asDict() == {'default_domain': '.example.com', 'have_reverse_dns': True,
-                               'servers': {'prod': '1.2.3.4', 'test': '1.2.3.5'}, 'ignore_ttl': False, 'sleep': 0.0}
+                               'servers': {'prod': '1.2.3.4', 'test': '1.2.3.5'}, 'ignore_ttl': False, 'sleep': 0.0,
+                               'prod_servers': ['1.2.3.4'], 'confirm_servers': [],
+                               'transport': {'prod': 'udp', 'test': 'udp'},
+                               'qps': {'prod': 0.0, 'test': 0.0}, 'burst': {'prod': 1, 'test': 1},
+                               'timeout': {'prod': 5.0, 'test': 5.0}, 'retries': {'prod': 2, 'test': 2},
+                               'retry_backoff': {'prod': 0.5, 'test': 0.5},
+                               'resolve_mode': 'single', 'cache_size': 1000, 'persistent_cache': False,
+                               'breaker_threshold': 5, 'breaker_reset': 30.0, 'axfr_zones': []}
+
+    def test_parse_resolve_mode(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[defaults]\nresolve_mode: Fallback\n")
+        dc.load_config(fpath)
+        assert dc.resolve_mode == 'fallback'
+
+    def test_parse_resolve_mode_invalid(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[defaults]\nresolve_mode: sometimes\n")
+        dc.load_config(fpath)
+        assert dc.resolve_mode == 'single'
+
+    def test_parse_cache_size(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[defaults]\ncache_size: 0\n")
+        dc.load_config(fpath)
+        assert dc.cache_size == 0
+
+    def test_parse_transport(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\ntest_transport: TCP\nprod_transport: carrier pigeon\n")
+        dc.load_config(fpath)
+        assert dc.transport_test == 'tcp'
+        assert dc.transport_prod == 'udp'
+
+    def test_parse_qps(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\nprod_qps: 100\nprod_burst: 10\ntest_qps: foo\n")
+        dc.load_config(fpath)
+        assert dc.qps_prod == 100.0
+        assert dc.burst_prod == 10
+        assert dc.qps_test == 0.0
+        assert dc.burst_test == 1
+
+    def test_parse_timeouts(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\ntest_timeout: 1.5\ntest_retries: 0\n"
+                             "test_retry_backoff: 0.1\nprod_retries: many\n")
+        dc.load_config(fpath)
+        assert dc.timeout_test == 1.5
+        assert dc.retries_test == 0
+        assert dc.retry_backoff_test == 0.1
+        assert dc.timeout_prod == 5.0
+        assert dc.retries_prod == 2
+        assert dc.retry_backoff_prod == 0.5
+
+    def test_parse_breaker(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[defaults]\nbreaker_threshold: 0\nbreaker_reset: soon\n")
+        dc.load_config(fpath)
+        assert dc.breaker_threshold == 0
+        assert dc.breaker_reset == 30.0
+
+    def test_parse_axfr_zones(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[defaults]\naxfr_zones: example.com, 10.in-addr.arpa,\n")
+        dc.load_config(fpath)
+        assert dc.axfr_zones == ['example.com', '10.in-addr.arpa']
+
+    def test_parse_prod_list(self, save_user_config):
+        dc = DnstestConfig()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4, 1.2.3.6 ,1.2.3.7\ntest: 1.2.3.5\n")
+        dc.load_config(fpath)
+        assert dc.server_prod == '1.2.3.4'
+        assert dc.prod_servers() == ['1.2.3.4', '1.2.3.6', '1.2.3.7']
+        assert "\nprod: 1.2.3.4, 1.2.3.6, 1.2.3.7\n" in dc.to_string()
+
+    def test_prod_servers_single(self):
+        dc = DnstestConfig()
+        assert dc.prod_servers() == []
+        dc.server_prod = '1.2.3.4'
+        assert dc.prod_servers() == ['1.2.3.4']
+
+    def test_cache_file(self):
+        dc = DnstestConfig()
+        dc.conf_file = '/home/foo/.dnstest.ini'
+        assert dc.cache_file() == '/home/foo/.dnstest.cache'
 
     def test_parse_bad_config_file(self, save_user_config):
         fpath = os.path.abspath("dnstest.ini")
@@ -146,6 +242,9 @@ blarg
         assert dc.have_reverse_dns == True
         assert dc.ignore_ttl == False
         assert dc.sleep == 0.0
+        assert dc.resolve_mode == 'single'
+        assert dc.cache_size == 1000
+        assert dc.persistent_cache == False
 
     def test_example_config_to_string(self):
         """ test converting the example config to a string """
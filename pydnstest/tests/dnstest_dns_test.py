@@ -49,6 +49,7 @@ import sys
 import os
 
 from pydnstest.dns import DNStestDNS
+from pydnstest.tests.dnsserver import StubDNSServer
 import DNS
 
 
@@ -141,10 +142,11 @@ class TestDNS:
         foo = test_DNS.lookup_reverse(query, server)
         assert foo == result
 
-    def test_multiple_answer(self, test_DNS, monkeypatch):
+    def test_multiple_answer(self, monkeypatch):
         """
         Test for something that returns multiple answers.
         """
+        test_DNS = DNStestDNS(resolve_mode='fallback')
 
         query = "foo.example.com"
         server = "ns.example.com"
@@ -161,3 +163,45 @@ class TestDNS:
 
         foo = test_DNS.resolve_name(query, server)
         assert foo == result
+
+
+class TestDNSResolveMode:
+    """
+    tests for DNStestDNS.resolve_name() resolve modes, against a local
+    stand-in server
+    """
+
+    RECORDS = {
+        'host1.example.com': [('A', '1.2.3.4', 360)],
+        'alias1.example.com': [('CNAME', 'host1.example.com', 360)],
+    }
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(records=self.RECORDS).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    def test_default_mode(self):
+        assert DNStestDNS().resolve_mode == 'single'
+
+    @pytest.mark.parametrize('mode', ['single', 'parallel', 'fallback'])
+    def test_cname_one_query(self, server, mode):
+        d = DNStestDNS(resolve_mode=mode)
+        res = d.resolve_name('alias1.example.com', '127.0.0.1', server.port)
+        assert res['answer']['typename'] == 'CNAME'
+        assert res['answer']['data'] == 'host1.example.com'
+        assert server.queries == [('alias1.example.com', 'A')]
+
+    def test_nxdomain_single(self, server):
+        d = DNStestDNS(resolve_mode='single')
+        res = d.resolve_name('foo.example.com', '127.0.0.1', server.port)
+        assert res == {'status': 'NXDOMAIN'}
+        assert server.queries == [('foo.example.com', 'A')]
+
+    def test_nxdomain_fallback(self, server):
+        d = DNStestDNS(resolve_mode='fallback')
+        res = d.resolve_name('foo.example.com', '127.0.0.1', server.port)
+        assert res == {'status': 'NXDOMAIN'}
+        assert server.queries == [('foo.example.com', 'A'),
+                                  ('foo.example.com', 'CNAME')]
@@ -0,0 +1,221 @@
+"""
+tests for hedge.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+
+import DNS
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.dns import DNStestDNS
+from pydnstest.hedge import HedgedServers, LatencyHistogram
+from pydnstest.socketpool import AsyncUDPSocketPool, UDPSocketPool
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+
+class TestLatencyHistogram:
+    """
+    tests for LatencyHistogram
+    """
+
+    def test_percentiles(self):
+        h = LatencyHistogram()
+        assert h.percentile(50) is None
+        for i in range(90):
+            h.record(0.001)
+        for i in range(10):
+            h.record(0.2)
+        assert h.percentile(50) == pytest.approx(0.001, rel=0.5)
+        assert 0.2 <= h.percentile(95) < 0.3
+
+    def test_decay(self):
+        h = LatencyHistogram(max_count=10)
+        for i in range(10):
+            h.record(1.0)
+        assert h.count == 5
+        for i in range(6):
+            h.record(0.001)
+        assert h.percentile(50) < 0.01
+
+
+class TestHedgedServers:
+    """
+    tests for HedgedServers
+    """
+
+    def test_ranked(self):
+        g = HedgedServers(['a', 'b', 'c'])
+        assert g.ranked() == ['a', 'b', 'c']
+        g.histograms['a'].record(0.5)
+        g.histograms['c'].record(0.01)
+        # untried first, then fastest
+        assert g.ranked() == ['b', 'c', 'a']
+
+    def test_delay(self):
+        g = HedgedServers(['a'], min_delay=0.01, max_delay=0.5, default_delay=0.1, min_samples=5)
+        assert g.delay('a') == 0.1
+        for i in range(5):
+            g.histograms['a'].record(0.0001)
+        assert g.delay('a') == 0.01
+        for i in range(5):
+            g.histograms['a'].record(3.0)
+        assert g.delay('a') == 0.5
+
+    def test_query_failover(self):
+        g = HedgedServers(['a', 'b'])
+        sent = []
+
+        def send(server):
+            sent.append(server)
+            if server == 'a':
+                raise DNS.TimeoutError('Timeout')
+            return 'answer from %s' % server
+        assert g.query(send) == 'answer from b'
+        assert sent == ['a', 'b']
+        # a now counts as slow, so b goes first
+        assert g.ranked() == ['b', 'a']
+
+    def test_query_all_fail(self):
+        g = HedgedServers(['a', 'b'])
+
+        def send(server):
+            raise DNS.TimeoutError(server)
+        with pytest.raises(DNS.TimeoutError) as exc:
+            g.query(send)
+        assert str(exc.value) == 'a'
+
+    def test_query_async_hedges(self):
+        g = HedgedServers(['slow', 'fast'], default_delay=0.02)
+        cancelled = []
+
+        async def send(server):
+            try:
+                await asyncio.sleep(1.0 if server == 'slow' else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(server)
+                raise
+            return server
+        start = time.time()
+        assert run(g.query_async(send)) == 'fast'
+        assert time.time() - start < 0.5
+        assert cancelled == ['slow']
+        assert g.hedges == 1
+        assert g.ranked() == ['fast', 'slow']
+
+    def test_query_async_no_hedge_when_fast(self):
+        g = HedgedServers(['a', 'b'], default_delay=0.5)
+        sent = []
+
+        async def send(server):
+            sent.append(server)
+            return server
+        assert run(g.query_async(send)) == 'a'
+        assert sent == ['a']
+        assert g.hedges == 0
+
+    def test_query_async_failover(self):
+        g = HedgedServers(['a', 'b', 'c'], default_delay=5.0)
+
+        async def send(server):
+            if server != 'c':
+                raise DNS.SocketError(server)
+            return server
+        assert run(g.query_async(send)) == 'c'
+        assert g.hedges == 0
+
+    def test_query_async_all_fail(self):
+        g = HedgedServers(['a', 'b'], default_delay=0.01)
+
+        async def send(server):
+            await asyncio.sleep(0.02)
+            raise DNS.TimeoutError(server)
+        with pytest.raises(DNS.TimeoutError) as exc:
+            run(g.query_async(send))
+        assert str(exc.value) == 'a'
+
+
+class TestDNSHedge:
+    """
+    tests for DNStestDNS and DNStestAsyncDNS with hedged server groups
+    """
+
+    records = {'foo.example.com': [('A', '1.2.3.4', 360)]}
+
+    def test_async_dns(self):
+        with StubDNSServer(self.records, delay=1.0) as slow, StubDNSServer(self.records) as fast:
+            # both listen on 127.0.0.1, so tell them apart by port
+            assert slow.port != fast.port
+            pool = AsyncUDPSocketPool()
+            dns = DNStestAsyncDNS(timeout=2, pool=pool)
+            group = HedgedServers(['slow', 'fast'], default_delay=0.05)
+            dns.hedge = {'prod': group}
+            ports = {'slow': slow.port, 'fast': fast.port}
+
+            async def attempt(name, server, qtype, to_port=53):
+                return await dns.send(name, '127.0.0.1', qtype, ports[server])
+            dns.attempt = attempt
+
+            async def go():
+                start = time.time()
+                r = await dns.resolve_name('foo.example.com', 'prod')
+                elapsed = time.time() - start
+                await pool.close()
+                return r, elapsed
+            r, elapsed = run(go())
+        assert r['answer']['data'] == '1.2.3.4'
+        assert elapsed < 0.9
+        assert group.hedges == 1
+
+    def test_dns_failover(self):
+        with StubDNSServer(self.records) as srv:
+            pool = UDPSocketPool(timeout=0.05)
+            dns = DNStestDNS(pool=pool, hedge={'prod': HedgedServers(['dead', 'live'])})
+            sent = []
+
+            def attempt(name, server, qtype, to_port=53):
+                sent.append(server)
+                if server == 'dead':
+                    raise DNS.TimeoutError('Timeout')
+                return dns.send(name, '127.0.0.1', qtype, srv.port)
+            dns.attempt = attempt
+            r = dns.resolve_name('foo.example.com', 'prod')
+            pool.close()
+        assert r['answer']['data'] == '1.2.3.4'
+        assert sent == ['dead', 'live']
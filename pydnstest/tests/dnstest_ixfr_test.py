@@ -0,0 +1,295 @@
+"""
+Tests for the IXFR incremental zone transfers and reuse of verify results
+
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import copy
+import functools
+
+import pytest
+
+from pydnstest.axfr import TransferError, transfer_zone
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.ixfr import Delta, ResultStore, SnapshotStore, iter_ixfr
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+SOA = ('SOA', ('ns1.example.com', 'hostmaster.example.com', 100, 3600, 600, 86400, 300), 3600)
+
+RECORDS = {
+    'example.com': [SOA, ('NS', 'ns1.example.com', 3600)],
+    'ns1.example.com': [('A', '1.2.3.1', 3600)],
+    'host1.example.com': [('A', '1.2.3.4', 3600)],
+    'host2.example.com': [('A', '1.2.3.5', 3600)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 300)],
+    '3.2.1.in-addr.arpa': [('SOA', SOA[1], 3600)],
+    '4.3.2.1.in-addr.arpa': [('PTR', 'host1.example.com', 3600)],
+    '5.3.2.1.in-addr.arpa': [('PTR', 'host2.example.com', 3600)],
+}
+
+
+@pytest.fixture
+def server():
+    # change_zone() changes the records in place
+    with StubDNSServer(copy.deepcopy(RECORDS)) as s:
+        yield s
+
+
+def transfer(server):
+    return transfer_zone('example.com', '127.0.0.1', server.port, timeout=5)
+
+
+def answers(z, name):
+    return sorted(repr(r['data']) for r in z.names.get(name, []))
+
+
+class TestIterIXFR:
+
+    def test_up_to_date(self, server):
+        assert list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5)) == []
+        assert ('example.com', 'IXFR') in server.queries
+
+    def test_changes(self, server):
+        server.change_zone('example.com', 101, delete=[('host1.example.com', 'A', '1.2.3.4', 3600)],
+                           add=[('host1.example.com', 'A', '1.2.3.9', 3600)])
+        server.change_zone('example.com', 102, add=[('host3.example.com', 'A', '1.2.3.6', 3600)])
+        changes = list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5))
+        assert [(op, rr['name'], rr['typename']) for op, rr in changes] == [
+            ('delete', 'example.com', 'SOA'),
+            ('delete', 'host1.example.com', 'A'),
+            ('add', 'example.com', 'SOA'),
+            ('add', 'host1.example.com', 'A'),
+            ('delete', 'example.com', 'SOA'),
+            ('add', 'example.com', 'SOA'),
+            ('add', 'host3.example.com', 'A'),
+        ]
+        assert changes[-2][1]['data'][2] == ('serial', 102)
+
+    def test_whole_zone(self, server):
+        server.change_zone('example.com', 101, add=[('host3.example.com', 'A', '1.2.3.6', 3600)])
+        server.ixfr_full = True
+        changes = list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5))
+        assert changes[0] == ('reset', None)
+        assert all(op == 'add' for op, rr in changes[1:])
+        assert len(changes) == 1 + 7
+
+    def test_refused(self):
+        with StubDNSServer(RECORDS, refuse_axfr=['example.com']) as s:
+            with pytest.raises(TransferError):
+                list(iter_ixfr('example.com', 100, '127.0.0.1', s.port, timeout=5))
+
+
+class TestApply:
+
+    def test_apply_same_as_transfer(self, server):
+        z = transfer(server)
+        server.change_zone('example.com', 101, delete=[('host2.example.com', 'A', '1.2.3.5', 3600)],
+                           add=[('host1.example.com', 'A', '1.2.3.9', 3600),
+                                ('a.b.example.com', 'A', '1.2.3.7', 3600)])
+        changed = z.apply(list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5)))
+        assert changed == set(['example.com', 'host1.example.com', 'host2.example.com', 'a.b.example.com'])
+        fresh = transfer(server)
+        assert z.serial == fresh.serial == 101
+        assert len(z) == len(fresh)
+        for name in fresh.names:
+            assert answers(z, name) == answers(fresh, name)
+        assert 'host2.example.com' not in z.names
+        assert z.nonterminals == fresh.nonterminals == set(['example.com', 'b.example.com'])
+
+    def test_apply_reset(self, server):
+        z = transfer(server)
+        server.change_zone('example.com', 101, delete=[('host2.example.com', 'A', '1.2.3.5', 3600)])
+        server.ixfr_full = True
+        assert z.apply(list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5))) is None
+        assert z.serial == 101
+        assert 'host2.example.com' not in z.names
+
+
+class TestDelta:
+
+    def delta(self, *names):
+        return Delta('example.com', 100, [('add', {'name': n, 'typename': t}) for n, t in names])
+
+    def test_changed_name(self):
+        d = self.delta(('example.com', 'SOA'), ('host1.example.com', 'A'))
+        assert d.base == 100
+        assert d.affects('host1.example.com')
+        assert d.affects('HOST1.example.com.')
+        assert not d.affects('host2.example.com')
+        assert not d.affects('a.host1.example.com')
+
+    def test_name_below(self):
+        d = self.delta(('a.b.example.com', 'A'))
+        assert d.affects('b.example.com')
+        assert not d.affects('c.example.com')
+
+    def test_delegation(self):
+        d = self.delta(('sub.example.com', 'NS'))
+        assert d.affects('host.sub.example.com')
+        assert not d.affects('host.example.com')
+
+    def test_wildcard(self):
+        d = self.delta(('*.wild.example.com', 'A'))
+        assert d.affects('anything.wild.example.com')
+        assert d.affects('a.b.wild.example.com')
+        assert not d.affects('host.example.com')
+
+
+class TestStores:
+
+    def test_snapshot_roundtrip(self, server, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        store = SnapshotStore(path)
+        assert store.load('127.0.0.1', 'example.com') is None
+        z = transfer(server)
+        store.save('127.0.0.1', z)
+        server.change_zone('example.com', 101, delete=[('host2.example.com', 'A', '1.2.3.5', 3600)],
+                           add=[('host3.example.com', 'A', '1.2.3.6', 3600)])
+        changes = list(iter_ixfr('example.com', 100, '127.0.0.1', server.port, timeout=5))
+        z.apply(changes)
+        store.update('127.0.0.1', z, changes)
+        store.close()
+        store = SnapshotStore(path)
+        loaded = store.load('127.0.0.1', 'example.com')
+        assert store.serial('127.0.0.1', 'example.com') == 101
+        assert loaded.serial == 101
+        assert len(loaded) == len(z)
+        assert answers(loaded, 'host3.example.com') == ["'1.2.3.6'"]
+        assert 'host2.example.com' not in loaded.names
+        assert store.load('localhost', 'example.com') is None
+        store.close()
+        assert SnapshotStore(path, refresh=True).load('127.0.0.1', 'example.com') is None
+
+    def test_result_roundtrip(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        store = ResultStore(path)
+        key = ('verify_added_name', ('host1', '1.2.3.4'))
+        assert store.load(key) is None
+        res = {'result': True, 'message': 'm', 'secondary': [], 'warnings': []}
+        store.save(key, {('127.0.0.1', 'example.com'): 100}, res)
+        store.close()
+        assert ResultStore(path).load(key) == ({('127.0.0.1', 'example.com'): 100}, res)
+
+
+class TestIncrementalVerify:
+
+    @pytest.fixture
+    def checks(self, server, tmpdir, monkeypatch):
+        """ make DNStestChecks objects sharing one cache file, using the stub server """
+        def make():
+            config = DnstestConfig()
+            config.server_test = '127.0.0.1'
+            config.server_prod = 'localhost'
+            config.default_domain = '.example.com'
+            config.axfr_zones = ['example.com', '3.2.1.in-addr.arpa']
+            config.persistent_cache = True
+            config.conf_file = str(tmpdir.join('dnstest.ini'))
+            chk = DNStestChecks(config)
+            monkeypatch.setattr(chk.DNS, 'transfer_zone', functools.partial(chk.DNS.transfer_zone, to_port=server.port))
+            monkeypatch.setattr(chk.DNS, 'update_zone', functools.partial(chk.DNS.update_zone, to_port=server.port))
+            return chk
+        return make
+
+    def transfers(self, server, qtype):
+        return len([q for q in server.queries if q[1] == qtype])
+
+    def test_unchanged(self, server, checks):
+        chk = checks()
+        chk.load_snapshots()
+        first = chk.verify_added_name('host1', '1.2.3.4')
+        assert first['result'] is True
+        chk.close()
+        assert self.transfers(server, 'AXFR') == 4
+        chk = checks()
+        messages = chk.load_snapshots()
+        assert messages[0] == "Note - zone example.com unchanged at serial 100 on 127.0.0.1 (TEST)"
+        assert self.transfers(server, 'AXFR') == 4
+        assert self.transfers(server, 'IXFR') == 4
+        calls = []
+        chk.run_plan = lambda plan: calls.append(plan)
+        assert chk.verify_added_name('host1', '1.2.3.4') == first
+        assert calls == []
+        chk.close()
+
+    def test_changed(self, server, checks):
+        chk = checks()
+        chk.load_snapshots()
+        assert chk.verify_added_name('host1', '1.2.3.4')['result'] is True
+        assert chk.verify_added_name('host2', '1.2.3.5')['result'] is True
+        chk.close()
+        server.change_zone('example.com', 101, delete=[('host1.example.com', 'A', '1.2.3.4', 3600)],
+                           add=[('host1.example.com', 'A', '1.2.3.9', 3600)])
+        chk = checks()
+        messages = chk.load_snapshots()
+        assert messages[0] == ("Note - updated zone example.com from serial 100 to 101 on 127.0.0.1 (TEST): "
+                               "1 records deleted, 1 added")
+        run_plan = chk.run_plan
+        calls = []
+
+        def counting(plan):
+            calls.append(plan)
+            return run_plan(plan)
+        chk.run_plan = counting
+        # host1 changed, so is looked up again
+        res = chk.verify_added_name('host1', '1.2.3.4')
+        assert res['result'] is False
+        assert res['message'] == "host1 resolves to 1.2.3.9 instead of 1.2.3.4 (PROD)"
+        assert len(calls) == 1
+        # host2 didn't, so its result is reused
+        assert chk.verify_added_name('host2', '1.2.3.5')['result'] is True
+        assert len(calls) == 1
+        chk.close()
+
+    def test_async_reused(self, server, checks):
+        chk = checks()
+        chk.load_snapshots()
+        first = run(chk.run_async('verify_added_name', 'host1', '1.2.3.4'))
+        chk.close()
+        chk = checks()
+        chk.load_snapshots()
+        chk.run_plan_async = None
+        assert run(chk.run_async('verify_added_name', 'host1', '1.2.3.4')) == first
+        chk.close()
+
+    def test_without_persistent_cache(self, server, checks):
+        chk = checks()
+        chk.config.persistent_cache = False
+        chk.load_snapshots()
+        assert chk.results is None
+        assert chk.verify_added_name('host1', '1.2.3.4')['result'] is True
+        chk.close()
@@ -42,11 +42,19 @@ import sys
 import os
 import shutil
 import mock
+import asyncio
+import io
+import json
+import subprocess
+from xml.etree import ElementTree
 
 from pydnstest.checks import DNStestChecks
 from pydnstest.config import DnstestConfig
+from pydnstest.dns import DNStestDNS
 import pydnstest.main
 from pydnstest.parser import DnstestParser
+from pydnstest.tests.dnsserver import StubDNSServer
+from pydnstest.timing import CheckTiming
 from pydnstest.version import VERSION as pydnstest_version
 
 """
@@ -85,6 +93,19 @@ class OptionsObject(object):
         self.testfile = None
         self.ignorettl = False
         self.sleep = None
+        self.concurrency = 1
+        self.refresh = False
+        self.confirm_all = False
+        self.confirm_zone = None
+        self.prod_zone_file = None
+        self.test_zone_file = None
+        self.wait_for_serial = None
+        self.wait_zone = None
+        self.wait_timeout = 600.0
+        self.watch = False
+        self.until_timeout = '30m'
+        self.timing = False
+        self.output_format = 'text'
         self.exampleconf = False
         self.configprint = False
         self.promptconfig = False
@@ -410,6 +431,151 @@ class TestDNSTestMain:
         assert out == "OK: foobarbaz\n**NG: foofail\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
         assert err == ""
 
+    def test_verify_bypasses_cache(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Verify mode must not answer lookups from the response cache
+        """
+        def mockreturn(foo, bar, chk):
+            assert chk.DNS.cache is None
+            assert chk.AsyncDNS.cache is None
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_verify_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\ncache_size: 10\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_check_uses_cache(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Check mode shares one response cache between the lookup engines
+        """
+        def mockreturn(foo, bar, chk):
+            assert chk.DNS.cache.max_size == 10
+            assert chk.AsyncDNS.cache is chk.DNS.cache
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\ncache_size: 10\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    @pytest.mark.parametrize("verify, refresh, loads", [
+        (False, False, True),
+        (False, True, False),
+        (True, False, False),
+    ])
+    def test_persistent_cache(self, write_testfile, save_user_config, capfd, monkeypatch, verify, refresh, loads):
+        """
+        The persistent cache is written in every mode, but only read in
+        check mode without --refresh
+        """
+        def mockreturn(foo, bar, chk):
+            backing = chk.DNS.cache.backing
+            assert backing.path == os.path.abspath("dnstest.cache")
+            assert backing.servers == set(['1.2.3.4'])
+            assert backing.refresh != loads
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_verify_line" if verify else "run_check_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", verify)
+        setattr(opt, "refresh", refresh)
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\npersistent_cache: True\n")
+
+        try:
+            pydnstest.main.main(opt)
+        finally:
+            os.remove("dnstest.cache")
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_verify_incremental(self, save_user_config, capfd, monkeypatch):
+        """
+        Two verify runs with the persistent cache and axfr_zones; the second
+        brings the stored zones up to date with IXFR, and reuses the stored
+        result of each line the changes don't touch
+        """
+        soa = ('SOA', ('ns1.example.com', 'hostmaster.example.com', 100, 3600, 600, 86400, 300), 3600)
+        server = StubDNSServer({
+            'example.com': [soa, ('NS', 'ns1.example.com', 3600)],
+            'host1.example.com': [('A', '1.2.3.4', 3600)],
+            'host2.example.com': [('A', '1.2.3.5', 3600)],
+            '3.2.1.in-addr.arpa': [soa],
+            '4.3.2.1.in-addr.arpa': [('PTR', 'host1.example.com', 3600)],
+            '5.3.2.1.in-addr.arpa': [('PTR', 'host2.example.com', 3600)],
+        }).start()
+        # send every query and transfer to the stub server's port
+        transfer_zone = DNStestDNS.transfer_zone
+        update_zone = DNStestDNS.update_zone
+        query = DNStestDNS.query
+        monkeypatch.setattr(DNStestDNS, 'transfer_zone',
+                            lambda self, zone, to_server, to_port=53: transfer_zone(self, zone, to_server, server.port))
+        monkeypatch.setattr(DNStestDNS, 'update_zone',
+                            lambda self, z, to_server, to_port=53: update_zone(self, z, to_server, server.port))
+        monkeypatch.setattr(DNStestDNS, 'query',
+                            lambda self, name, to_server, qtype, to_port=53, direct=False:
+                            query(self, name, to_server, qtype, server.port, direct))
+        plans = []
+        run_plan = DNStestChecks.run_plan
+
+        def counting(self, plan):
+            plans.append(plan)
+            return run_plan(self, plan)
+        monkeypatch.setattr(DNStestChecks, 'run_plan', counting)
+
+        with open("testfile.txt", 'w') as fh:
+            fh.write("add record host1.example.com address 1.2.3.4\nadd record host2.example.com address 1.2.3.5\n")
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: localhost\ntest: 127.0.0.1\n[defaults]\n"
+                             "domain: .example.com\npersistent_cache: True\n"
+                             "axfr_zones: example.com, 3.2.1.in-addr.arpa\n")
+
+        def transfers(qtype):
+            return len([q for q in server.queries if q[1] == qtype])
+
+        try:
+            pydnstest.main.main(opt)
+            out, err = capfd.readouterr()
+            assert out.endswith("++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version)
+            assert len(plans) == 2
+            assert transfers('AXFR') == 4
+            server.change_zone('example.com', 101, delete=[('host1.example.com', 'A', '1.2.3.4', 3600)],
+                               add=[('host1.example.com', 'A', '1.2.3.9', 3600)])
+            pydnstest.main.main(opt)
+            out, err = capfd.readouterr()
+        finally:
+            server.stop()
+            os.remove("testfile.txt")
+            os.remove("dnstest.cache")
+        assert ("Note - updated zone example.com from serial 100 to 101 on 127.0.0.1 (TEST): "
+                "1 records deleted, 1 added\n") in out
+        assert "**NG: host1.example.com resolves to 1.2.3.9 instead of 1.2.3.4 (PROD)\n" in out
+        assert out.endswith("++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version)
+        # no more full transfers; only host1's line is looked up again
+        assert transfers('AXFR') == 4
+        assert transfers('IXFR') == 4
+        assert len(plans) == 3
+
     def test_verify_with_sleep(self, write_testfile, save_user_config, capfd, monkeypatch):
         """
         Test with a testfile.
@@ -436,6 +602,607 @@ class TestDNSTestMain:
         assert out == "Note - will sleep 0.001 seconds between lines\nOK: foobarbaz\n**NG: foofail\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
         assert err == ""
 
+    def test_verify_with_testfile_concurrency(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile, running lines concurrently; the slower first
+        line must still be printed first.
+        """
+        async def mockreturn(self, check, *args):
+            assert check == 'confirm_name'
+            if args[0] == "bar.jasonantman.com":
+                return {'result': False, 'message': 'foofail', 'secondary': [], 'warnings': []}
+            await asyncio.sleep(0.05)
+            return {'result': True, 'message': 'foobarbaz', 'secondary': ['sec'], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "concurrency", 4)
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: foobarbaz\n\tsec\n**NG: foofail\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
+        assert err == ""
+
+    def test_verify_with_testfile_concurrency_limits(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile, running lines concurrently; the summary
+        reports the adaptive per-server concurrency limits
+        """
+        async def mockreturn(self, check, *args):
+            started = await self.AsyncDNS.concurrency.acquire('1.2.3.4')
+            self.AsyncDNS.concurrency.release('1.2.3.4', started, 0.01, 'NOERROR')
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "concurrency", 4)
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n++++ Concurrency limits: 1.2.3.4 6 in flight (0 cuts)\n" % pydnstest_version
+        assert err == ""
+
+    def test_verify_with_testfile_timing(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile and --timing; the summary reports the query
+        latency percentiles of each server
+        """
+        async def mockreturn(self, check, *args):
+            timing = CheckTiming()
+            timing.record('resolve_name', args[0], '1.2.3.4', 0.002, False)
+            return self.add_timing({'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}, timing)
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "concurrency", 4)
+        setattr(opt, "timing", True)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == ("OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n"
+                       "++++ Query latency: 1.2.3.4 (PROD) p50 2.0ms p95 2.0ms p99 2.0ms over 2 queries\n" % pydnstest_version)
+        assert err == ""
+
+    def test_verify_with_testfile_jsonl(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile and --output-format jsonl; each result is a
+        JSON object with the fields of its parsed line
+        """
+        def mockreturn(foo, bar, baz):
+            if foo == "confirm bar.jasonantman.com":
+                return {'result': False, 'message': 'foofail', 'secondary': ['sec'], 'warnings': []}
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_verify_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "output_format", 'jsonl')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert [json.loads(l) for l in out.splitlines()] == [
+            {'type': 'result', 'line': 'confirm foo.jasonantman.com', 'operation': 'confirm',
+             'hostname': 'foo.jasonantman.com', 'result': True, 'message': 'foobarbaz',
+             'secondary': [], 'warnings': []},
+            {'type': 'result', 'line': 'confirm bar.jasonantman.com', 'operation': 'confirm',
+             'hostname': 'bar.jasonantman.com', 'result': False, 'message': 'foofail',
+             'secondary': ['sec'], 'warnings': []},
+            {'type': 'summary', 'passed': 1, 'failed': 1, 'notes': [], 'version': pydnstest_version},
+        ]
+        assert err == ""
+
+    def test_verify_with_testfile_junit(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile, --concurrency and --output-format junit
+        """
+        async def mockreturn(self, check, *args):
+            if args[0] == "bar.jasonantman.com":
+                return {'result': False, 'message': 'foofail', 'secondary': [], 'warnings': []}
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "concurrency", 4)
+        setattr(opt, "output_format", 'junit')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        suite = ElementTree.fromstring(out).find('testsuite')
+        assert suite.get('tests') == '2'
+        assert suite.get('failures') == '1'
+        cases = suite.findall('testcase')
+        assert [(c.get('classname'), c.get('name')) for c in cases] == [
+            ('pydnstest.confirm', 'confirm foo.jasonantman.com'),
+            ('pydnstest.confirm', 'confirm bar.jasonantman.com'),
+        ]
+        assert cases[0].find('failure') is None
+        assert cases[1].find('failure').get('message') == 'foofail'
+        assert suite.find('system-out').text == "++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
+        assert err == ""
+
+    def test_output_format_unparseable_line(self, save_user_config, capfd, monkeypatch):
+        """
+        Test that a line that can't be parsed is written as a message when
+        the output format wants the parsed fields
+        """
+        monkeypatch.setattr(sys, 'stdin', io.StringIO("foo bar baz\n"))
+        opt = OptionsObject()
+        setattr(opt, "output_format", 'jsonl')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert [json.loads(l) for l in out.splitlines()] == [
+            {'type': 'message', 'message': 'ERROR: could not parse input line, SKIPPING: foo bar baz'},
+            {'type': 'summary', 'passed': 0, 'failed': 0, 'notes': [], 'version': pydnstest_version},
+        ]
+
+    def test_verify_with_testfile_short_circuited(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile; the summary counts lines failed by an open
+        circuit breaker
+        """
+        def mockreturn(self, n):
+            if n == "bar.jasonantman.com":
+                return {'result': False, 'message': 'UNREACHABLE', 'secondary': [], 'warnings': [],
+                        'short_circuited': True}
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "confirm_name", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "testfile", 'testfile.txt')
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: foobarbaz\n**NG: UNREACHABLE\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" \
+            "++++ 1 lines short-circuited: a server stopped answering (UNREACHABLE)\n" % pydnstest_version
+        assert err == ""
+
+    def test_confirm_all(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile in confirm-all mode; every line is checked with
+        confirm_all_name() through the pipeline, even without --concurrency
+        """
+        calls = []
+
+        async def mockreturn(self, check, *args):
+            calls.append((check, args))
+            assert self.config.cache_size == 0
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "confirm_all", True)
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4, 1.2.3.6\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+        assert calls == [('confirm_all_name', ('foo.jasonantman.com',)),
+                         ('confirm_all_name', ('bar.jasonantman.com',))]
+
+    def test_confirm_all_concurrency_limits(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test with a testfile in confirm-all mode without --concurrency; the
+        lines still run through the pipeline, so the summary reports the
+        concurrency limits
+        """
+        async def mockreturn(self, check, *args):
+            started = await self.AsyncDNS.concurrency.acquire('1.2.3.4')
+            self.AsyncDNS.concurrency.release('1.2.3.4', started, 0.01, 'NOERROR')
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "run_async", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "testfile", 'testfile.txt')
+        setattr(opt, "confirm_all", True)
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4, 1.2.3.6\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: foobarbaz\nOK: foobarbaz\n++++ All 2 tests passed. (pydnstest %s)\n++++ Concurrency limits: 1.2.3.4 6 in flight (0 cuts)\n" % pydnstest_version
+        assert err == ""
+
+    def test_confirm_zone(self, save_user_config, capfd, monkeypatch):
+        """
+        Test confirm-zone mode; no input is read, and each result of
+        confirm_zone() is printed and counted
+        """
+        calls = []
+
+        def mockreturn(self, zone, prod_file, test_file):
+            calls.append((zone, prod_file, test_file))
+            yield {'result': False, 'message': "RRset 'foo.example.com A' only on test server (added)",
+                   'secondary': ['TEST: foo.example.com 360 IN A 1.2.3.4'], 'warnings': []}
+            yield {'result': False, 'message': "1 of 2 RRsets differ in zone 'example.com'", 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "confirm_zone", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "confirm_zone", 'example.com')
+        setattr(opt, "test_zone_file", 'test.zone')
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == ("**NG: RRset 'foo.example.com A' only on test server (added)\n"
+                       "\tTEST: foo.example.com 360 IN A 1.2.3.4\n"
+                       "**NG: 1 of 2 RRsets differ in zone 'example.com'\n"
+                       "++++ 0 passed / 2 FAILED. (pydnstest %s)\n" % pydnstest_version)
+        assert err == ""
+        assert calls == [('example.com', None, 'test.zone')]
+
+    def test_wait_for_serial(self, save_user_config, capfd, monkeypatch):
+        """
+        Test --wait-for-serial with the TEST server's serial; input is read
+        once PROD has it
+        """
+        calls = []
+
+        def mock_serial(self, zone, server):
+            calls.append(('current_serial', zone, server))
+            return 2017122402
+
+        def mock_wait(self, zone, serial, timeout):
+            calls.append(('wait_for_serial', zone, serial, timeout))
+            return {'result': True, 'message': "PROD has serial 2017122402 for zone 'example.com' (waited for 2017122402)",
+                    'secondary': ['3 SOA queries to 1.2.3.4 over 3.0 seconds'], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "current_serial", mock_serial)
+        monkeypatch.setattr(DNStestChecks, "wait_for_serial", mock_wait)
+
+        opt = OptionsObject()
+        setattr(opt, "wait_for_serial", 'test')
+        setattr(opt, "wait_timeout", 30.0)
+        setattr(opt, "testfile", os.path.abspath("empty.txt"))
+        with open(opt.testfile, 'w') as fh:
+            fh.write("# nothing to test\n")
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        try:
+            foo = pydnstest.main.main(opt)
+        finally:
+            os.remove(opt.testfile)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == ("Note - TEST has serial 2017122402 for zone 'example.com'\n"
+                       "OK: PROD has serial 2017122402 for zone 'example.com' (waited for 2017122402)\n"
+                       "\t3 SOA queries to 1.2.3.4 over 3.0 seconds\n"
+                       "++++ All 0 tests passed. (pydnstest %s)\n" % pydnstest_version)
+        assert calls == [('current_serial', 'example.com', '1.2.3.5'),
+                         ('wait_for_serial', 'example.com', 2017122402, 30.0)]
+
+    def test_wait_for_serial_timeout(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test --wait-for-serial giving up; no input is tested, but the
+        checks are still closed, committing the persistent cache
+        """
+        closed = []
+
+        def mock_wait(self, zone, serial, timeout):
+            return {'result': False, 'message': "PROD still has serial 5 for zone 'foo.com' after 10 seconds, waited for 7",
+                    'secondary': [], 'warnings': []}
+        monkeypatch.setattr(DNStestChecks, "wait_for_serial", mock_wait)
+        monkeypatch.setattr(DNStestChecks, "close", lambda self: closed.append(self))
+
+        opt = OptionsObject()
+        setattr(opt, "wait_for_serial", '7')
+        setattr(opt, "wait_zone", 'foo.com')
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == ("**NG: PROD still has serial 5 for zone 'foo.com' after 10 seconds, waited for 7\n"
+                       "++++ not running tests: PROD does not have the changes yet. (pydnstest %s)\n" % pydnstest_version)
+        assert len(closed) == 1
+
+    def test_interrupted_closes(self, write_testfile, save_user_config, capfd, monkeypatch):
+        """
+        Test a run interrupted part way through the input; the checks are
+        still closed, committing the persistent cache
+        """
+        closed = []
+
+        def mockreturn(foo, bar, baz):
+            raise KeyboardInterrupt()
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+        monkeypatch.setattr(DNStestChecks, "close", lambda self: closed.append(self))
+
+        opt = OptionsObject()
+        setattr(opt, "testfile", 'testfile.txt')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\ndomain: .example.com\n")
+
+        with pytest.raises(KeyboardInterrupt):
+            pydnstest.main.main(opt)
+        assert len(closed) == 1
+
+    def test_wait_for_serial_no_testfile(self, save_user_config, capfd, monkeypatch):
+        """
+        Test --wait-for-serial with a test file that doesn't exist; that's
+        reported before waiting for anything
+        """
+        def mock_wait(self, zone, serial, timeout):
+            raise AssertionError("waited for the serial")
+        monkeypatch.setattr(DNStestChecks, "wait_for_serial", mock_wait)
+
+        opt = OptionsObject()
+        setattr(opt, "wait_for_serial", '7')
+        setattr(opt, "wait_zone", 'foo.com')
+        setattr(opt, "testfile", 'nofilehere')
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\ndomain: .example.com\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: test file 'nofilehere' does not exist.\n"
+
+    def test_wait_for_serial_invalid(self, save_user_config, capfd):
+        opt = OptionsObject()
+        setattr(opt, "wait_for_serial", 'latest')
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\ndomain: .example.com\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --wait-for-serial must be a serial number or 'test'.\n"
+
+    def test_run_watch(self, capfd, monkeypatch):
+        """
+        Test run_watch() re-verifying only the lines that haven't passed,
+        with backoff, until they pass or the timeout
+        """
+        clock = {'now': 100.0, 'sleeps': []}
+
+        def mock_sleep(secs):
+            clock['sleeps'].append(secs)
+            clock['now'] += secs
+        monkeypatch.setattr(pydnstest.main, 'sleep', mock_sleep)
+        monkeypatch.setattr(pydnstest.main, 'monotonic', lambda: clock['now'])
+        # the pass each line first passes on, or None for never
+        passes_on = {'add a': 0, 'add b': 1, 'add c': 3, 'add d': None}
+        calls = []
+
+        def mock_verify(line, parser, chk):
+            if line == 'bad line':
+                print("ERROR: could not parse input line, SKIPPING: %s" % line)
+                return False
+            n = len([c for c in calls if c == line])
+            calls.append(line)
+            ok = passes_on[line] is not None and n >= passes_on[line]
+            return {'result': ok, 'message': '%s %s' % (line, 'ok' if ok else 'pending'),
+                    'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, 'run_verify_line', mock_verify)
+
+        res = pydnstest.main.run_watch(['add a', 'bad line', 'add b', 'add c', 'add d'], None, None, 60,
+                                       interval=5.0, max_interval=20.0)
+        assert res == (3, 1)
+        assert clock['sleeps'] == [5.0, 10.0, 20.0, 20.0, 5.0]
+        # lines are only re-run until they pass
+        assert calls == ['add a', 'add b', 'add c', 'add d',
+                         'add b', 'add c', 'add d',
+                         'add c', 'add d',
+                         'add c', 'add d',
+                         'add d',
+                         'add d']
+        out, err = capfd.readouterr()
+        assert out == ("OK: add a ok\n"
+                       "ERROR: could not parse input line, SKIPPING: bad line\n"
+                       "**NG: add b pending\n"
+                       "**NG: add c pending\n"
+                       "**NG: add d pending\n"
+                       "Note - watching 3 of 4 lines until they pass, for up to 60 seconds\n"
+                       "OK: add b ok\n"
+                       "OK: add c ok\n"
+                       "Note - 1 lines did not pass within 60 seconds:\n"
+                       "**NG: add d pending\n"
+                       "++++ Time to convergence:\n"
+                       "\tadd a: 0.0 seconds\n"
+                       "\tadd b: 5.0 seconds\n"
+                       "\tadd c: 35.0 seconds\n"
+                       "\tadd d: did not pass\n")
+
+    def test_run_watch_all_pass(self, capfd, monkeypatch):
+        monkeypatch.setattr(pydnstest.main, 'sleep', lambda secs: pytest.fail('slept'))
+        monkeypatch.setattr(pydnstest.main, 'run_verify_line', lambda line, parser, chk: {
+            'result': True, 'message': line, 'secondary': [], 'warnings': []})
+        assert pydnstest.main.run_watch(['add a'], None, None, 60) == (1, 0)
+        out, err = capfd.readouterr()
+        assert out == "OK: add a\n++++ Time to convergence:\n\tadd a: 0.0 seconds\n"
+
+    def test_watch(self, save_user_config, capfd, monkeypatch):
+        """
+        Test --watch: lines are read from the file, and verified
+        """
+        calls = []
+
+        def mock_watch(lines, parser, chk, timeout, writer=None):
+            calls.append((lines, timeout))
+            print("watching")
+            return (1, 1)
+        monkeypatch.setattr(pydnstest.main, "run_watch", mock_watch)
+
+        opt = OptionsObject()
+        setattr(opt, "watch", True)
+        setattr(opt, "until_timeout", '1h30m')
+        setattr(opt, "testfile", os.path.abspath("watch.txt"))
+        with open(opt.testfile, 'w') as fh:
+            fh.write("# a comment\nadd foo with value 1.2.3.4\n\nremove bar\n")
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        try:
+            pydnstest.main.main(opt)
+        finally:
+            os.remove(opt.testfile)
+        out, err = capfd.readouterr()
+        assert out == "watching\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
+        assert calls == [(['add foo with value 1.2.3.4', 'remove bar'], 5400)]
+        assert opt.verify is True
+
+    def test_watch_invalid_timeout(self, save_user_config, capfd):
+        opt = OptionsObject()
+        setattr(opt, "watch", True)
+        setattr(opt, "until_timeout", 'soon')
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --until-timeout must be a number of seconds, or a duration like '30m' or '1h30m'.\n"
+
+    def test_check_for_line_confirm_all(self):
+        parser = DnstestParser()
+        d = parser.parse_line("rename foo with value 1.2.3.4 to bar")
+        assert pydnstest.main.check_for_line(d, False, confirm_all=True) == ('confirm_all_name', ('foo',))
+        assert pydnstest.main.check_for_line(d, False)[0] == 'check_renamed_name'
+
+    def test_run_pipeline(self, capfd):
+        """
+        Test run_pipeline() output order, parse errors and the in-flight bound
+        """
+        class FakeChecks(object):
+            in_flight = 0
+            max_in_flight = 0
+            calls = []
+
+            async def run_async(self, check, *args):
+                self.calls.append((check, args))
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                # earlier lines take longer
+                await asyncio.sleep(0.002 * (20 - len(self.calls)))
+                self.in_flight -= 1
+                return {'result': args[0] != 'host7', 'message': args[0], 'secondary': [], 'warnings': []}
+
+        lines = ["confirm host%d\n" % i for i in range(12)]
+        lines.insert(3, "foo bar baz\n")
+        lines.insert(5, "# comment\n")
+        lines.insert(6, "\n")
+        chk = FakeChecks()
+        loop = asyncio.new_event_loop()
+        try:
+            res = loop.run_until_complete(pydnstest.main.run_pipeline(lines, DnstestParser(), chk, False, 4))
+        finally:
+            loop.close()
+        out, err = capfd.readouterr()
+        expected = ["OK: host%d" % i if i != 7 else "**NG: host7" for i in range(12)]
+        expected.insert(3, "ERROR: could not parse input line, SKIPPING: foo bar baz")
+        assert out == "\n".join(expected) + "\n"
+        assert res == (11, 1, 0)
+        assert chk.max_in_flight == 4
+        assert chk.calls[0] == ('confirm_name', ('host0',))
+
+    def test_run_pipeline_verify(self, capfd):
+        """
+        Test that run_pipeline() calls the verify methods in verify mode
+        """
+        calls = []
+
+        class FakeChecks(object):
+            async def run_async(self, check, *args):
+                calls.append((check, args))
+                return {'result': True, 'message': check, 'secondary': [], 'warnings': []}
+
+        lines = ["add foo value 1.2.3.4", "remove foo", "change foo to bar", "rename foo with value 1.2.3.4 to bar", "confirm foo"]
+        loop = asyncio.new_event_loop()
+        try:
+            res = loop.run_until_complete(pydnstest.main.run_pipeline(lines, DnstestParser(), FakeChecks(), True, 2))
+        finally:
+            loop.close()
+        assert res == (5, 0, 0)
+        assert calls == [('verify_added_name', ('foo', '1.2.3.4')),
+                         ('verify_removed_name', ('foo',)),
+                         ('verify_changed_name', ('foo', 'bar')),
+                         ('verify_renamed_name', ('foo', 'bar', '1.2.3.4')),
+                         ('confirm_name', ('foo',))]
+
+    def test_run_pipeline_exception(self):
+        """
+        An exception from a check ends the pipeline and is raised
+        """
+        class FakeChecks(object):
+            async def run_async(self, check, *args):
+                raise ValueError("boom")
+
+        loop = asyncio.new_event_loop()
+        try:
+            with pytest.raises(ValueError):
+                loop.run_until_complete(pydnstest.main.run_pipeline(["confirm foo"] * 10, DnstestParser(), FakeChecks(), False, 3))
+        finally:
+            loop.close()
+
     def test_verify_with_ignorettl(self, write_testfile, save_user_config, capfd, monkeypatch):
         """
         Test with a testfile.
@@ -489,6 +1256,40 @@ class TestDNSTestMain:
         sys.argv = ['pydnstest', '-c', 'configfile', '-f', 'mytestfile', '-V', '--sleep', '0.01']
         x = pydnstest.main.parse_opts()
 
+    def test_options_concurrency(self, monkeypatch):
+        """
+        Test the parse_opts option parsing method, with the concurrency option
+        """
+        def mockreturn(options):
+            assert options.verify == False
+            assert options.testfile == "mytestfile"
+            assert options.concurrency == 50
+        monkeypatch.setattr(pydnstest.main, "main", mockreturn)
+        sys.argv = ['pydnstest', '-f', 'mytestfile', '--concurrency', '50']
+        x = pydnstest.main.parse_opts()
+
+    def test_options_confirm_all(self, monkeypatch):
+        """
+        Test the parse_opts option parsing method, with the confirm-all option
+        """
+        def mockreturn(options):
+            assert options.confirm_all == True
+            assert options.verify == False
+        monkeypatch.setattr(pydnstest.main, "main", mockreturn)
+        sys.argv = ['pydnstest', '-f', 'mytestfile', '--confirm-all']
+        x = pydnstest.main.parse_opts()
+
+    def test_options_refresh(self, monkeypatch):
+        """
+        Test the parse_opts option parsing method, with the refresh option
+        """
+        def mockreturn(options):
+            assert options.verify == False
+            assert options.refresh == True
+        monkeypatch.setattr(pydnstest.main, "main", mockreturn)
+        sys.argv = ['pydnstest', '-f', 'mytestfile', '--refresh']
+        x = pydnstest.main.parse_opts()
+
     def test_options_ignorettl(self, monkeypatch):
         """
         Test the parse_opts option parsing method, with the ignorettl option
@@ -582,13 +1383,33 @@ class TestDNSTestMain:
                     pydnstest.main.main(opt)
         assert prompt_config_mock.call_count == 1
 
+    def test_lazy_imports(self):
+        """
+        Importing main and printing the example config doesn't load
+        pyparsing, DNS or asyncio
+        """
+        code = ("import sys\n"
+                "import pydnstest.main\n"
+                "sys.argv = ['pydnstest', '--example-config']\n"
+                "try:\n"
+                "    pydnstest.main.parse_opts()\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stderr.write(repr(sorted(m for m in ('pyparsing', 'DNS', 'asyncio', 'pydnstest.checks') "
+                "if m in sys.modules)))\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(pydnstest.main.__file__)))
+        proc = subprocess.Popen([sys.executable, '-c', code], cwd=root, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = proc.communicate()
+        assert proc.returncode == 0
+        assert "[servers]" in out
+        assert err == "[]"
+
     def test_options_help(self, save_user_config, capfd):
         """
         test --help output
         """
-        grammar_mock = mock.MagicMock()
-        grammar_mock.return_value = ["outputhere"]
-        with mock.patch('pydnstest.main.DnstestParser.get_grammar', grammar_mock):
+        with mock.patch('pydnstest.main.DnstestParser.grammar_strings', ["outputhere"]):
             with mock.patch('pydnstest.main.sys.argv', ['pydnstest', '--help']):
                 with pytest.raises(SystemExit):
                     pydnstest.main.parse_opts()
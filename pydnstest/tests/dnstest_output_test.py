@@ -0,0 +1,167 @@
+"""
+tests for output.py - the result writers
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import io
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from pydnstest.output import JSONLinesWriter, JUnitWriter, TextWriter, WRITERS, result_text
+from pydnstest.version import VERSION
+
+
+OK = {'result': True, 'message': 'all good', 'secondary': [], 'warnings': []}
+NG = {'result': False, 'message': 'foo.example.com <b> differs', 'secondary': ['PROD says 1.2.3.4'],
+      'warnings': ['TTL mismatch']}
+PARSED = {'operation': 'confirm', 'hostname': 'foo.example.com'}
+
+
+def test_result_text():
+    assert result_text(OK) == "OK: all good\n"
+    assert result_text(NG) == "**NG: foo.example.com <b> differs\n\tPROD says 1.2.3.4\n\tTTL mismatch\n"
+
+
+def test_writers():
+    assert WRITERS == {'text': TextWriter, 'jsonl': JSONLinesWriter, 'junit': JUnitWriter}
+    assert TextWriter.wants_fields is False
+    assert JSONLinesWriter.wants_fields is True
+    assert JUnitWriter.wants_fields is True
+
+
+def test_text_writer():
+    s = io.StringIO()
+    w = TextWriter(s)
+    w.write_message("Note - will sleep 1 seconds between lines")
+    w.write_result(OK, 'confirm foo.example.com', PARSED)
+    w.write_result(NG)
+    w.write_summary(1, 1, ["Query latency: none"])
+    w.close()
+    assert s.getvalue() == ("Note - will sleep 1 seconds between lines\nOK: all good\n"
+                            "**NG: foo.example.com <b> differs\n\tPROD says 1.2.3.4\n\tTTL mismatch\n"
+                            "++++ 1 passed / 1 FAILED. (pydnstest %s)\n++++ Query latency: none\n" % VERSION)
+
+
+def test_text_writer_all_passed():
+    s = io.StringIO()
+    w = TextWriter(s)
+    w.write_summary(3, 0)
+    assert s.getvalue() == "++++ All 3 tests passed. (pydnstest %s)\n" % VERSION
+
+
+def test_jsonl_writer():
+    s = io.StringIO()
+    w = JSONLinesWriter(s)
+    w.write_message("a note")
+    timed = dict(OK, timing={'elapsed': 0.25, 'queries': 2, 'lookups': []})
+    w.write_result(timed, 'confirm foo.example.com', PARSED)
+    # each record is written as soon as it's given
+    assert len(s.getvalue().splitlines()) == 2
+    w.write_result(NG)
+    w.write_summary(1, 1, ["a summary note"])
+    w.close()
+    assert [json.loads(l) for l in s.getvalue().splitlines()] == [
+        {'type': 'message', 'message': 'a note'},
+        {'type': 'result', 'line': 'confirm foo.example.com', 'operation': 'confirm',
+         'hostname': 'foo.example.com', 'result': True, 'message': 'all good', 'secondary': [],
+         'warnings': [], 'timing': {'elapsed': 0.25, 'queries': 2, 'lookups': []}},
+        {'type': 'result', 'result': False, 'message': 'foo.example.com <b> differs',
+         'secondary': ['PROD says 1.2.3.4'], 'warnings': ['TTL mismatch']},
+        {'type': 'summary', 'passed': 1, 'failed': 1, 'notes': ['a summary note'], 'version': VERSION},
+    ]
+
+
+def test_jsonl_writer_fields():
+    s = io.StringIO()
+    w = JSONLinesWriter(s)
+    w.write_result(OK, 'rename foo.example.com bar.example.com',
+                   {'operation': 'rename', 'hostname': 'foo.example.com', 'newname': 'bar.example.com',
+                    'extra': 'ignored'})
+    rec = json.loads(s.getvalue())
+    assert rec['operation'] == 'rename'
+    assert rec['newname'] == 'bar.example.com'
+    assert 'extra' not in rec
+    assert 'value' not in rec
+
+
+def test_junit_writer():
+    s = io.StringIO()
+    w = JUnitWriter(s)
+    w.write_message("a <note>")
+    w.write_result(dict(OK, timing={'elapsed': 0.25, 'queries': 2, 'lookups': []}),
+                   'confirm foo.example.com', PARSED)
+    w.write_result(dict(NG, timing={'elapsed': 0.5, 'queries': 2, 'lookups': []}),
+                   'confirm bar.example.com', {'operation': 'confirm', 'hostname': 'bar.example.com'})
+    w.write_result(OK)
+    w.write_summary(2, 1)
+    # nothing is written until the counts are known
+    assert s.getvalue() == ""
+    w.close()
+    root = ElementTree.fromstring(s.getvalue())
+    assert root.tag == 'testsuites'
+    suite = root.find('testsuite')
+    assert suite.get('name') == 'pydnstest'
+    assert suite.get('tests') == '3'
+    assert suite.get('failures') == '1'
+    assert suite.get('errors') == '0'
+    assert float(suite.get('time')) == pytest.approx(0.75)
+    cases = suite.findall('testcase')
+    assert [(c.get('classname'), c.get('name'), float(c.get('time'))) for c in cases] == [
+        ('pydnstest.confirm', 'confirm foo.example.com', 0.25),
+        ('pydnstest.confirm', 'confirm bar.example.com', 0.5),
+        ('pydnstest', 'all good', 0.0),
+    ]
+    assert cases[0].find('failure') is None
+    assert cases[1].find('failure').get('message') == 'foo.example.com <b> differs'
+    assert cases[1].find('system-out').text == result_text(NG)
+    assert suite.find('system-out').text == "a <note>\n++++ 2 passed / 1 FAILED. (pydnstest %s)\n" % VERSION
+
+
+def test_junit_writer_spools():
+    s = io.StringIO()
+    w = JUnitWriter(s, name='mysuite')
+    for i in range(1000):
+        w.write_result(OK, 'confirm host%d.example.com' % i, PARSED)
+    # the test cases are kept in a temporary file, not in memory
+    assert w.cases.tell() > 0
+    w.close()
+    assert w.cases.closed
+    suite = ElementTree.fromstring(s.getvalue()).find('testsuite')
+    assert suite.get('name') == 'mysuite'
+    assert len(suite.findall('testcase')) == 1000
@@ -38,11 +38,78 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import pytest
+import subprocess
 import sys
 import os
 
-from pydnstest.parser import DnstestParser
-from pyparsing import ParseException
+from pydnstest.parser import DnstestParser, ParseError, fast_parse_line
+
+
+GOOD_LINES = [
+    ("add fooHostOne value fooHostTwo", {'operation': 'add', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
+    ("add foobar value 10.104.92.243", {'operation': 'add', 'hostname': 'foobar', 'value': '10.104.92.243'}),
+    ("add entry foobar with value baz", {'operation': 'add', 'hostname': 'foobar', 'value': 'baz'}),
+    ("add record foobar.example.com target blam", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': 'blam'}),
+    ("add name foobar address 192.168.0.139", {'operation': 'add', 'hostname': 'foobar', 'value': '192.168.0.139'}),
+    ("add foobar.example.com with target 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
+    ("add foobar.hosts.example.com value 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("remove fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove record fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove name fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove entry fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove record foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove name foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove entry foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove entry foo.bar.baz.example.com", {'operation': 'remove', 'hostname': 'foo.bar.baz.example.com'}),
+    ("rename fooHostOne with target targ to fooHostTwo", {'operation': 'rename', 'hostname': 'fooHostOne', 'newname': 'fooHostTwo', 'value': 'targ'}),
+    ("rename entry foobar foo.bar.net to baz", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz', 'value': 'foo.bar.net'}),
+    ("rename record foobar.example.com with address 1.2.3.4 to blam", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'blam', 'value': '1.2.3.4'}),
+    ("rename name foobar 1.2.3.5 to baz.example.com", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz.example.com', 'value': '1.2.3.5'}),
+    ("rename foobar.example.com value 1.2.3.4 to baz.blam.hosts.example.com", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'baz.blam.hosts.example.com', 'value': '1.2.3.4'}),
+    ("rename foobar.hosts.example.com with value baz to blam", {'operation': 'rename', 'hostname': 'foobar.hosts.example.com', 'newname': 'blam', 'value': 'baz'}),
+    ("rename foo.subdomain.example.com with value 10.188.8.76 to bar.subdomain.example.com", {'operation': 'rename', 'hostname': 'foo.subdomain.example.com', 'newname': 'bar.subdomain.example.com', 'value': '10.188.8.76'}),
+    ("change fooHostOne to fooHostTwo", {'operation': 'change', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
+    ("change foobar to 10.104.92.243", {'operation': 'change', 'hostname': 'foobar', 'value': '10.104.92.243'}),
+    ("change entry foobar to baz", {'operation': 'change', 'hostname': 'foobar', 'value': 'baz'}),
+    ("change record foobar.example.com to blam", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': 'blam'}),
+    ("change name foobar to 192.168.0.139", {'operation': 'change', 'hostname': 'foobar', 'value': '192.168.0.139'}),
+    ("change foobar.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
+    ("change foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("change entry foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("change name foobar to foobar.hosts.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.hosts.example.com'}),
+    ("change name foobar to foobar.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.example.com'}),
+    ("confirm foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm record foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm entry foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm name foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm 1.2.3.4", None),
+    ("confirm record 1.2.3.4", None),
+    ("confirm entry 1.2.3.4", None),
+    ("confirm name 1.2.3.4", None),
+    ("confirm foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm record foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm entry foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm name foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm m.example.com", {'operation': 'confirm', 'hostname': 'm.example.com'}),
+    ("confirm foo.m.example.com", {'operation': 'confirm', 'hostname': 'foo.m.example.com'}),
+    ("confirm m", {'operation': 'confirm', 'hostname': 'm'}),
+    ("confirm m._foo.example.com", {'operation': 'confirm', 'hostname': 'm._foo.example.com'}),
+    ("confirm _bar.example.com", {'operation': 'confirm', 'hostname': '_bar.example.com'}),
+    ("add record _foobar.example.com address 1.2.3.4", {'operation': 'add', 'hostname': '_foobar.example.com', 'value': '1.2.3.4'}),
+    ("add record foobar._discover.example.com target blam", {'operation': 'add', 'hostname': 'foobar._discover.example.com', 'value': 'blam'})
+]
+
+BAD_LINES = [
+    "add extraword record foobar.example.com target blam",
+    "add foobar value blam extraword",
+    "remove foo blam",
+    "rename foobar.example.com to baz.blam.hosts.example.com EXTRAWORD"
+    "change foobar",
+    "change foobar to",
+    "change foobar.hosts.example.com to",
+    "add m.foo.example.com with target foo.example.com.edgesuite.net.",
+]
 
 
 class TestLanguageParsing:
@@ -57,82 +124,20 @@ class TestLanguageParsing:
     'confirm <hostname_or_fqdn>'
     """
 
-    @pytest.mark.parametrize(("line", "parsed_dict"), [
-        ("add fooHostOne value fooHostTwo", {'operation': 'add', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
-        ("add foobar value 10.104.92.243", {'operation': 'add', 'hostname': 'foobar', 'value': '10.104.92.243'}),
-        ("add entry foobar with value baz", {'operation': 'add', 'hostname': 'foobar', 'value': 'baz'}),
-        ("add record foobar.example.com target blam", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': 'blam'}),
-        ("add name foobar address 192.168.0.139", {'operation': 'add', 'hostname': 'foobar', 'value': '192.168.0.139'}),
-        ("add foobar.example.com with target 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
-        ("add foobar.hosts.example.com value 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("remove fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove record fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove name fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove entry fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove record foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove name foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove entry foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove entry foo.bar.baz.example.com", {'operation': 'remove', 'hostname': 'foo.bar.baz.example.com'}),
-        ("rename fooHostOne with target targ to fooHostTwo", {'operation': 'rename', 'hostname': 'fooHostOne', 'newname': 'fooHostTwo', 'value': 'targ'}),
-        ("rename entry foobar foo.bar.net to baz", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz', 'value': 'foo.bar.net'}),
-        ("rename record foobar.example.com with address 1.2.3.4 to blam", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'blam', 'value': '1.2.3.4'}),
-        ("rename name foobar 1.2.3.5 to baz.example.com", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz.example.com', 'value': '1.2.3.5'}),
-        ("rename foobar.example.com value 1.2.3.4 to baz.blam.hosts.example.com", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'baz.blam.hosts.example.com', 'value': '1.2.3.4'}),
-        ("rename foobar.hosts.example.com with value baz to blam", {'operation': 'rename', 'hostname': 'foobar.hosts.example.com', 'newname': 'blam', 'value': 'baz'}),
-        ("rename foo.subdomain.example.com with value 10.188.8.76 to bar.subdomain.example.com", {'operation': 'rename', 'hostname': 'foo.subdomain.example.com', 'newname': 'bar.subdomain.example.com', 'value': '10.188.8.76'}),
-        ("change fooHostOne to fooHostTwo", {'operation': 'change', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
-        ("change foobar to 10.104.92.243", {'operation': 'change', 'hostname': 'foobar', 'value': '10.104.92.243'}),
-        ("change entry foobar to baz", {'operation': 'change', 'hostname': 'foobar', 'value': 'baz'}),
-        ("change record foobar.example.com to blam", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': 'blam'}),
-        ("change name foobar to 192.168.0.139", {'operation': 'change', 'hostname': 'foobar', 'value': '192.168.0.139'}),
-        ("change foobar.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
-        ("change foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("change entry foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("change name foobar to foobar.hosts.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.hosts.example.com'}),
-        ("change name foobar to foobar.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.example.com'}),
-        ("confirm foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm record foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm entry foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm name foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm 1.2.3.4", None),
-        ("confirm record 1.2.3.4", None),
-        ("confirm entry 1.2.3.4", None),
-        ("confirm name 1.2.3.4", None),
-        ("confirm foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm record foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm entry foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm name foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm m.example.com", {'operation': 'confirm', 'hostname': 'm.example.com'}),
-        ("confirm foo.m.example.com", {'operation': 'confirm', 'hostname': 'foo.m.example.com'}),
-        ("confirm m", {'operation': 'confirm', 'hostname': 'm'}),
-        ("confirm m._foo.example.com", {'operation': 'confirm', 'hostname': 'm._foo.example.com'}),
-        ("confirm _bar.example.com", {'operation': 'confirm', 'hostname': '_bar.example.com'}),
-        ("add record _foobar.example.com address 1.2.3.4", {'operation': 'add', 'hostname': '_foobar.example.com', 'value': '1.2.3.4'}),
-        ("add record foobar._discover.example.com target blam", {'operation': 'add', 'hostname': 'foobar._discover.example.com', 'value': 'blam'})
-    ])
+    @pytest.mark.parametrize(("line", "parsed_dict"), GOOD_LINES)
     def test_parse_should_succeed(self, line, parsed_dict):
         foo = None
         try:
             p = DnstestParser()
             foo = p.parse_line(line)
-        except ParseException:
+        except ParseError:
             # assert will fail, no need to do anything here
             pass
         assert foo == parsed_dict
 
-    @pytest.mark.parametrize("line", [
-        "add extraword record foobar.example.com target blam",
-        "add foobar value blam extraword",
-        "remove foo blam",
-        "rename foobar.example.com to baz.blam.hosts.example.com EXTRAWORD"
-        "change foobar",
-        "change foobar to",
-        "change foobar.hosts.example.com to",
-        "add m.foo.example.com with target foo.example.com.edgesuite.net.",
-    ])
+    @pytest.mark.parametrize("line", BAD_LINES)
     def test_parse_should_raise_exception(self, line):
-        with pytest.raises(ParseException):
+        with pytest.raises(ParseError):
             p = DnstestParser()
             p.parse_line(line)
 
@@ -146,3 +151,155 @@ class TestLanguageParsing:
                     ]
         result = p.get_grammar()
         assert result == expected
+
+
+# lines around the edges of the grammar, where pyparsing matches keywords
+# and addresses at the start of a token, or skips only some whitespace
+EDGE_LINES = [
+    "",
+    "   ",
+    "confirm",
+    "Confirm foo.example.com",
+    "  confirm \t foo.example.com  \r\n",
+    "confirm foo.example.com\x0b",
+    "confirm-foo",
+    "confirm -foo",
+    "confirm foo-",
+    "confirm record",
+    "confirm record record",
+    "confirm with",
+    "confirm record-foo",
+    "confirm recordfoo",
+    "confirm name.example.com",
+    "confirm to.example.com",
+    "confirm 10.1.2.3.example.com",
+    "confirm 1.2.3.456",
+    "confirm %s" % ("a" * 63),
+    "confirm %s" % ("a" * 64),
+    "confirm %s.example.com" % ("a" * 64),
+    "remove 1.2.3.4",
+    "remove record 1.2.3.4",
+    "remove 1.2.3.456",
+    "remove 1.2.3.05",
+    "remove 256.1.1.1",
+    "add foo with bar",
+    "add foo bar",
+    "add foo with value",
+    "add value value value",
+    "add foo value 1.2.3.05",
+    "add foo value value.example.com",
+    "add foo value-x 1.2.3.4",
+    "add 1.2.3.4 value foo",
+    "rename foo with to bar",
+    "rename foo value to bar",
+    "rename foo with value with to bar",
+    "rename foo bar to",
+    "rename foo bar to 1.2.3.4",
+    "rename foo bar baz",
+    "change foo to",
+    "change foo bar",
+    "change foo to to",
+    "change foo to 10.1.2.3.example.com",
+    "change foo to foo_",
+    "confirm foo.example.com.",
+    "confirm foo..example.com",
+    "confirm foo$bar",
+]
+
+
+def parse_pyparsing(line):
+    try:
+        return DnstestParser().parse_line_pyparsing(line)
+    except ParseError:
+        return None
+
+
+class TestFastParse:
+    """
+    Conformance of fast_parse_line() to the pyparsing grammar
+    """
+
+    @pytest.mark.parametrize(("line", "parsed_dict"), GOOD_LINES)
+    def test_good_lines(self, line, parsed_dict):
+        assert parse_pyparsing(line) == parsed_dict
+        if parsed_dict is not None:
+            # every documented form is parsed without pyparsing
+            assert fast_parse_line(line) == parsed_dict
+        else:
+            assert fast_parse_line(line) is None
+
+    @pytest.mark.parametrize("line", BAD_LINES)
+    def test_bad_lines(self, line):
+        assert fast_parse_line(line) is None
+
+    @pytest.mark.parametrize("line", EDGE_LINES)
+    def test_edge_lines(self, line):
+        # lines the fast path parses must parse the same with pyparsing
+        expected = parse_pyparsing(line)
+        d = fast_parse_line(line)
+        if d is not None:
+            assert d == expected
+        p = DnstestParser()
+        if expected is None:
+            with pytest.raises(ParseError):
+                p.parse_line(line)
+        else:
+            assert p.parse_line(line) == expected
+
+    @pytest.mark.parametrize(("line", "parsed_dict"), [
+        ("confirm record-foo", {'operation': 'confirm', 'hostname': '-foo'}),
+        ("confirm with", {'operation': 'confirm', 'hostname': 'with'}),
+        ("confirm record record", {'operation': 'confirm', 'hostname': 'record'}),
+        ("rename foo with to bar", {'operation': 'rename', 'hostname': 'foo', 'value': 'with', 'newname': 'bar'}),
+        ("add value value value", {'operation': 'add', 'hostname': 'value', 'value': 'value'}),
+        ("  confirm \t foo.example.com  \r\n", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ])
+    def test_edge_results(self, line, parsed_dict):
+        assert DnstestParser().parse_line(line) == parsed_dict
+
+    def test_parse_line_uses_fast_path(self, monkeypatch):
+        def fail(self, line):
+            assert False, "pyparsing used for %s" % line
+        monkeypatch.setattr(DnstestParser, 'parse_line_pyparsing', fail)
+        p = DnstestParser()
+        assert p.parse_line("add foo value 1.2.3.4") == {'operation': 'add', 'hostname': 'foo', 'value': '1.2.3.4'}
+
+    def test_parse_line_falls_back(self, monkeypatch):
+        calls = []
+
+        def mock_parse(self, line):
+            calls.append(line)
+            return {'operation': 'confirm', 'hostname': '-foo'}
+        monkeypatch.setattr(DnstestParser, 'parse_line_pyparsing', mock_parse)
+        p = DnstestParser()
+        assert p.parse_line("confirm record-foo") == {'operation': 'confirm', 'hostname': '-foo'}
+        assert calls == ["confirm record-foo"]
+
+    def test_benchmark(self):
+        from pydnstest.tests.parser_benchmark import benchmark
+        fast, slow = benchmark(100)
+        assert 0 < fast < slow
+
+
+def test_grammar_built_when_needed():
+    """
+    pyparsing isn't imported, nor the grammar built, until a line the fast
+    path can't parse
+    """
+    code = ("import sys\n"
+            "from pydnstest.parser import DnstestParser, ParseError\n"
+            "p = DnstestParser()\n"
+            "p.parse_line('confirm foo.example.com')\n"
+            "print('pyparsing' in sys.modules, DnstestParser.line_parser is None)\n"
+            "try:\n"
+            "    p.parse_line('confirm foo.example.com bar')\n"
+            "except ParseError:\n"
+            "    print('pyparsing' in sys.modules, DnstestParser.line_parser is None)\n")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=root, universal_newlines=True)
+    assert out == "False True\nTrue False\n"
+
+
+def test_grammar_strings():
+    assert DnstestParser.grammar_strings == DnstestParser().get_grammar()
+    assert [g.split()[0] for g in DnstestParser.grammar_strings] == ['add', 'remove', 'rename', 'change', 'confirm']
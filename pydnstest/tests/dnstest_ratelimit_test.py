@@ -0,0 +1,118 @@
+"""
+tests for ratelimit.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.dns import DNStestDNS
+from pydnstest.ratelimit import RateLimiter, TokenBucket
+from pydnstest.socketpool import AsyncUDPSocketPool, UDPSocketPool
+from pydnstest.tests.dnsserver import FakeClock, StubDNSServer, run
+
+
+class TestTokenBucket:
+    """
+    tests for TokenBucket and RateLimiter
+    """
+
+    def test_burst(self):
+        b = TokenBucket(10, burst=3, clock=FakeClock())
+        assert [b.reserve() for i in range(3)] == [0.0, 0.0, 0.0]
+        assert b.reserve() == pytest.approx(0.1)
+
+    def test_reservations_spaced(self):
+        """ concurrent waiters each get their own slot """
+        b = TokenBucket(10, burst=1, clock=FakeClock())
+        assert [b.reserve() for i in range(4)] == pytest.approx([0.0, 0.1, 0.2, 0.3])
+
+    def test_refill(self):
+        clock = FakeClock()
+        b = TokenBucket(10, burst=2, clock=clock)
+        b.reserve()
+        b.reserve()
+        clock.now += 0.1
+        assert b.reserve() == 0.0
+        assert b.reserve() == pytest.approx(0.1)
+        # never refills past burst
+        clock.now += 100
+        assert [b.reserve() for i in range(2)] == [0.0, 0.0]
+        assert b.reserve() > 0
+
+    def test_limiter_other_servers(self):
+        limiter = RateLimiter({'1.2.3.4': TokenBucket(1)})
+        start = time.time()
+        for i in range(10):
+            limiter.acquire('1.2.3.5')
+        assert time.time() - start < 0.1
+
+    def test_blocking_qps(self):
+        with StubDNSServer({'foo.example.com': [('A', '1.2.3.4', 60)]}) as server:
+            d = DNStestDNS(pool=UDPSocketPool(), limiter=RateLimiter({'127.0.0.1': TokenBucket(50)}))
+            start = time.time()
+            for i in range(6):
+                d.resolve_name('foo.example.com', '127.0.0.1', server.port)
+            elapsed = time.time() - start
+            d.close()
+        assert 0.09 < elapsed < 1.0
+
+    def test_async_qps(self):
+        """ concurrent queries are held to the server's rate """
+        with StubDNSServer({'foo.example.com': [('A', '1.2.3.4', 60)]}) as server:
+            pool = AsyncUDPSocketPool()
+            adns = DNStestAsyncDNS(pool=pool, limiter=RateLimiter({'127.0.0.1': TokenBucket(50, burst=2)}))
+            sent = []
+
+            async def resolve_all():
+                async def resolve():
+                    res = await adns.resolve_name('foo.example.com', '127.0.0.1', server.port)
+                    sent.append(time.time())
+                    return res
+                res = await asyncio.gather(*[resolve() for i in range(12)])
+                await adns.close()
+                return res
+
+            start = time.time()
+            res = run(resolve_all())
+        assert all(r['answer']['data'] == '1.2.3.4' for r in res)
+        # 2 at once, then 10 more at 50 qps
+        assert 0.18 < sent[-1] - start < 1.0
+        assert sent[1] - start < 0.05
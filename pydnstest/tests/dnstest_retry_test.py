@@ -0,0 +1,161 @@
+"""
+tests for retry.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socket
+import time
+
+import DNS
+import pytest
+
+from pydnstest.dns import DNStestDNS
+from pydnstest.retry import RetryPolicies, RetryPolicy
+from pydnstest.socketpool import UDPSocketPool
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+
+class FlakySend(object):
+    """ send callable that times out ``failures`` times, then answers """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if len(self.timeouts) <= self.failures:
+            raise DNS.TimeoutError('Timeout')
+        return 'answer'
+
+
+class TestRetryPolicy:
+    """
+    tests for RetryPolicy and RetryPolicies
+    """
+
+    def test_defaults(self):
+        p = RetryPolicy()
+        assert (p.timeout, p.retries, p.retry_backoff) == (5.0, 2, 0.5)
+        assert [p.backoff(i) for i in (1, 2, 3)] == [0.5, 1.0, 2.0]
+        assert RetryPolicy(retries=-1).retries == 0
+
+    def test_call_retries(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(time, 'sleep', lambda s: sleeps.append(s))
+        send = FlakySend(2)
+        assert RetryPolicy(timeout=1.5, retries=2, retry_backoff=0.1).call(send) == 'answer'
+        assert send.timeouts == [1.5, 1.5, 1.5]
+        assert sleeps == [0.1, 0.2]
+
+    def test_call_gives_up(self, monkeypatch):
+        monkeypatch.setattr(time, 'sleep', lambda s: None)
+        send = FlakySend(5)
+        with pytest.raises(DNS.TimeoutError):
+            RetryPolicy(retries=1).call(send)
+        assert len(send.timeouts) == 2
+
+    def test_call_other_errors_not_retried(self):
+        def send(timeout):
+            raise DNS.SocketError('refused')
+        with pytest.raises(DNS.SocketError):
+            RetryPolicy().call(send)
+
+    def test_call_async_does_not_block(self):
+        """ other queries carry on while one waits out its backoff """
+        done = []
+
+        async def flaky():
+            sends = {'n': 0}
+
+            async def send(timeout):
+                sends['n'] += 1
+                if sends['n'] == 1:
+                    raise DNS.TimeoutError('Timeout')
+                return 'retried'
+            r = await RetryPolicy(retry_backoff=0.1).call_async(send)
+            done.append(r)
+
+        async def quick():
+            await asyncio.sleep(0.01)
+            done.append('quick')
+
+        async def go():
+            await asyncio.gather(flaky(), quick())
+        run(go())
+        assert done == ['quick', 'retried']
+
+    def test_policies(self):
+        fast = RetryPolicy(timeout=1.0)
+        p = RetryPolicies({'1.2.3.4': fast})
+        assert p.get('1.2.3.4') is fast
+        assert p.get('1.2.3.5').timeout == 5.0
+
+
+class TestDNSRetry:
+    """
+    tests for DNStestDNS with a RetryPolicies
+    """
+
+    def test_timeout_status(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        pool = UDPSocketPool()
+        try:
+            retry = RetryPolicies(default=RetryPolicy(timeout=0.05, retries=1, retry_backoff=0.01))
+            dns = DNStestDNS(pool=pool, retry=retry)
+            start = time.time()
+            assert dns.resolve_name('foo.example.com', '127.0.0.1', port) == {'status': 'TIMEOUT'}
+            assert dns.lookup_reverse('1.2.3.4', '127.0.0.1', port) == {'status': 'TIMEOUT'}
+            assert time.time() - start < 1.0
+            sock.settimeout(0.5)
+            for i in range(4):
+                sock.recvfrom(512)
+        finally:
+            pool.close()
+            sock.close()
+
+    def test_answer(self):
+        records = {'foo.example.com': [('A', '1.2.3.4', 360)]}
+        with StubDNSServer(records) as srv:
+            pool = UDPSocketPool()
+            dns = DNStestDNS(pool=pool, retry=RetryPolicies())
+            foo = dns.resolve_name('foo.example.com', '127.0.0.1', srv.port)
+            pool.close()
+        assert foo['answer']['data'] == '1.2.3.4'
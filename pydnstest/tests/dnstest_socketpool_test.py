@@ -0,0 +1,461 @@
+"""
+tests for socketpool.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+import DNS
+
+from pydnstest.asyncdns import DNStestAsyncDNS
+from pydnstest.dns import DNStestDNS
+from pydnstest.socketpool import (AsyncDNSTransport, AsyncTCPConnectionPool, AsyncUDPSocketPool,
+                                  DNSTransport, TCPConnectionPool, UDPSocketPool)
+from pydnstest.tests.dnsserver import StubDNSServer, run
+
+RECORDS = {
+    'host1.example.com': [('A', '1.2.3.4', 3600)],
+    'host2.example.com': [('A', '1.2.3.5', 3600)],
+    'alias1.example.com': [('CNAME', 'host1.example.com', 300)],
+    '4.3.2.1.in-addr.arpa': [('PTR', 'host1.example.com', 3600)],
+}
+
+
+class NoisyServer(object):
+    """
+    answers one query with a reply from the wrong address, then a reply
+    with the wrong ID, then the real reply
+    """
+
+    def __init__(self):
+        self.stub = StubDNSServer(RECORDS)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def serve(self):
+        data, addr = self.sock.recvfrom(512)
+        reply = self.stub.build_response(data)
+        tid = struct.unpack('!H', reply[:2])[0]
+        wrong = self.stub.build_response(data.replace(b'host1', b'host2', 1))
+        self.other.sendto(wrong, addr)
+        self.sock.sendto(struct.pack('!H', (tid + 1) % 65536) + wrong[2:], addr)
+        self.sock.sendto(reply, addr)
+
+    def close(self):
+        self.sock.close()
+        self.other.close()
+
+
+class LateServer(object):
+    """
+    doesn't answer the first query until a second one arrives, then sends
+    the late reply to the first just before the reply to the second
+    """
+
+    def __init__(self):
+        self.stub = StubDNSServer(RECORDS)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def serve(self):
+        first, addr = self.sock.recvfrom(512)
+        second, addr = self.sock.recvfrom(512)
+        self.sock.sendto(self.stub.build_response(first), addr)
+        self.sock.sendto(self.stub.build_response(second), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+class FullListener(object):
+    """
+    a TCP listener whose accept queue is full, so new connections to it
+    are never established
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(0)
+        self.clients = []
+        for i in range(3):
+            c = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            c.setblocking(False)
+            c.connect_ex(('127.0.0.1', self.port))
+            self.clients.append(c)
+        time.sleep(0.05)
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def close(self):
+        for c in self.clients:
+            c.close()
+        self.sock.close()
+
+
+class TestUDPSocketPool:
+    """
+    tests for UDPSocketPool and DNStestDNS with a pool
+    """
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(RECORDS).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    @pytest.mark.parametrize("method, name", [
+        ('resolve_name', 'host1.example.com'),
+        ('resolve_name', 'alias1.example.com'),
+        ('resolve_name', 'notaname.example.com'),
+        ('lookup_reverse', '1.2.3.4'),
+        ('lookup_reverse', '1.2.3.5'),
+    ])
+    def test_same_as_request(self, server, method, name):
+        """ results must match those from DNS.Request exactly """
+        expected = getattr(DNStestDNS(), method)(name, '127.0.0.1', server.port)
+        d = DNStestDNS(pool=UDPSocketPool())
+        assert getattr(d, method)(name, '127.0.0.1', server.port) == expected
+        d.close()
+
+    def test_reuses_socket(self, server):
+        pool = UDPSocketPool()
+        d = DNStestDNS(pool=pool)
+        for i in range(10):
+            assert d.resolve_name('host1.example.com', '127.0.0.1', server.port)['answer']['data'] == '1.2.3.4'
+        with StubDNSServer(RECORDS) as other:
+            d.resolve_name('host1.example.com', '127.0.0.1', other.port)
+        assert pool.stats() == {'sockets_open': 2, 'queries': 11, 'queries_per_socket': [10, 1]}
+        pool.close()
+        assert pool.stats() == {'sockets_open': 0, 'queries': 0, 'queries_per_socket': []}
+
+    def test_matches_id_and_source(self):
+        server = NoisyServer()
+        try:
+            res = DNStestDNS(pool=UDPSocketPool(timeout=2)).resolve_name('host1.example.com', '127.0.0.1', server.port)
+        finally:
+            server.close()
+        assert res['answer']['data'] == '1.2.3.4'
+
+    def test_late_reply_reused_id(self, monkeypatch):
+        """ a late reply to a timed-out query isn't taken for the next one with its ID """
+        monkeypatch.setattr('random.randint', lambda a, b: 4660)
+        server = LateServer()
+        pool = UDPSocketPool()
+        try:
+            with pytest.raises(DNS.TimeoutError):
+                pool.query('host1.example.com', '127.0.0.1', 'A', server.port, 0.2)
+            res = pool.query('host2.example.com', '127.0.0.1', 'A', server.port, 2)
+        finally:
+            pool.close()
+            server.close()
+        assert res.answers[0]['data'] == '1.2.3.5'
+
+    def test_timeout(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        pool = UDPSocketPool(timeout=0.1)
+        try:
+            with pytest.raises(DNS.TimeoutError):
+                pool.query('host1.example.com', '127.0.0.1', 'A', sock.getsockname()[1])
+        finally:
+            sock.close()
+        # the socket is still usable, and kept
+        assert pool.stats()['sockets_open'] == 1
+        pool.close()
+
+    def test_bad_server(self):
+        with pytest.raises(DNS.SocketError):
+            UDPSocketPool().query('host1.example.com', 'no.such.host.invalid', 'A')
+
+
+class TestAsyncUDPSocketPool:
+    """
+    tests for AsyncUDPSocketPool and DNStestAsyncDNS with a pool
+    """
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(RECORDS).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    def test_shared_socket(self, server):
+        """ concurrent queries to one server share one socket """
+        server.delay = 0.1
+        pool = AsyncUDPSocketPool()
+        adns = DNStestAsyncDNS(pool=pool)
+        names = ['host1.example.com', 'host2.example.com', 'alias1.example.com'] * 10
+
+        async def resolve_all():
+            res = await asyncio.gather(*[adns.resolve_name(n, '127.0.0.1', server.port) for n in names])
+            stats = pool.stats()
+            await adns.close()
+            return res, stats
+
+        start = time.time()
+        res, stats = run(resolve_all())
+        assert time.time() - start < 2.0
+        assert [r['answer']['name'] for r in res] == names
+        assert [r['answer']['data'] for r in res[:3]] == ['1.2.3.4', '1.2.3.5', 'host1.example.com']
+        assert stats == {'sockets_open': 1, 'queries': 30, 'queries_per_socket': [30]}
+        assert pool.stats()['sockets_open'] == 0
+
+    def test_new_loop(self, server):
+        """ a pool can be used from one event loop after another """
+        adns = DNStestAsyncDNS(pool=AsyncUDPSocketPool())
+
+        async def resolve():
+            res = await adns.resolve_name('host1.example.com', '127.0.0.1', server.port)
+            await adns.close()
+            return res
+
+        assert run(resolve())['answer']['data'] == '1.2.3.4'
+        assert run(resolve())['answer']['data'] == '1.2.3.4'
+
+    def test_matches_id_and_source(self):
+        server = NoisyServer()
+        pool = AsyncUDPSocketPool()
+
+        async def query():
+            try:
+                return await pool.query('host1.example.com', '127.0.0.1', 'A', server.port, 2)
+            finally:
+                await pool.close()
+
+        try:
+            res = run(query())
+        finally:
+            server.close()
+        assert res.answers[0]['data'] == '1.2.3.4'
+
+    def test_late_reply_reused_id(self, monkeypatch):
+        """ a late reply to a timed-out query isn't taken for the next one with its ID """
+        monkeypatch.setattr('random.randint', lambda a, b: 4660)
+        server = LateServer()
+        pool = AsyncUDPSocketPool()
+
+        async def query():
+            try:
+                with pytest.raises(DNS.TimeoutError):
+                    await pool.query('host1.example.com', '127.0.0.1', 'A', server.port, 0.2)
+                return await pool.query('host2.example.com', '127.0.0.1', 'A', server.port, 2)
+            finally:
+                await pool.close()
+
+        try:
+            res = run(query())
+        finally:
+            server.close()
+        assert res.answers[0]['data'] == '1.2.3.5'
+
+    def test_timeout(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        pool = AsyncUDPSocketPool()
+
+        async def query():
+            try:
+                await pool.query('host1.example.com', '127.0.0.1', 'A', sock.getsockname()[1], 0.1)
+            finally:
+                await pool.close()
+
+        try:
+            with pytest.raises(DNS.TimeoutError):
+                run(query())
+        finally:
+            sock.close()
+
+
+class TestTCP:
+    """
+    tests for TCPConnectionPool, AsyncTCPConnectionPool and the transports
+    """
+
+    @pytest.fixture
+    def server(self, request):
+        s = StubDNSServer(RECORDS, truncate=['alias1.example.com']).start()
+        request.addfinalizer(s.stop)
+        return s
+
+    @pytest.mark.parametrize("method, name", [
+        ('resolve_name', 'host1.example.com'),
+        ('resolve_name', 'notaname.example.com'),
+        ('lookup_reverse', '1.2.3.4'),
+    ])
+    def test_same_as_udp(self, server, method, name):
+        expected = getattr(DNStestDNS(), method)(name, '127.0.0.1', server.port)
+        d = DNStestDNS(pool=TCPConnectionPool())
+        assert getattr(d, method)(name, '127.0.0.1', server.port) == expected
+        d.close()
+
+    def test_persistent_connection(self, server):
+        pool = TCPConnectionPool()
+        for i in range(5):
+            assert pool.query('host1.example.com', '127.0.0.1', 'A', server.port).answers[0]['data'] == '1.2.3.4'
+        assert pool.stats() == {'sockets_open': 1, 'queries': 5, 'queries_per_socket': [5]}
+        assert server.tcp_connections == 1
+        pool.close()
+
+    def test_reconnect(self, server):
+        """ a connection closed by the server is replaced """
+        pool = TCPConnectionPool()
+        pool.query('host1.example.com', '127.0.0.1', 'A', server.port)
+        list(pool.conns.values())[0].sock.shutdown(socket.SHUT_RDWR)
+        assert pool.query('host1.example.com', '127.0.0.1', 'A', server.port).answers[0]['data'] == '1.2.3.4'
+        assert server.tcp_connections == 2
+        pool.close()
+
+    def test_connect_timeout(self):
+        """ the timeout of each query also limits the wait for a new connection """
+        listener = FullListener()
+        pool = TCPConnectionPool()
+        start = time.time()
+        try:
+            with pytest.raises(DNS.TimeoutError):
+                pool.query('host1.example.com', '127.0.0.1', 'A', listener.port, 0.2)
+        finally:
+            pool.close()
+            listener.close()
+        assert time.time() - start < 2.0
+
+    def test_truncated_fallback(self, server):
+        d = DNStestDNS(pool=DNSTransport())
+        res = d.resolve_name('alias1.example.com', '127.0.0.1', server.port)
+        assert res['answer']['data'] == 'host1.example.com'
+        assert d.pool.stats()['udp']['queries'] == 1
+        assert d.pool.stats()['tcp']['queries'] == 1
+        # without the fallback, the truncated UDP reply has no answer
+        assert DNStestDNS(pool=UDPSocketPool()).resolve_name('alias1.example.com', '127.0.0.1', server.port) == {'status': 'NOERROR'}
+        d.close()
+
+    def test_tcp_servers(self, server):
+        d = DNStestDNS(pool=DNSTransport(tcp_servers=['127.0.0.1']))
+        d.resolve_name('host1.example.com', '127.0.0.1', server.port)
+        assert d.pool.stats()['udp']['queries'] == 0
+        assert d.pool.stats()['tcp']['queries'] == 1
+        d.close()
+
+    def test_async_pipelined(self, server):
+        """ many queries on one connection, answered out of order """
+        server.delays = {'host1.example.com': 0.3}
+        pool = AsyncTCPConnectionPool()
+        adns = DNStestAsyncDNS(pool=pool)
+        names = ['host1.example.com', 'host2.example.com', 'notaname.example.com'] * 5
+
+        async def resolve_all():
+            res = await asyncio.gather(*[adns.resolve_name(n, '127.0.0.1', server.port) for n in names])
+            stats = pool.stats()
+            await adns.close()
+            return res, stats
+
+        start = time.time()
+        res, stats = run(resolve_all())
+        assert time.time() - start < 1.5
+        assert [r['answer']['data'] for r in res[:2]] == ['1.2.3.4', '1.2.3.5']
+        assert res[2] == {'status': 'NXDOMAIN'}
+        assert stats == {'sockets_open': 1, 'queries': 15, 'queries_per_socket': [15]}
+        assert server.tcp_connections == 1
+
+    def test_async_truncated_fallback(self, server):
+        transport = AsyncDNSTransport()
+        adns = DNStestAsyncDNS(pool=transport)
+
+        async def resolve():
+            res = await adns.resolve_name('alias1.example.com', '127.0.0.1', server.port)
+            stats = transport.stats()
+            await adns.close()
+            return res, stats
+
+        res, stats = run(resolve())
+        assert res['answer']['data'] == 'host1.example.com'
+        assert stats['udp']['queries'] == 1
+        assert stats['tcp']['queries'] == 1
+
+    def test_async_connect_timeout(self):
+        listener = FullListener()
+        pool = AsyncTCPConnectionPool()
+
+        async def query():
+            try:
+                await pool.query('host1.example.com', '127.0.0.1', 'A', listener.port, 0.2)
+            finally:
+                await pool.close()
+
+        start = time.time()
+        try:
+            with pytest.raises(DNS.TimeoutError):
+                run(query())
+        finally:
+            listener.close()
+        assert time.time() - start < 2.0
+
+    def test_async_reconnect(self, server):
+        pool = AsyncTCPConnectionPool()
+
+        async def query_twice():
+            await pool.query('host1.example.com', '127.0.0.1', 'A', server.port)
+            pool.protocols()[0].transport.close()
+            await asyncio.sleep(0.01)
+            res = await pool.query('host1.example.com', '127.0.0.1', 'A', server.port)
+            await pool.close()
+            return res
+
+        assert run(query_twice()).answers[0]['data'] == '1.2.3.4'
+        assert server.tcp_connections == 2
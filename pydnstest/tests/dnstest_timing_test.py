@@ -0,0 +1,171 @@
+"""
+Tests for timing of check lookups (pydnstest.timing)
+
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+
+import pytest
+
+from pydnstest.axfr import Zone, ZoneSnapshot
+from pydnstest.cache import cache_key
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.timing import CheckTiming, TimingSummary, percentile
+from pydnstest.tests.dnsserver import FakeClock, run
+
+
+def lookup(server, rtt, cached=False):
+    return {'server': server, 'qtype': 'A', 'name': 'foo.example.com', 'rtt': rtt, 'cached': cached}
+
+
+@pytest.mark.parametrize("p, expected", [(0, 1), (50, 50), (95, 95), (99, 99), (100, 100)])
+def test_percentile(p, expected):
+    assert percentile(list(range(1, 101)), p) == expected
+
+
+def test_percentile_small():
+    assert percentile([7], 99) == 7
+    assert percentile([1, 2, 3], 50) == 2
+
+
+def test_check_timing():
+    t = CheckTiming(clock=FakeClock(0.5))
+    t.record('resolve_name', 'foo.example.com', '1.2.3.4', 0.01, False)
+    t.record('lookup_reverse', '1.2.3.5', '1.2.3.4', 0.0, True)
+    assert t.as_dict() == {
+        'elapsed': 0.5, 'queries': 1,
+        'lookups': [{'server': '1.2.3.4', 'qtype': 'A', 'name': 'foo.example.com', 'rtt': 0.01, 'cached': False},
+                    {'server': '1.2.3.4', 'qtype': 'PTR', 'name': '1.2.3.5', 'rtt': 0.0, 'cached': True}]}
+
+
+class TestTimingSummary:
+
+    def test_empty(self):
+        assert TimingSummary().summary() is None
+
+    def test_summary(self):
+        s = TimingSummary({'1.2.3.4': 'PROD'})
+        s.add({'elapsed': 1.0, 'queries': 100,
+               'lookups': [lookup('1.2.3.4', i / 1000.0) for i in range(1, 101)]})
+        s.add({'elapsed': 1.0, 'queries': 1, 'lookups': [lookup('1.2.3.5', 0.002), lookup('1.2.3.5', 0, True)]})
+        assert s.stats() == {'1.2.3.4': {'queries': 100, 'p50': 0.05, 'p95': 0.095, 'p99': 0.099},
+                             '1.2.3.5': {'queries': 1, 'p50': 0.002, 'p95': 0.002, 'p99': 0.002}}
+        assert s.summary() == ("1.2.3.4 (PROD) p50 50.0ms p95 95.0ms p99 99.0ms over 100 queries, "
+                               "1.2.3.5 p50 2.0ms p95 2.0ms p99 2.0ms over 1 queries, "
+                               "1 lookups answered without a query")
+
+
+class TestCheckTiming:
+    """
+    timing sections added to check results by run_plan() and run_plan_async()
+    """
+
+    @pytest.fixture
+    def chk(self):
+        config = DnstestConfig()
+        config.server_prod = '1.2.3.4'
+        config.server_test = '1.2.3.5'
+        config.default_domain = '.example.com'
+        config.have_reverse_dns = False
+        chk = DNStestChecks(config)
+        # foo renamed to bar, baz changed, between PROD (1.2.3.4) and TEST (1.2.3.5)
+        answers = {'1.2.3.4': {'foo.example.com': '1.2.3.10', 'baz.example.com': '1.2.3.11'},
+                   '1.2.3.5': {'bar.example.com': '1.2.3.10', 'baz.example.com': '1.2.3.12'}}
+
+        def resolve_name(name, server):
+            if name not in answers[server]:
+                return {'status': 'NXDOMAIN'}
+            return {'answer': {'name': name, 'data': answers[server][name], 'typename': 'A', 'ttl': 300}}
+
+        def lookup_reverse(addr, server):
+            return {'status': 'NXDOMAIN'}
+
+        async def resolve_name_async(name, server):
+            return resolve_name(name, server)
+        chk.DNS.resolve_name = resolve_name
+        chk.DNS.lookup_reverse = lookup_reverse
+        chk.AsyncDNS.resolve_name = resolve_name_async
+        yield chk
+        chk.close()
+
+    def test_disabled(self, chk):
+        res = chk.verify_added_name('foo', '1.2.3.10')
+        assert res['result'] is True
+        assert 'timing' not in res
+        assert chk.timings is None
+
+    def test_blocking(self, chk):
+        chk.enable_timing()
+        res = chk.check_renamed_name('foo', 'bar', '1.2.3.10')
+        timing = res['timing']
+        assert [(l['server'], l['qtype'], l['name'], l['cached']) for l in timing['lookups']] == [
+            ('1.2.3.5', 'A', 'foo.example.com', False),
+            ('1.2.3.5', 'A', 'bar.example.com', False),
+            ('1.2.3.4', 'A', 'foo.example.com', False),
+            ('1.2.3.5', 'PTR', '1.2.3.10', False),
+        ]
+        assert timing['queries'] == 4
+        assert timing['elapsed'] >= sum(l['rtt'] for l in timing['lookups'])
+        assert chk.timings.stats()['1.2.3.5']['queries'] == 3
+
+    def test_cached(self, chk):
+        chk.enable_timing()
+        chk.DNS.cache.put(cache_key('baz.example.com', '1.2.3.4', 'A'), CachedAnswer())
+        z = Zone('example.com')
+        z.add({'name': 'example.com', 'typename': 'SOA', 'ttl': 300,
+               'data': ('ns1.example.com', 'hostmaster.example.com', ('serial', 1))})
+        chk.DNS.snapshots['1.2.3.5'] = ZoneSnapshot()
+        chk.DNS.snapshots['1.2.3.5'].add_zone(z)
+        res = chk.check_changed_name('baz', '1.2.3.12')
+        assert [(l['server'], l['cached']) for l in res['timing']['lookups']] == [
+            ('1.2.3.5', True), ('1.2.3.4', True), ('1.2.3.5', False)]
+        assert res['timing']['queries'] == 1
+
+    def test_async(self, chk):
+        chk.enable_timing()
+        res = run(chk.run_async('verify_added_name', 'foo', '1.2.3.10'))
+        assert res['result'] is True
+        assert [(l['server'], l['name']) for l in res['timing']['lookups']] == [('1.2.3.4', 'foo.example.com')]
+        assert chk.timings.stats()['1.2.3.4']['queries'] == 1
+
+
+class CachedAnswer(object):
+    """ a response that can be cached """
+    answers = [{'name': 'baz.example.com', 'data': '1.2.3.11', 'typename': 'A', 'ttl': 300}]
+    authority = []
+    header = {'status': 'NOERROR'}
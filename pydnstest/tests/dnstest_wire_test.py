@@ -0,0 +1,171 @@
+"""
+tests for wire.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import struct
+
+import pytest
+import DNS
+
+from pydnstest.wire import (WireError, WireResponse, build_query, decode_name,
+                            encode_name, query_template)
+
+
+def message(answers=(), authority=(), additional=(), rcode=0, tc=0):
+    """
+    build a response with the DNS module's packer (which compresses names);
+    each record is (method suffix, name, ttl, *rdata)
+    """
+    m = DNS.Lib.Mpacker()
+    m.addHeader(1234, 1, 0, 1, tc, 1, 1, 0, rcode, 1, len(answers), len(authority), len(additional))
+    m.addQuestion('foo.example.com', DNS.Type.A, DNS.Class.IN)
+    for rr in list(answers) + list(authority) + list(additional):
+        getattr(m, 'add%s' % rr[0])(rr[1], DNS.Class.IN, rr[2], *rr[3:])
+    return m.getbuf()
+
+
+def raw_record(m, name, rtype, ttl, rdata):
+    m.addRRheader(name, rtype, DNS.Class.IN, ttl)
+    m.buf += rdata
+    m.endRR()
+
+
+RECORDS = [
+    ('A', 'foo.example.com', 360, '1.2.3.4'),
+    ('CNAME', 'alias.example.com', 300, 'foo.example.com'),
+    ('NS', 'example.com', 3600, 'ns1.example.com'),
+    ('PTR', '4.3.2.1.in-addr.arpa', 3600, 'foo.example.com'),
+    ('MX', 'example.com', 3600, 10, 'mail.example.com'),
+    ('SOA', 'example.com', 3600, 'ns1.example.com', 'hostmaster.example.com',
+     2017122401, 3600, 600, 1209600, 59),
+    ('TXT', 'example.com', 60, ['v=spf1 -all', 'second']),
+    ('HINFO', 'foo.example.com', 60, 'x86', 'Linux'),
+]
+
+
+class TestWire:
+    """
+    tests for the wire format codec; results must match the DNS module's
+    """
+
+    def test_build_query(self):
+        m = DNS.Lib.Mpacker()
+        m.addHeader(4321, 0, DNS.Opcode.QUERY, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0)
+        m.addQuestion('foo.example.com', DNS.Type.CNAME, DNS.Class.IN)
+        assert build_query(4321, 'foo.example.com', 'CNAME') == m.getbuf()
+        assert build_query(4321, 'foo.example.com.', 'CNAME') == m.getbuf()
+
+    def test_query_template_cached(self):
+        assert query_template('bar.example.com', 'A') is query_template('bar.example.com', 'A')
+
+    def test_encode_name(self):
+        assert encode_name('foo.example.com') == b'\x03foo\x07example\x03com\x00'
+        assert encode_name('') == b'\x00'
+        with pytest.raises(WireError):
+            encode_name('a' * 64 + '.com')
+
+    @pytest.mark.parametrize("rr", RECORDS, ids=[r[0] for r in RECORDS])
+    def test_same_as_dns_module(self, rr):
+        data = message(answers=[rr], authority=[RECORDS[5]], additional=[RECORDS[0]])
+        expected = DNS.Lib.DnsResult(DNS.Lib.Munpacker(data), {})
+        res = WireResponse(data)
+        assert res.answers == expected.answers
+        assert res.authority == expected.authority
+        assert res.additional == expected.additional
+        assert res.header == expected.header
+
+    def test_srv(self):
+        m = DNS.Lib.Mpacker()
+        m.addHeader(1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0, 0)
+        m.addQuestion('_ldap._tcp.example.com', DNS.Type.SRV, DNS.Class.IN)
+        raw_record(m, '_ldap._tcp.example.com', DNS.Type.SRV, 60,
+                   struct.pack('!HHH', 0, 5, 389) + encode_name('ldap.example.com'))
+        data = m.getbuf()
+        expected = DNS.Lib.DnsResult(DNS.Lib.Munpacker(data), {})
+        assert WireResponse(data).answers == expected.answers
+        assert WireResponse(data).answers[0]['data'] == (0, 5, 389, 'ldap.example.com')
+
+    def test_unknown_type(self):
+        """ types the DNS module can't decode (i.e. AAAA) are raw bytes """
+        m = DNS.Lib.Mpacker()
+        m.addHeader(1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 2, 0, 0)
+        m.addQuestion('foo.example.com', DNS.Type.AAAA, DNS.Class.IN)
+        raw_record(m, 'foo.example.com', DNS.Type.AAAA, 60, b'\x20\x01' + b'\x00' * 14)
+        raw_record(m, 'foo.example.com', 65280, 60, b'\x01\x02')
+        data = m.getbuf()
+        expected = DNS.Lib.DnsResult(DNS.Lib.Munpacker(data), {})
+        res = WireResponse(data)
+        assert res.answers == expected.answers
+        assert res.answers[1]['typename'] == '65280'
+
+    @pytest.mark.parametrize("rcode, status", [(0, 'NOERROR'), (3, 'NXDOMAIN'), (5, 'REFUSED'), (15, '15')])
+    def test_status(self, rcode, status):
+        res = WireResponse(message(rcode=rcode))
+        assert res.header['status'] == status
+        assert res.answers == []
+
+    def test_tc(self):
+        assert WireResponse(message(tc=1)).header['tc'] == 1
+        assert WireResponse(message()).header['tc'] == 0
+
+    def test_lazy(self):
+        """ sections are only parsed when accessed, then kept """
+        res = WireResponse(message(answers=[RECORDS[0]], additional=[RECORDS[1]]))
+        assert res.sections == {}
+        answers = res.answers
+        assert list(res.sections) == [0]
+        assert res.answers is answers
+        assert res.additional[0]['data'] == 'foo.example.com'
+
+    def test_idna(self):
+        data = message(answers=[('CNAME', 'foo.example.com', 60, 'xn--bcher-kva.example.com')])
+        expected = DNS.Lib.DnsResult(DNS.Lib.Munpacker(data), {})
+        assert WireResponse(data).answers == expected.answers
+        assert WireResponse(data).answers[0]['data'] == 'b\xfccher.example.com'
+
+    def test_compression_loop(self):
+        buf = b'\xc0\x00'
+        with pytest.raises(WireError):
+            decode_name(buf, 0)
+
+    def test_truncated(self):
+        data = message(answers=[RECORDS[0]])
+        with pytest.raises(WireError):
+            WireResponse(data[:-2]).answers
+        with pytest.raises(WireError):
+            WireResponse(data[:10])
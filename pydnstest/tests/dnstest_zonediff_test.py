@@ -0,0 +1,161 @@
+"""
+tests for pydnstest.zonediff
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import random
+
+from pydnstest.zonediff import (SortedRecords, canonical_data, canonical_name, data_text, diff_zones,
+                                iter_rrsets, rrset_text)
+
+
+def rr(name, typename, data, ttl=3600):
+    types = {'A': 1, 'NS': 2, 'CNAME': 5, 'SOA': 6, 'MX': 15, 'TXT': 16}
+    return {'name': name, 'type': types[typename], 'class': 1, 'ttl': ttl, 'typename': typename,
+            'classstr': 'IN', 'data': data}
+
+
+def rrsets(records, chunk_size=None):
+    return list(iter_rrsets(SortedRecords(records, chunk_size=chunk_size)))
+
+
+def test_canonical_name():
+    # the example from RFC 4034 6.1
+    names = ['example', 'a.example', 'yljkjljk.a.example', 'Z.a.example', 'zABC.a.EXAMPLE',
+             'z.example', '*.z.example', '\\200.z.example']
+    shuffled = list(names)
+    random.shuffle(shuffled)
+    assert sorted(shuffled, key=canonical_name) == [
+        'example', 'a.example', 'yljkjljk.a.example', 'Z.a.example', 'zABC.a.EXAMPLE',
+        'z.example', '*.z.example', '\\200.z.example']
+
+
+def test_canonical_data():
+    assert canonical_data(rr('a', 'CNAME', 'Host.Example.com')) == 'host.example.com'
+    assert canonical_data(rr('a', 'MX', (10, 'Mail.Example.com'))) == (10, 'mail.example.com')
+    assert canonical_data(rr('a', 'A', '1.2.3.4')) == '1.2.3.4'
+
+
+class TestSortedRecords:
+
+    def test_sorted_in_memory(self):
+        records = [rr('b.example.com', 'A', '1.2.3.5'), rr('example.com', 'NS', 'ns1'),
+                   rr('a.example.com', 'A', '1.2.3.4')]
+        s = SortedRecords(records)
+        assert s.runs == []
+        assert [r['name'] for k, r in s] == ['example.com', 'a.example.com', 'b.example.com']
+        assert s.count == 3
+
+    def test_spilled(self):
+        """ more records than chunk_size are sorted via temporary files """
+        records = [rr('h%d.example.com' % i, 'A', '10.0.0.%d' % (i % 250)) for i in range(1000)]
+        random.shuffle(records)
+        s = SortedRecords(records, chunk_size=64)
+        assert len(s.runs) == 15
+        assert len(s.chunk) == 40
+        keys = [k for k, r in s]
+        assert len(keys) == 1000
+        assert keys == sorted(keys)
+        s.close()
+        assert s.runs == []
+
+    def test_types_within_name(self):
+        records = [rr('example.com', 'MX', (10, 'mail')), rr('example.com', 'A', '1.2.3.4'),
+                   rr('example.com', 'NS', 'ns1')]
+        assert [r['typename'] for k, r in SortedRecords(records)] == ['A', 'NS', 'MX']
+
+
+class TestRRsets:
+
+    def test_grouped(self):
+        sets = rrsets([rr('a.example.com', 'A', '1.2.3.5', 300), rr('A.example.com.', 'A', '1.2.3.4'),
+                       rr('a.example.com', 'A', '1.2.3.4'), rr('a.example.com', 'TXT', [b'x'])])
+        assert len(sets) == 2
+        assert sets[0]['name'] == 'a.example.com'
+        assert sets[0]['ttl'] == 300
+        assert sets[0]['data'] == ['1.2.3.4', '1.2.3.5']
+        assert sets[1]['typename'] == 'TXT'
+
+    def test_text(self):
+        s = rrsets([rr('a.example.com', 'A', '1.2.3.4'), rr('a.example.com', 'A', '1.2.3.5')])[0]
+        assert rrset_text(s) == ['a.example.com 3600 IN A 1.2.3.4', 'a.example.com 3600 IN A 1.2.3.5']
+        soa = ('ns1', 'hm', ('serial', 7), ('refresh ', 3600, '1 hours'), ('retry', 600, '10 minutes'),
+               ('expire', 86400, '1 days'), ('minimum', 300, '5 minutes'))
+        assert data_text('SOA', soa) == 'ns1 hm 7 3600 600 86400 300'
+        assert data_text('MX', (10, 'mail')) == '10 mail'
+        assert data_text('TXT', [b'a b', b'c']) == '"a b" "c"'
+        assert data_text('TYPE65534', b'\xab\xcd') == '\\# 2 abcd'
+
+
+class TestDiffZones:
+
+    def diff(self, prod, test, ignore_ttl=False, chunk_size=None):
+        return [(c, (p or t)['name'], (p or t)['typename'])
+                for c, p, t in diff_zones(rrsets(prod, chunk_size), rrsets(test, chunk_size), ignore_ttl)]
+
+    def test_changes(self):
+        prod = [rr('example.com', 'NS', 'ns1'), rr('a.example.com', 'A', '1.2.3.4'),
+                rr('b.example.com', 'A', '1.2.3.5'), rr('c.example.com', 'A', '1.2.3.6')]
+        test = [rr('example.com', 'NS', 'NS1'), rr('a.example.com', 'A', '1.2.3.4'),
+                rr('a.example.com', 'TXT', [b'new']), rr('c.example.com', 'A', '1.2.3.7'),
+                rr('d.example.com', 'A', '1.2.3.8')]
+        assert self.diff(prod, test) == [
+            ('same', 'example.com', 'NS'),
+            ('same', 'a.example.com', 'A'),
+            ('added', 'a.example.com', 'TXT'),
+            ('removed', 'b.example.com', 'A'),
+            ('changed', 'c.example.com', 'A'),
+            ('added', 'd.example.com', 'A'),
+        ]
+
+    def test_ttl(self):
+        prod = [rr('a.example.com', 'A', '1.2.3.4', 300)]
+        test = [rr('a.example.com', 'A', '1.2.3.4', 600)]
+        assert self.diff(prod, test) == [('changed', 'a.example.com', 'A')]
+        assert self.diff(prod, test, ignore_ttl=True) == [('same', 'a.example.com', 'A')]
+
+    def test_empty(self):
+        assert self.diff([], [rr('a.example.com', 'A', '1.2.3.4')]) == [('added', 'a.example.com', 'A')]
+        assert self.diff([rr('a.example.com', 'A', '1.2.3.4')], []) == [('removed', 'a.example.com', 'A')]
+        assert self.diff([], []) == []
+
+    def test_large_spilled(self):
+        prod = [rr('h%d.example.com' % i, 'A', '10.0.%d.%d' % (i // 250, i % 250)) for i in range(2000)]
+        test = [r for r in prod if r['name'] != 'h7.example.com'] + [rr('new.example.com', 'A', '10.9.9.9')]
+        random.shuffle(test)
+        changes = [d for d in self.diff(prod, test, chunk_size=100) if d[0] != 'same']
+        assert changes == [('removed', 'h7.example.com', 'A'), ('added', 'new.example.com', 'A')]
@@ -0,0 +1,124 @@
+"""
+tests for pydnstest.zonedigest
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+from pydnstest.zonediff import SortedRecords, iter_rrsets
+from pydnstest.zonedigest import DigestStore, DigestTree
+
+SOA = ('ns1.example.com', 'hostmaster.example.com', ('serial', 7), ('refresh ', 3600, '1 hours'),
+       ('retry', 600, '10 minutes'), ('expire', 86400, '1 days'), ('minimum', 300, '5 minutes'))
+
+
+def rr(name, typename, data, ttl=3600):
+    types = {'A': 1, 'SOA': 6}
+    return {'name': name, 'type': types[typename], 'class': 1, 'ttl': ttl, 'typename': typename,
+            'classstr': 'IN', 'data': data}
+
+
+def zone(n=500, changes=None, ttl=3600):
+    records = [rr('example.com', 'SOA', SOA)]
+    for i in range(n):
+        records.append(rr('h%d.example.com' % i, 'A', '10.0.%d.%d' % (i // 250, i % 250), ttl))
+    for name, data in (changes or {}).items():
+        records = [r for r in records if r['name'] != name]
+        if data is not None:
+            records.append(rr(name, 'A', data, ttl))
+    return records
+
+
+def tree(records, ignore_ttl=False):
+    return DigestTree.from_rrsets(iter_rrsets(SortedRecords(records)), 'example.com', ignore_ttl, len(records))
+
+
+class TestDigestTree:
+
+    def test_shape(self):
+        t = tree(zone())
+        assert [len(level) for level in t.levels] == [1, 16, 256, 4096]
+        assert t.rrsets == 501
+        assert t.records == 501
+        assert t.serial == 7
+        assert len(t.root) == 96
+
+    def test_same(self):
+        a = tree(zone())
+        b = tree(list(reversed(zone())))
+        assert a.root == b.root
+        assert a.diff(b) == ([], 1)
+
+    def test_bucket_stable(self):
+        assert DigestTree.bucket('Host.Example.com.') == DigestTree.bucket('host.example.com')
+        assert 0 <= DigestTree.bucket('host.example.com') < 4096
+
+    def test_diff(self):
+        a = tree(zone())
+        b = tree(zone(changes={'h3.example.com': '10.9.9.9', 'h400.example.com': None,
+                               'new.example.com': '10.8.8.8'}))
+        buckets, compared = a.diff(b)
+        assert buckets == sorted(set(DigestTree.bucket(n) for n in
+                                     ('h3.example.com', 'h400.example.com', 'new.example.com')))
+        # the root, then 16 children of each differing node per level
+        assert compared <= 1 + 16 * 3 * 3
+        assert b.rrsets == 501
+
+    def test_ignore_ttl(self):
+        assert tree(zone()).root != tree(zone(ttl=60)).root
+        assert tree(zone(), ignore_ttl=True).root == tree(zone(ttl=60), ignore_ttl=True).root
+
+    def test_json(self):
+        a = tree(zone())
+        b = DigestTree.from_json(a.to_json())
+        assert b.levels == a.levels
+        assert b.counts == a.counts
+        assert (b.records, b.serial, b.ignore_ttl) == (501, 7, False)
+
+
+class TestDigestStore:
+
+    def test_roundtrip(self, tmpdir):
+        path = str(tmpdir.join('dnstest.cache'))
+        store = DigestStore(path)
+        assert store.load('1.2.3.4', 'example.com') is None
+        store.save('1.2.3.4', 'example.com', tree(zone()))
+        store.close()
+        store = DigestStore(path)
+        assert store.load('1.2.3.4', 'Example.com.').root == tree(zone()).root
+        assert store.load('1.2.3.4', 'example.com', ignore_ttl=True) is None
+        assert store.load('1.2.3.5', 'example.com') is None
+        store.close()
+        assert DigestStore(path, refresh=True).load('1.2.3.4', 'example.com') is None
@@ -0,0 +1,136 @@
+"""
+tests for pydnstest.zonefile
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+from pydnstest.zonefile import ZoneFileError, iter_zone_file, parse_ttl, split_line
+
+ZONE = """$ORIGIN example.com.
+$TTL 1h
+@   IN  SOA ns1 hostmaster (
+        2017122401 ; serial
+        1h 10m 1d 5m )
+    IN  NS  ns1
+    IN  MX  10 mail.example.com.
+ns1     A   1.2.3.1
+host1   300 IN A 1.2.3.4
+        IN  A  1.2.3.5
+alias1  CNAME host1
+txt     TXT "hello world" "semi;colon" bare
+v6      AAAA 2001:db8::1
+srv     SRV 0 5 5060 sip
+blob    TYPE65534 \\# 3 abcdef
+$ORIGIN sub.example.com.
+deep    A 1.2.3.6 ; comment
+"""
+
+
+def test_parse_ttl():
+    assert parse_ttl('3600') == 3600
+    assert parse_ttl('1h30m') == 5400
+    assert parse_ttl('1W') == 604800
+    with pytest.raises(ZoneFileError):
+        parse_ttl('soon')
+
+
+def test_split_line():
+    assert split_line('foo  IN A 1.2.3.4 ; comment\n') == ['foo', 'IN', 'A', '1.2.3.4']
+    assert split_line('txt TXT "a \\"b\\" ;c"') == ['txt', 'TXT', '"a "b" ;c']
+    assert split_line('@ SOA a b (') == ['@', 'SOA', 'a', 'b', '(']
+
+
+class TestIterZoneFile:
+
+    @pytest.fixture
+    def records(self):
+        return list(iter_zone_file(ZONE.splitlines(True), 'example.com'))
+
+    def test_records(self, records):
+        assert len(records) == 12
+        assert [r['name'] for r in records[:3]] == ['example.com'] * 3
+
+    def test_soa(self, records):
+        soa = records[0]
+        assert soa['typename'] == 'SOA'
+        assert soa['type'] == 6
+        assert soa['ttl'] == 3600
+        assert soa['data'][:3] == ('ns1.example.com', 'hostmaster.example.com', ('serial', 2017122401))
+        assert soa['data'][3] == ('refresh ', 3600, '1 hours')
+        assert soa['data'][6] == ('minimum', 300, '5 minutes')
+
+    def test_relative_names(self, records):
+        assert records[1]['data'] == 'ns1.example.com'
+        assert records[2]['data'] == (10, 'mail.example.com')
+        assert records[6]['data'] == 'host1.example.com'
+        assert records[11]['name'] == 'deep.sub.example.com'
+
+    def test_owner_and_ttl(self, records):
+        assert records[4] == {'name': 'host1.example.com', 'type': 1, 'class': 1, 'ttl': 300,
+                              'typename': 'A', 'classstr': 'IN', 'data': '1.2.3.4'}
+        # omitted owner is the previous one; omitted TTL is $TTL
+        assert records[5]['name'] == 'host1.example.com'
+        assert records[5]['ttl'] == 3600
+
+    def test_data(self, records):
+        by_name = dict((r['name'], r) for r in records)
+        assert by_name['txt.example.com']['data'] == [b'hello world', b'semi;colon', b'bare']
+        assert by_name['v6.example.com']['data'] == b'\x20\x01\x0d\xb8' + b'\x00' * 11 + b'\x01'
+        assert by_name['srv.example.com']['data'] == (0, 5, 5060, 'sip.example.com')
+        assert by_name['blob.example.com']['type'] == 65534
+        assert by_name['blob.example.com']['data'] == b'\xab\xcd\xef'
+
+    def test_last_ttl(self):
+        records = list(iter_zone_file(['a 60 A 1.2.3.4\n', 'b A 1.2.3.5\n'], 'example.com'))
+        assert [r['ttl'] for r in records] == [60, 60]
+
+    def test_soa_minimum_ttl(self):
+        records = list(iter_zone_file(['@ SOA ns1 hm 1 2 3 4 5\n', 'b A 1.2.3.5\n'], 'example.com.'))
+        assert [r['ttl'] for r in records] == [5, 5]
+
+    @pytest.mark.parametrize('text', [
+        'a A 1.2.3.4\n',
+        'a 60 A not.an.address\n',
+        'a 60 BOGUS x\n',
+        'a 60\n',
+        '$INCLUDE other.zone\n',
+        'a 60 SOA ns1 hm ( 1 2 3 4 5\n',
+    ])
+    def test_errors(self, text):
+        with pytest.raises(ZoneFileError):
+            list(iter_zone_file([text], 'example.com'))
@@ -0,0 +1,69 @@
+"""
+benchmark of DnstestParser.parse_line(), with and without the fast path;
+run with ``python -m pydnstest.tests.parser_benchmark [lines]``
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import sys
+import timeit
+
+from pydnstest.parser import DnstestParser
+from pydnstest.tests.dnstest_parser_test import GOOD_LINES
+
+
+def benchmark(count):
+    """
+    Parse ``count`` lines (the parser tests' lines, repeated) with
+    parse_line() and with parse_line_pyparsing(), and return a
+    (fast seconds, pyparsing seconds) tuple of the time per line.
+    """
+    good = [line for line, d in GOOD_LINES if d is not None]
+    lines = (good * (count // len(good) + 1))[:count]
+    p = DnstestParser()
+    fast = min(timeit.repeat(lambda: [p.parse_line(l) for l in lines], number=1, repeat=3))
+    slow = min(timeit.repeat(lambda: [p.parse_line_pyparsing(l) for l in lines], number=1, repeat=3))
+    return (fast / count, slow / count)
+
+
+def main(count=10000):
+    fast, slow = benchmark(count)
+    print("parse_line: %.1fus per line, pyparsing only: %.1fus per line (%.1fx), over %d lines" % (
+        fast * 1e6, slow * 1e6, slow / fast, count))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
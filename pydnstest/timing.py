@@ -0,0 +1,148 @@
+"""
+Timing of the lookups made by each check, and latency percentiles per server
+
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import math
+import time
+
+# query type of each DNStestDNS lookup method used in query plans
+LOOKUP_QTYPES = {'resolve_name': 'A', 'resolve_name_direct': 'A',
+                 'lookup_reverse': 'PTR', 'lookup_soa_serial': 'SOA'}
+
+
+def percentile(values, p):
+    """
+    return the p'th percentile (0-100) of a sorted, non-empty list, by
+    the nearest-rank method
+    """
+    return values[max(int(math.ceil(p / 100.0 * len(values))), 1) - 1]
+
+
+class CheckTiming(object):
+    """
+    Timing of one check: the lookups its query plan made, and the
+    elapsed time from creating this object to as_dict().
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        """
+        @param clock callable returning the current time in seconds
+        """
+        self.clock = clock
+        self.start = clock()
+        self.lookups = []
+
+    def record(self, method, name, server, rtt, cached):
+        """
+        record one lookup
+
+        @param method DNStestDNS lookup method, i.e. 'resolve_name'
+        @param name name or address looked up
+        @param server server it was sent to
+        @param rtt seconds until its result came back
+        @param cached True if it was answered from the cache or a zone
+          snapshot, without querying the server
+        """
+        self.lookups.append({'server': server, 'qtype': LOOKUP_QTYPES.get(method, method),
+                             'name': name, 'rtt': rtt, 'cached': cached})
+
+    def as_dict(self):
+        """
+        return the timing section of a check's result dict: elapsed
+        seconds, the number of queries sent to servers, and the list of
+        lookups as dicts with server, qtype, name, rtt and cached keys
+        """
+        return {'elapsed': self.clock() - self.start,
+                'queries': len([l for l in self.lookups if not l['cached']]),
+                'lookups': self.lookups}
+
+
+class TimingSummary(object):
+    """
+    Round trip times of the lookups sent to each server, gathered from
+    the timing sections of check results.
+    """
+
+    def __init__(self, labels=None):
+        """
+        @param labels dict of server to a label for summary(), i.e. 'PROD'
+        """
+        self.labels = labels or {}
+        self.rtts = {}
+        self.cached = 0
+
+    def add(self, timing):
+        """ add the lookups of a result dict's timing section """
+        for l in timing['lookups']:
+            if l['cached']:
+                self.cached += 1
+            else:
+                self.rtts.setdefault(l['server'], []).append(l['rtt'])
+
+    def stats(self):
+        """
+        return a dict of server to a dict of its number of queries, and
+        p50, p95 and p99 round trip times in seconds
+        """
+        s = {}
+        for server, rtts in self.rtts.items():
+            rtts = sorted(rtts)
+            s[server] = {'queries': len(rtts), 'p50': percentile(rtts, 50),
+                         'p95': percentile(rtts, 95), 'p99': percentile(rtts, 99)}
+        return s
+
+    def summary(self):
+        """
+        return a one-line description of the latency percentiles of each
+        server, or None if no lookups were timed
+        """
+        if not self.rtts and not self.cached:
+            return None
+        parts = []
+        s = self.stats()
+        for server in sorted(s):
+            label = ''
+            if server in self.labels:
+                label = ' (%s)' % self.labels[server]
+            parts.append("%s%s p50 %.1fms p95 %.1fms p99 %.1fms over %d queries" % (
+                server, label, s[server]['p50'] * 1000, s[server]['p95'] * 1000,
+                s[server]['p99'] * 1000, s[server]['queries']))
+        if self.cached:
+            parts.append("%d lookups answered without a query" % self.cached)
+        return ", ".join(parts)
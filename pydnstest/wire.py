@@ -0,0 +1,324 @@
+"""
+Dependency-free DNS wire format codec for dnstest.py: builds queries from
+precomputed templates, and parses responses in place
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import struct
+from functools import lru_cache
+
+# type, class and status names, as used by the DNS (py3dns) module
+TYPES = {1: 'A', 2: 'NS', 3: 'MD', 4: 'MF', 5: 'CNAME', 6: 'SOA', 7: 'MB', 8: 'MG',
+         9: 'MR', 10: 'NULL', 11: 'WKS', 12: 'PTR', 13: 'HINFO', 14: 'MINFO', 15: 'MX',
+         16: 'TXT', 28: 'AAAA', 33: 'SRV', 99: 'SPF', 110: 'UNAME', 240: 'MP',
+         251: 'IXFR', 252: 'AXFR', 253: 'MAILB', 254: 'MAILA', 255: 'ANY'}
+TYPE_CODES = dict((v, k) for k, v in TYPES.items())
+CLASSES = {1: 'IN', 2: 'CS', 3: 'CH', 4: 'HS', 255: 'ANY'}
+STATUSES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP',
+            5: 'REFUSED', 6: 'YXDOMAIN', 7: 'YXRRSET', 8: 'NXRRSET', 9: 'NOTAUTH',
+            10: 'NOTZONE', 16: 'BADVERS', 17: 'BADKEY', 18: 'BADTIME', 19: 'BADMODE',
+            20: 'BADNAME', 21: 'BADALG'}
+OPCODES = {0: 'QUERY', 1: 'IQUERY', 2: 'STATUS', 4: 'NOTIFY', 5: 'UPDATE'}
+
+HEADER = struct.Struct('!HHHHHH')
+RR_HEADER = struct.Struct('!HHIH')
+QUESTION_TAIL = struct.Struct('!HH')
+U16 = struct.Struct('!H')
+U32 = struct.Struct('!I')
+
+
+class WireError(Exception):
+    """ raised for a malformed DNS message """
+    pass
+
+
+def encode_name(name):
+    """
+    return the uncompressed wire format of a domain name
+
+    @param name domain name, with or without the trailing dot
+    @return bytes
+    """
+    out = bytearray()
+    for label in name.rstrip('.').split('.'):
+        if not label:
+            continue
+        try:
+            b = label.encode('ascii')
+        except UnicodeEncodeError:
+            b = label.encode('idna')
+        if len(b) > 63:
+            raise WireError('label too long: %s' % label)
+        out.append(len(b))
+        out += b
+    out.append(0)
+    return bytes(out)
+
+
+@lru_cache(maxsize=4096)
+def query_template(name, qtype):
+    """
+    return a recursion-desired query for name and qtype, less its 2-byte ID
+
+    @param name name to query
+    @param qtype query type name, i.e. 'A'
+    @return bytes
+    """
+    return (HEADER.pack(0, 0x0100, 1, 0, 0, 0)[2:] + encode_name(name) +
+            QUESTION_TAIL.pack(TYPE_CODES[qtype], 1))
+
+
+def build_query(tid, name, qtype):
+    """
+    return the wire format of a recursion-desired query
+
+    @param tid query ID
+    @param name name to query
+    @param qtype query type name, i.e. 'A'
+    @return bytes
+    """
+    return U16.pack(tid) + query_template(name, qtype)
+
+
+def decode_label(label):
+    """ decode a label like the DNS module does (IDNA, mostly just ASCII) """
+    if label[:4].lower() != b'xn--':
+        try:
+            return label.decode('ascii')
+        except UnicodeDecodeError:
+            pass
+    return str(label, 'idna')
+
+
+def decode_name(buf, offset):
+    """
+    decode a (possibly compressed) domain name
+
+    @param buf bytes or memoryview of the whole message
+    @param offset offset of the name in buf
+    @return tuple (name without trailing dot, offset just past the name)
+    """
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        n = buf[offset]
+        if n == 0:
+            offset += 1
+            break
+        if n & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 127:
+                raise WireError('compression loop')
+            offset = U16.unpack_from(buf, offset)[0] & 0x3FFF
+            continue
+        labels.append(decode_label(bytes(buf[offset + 1:offset + 1 + n])))
+        offset += 1 + n
+    return ('.'.join(labels), end if end is not None else offset)
+
+
+def skip_name(buf, offset):
+    """ return the offset just past the domain name at offset, without decoding it """
+    while True:
+        n = buf[offset]
+        if n == 0:
+            return offset + 1
+        if n & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + n
+
+
+def pretty_time(seconds):
+    """ (seconds, description) tuple, as in DNS module SOA data """
+    if seconds < 60:
+        return seconds, "%d seconds" % (seconds)
+    if seconds < 3600:
+        return seconds, "%d minutes" % (seconds / 60)
+    if seconds < 86400:
+        return seconds, "%d hours" % (seconds / 3600)
+    if seconds < 604800:
+        return seconds, "%d days" % (seconds / 86400)
+    return seconds, "%d weeks" % (seconds / 604800)
+
+
+def rdata_name(buf, offset, end):
+    return decode_name(buf, offset)[0]
+
+
+def rdata_a(buf, offset, end):
+    return '%d.%d.%d.%d' % tuple(buf[offset:offset + 4])
+
+
+def rdata_mx(buf, offset, end):
+    return (U16.unpack_from(buf, offset)[0], decode_name(buf, offset + 2)[0])
+
+
+def rdata_soa(buf, offset, end):
+    mname, offset = decode_name(buf, offset)
+    rname, offset = decode_name(buf, offset)
+    serial, refresh, retry, expire, minimum = struct.unpack_from('!IIIII', buf, offset)
+    return (mname, rname, ('serial', serial), ('refresh ',) + pretty_time(refresh),
+            ('retry',) + pretty_time(retry), ('expire',) + pretty_time(expire),
+            ('minimum',) + pretty_time(minimum))
+
+
+def rdata_txt(buf, offset, end):
+    strings = []
+    while offset < end:
+        n = buf[offset]
+        strings.append(bytes(buf[offset + 1:offset + 1 + n]))
+        offset += 1 + n
+    return strings
+
+
+def rdata_hinfo(buf, offset, end):
+    n = buf[offset]
+    cpu = bytes(buf[offset + 1:offset + 1 + n])
+    offset += 1 + n
+    n = buf[offset]
+    return (decode_label(cpu), decode_label(bytes(buf[offset + 1:offset + 1 + n])))
+
+
+def rdata_srv(buf, offset, end):
+    priority, weight, port = struct.unpack_from('!HHH', buf, offset)
+    return (priority, weight, port, decode_name(buf, offset + 6)[0])
+
+
+def rdata_wks(buf, offset, end):
+    return (rdata_a(buf, offset, end).encode('ascii'), buf[offset + 4],
+            bytes(buf[offset + 5:end]))
+
+
+# rdata decoders by type, giving the same 'data' as the DNS module;
+# any other type's data is the raw rdata bytes
+RDATA = {'A': rdata_a, 'NS': rdata_name, 'CNAME': rdata_name, 'PTR': rdata_name,
+         'MX': rdata_mx, 'SOA': rdata_soa, 'TXT': rdata_txt, 'SPF': rdata_txt,
+         'HINFO': rdata_hinfo, 'SRV': rdata_srv, 'WKS': rdata_wks}
+
+
+class WireResponse(object):
+    """
+    A DNS response parsed in place, with the same header dict and answers,
+    authority and additional lists of record dicts (name, type, class, ttl,
+    rdlength, typename, classstr, data) as a DNS.DnsResult.
+
+    Only the header is parsed up front. Each section is parsed, and its
+    names decompressed, the first time it is accessed; earlier sections
+    are skipped over without decoding them.
+    """
+
+    def __init__(self, data):
+        """
+        @param data bytes of the whole response
+        """
+        if len(data) < 12:
+            raise WireError('message too short')
+        self.buf = memoryview(data)
+        (tid, flags, qdcount, ancount, nscount, arcount) = HEADER.unpack_from(self.buf, 0)
+        rcode = flags & 0xF
+        opcode = (flags >> 11) & 0xF
+        self.header = {'id': tid, 'qr': flags >> 15, 'opcode': opcode,
+                       'aa': (flags >> 10) & 1, 'tc': (flags >> 9) & 1,
+                       'rd': (flags >> 8) & 1, 'ra': (flags >> 7) & 1,
+                       'z': (flags >> 4) & 7, 'rcode': rcode,
+                       'qdcount': qdcount, 'ancount': ancount,
+                       'nscount': nscount, 'arcount': arcount,
+                       'opcodestr': OPCODES.get(opcode, repr(opcode)),
+                       'status': STATUSES.get(rcode, repr(rcode))}
+        self.sections = {}
+        # offset of the start of the answer, authority and additional sections,
+        # filled in as earlier sections are skipped
+        self.offsets = [None, None, None]
+
+    def section_offset(self, i):
+        if self.offsets[i] is None:
+            if i == 0:
+                offset = 12
+                for q in range(self.header['qdcount']):
+                    offset = skip_name(self.buf, offset) + 4
+            else:
+                offset = self.section_offset(i - 1)
+                for r in range(self.header[('ancount', 'nscount')[i - 1]]):
+                    offset = skip_name(self.buf, offset)
+                    offset += 10 + U16.unpack_from(self.buf, offset + 8)[0]
+            self.offsets[i] = offset
+        return self.offsets[i]
+
+    def section(self, i):
+        if i not in self.sections:
+            try:
+                self.sections[i] = self.parse_section(i)
+            except (IndexError, struct.error):
+                raise WireError('truncated message')
+        return self.sections[i]
+
+    def parse_section(self, i):
+        buf = self.buf
+        offset = self.section_offset(i)
+        records = []
+        for r in range(self.header[('ancount', 'nscount', 'arcount')[i]]):
+            name, offset = decode_name(buf, offset)
+            rtype, klass, ttl, rdlength = RR_HEADER.unpack_from(buf, offset)
+            offset += 10
+            end = offset + rdlength
+            if end > len(buf):
+                raise WireError('truncated message')
+            typename = TYPES.get(rtype, repr(rtype))
+            decoder = RDATA.get(typename)
+            if decoder is not None:
+                data = decoder(buf, offset, end)
+            else:
+                data = bytes(buf[offset:end])
+            records.append({'name': name, 'type': rtype, 'class': klass, 'ttl': ttl,
+                            'rdlength': rdlength, 'typename': typename,
+                            'classstr': CLASSES.get(klass, repr(klass)), 'data': data})
+            offset = end
+        return records
+
+    @property
+    def answers(self):
+        return self.section(0)
+
+    @property
+    def authority(self):
+        return self.section(1)
+
+    @property
+    def additional(self):
+        return self.section(2)
@@ -0,0 +1,206 @@
+"""
+Canonically sorted streams of zone records, and a merge-join diff of two zones
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import binascii
+import heapq
+import itertools
+import pickle
+import tempfile
+from operator import itemgetter
+
+# types whose data is a name, or a tuple with names at these positions
+NAME_FIELDS = {'NS': None, 'CNAME': None, 'PTR': None, 'MX': (1,), 'SRV': (3,), 'SOA': (0, 1)}
+
+
+def canonical_name(name):
+    """
+    return a sort key putting names in canonical DNS order (RFC 4034 6.1):
+    by their labels compared right to left, case-insensitively
+    """
+    labels = name.lower().rstrip('.').split('.')
+    labels.reverse()
+    return tuple(labels)
+
+
+def record_key(rr):
+    """ return the (canonical name, type) sort key of a record dict """
+    return (canonical_name(rr['name']), rr['type'])
+
+
+def canonical_data(rr):
+    """ return a record's data with the names in it lower-cased, for comparison """
+    data = rr['data']
+    if rr['typename'] not in NAME_FIELDS:
+        return data
+    fields = NAME_FIELDS[rr['typename']]
+    if fields is None:
+        return data.lower()
+    return tuple(d.lower() if i in fields else d for i, d in enumerate(data))
+
+
+def read_run(f):
+    """ yield the pickled items in a temporary file, from the start """
+    f.seek(0)
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+class SortedRecords(object):
+    """
+    A stream of record dicts sorted by record_key(), using an external
+    merge sort: records are read ``chunk_size`` at a time, each chunk is
+    sorted and written to a temporary file, and iterating merges them.
+    Memory use is bounded by ``chunk_size``, however large the zone.
+
+    The records are read (and any error reading them raised) when the
+    object is created; iterating yields ``(key, record)`` tuples, and can
+    be repeated until close() is called.
+    """
+
+    chunk_size = 100000
+
+    def __init__(self, records, chunk_size=None):
+        """
+        @param records iterable of record dicts, i.e. from
+          pydnstest.axfr.iter_axfr() or pydnstest.zonefile.iter_zone_file()
+        @param chunk_size number of records to sort in memory at a time
+        """
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.runs = []
+        self.count = 0
+        chunk = []
+        for rr in records:
+            chunk.append((record_key(rr), rr))
+            if len(chunk) >= self.chunk_size:
+                self.runs.append(self.spill(chunk))
+                chunk = []
+            self.count += 1
+        chunk.sort(key=itemgetter(0))
+        # the last chunk is merged straight from memory
+        self.chunk = chunk
+
+    def spill(self, chunk):
+        """ sort a chunk and write it to a temporary file """
+        chunk.sort(key=itemgetter(0))
+        f = tempfile.TemporaryFile()
+        for item in chunk:
+            pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+        return f
+
+    def __iter__(self):
+        runs = [read_run(f) for f in self.runs] + [iter(self.chunk)]
+        return heapq.merge(*runs, key=itemgetter(0))
+
+    def close(self):
+        """ remove the temporary files """
+        for f in self.runs:
+            f.close()
+        self.runs = []
+
+
+def iter_rrsets(records):
+    """
+    Group a stream of (key, record) tuples in record_key() order into
+    RRsets: dicts of key, name, typename, ttl (the lowest of its records)
+    and data, the sorted list of its records' distinct canonical_data().
+    """
+    for key, group in itertools.groupby(records, key=itemgetter(0)):
+        rrs = [rr for k, rr in group]
+        data = {}
+        for rr in rrs:
+            d = canonical_data(rr)
+            data[repr(d)] = d
+        yield {'key': key, 'name': rrs[0]['name'].lower().rstrip('.'), 'typename': rrs[0]['typename'],
+               'ttl': min(rr['ttl'] for rr in rrs), 'data': [data[k] for k in sorted(data)]}
+
+
+def diff_zones(prod, test, ignore_ttl=False):
+    """
+    Merge-join two streams of RRsets from iter_rrsets(), in one pass,
+    holding one RRset from each at a time. Yields a (change, prod_rrset,
+    test_rrset) tuple for every RRset in either, where change is 'same',
+    'added' (only in test; prod_rrset is None), 'removed' (only in prod;
+    test_rrset is None) or 'changed'.
+
+    @param prod iterable of RRsets from the PROD zone
+    @param test iterable of RRsets from the TEST zone
+    @param ignore_ttl if True, RRsets differing only in TTL are the same
+    """
+    prod = iter(prod)
+    test = iter(test)
+    p = next(prod, None)
+    t = next(test, None)
+    while p is not None or t is not None:
+        if t is None or (p is not None and p['key'] < t['key']):
+            yield ('removed', p, None)
+            p = next(prod, None)
+        elif p is None or t['key'] < p['key']:
+            yield ('added', None, t)
+            t = next(test, None)
+        else:
+            if p['data'] == t['data'] and (ignore_ttl or p['ttl'] == t['ttl']):
+                yield ('same', p, t)
+            else:
+                yield ('changed', p, t)
+            p = next(prod, None)
+            t = next(test, None)
+
+
+def data_text(typename, data):
+    """ return record data in zone file form """
+    if isinstance(data, bytes):
+        return '\\# %d %s' % (len(data), binascii.hexlify(data).decode('ascii'))
+    if typename == 'SOA':
+        # SOA data is (mname, rname, ('serial', n), ('refresh ', n, text), ...)
+        return ' '.join([data[0], data[1]] + [str(d[1]) for d in data[2:]])
+    if isinstance(data, list):
+        return ' '.join('"%s"' % s.decode('utf-8', 'replace') for s in data)
+    if isinstance(data, tuple):
+        return ' '.join(str(d) for d in data)
+    return str(data)
+
+
+def rrset_text(rrset):
+    """ return a list of zone file lines, one per record in an RRset """
+    return ['%s %d IN %s %s' % (rrset['name'], rrset['ttl'], rrset['typename'], data_text(rrset['typename'], d))
+            for d in rrset['data']]
@@ -0,0 +1,202 @@
+"""
+Merkle trees of digests over the RRsets of a zone, to find where two copies of
+a zone differ without comparing every record
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import hashlib
+import json
+import sqlite3
+
+from pydnstest.zonediff import rrset_text
+
+
+def rrset_digest_text(rrset, ignore_ttl=False):
+    """ return the canonical text of an RRset that is hashed into a tree """
+    if ignore_ttl:
+        rrset = dict(rrset, ttl=0)
+    return ('\n'.join(rrset_text(rrset)) + '\n').encode('utf-8')
+
+
+class DigestTree(object):
+    """
+    A Merkle tree of SHA-384 digests over the RRsets of a zone, in the
+    spirit of RFC 8976 (ZONEMD).
+
+    The RRsets are split into ``fanout ** depth`` leaf buckets by a hash of
+    their owner name, so all the RRsets of a name land in the same bucket
+    in every copy of the zone, and adding or removing a name only changes
+    its own bucket. Each leaf is the digest of its RRsets in canonical
+    order, and each node above is the digest of its children; two copies
+    of a zone are the same if their roots are, and diff() finds the
+    buckets that differ by descending only into the differing subtrees.
+    """
+
+    fanout = 16
+    depth = 3
+
+    def __init__(self, levels, counts, records=0, serial=None, ignore_ttl=False):
+        """
+        @param levels list of lists of hex digests, from the root to the leaves
+        @param counts list of the number of RRsets in each leaf bucket
+        @param records number of records in the zone
+        @param serial SOA serial of the zone, if known
+        @param ignore_ttl True if the digests exclude TTLs
+        """
+        self.levels = levels
+        self.counts = counts
+        self.records = records
+        self.serial = serial
+        self.ignore_ttl = ignore_ttl
+
+    @property
+    def root(self):
+        return self.levels[0][0]
+
+    @property
+    def rrsets(self):
+        return sum(self.counts)
+
+    @classmethod
+    def buckets(cls):
+        return cls.fanout ** cls.depth
+
+    @classmethod
+    def bucket(cls, name):
+        """ return the leaf bucket of an owner name """
+        h = hashlib.sha1(name.lower().rstrip('.').encode('utf-8')).digest()
+        return int.from_bytes(h[:4], 'big') % cls.buckets()
+
+    @classmethod
+    def from_rrsets(cls, rrsets, zone=None, ignore_ttl=False, records=0):
+        """
+        Build a tree from a stream of RRsets in canonical order, i.e. from
+        pydnstest.zonediff.iter_rrsets(), holding only one digest per bucket.
+
+        @param rrsets iterable of RRset dicts
+        @param zone name of the zone, to take the serial from its SOA RRset
+        @param ignore_ttl if True, RRsets differing only in TTL hash the same
+        @param records number of records the RRsets were built from
+        """
+        leaves = [hashlib.sha384() for i in range(cls.buckets())]
+        counts = [0] * cls.buckets()
+        serial = None
+        for rrset in rrsets:
+            b = cls.bucket(rrset['name'])
+            leaves[b].update(rrset_digest_text(rrset, ignore_ttl))
+            counts[b] += 1
+            if rrset['typename'] == 'SOA' and zone is not None and rrset['name'] == zone.lower().rstrip('.'):
+                # SOA data is (mname, rname, ('serial', n), refresh, retry, expire, minimum)
+                serial = rrset['data'][0][2][1]
+        levels = [[h.hexdigest() for h in leaves]]
+        while len(levels[0]) > 1:
+            below = levels[0]
+            levels.insert(0, [hashlib.sha384(''.join(below[i:i + cls.fanout]).encode('ascii')).hexdigest()
+                              for i in range(0, len(below), cls.fanout)])
+        return cls(levels, counts, records=records, serial=serial, ignore_ttl=ignore_ttl)
+
+    def diff(self, other):
+        """
+        Return (buckets, compared): the sorted leaf buckets whose digests
+        differ from another tree's, and the number of digests compared to
+        find them.
+        """
+        compared = 1
+        if self.root == other.root:
+            return ([], compared)
+        differ = [0]
+        for level in range(1, len(self.levels)):
+            children = []
+            for node in differ:
+                for i in range(node * self.fanout, (node + 1) * self.fanout):
+                    compared += 1
+                    if self.levels[level][i] != other.levels[level][i]:
+                        children.append(i)
+            differ = children
+        return (differ, compared)
+
+    def to_json(self):
+        return json.dumps({'levels': self.levels, 'counts': self.counts, 'records': self.records,
+                           'serial': self.serial, 'ignore_ttl': self.ignore_ttl})
+
+    @classmethod
+    def from_json(cls, s):
+        d = json.loads(s)
+        return cls(d['levels'], d['counts'], d['records'], d['serial'], d['ignore_ttl'])
+
+
+class DigestStore(object):
+    """
+    Digest trees of zones kept between runs, in a table of the persistent
+    cache's SQLite file, so re-confirming a zone whose SOA serial hasn't
+    changed needs no transfer. If refresh is True, nothing is loaded, but
+    new trees are still saved.
+    """
+
+    def __init__(self, path, refresh=False):
+        """
+        @param path path to the SQLite database file; created if needed
+        @param refresh if True, ignore stored trees
+        """
+        self.refresh = refresh
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS zone_digests (server TEXT, zone TEXT, "
+                          "ignore_ttl INTEGER, tree TEXT, PRIMARY KEY (server, zone, ignore_ttl))")
+        self.conn.commit()
+
+    def load(self, server, zone, ignore_ttl=False):
+        """ return the DigestTree stored for a zone on a server, or None """
+        if self.refresh:
+            return None
+        row = self.conn.execute("SELECT tree FROM zone_digests WHERE server=? AND zone=? AND ignore_ttl=?",
+                                (server, zone.lower().rstrip('.'), int(ignore_ttl))).fetchone()
+        if row is None:
+            return None
+        tree = DigestTree.from_json(row[0])
+        if len(tree.counts) != DigestTree.buckets():
+            # stored with a different tree shape
+            return None
+        return tree
+
+    def save(self, server, zone, tree):
+        """ store the DigestTree of a zone on a server """
+        self.conn.execute("INSERT OR REPLACE INTO zone_digests VALUES (?, ?, ?, ?)",
+                          (server, zone.lower().rstrip('.'), int(tree.ignore_ttl), tree.to_json()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,231 @@
+"""
+Streaming reader for RFC 1035 master (zone) files
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import binascii
+import re
+import socket
+
+from pydnstest.wire import TYPE_CODES, pretty_time
+
+TTL_RE = re.compile(r'^(?:\d+[smhdw]?)+$', re.IGNORECASE)
+TTL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+CLASSES = ('IN', 'CH', 'HS', 'CS')
+
+
+class ZoneFileError(Exception):
+    """
+    A zone file couldn't be parsed
+    """
+    pass
+
+
+def parse_ttl(s):
+    """ return the seconds of a TTL, i.e. '3600' or BIND-style '1h30m' """
+    if not TTL_RE.match(s):
+        raise ZoneFileError("invalid TTL '%s'" % s)
+    return sum(int(n) * TTL_UNITS[u.lower()] for n, u in re.findall(r'(\d+)([smhdw]?)', s, re.IGNORECASE))
+
+
+def split_line(line):
+    """
+    split one line of a zone file into tokens, dropping any comment; quoted
+    strings are returned with their opening quote and without escapes
+    """
+    tokens = []
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c == ';':
+            break
+        if c.isspace():
+            i += 1
+        elif c in '()':
+            tokens.append(c)
+            i += 1
+        elif c == '"':
+            s = ['"']
+            i += 1
+            while i < n and line[i] != '"':
+                if line[i] == '\\' and i + 1 < n:
+                    i += 1
+                s.append(line[i])
+                i += 1
+            tokens.append(''.join(s))
+            i += 1
+        else:
+            start = i
+            while i < n and not line[i].isspace() and line[i] not in ';()"':
+                i += 1
+            tokens.append(line[start:i])
+    return tokens
+
+
+def logical_lines(fh):
+    """
+    yield (owner_omitted, tokens) for each entry in a zone file, joining
+    lines between parentheses; owner_omitted is True if the entry's first
+    line starts with whitespace
+    """
+    tokens = []
+    depth = 0
+    blank = False
+    for line in fh:
+        if depth == 0:
+            blank = line[:1].isspace()
+        for t in split_line(line):
+            if t == '(':
+                depth += 1
+            elif t == ')':
+                depth -= 1
+            else:
+                tokens.append(t)
+        if depth == 0 and tokens:
+            yield (blank, tokens)
+            tokens = []
+    if depth != 0:
+        raise ZoneFileError('unbalanced parentheses')
+
+
+def absolute(name, origin):
+    """ return a possibly-relative name as an absolute name without the trailing dot """
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name[:-1]
+    if not origin:
+        return name
+    return name + '.' + origin
+
+
+def type_code(typename):
+    """ return the type number for a mnemonic or RFC 3597 TYPEnnn """
+    if typename in TYPE_CODES:
+        return TYPE_CODES[typename]
+    if typename.startswith('TYPE') and typename[4:].isdigit():
+        return int(typename[4:])
+    raise ZoneFileError("unknown record type '%s'" % typename)
+
+
+def parse_rdata(typename, tokens, origin):
+    """
+    return a record's data in the same form as pydnstest.wire.WireResponse;
+    rdata of types it doesn't decode is the raw bytes, from RFC 3597
+    ``\\# length hex`` or (for AAAA) the address
+    """
+    if tokens and tokens[0] == '\\#':
+        data = binascii.unhexlify(''.join(tokens[2:]))
+        if len(data) != int(tokens[1]):
+            raise ZoneFileError('rdata length %s does not match its data' % tokens[1])
+        return data
+    try:
+        if typename == 'A':
+            socket.inet_aton(tokens[0])
+            return tokens[0]
+        if typename in ('NS', 'CNAME', 'PTR'):
+            return absolute(tokens[0], origin)
+        if typename == 'MX':
+            return (int(tokens[0]), absolute(tokens[1], origin))
+        if typename == 'SRV':
+            return (int(tokens[0]), int(tokens[1]), int(tokens[2]), absolute(tokens[3], origin))
+        if typename == 'SOA':
+            times = [parse_ttl(t) for t in tokens[3:7]]
+            return (absolute(tokens[0], origin), absolute(tokens[1], origin), ('serial', int(tokens[2])),
+                    ('refresh ',) + pretty_time(times[0]), ('retry',) + pretty_time(times[1]),
+                    ('expire',) + pretty_time(times[2]), ('minimum',) + pretty_time(times[3]))
+        if typename in ('TXT', 'SPF'):
+            return [t.lstrip('"').encode('utf-8') if t.startswith('"') else t.encode('utf-8') for t in tokens]
+        if typename == 'AAAA':
+            return socket.inet_pton(socket.AF_INET6, tokens[0])
+    except (IndexError, ValueError, OSError):
+        raise ZoneFileError("invalid %s record data '%s'" % (typename, ' '.join(tokens)))
+    return ' '.join(tokens)
+
+
+def iter_zone_file(fh, origin, ttl=None):
+    """
+    Read a zone file one entry at a time, yielding its records as record
+    dicts like WireResponse.answers (without rdlength). Supports $ORIGIN,
+    $TTL, relative names, '@', omitted owners, TTLs and classes, and
+    multi-line entries in parentheses; $INCLUDE isn't supported.
+
+    Raises ZoneFileError on entries it can't parse.
+
+    @param fh open file (or any iterable of lines)
+    @param origin origin of the zone, i.e. 'example.com'
+    @param ttl TTL of records without one until a $TTL directive; without
+      either, the last TTL given (RFC 1035)
+    """
+    origin = origin.rstrip('.')
+    owner = origin
+    last_ttl = None
+    for blank, tokens in logical_lines(fh):
+        keyword = tokens[0].upper()
+        if keyword == '$ORIGIN':
+            origin = absolute(tokens[1], origin)
+            continue
+        if keyword == '$TTL':
+            ttl = parse_ttl(tokens[1])
+            continue
+        if keyword.startswith('$'):
+            raise ZoneFileError("unsupported directive '%s'" % tokens[0])
+        if not blank:
+            owner = absolute(tokens.pop(0), origin)
+        rttl = None
+        while tokens and (tokens[0].upper() in CLASSES or TTL_RE.match(tokens[0])):
+            t = tokens.pop(0)
+            if t.upper() not in CLASSES:
+                rttl = parse_ttl(t)
+        if not tokens:
+            raise ZoneFileError("no record type for '%s'" % owner)
+        typename = tokens.pop(0).upper()
+        data = parse_rdata(typename, tokens, origin)
+        if rttl is not None:
+            last_ttl = rttl
+        elif ttl is not None:
+            rttl = ttl
+        elif last_ttl is not None:
+            rttl = last_ttl
+        elif typename == 'SOA':
+            # with no TTL anywhere, the SOA minimum is the default
+            rttl = last_ttl = data[6][1]
+        else:
+            raise ZoneFileError("no TTL for '%s %s'" % (owner, typename))
+        yield {'name': owner, 'type': type_code(typename), 'class': 1, 'ttl': rttl,
+               'typename': typename, 'classstr': 'IN', 'data': data}
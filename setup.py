@@ -1,17 +1,10 @@
 from setuptools import setup
-from sys import version_info
 from pydnstest.version import VERSION
 
-if version_info[0] == 3:
-    pyver_requires = [
-        "py3dns==3.0.4",
-        "pyparsing==2.0.1",
-    ]
-else:
-    pyver_requires = [
-        "pydns==2.3.6",
-        "pyparsing==1.5.7",
-    ]
+requires = [
+    "py3dns==3.0.4",
+    "pyparsing==2.0.1",
+]
 
 with open('README.rst') as file:
     long_description = file.read()
@@ -28,8 +21,7 @@ classifiers = [
     'Natural Language :: English',
     'Operating System :: POSIX',
     'Programming Language :: Python',
-    'Programming Language :: Python :: 2.7',
-    'Programming Language :: Python :: 3.4',
+    'Programming Language :: Python :: 3',
     'Programming Language :: Python :: 3.5',
     'Programming Language :: Python :: 3.6',
     'Topic :: Internet :: Name Service (DNS)'
@@ -46,7 +38,8 @@ setup(
     license='AGPLv3+',
     description='Tool to test DNS changes on a staging server and verify in production',
     long_description=long_description,
-    install_requires=pyver_requires,
+    install_requires=requires,
+    python_requires='>=3.5',
     keywords="dns testing pydns",
     classifiers=classifiers
 )